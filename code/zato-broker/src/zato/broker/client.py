@@ -13,6 +13,7 @@ from traceback import format_exc
 
 # gevent
 from gevent import sleep, spawn
+from gevent.queue import Empty, Queue
 
 # orjson
 from orjson import dumps
@@ -21,7 +22,7 @@ from orjson import dumps
 from requests import post as requests_post
 
 # Zato
-from zato.common.broker_message import code_to_name, SCHEDULER
+from zato.common.broker_message import code_to_name, Common as BROKER_COMMON, SCHEDULER
 from zato.common.api import URLInfo
 from zato.common.util.config import get_url_protocol_from_config_item
 from zato.common.util.platform_ import is_non_windows
@@ -32,7 +33,7 @@ from zato.common.util.platform_ import is_non_windows
 if 0:
     from requests.models import Response
     from zato.client import AnyServiceInvoker
-    from zato.common.typing_ import any_, anydict, strdict, strdictnone
+    from zato.common.typing_ import any_, anydict, anylist, strdict, strdictnone
     from zato.server.connection.server.rpc.api import ServerRPC
 
     AnyServiceInvoker = AnyServiceInvoker
@@ -49,6 +50,21 @@ use_tls = is_non_windows
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How many messages may be waiting for a destination before publishers are made to wait too
+    Queue_Max_Size = 10_000
+
+    # How many messages at most are sent to a destination in one invocation
+    Batch_Max_Size = 500
+
+    # Where published messages can be sent to
+    Destination_Servers = 'servers'
+    Destination_Scheduler = 'scheduler'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 to_scheduler_actions = {
     SCHEDULER.CREATE.value,
     SCHEDULER.EDIT.value,
@@ -84,6 +100,9 @@ class BrokerClient:
         self.scheduler_address = ''
         self.scheduler_auth = None
 
+        # Outgoing messages for each destination, each queue is sent by a greenlet of its own
+        self._queues = {} # type: dict[str, Queue]
+
         # We are a server so we will have configuration needed to set up the scheduler's details ..
         if scheduler_config:
             self.set_scheduler_config(scheduler_config)
@@ -236,15 +255,97 @@ class BrokerClient:
         except Exception:
             logger.warning(format_exc())
 
+# ################################################################################################################################
+
+    def _get_queue(self, destination:'str') -> 'Queue':
+
+        # Queues are created on first use so that clients that never publish anything do not start any greenlets
+        if not (queue := self._queues.get(destination)):
+            queue = Queue(ModuleCtx.Queue_Max_Size)
+            self._queues[destination] = queue
+            _ = spawn(self._send_queue, destination, queue)
+
+        return queue
+
+# ################################################################################################################################
+
+    def _send_queue(self, destination:'str', queue:'Queue') -> 'None':
+        """ Sends messages from a destination's queue, in the same order they were published in, with all the messages
+        that are already waiting sent together in one invocation.
+        """
+        while True:
+
+            # Wait until there is at least one message ..
+            batch = [queue.get()]
+
+            # .. add all the others that are available now ..
+            while len(batch) < ModuleCtx.Batch_Max_Size:
+                try:
+                    batch.append(queue.get_nowait())
+                except Empty:
+                    break
+
+            # .. and send them all.
+            try:
+                self._send_batch(destination, batch)
+            except Exception:
+                logger.warning('Could not send %d message(s) to %s -> %s', len(batch), destination, format_exc())
+
+# ################################################################################################################################
+
+    def _send_batch(self, destination:'str', batch:'anylist') -> 'None':
+
+        # A single message is sent as it is ..
+        if len(batch) == 1:
+            msg = batch[0]
+
+        # .. whereas several ones are sent as one message that recipients will unpack.
+        else:
+            msg = {
+                'action': BROKER_COMMON.Batch.value,
+                'messages': batch,
+            }
+
+        if has_debug:
+            logger.info('Sending %d message(s) to %s', len(batch), destination)
+
+        if destination == ModuleCtx.Destination_Scheduler:
+            _ = self._invoke_scheduler_from_server(msg)
+
+        elif self.server_rpc:
+            _ = self.server_rpc.invoke_all('zato.service.rpc-service-invoker', msg, ping_timeout=10)
+
+        else:
+            logger.warning('Server-to-server RPC invocation failure -> self.server_rpc is not configured (%r) (%d)',
+                self.server_rpc, len(batch))
+
+# ################################################################################################################################
+
+    def _enqueue(self, msg:'anydict', **kwargs:'any_') -> 'None':
+
+        # Messages from the scheduler are service invocations so they cannot be combined with other ones ..
+        if kwargs.get('from_scheduler'):
+            _ = spawn(self._rpc_invoke, msg, **kwargs)
+            return
+
+        # .. otherwise, the message goes to the scheduler or to servers ..
+        if msg['action'] in to_scheduler_actions:
+            destination = ModuleCtx.Destination_Scheduler
+        else:
+            destination = ModuleCtx.Destination_Servers
+
+        # .. and this blocks if there are too many messages for the destination already.
+        self._get_queue(destination).put(msg)
+
 # ################################################################################################################################
 
     def publish(self, msg:'anydict', *ignored_args:'any_', **kwargs:'any_') -> 'any_':
-        spawn(self._rpc_invoke, msg, **kwargs)
+        self._enqueue(msg, **kwargs)
 
 # ################################################################################################################################
 
     def invoke_async(self, msg:'anydict', *ignored_args:'any_', **kwargs:'any_') -> 'any_':
-        spawn(self._rpc_invoke, msg, **kwargs)
+        self._enqueue(msg, **kwargs)
 
 # ################################################################################################################################
 
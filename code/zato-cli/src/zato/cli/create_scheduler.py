@@ -60,6 +60,7 @@ server_prefer_odb_config={server_prefer_odb_config}
 
 [misc]
 initial_sleep_time={initial_sleep_time}
+engine=greenlet
 
 [odb]
 engine={odb_engine}
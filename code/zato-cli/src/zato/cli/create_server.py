@@ -65,6 +65,7 @@ debugger_host=0.0.0.0
 debugger_port=5678
 ipc_host=127.0.0.1
 ipc_port_start=17050
+ipc_use_unix_socket=False
 
 work_dir=../../work
 
@@ -169,11 +170,15 @@ return_json_schema_errors=False
 sftp_genkey_command=dropbearkey
 posix_ipc_skip_platform=darwin
 service_invoker_allow_internal="pub.zato.ping", "/zato/api/invoke/service_name"
+zato_kvdb_use_journal=False
 
 [events]
 fs_data_path = {{events_fs_data_path}}
 sync_threshold = {{events_sync_threshold}}
 sync_interval = {{events_sync_interval}}
+push_is_buffered = {{events_push_is_buffered}}
+push_batch_size = {{events_push_batch_size}}
+push_batch_interval = {{events_push_batch_interval}}
 
 [http]
 methods_allowed=GET, POST, DELETE, PUT, PATCH, HEAD, OPTIONS
@@ -263,6 +268,9 @@ log_if_wsx_deliv_server_not_found=False
 data_prefix_len=2048
 data_prefix_short_len=64
 sk_server_table_columns=6, 15, 8, 6, 17, 75
+gd_group_commit=False
+gd_group_commit_window=5
+gd_group_commit_max_size=100
 
 [pubsub_meta_topic]
 enabled=True
@@ -310,6 +318,8 @@ allow_loopback=False
 
 [shmem]
 size=0.1 # In MB
+cache_names=
+cache_size=100 # In MB
 
 [logging]
 http_access_log_ignore=
@@ -940,6 +950,9 @@ class Create(ZatoCommand):
                     events_fs_data_path=EventsDefault.fs_data_path,
                     events_sync_threshold=EventsDefault.sync_threshold,
                     events_sync_interval=EventsDefault.sync_interval,
+                    events_push_is_buffered=EventsDefault.push_is_buffered,
+                    events_push_batch_size=EventsDefault.push_batch_size,
+                    events_push_batch_interval=EventsDefault.push_batch_interval,
                     scheduler_host=scheduler_config.scheduler_host,
                     scheduler_port=scheduler_config.scheduler_port,
                     scheduler_use_tls=scheduler_config.scheduler_use_tls,
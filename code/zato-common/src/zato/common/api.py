@@ -435,6 +435,20 @@ class CACHE:
         BUILTIN = 'builtin'
         MEMCACHED = 'memcached'
 
+    # How keys of responses cached by HTTP channels are computed
+    class HTTP_KEY_TYPE:
+
+        # sha256 over the method, path, query string and payload
+        SHA256 = 'sha256'
+
+        # A non-cryptographic 128-bit hash of the same data
+        FAST_HASH = 'fast-hash'
+
+        # As above but without the payload, e.g. for GET requests
+        NO_PAYLOAD = 'no-payload'
+
+        ALL = (SHA256, FAST_HASH, NO_PAYLOAD)
+
     class BUILTIN_KV_DATA_TYPE:
         STR = NameId('String', 'str')
         INT = NameId('Integer', 'int')
@@ -606,6 +620,19 @@ class SCHEDULER:
         Active = 'Active'
         Paused = 'Paused'
 
+    class Engine:
+
+        # Each job runs in its own greenlet
+        Greenlet = 'greenlet'
+
+        # All jobs are run from a single greenlet using a heap of their next run times
+        Timer_Heap = 'timer-heap'
+
+        Default = Greenlet
+
+    # How many due jobs the timer heap engine runs at most before letting other greenlets run
+    Timer_Heap_Max_Batch_Size = 1000
+
     class Env:
 
         # Basic information about where the scheduler can be found
@@ -910,8 +937,12 @@ class PUBSUB:
 
         Dashboard_Message_Body = 'This is a sample message'
         Delivery_Err_Should_Block = True
+        GD_Group_Commit_Window = 5 # In milliseconds
+        GD_Group_Commit_Max_Size = 100
+        GD_Group_Commit_Timeout = 60 # In seconds
         Has_GD = False
         PositionInGroup = 1
+        Sync_Backlog_Shards = 16
         UnsubOnWSXClose = True
         Wrap_One_Msg_In_List = True
 
@@ -1183,9 +1214,10 @@ class RATE_LIMIT:
     class TYPE:
         APPROXIMATE = NameId('Approximate', 'APPROXIMATE')
         EXACT       = NameId('Exact', 'EXACT')
+        HOST        = NameId('Host', 'HOST')
 
         def __iter__(self):
-            return iter((self.APPROXIMATE, self.EXACT))
+            return iter((self.APPROXIMATE, self.HOST, self.EXACT))
 
     class OBJECT_TYPE:
         HTTP_SOAP = 'http_soap'
@@ -1863,6 +1895,9 @@ class ZatoKVDB:
     DefaultSyncThreshold = 3_000
     DefaultSyncInterval  = 3
 
+    # Service usage counters are changed on each invocation so they are kept in stripes, aggregated when read
+    CurrentUsageNumStripes = 16
+
 # ################################################################################################################################
 # ################################################################################################################################
 
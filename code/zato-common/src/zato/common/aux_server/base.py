@@ -8,6 +8,7 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import os
+import socket
 from json import dumps
 from logging import getLogger
 from traceback import format_exc
@@ -21,7 +22,7 @@ from gevent.pywsgi import WSGIServer
 
 # Zato
 from zato.common.api import IPC as Common_IPC, ZATO_ODB_POOL_NAME
-from zato.common.broker_message import code_to_name
+from zato.common.broker_message import code_to_name, Common as BROKER_COMMON
 from zato.common.crypto.api import CryptoManager
 from zato.common.odb.api import ODBManager, PoolStore
 from zato.common.typing_ import cast_
@@ -33,7 +34,7 @@ from zato.common.util.json_ import json_loads
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, anydict, byteslist, callable_, callnone, intnone, strdict, strnone, type_
+    from zato.common.typing_ import any_, anydict, anylist, byteslist, callable_, callnone, intnone, strdict, strnone, type_
     callnone = callnone
     intnone = intnone
     strnone = strnone
@@ -74,6 +75,9 @@ class AuxServerConfig:
     parent_server_pid: 'int'
     raw_config: 'Bunch'
 
+    # If given, the server will also listen on this Unix domain socket
+    bind_unix_path: 'str' = ''
+
     def __init__(self) -> 'None':
         self.main = Bunch()
         self.stats_enabled = None
@@ -259,6 +263,7 @@ class AuxServer:
     """
     needs_logging_setup: 'bool'
     api_server: 'WSGIServer'
+    unix_api_server: 'WSGIServer | None'
     cid_prefix: 'str'
     server_type: 'str'
     conf_file_name: 'str'
@@ -291,6 +296,31 @@ class AuxServer:
         # API server
         self.api_server = WSGIServer((main.bind.host, int(main.bind.port)), self, **tls_kwargs)
 
+        # Optional API server for local clients, without TLS because the socket never leaves the host
+        if config.bind_unix_path:
+            self.unix_api_server = WSGIServer(self._get_unix_listener(config.bind_unix_path), self)
+        else:
+            self.unix_api_server = None
+
+# ################################################################################################################################
+
+    def _get_unix_listener(self, path:'str') -> 'socket.socket':
+
+        # Remove a socket file that may have been left over by a previous process of the same name ..
+        if os.path.exists(path):
+            os.remove(path)
+
+        # .. create and bind the socket ..
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+
+        # .. only our own user may connect to it ..
+        os.chmod(path, 0o600)
+
+        # .. and we can start to listen for connections now.
+        listener.listen(128)
+        return listener
+
 # ################################################################################################################################
 
     @classmethod
@@ -329,6 +359,7 @@ class AuxServer:
         server_type_suffix='', # type: str
         parent_server_name='', # type: str
         parent_server_pid=-1,  # type: int
+        bind_unix_path='',     # type: str
     ) -> 'None':
 
         # Functionality that needs to run before configuration is created
@@ -353,6 +384,7 @@ class AuxServer:
 
         config.parent_server_name = parent_server_name
         config.parent_server_pid  = parent_server_pid
+        config.bind_unix_path = bind_unix_path
 
         if not config.username:
             username = username or 'ipc.username.not.set.' + CryptoManager.generate_secret().decode('utf8') # type: ignore
@@ -396,6 +428,12 @@ class AuxServer:
 # ################################################################################################################################
 
     def serve_forever(self) -> 'None':
+
+        # The Unix socket server runs in background ..
+        if self.unix_api_server:
+            self.unix_api_server.start()
+
+        # .. whereas the TCP one blocks.
         self.api_server.serve_forever()
 
 # ################################################################################################################################
@@ -432,6 +470,35 @@ class AuxServer:
             if self.should_check_credentials():
                 self._check_credentials(credentials)
 
+        # .. several requests may have been sent together, in which case each is handled in the order given ..
+        if request.get('action') == BROKER_COMMON.Batch.value:
+            return self._handle_batch_request(request)
+
+        return self._handle_action_request(request)
+
+# ################################################################################################################################
+
+    def _handle_batch_request(self, request:'Bunch') -> 'anylist':
+
+        out = []
+
+        for item in request['messages']:
+
+            # .. an error in one of the requests should not prevent the remaining ones from being handled.
+            try:
+                response = self._handle_action_request(Bunch(item))
+            except Exception:
+                logger.warning('Could not handle batch request `%r` -> %s', item, format_exc())
+                response = None
+
+            out.append(response)
+
+        return out
+
+# ################################################################################################################################
+
+    def _handle_action_request(self, request:'Bunch') -> 'any_':
+
         # .. look up the action we need to invoke ..
         action = request.get('action') # type: ignore
 
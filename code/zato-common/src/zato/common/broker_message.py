@@ -480,6 +480,8 @@ class CACHE(Constants):
     MEMCACHED_EDIT = ValueConstant('')
     MEMCACHED_DELETE = ValueConstant('')
 
+    BUILTIN_STATE_CHANGED_BATCH = ValueConstant('')
+
 class GENERIC(Constants):
     code_start = 107000
 
@@ -508,6 +510,7 @@ class SERVER_IPC(Constants):
 class Common(Constants):
     code_start = 107800
     Sync_Objects = ValueConstant('')
+    Batch = ValueConstant('')
 
 class Groups(Constants):
     code_start = 108000
@@ -19,7 +19,7 @@ from gevent.lock import RLock
 from orjson import dumps
 
 # Zato
-from zato.common.events.common import Action
+from zato.common.events.common import Action, pack_events
 from zato.common.typing_ import asdict
 from zato.common.util.api import new_cid
 from zato.common.util.json_ import json_loads
@@ -90,11 +90,11 @@ class Client:
 
 # ################################################################################################################################
 
-    def send(self, action, data=b''):
-        # type: (bytes) -> None
+    def send(self, action, data=b'', delimiter=b'\n'):
+        # type: (bytes, bytes, bytes) -> None
         with self.lock:
             try:
-                self.socket.sendall(action + data + b'\n')
+                self.socket.sendall(action + data + delimiter)
             except Exception as e:
                 self.is_connected = False
                 logger.info('Socket send error `%s` -> %s', e.args, self.remote_addr_str)
@@ -151,6 +151,19 @@ class Client:
         # .. and send it across (there will be no response).
         self.send(Action.Push, data)
 
+# ################################################################################################################################
+
+    def push_many(self, ctx_list):
+        # type: (list) -> None
+
+        # Serialise all the contexts to a single binary batch ..
+        data = pack_events(ctx_list)
+
+        # .. and send it across in one message (there will be no response). The batch begins with its own length,
+        # which is what the receiving end uses to find where it ends, so there is no delimiter to add. Note that a delimiter
+        # could not have been used anyway because the binary data may contain it.
+        self.send(Action.PushBatch, data, b'')
+
 # ################################################################################################################################
 
     def get_table(self):
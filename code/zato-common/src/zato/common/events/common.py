@@ -7,6 +7,7 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from struct import Struct
 from typing import Optional as optional
 
 # Zato
@@ -26,6 +27,15 @@ class Default:
     # .. or once in that many seconds.
     sync_interval = 30
 
+    # Whether events should be pushed to the backend in batches (the buffered mode) rather than one by one
+    push_is_buffered = False
+
+    # In the buffered mode, push events to the backend once there are that many of them ..
+    push_batch_size = 500
+
+    # .. or once in that many seconds.
+    push_batch_interval = 1
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -50,6 +60,7 @@ class Action:
     GetTable       = b'04'
     GetTableReply  = b'05'
     SyncState      = b'06'
+    PushBatch      = b'07'
 
     LenAction = len(Ping)
 
@@ -79,3 +90,104 @@ class PushCtx:
 
 # ################################################################################################################################
 # ################################################################################################################################
+
+# A batch of events is a header followed by the events, each of which is a header followed by its string fields
+_batch_header = Struct('<II')     # Length of the data that follows and how many events there are
+_event_header = Struct('<iiq8H')  # Event type, object type, total time and lengths of string fields
+
+# Length of a string field that is None
+_none_len = 0xFFFF
+
+# A total time that is None
+_none_time = -1
+
+_string_fields = ('id', 'cid', 'timestamp', 'source_type', 'source_id', 'object_id', 'recipient_type', 'recipient_id')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def pack_events(events):
+    """ Serialises push contexts to a length-prefixed binary batch that can be sent to the backend in one message.
+    """
+    # type: (list) -> bytes
+
+    out = []
+
+    for ctx in events: # type: PushCtx
+
+        strings = []
+        lengths = []
+
+        for name in _string_fields:
+            value = getattr(ctx, name, None)
+            if value is None:
+                lengths.append(_none_len)
+            else:
+                value = value if isinstance(value, str) else str(value)
+                value = value.encode('utf8')
+                strings.append(value)
+                lengths.append(len(value))
+
+        total_time_ms = getattr(ctx, 'total_time_ms', None)
+        total_time_ms = _none_time if total_time_ms is None else total_time_ms
+
+        out.append(_event_header.pack(ctx.event_type, ctx.object_type, total_time_ms, *lengths))
+        out.extend(strings)
+
+    data = b''.join(out)
+    return _batch_header.pack(len(data), len(events)) + data
+
+# ################################################################################################################################
+
+def get_batch_size(data, offset=0):
+    """ Returns how many bytes, header included, a binary batch starting at offset takes, or None if its header is incomplete.
+    """
+    # type: (bytes, int) -> int | None
+
+    if len(data) - offset < _batch_header.size:
+        return None
+
+    data_len, _ = _batch_header.unpack_from(data, offset)
+    return _batch_header.size + data_len
+
+# ################################################################################################################################
+
+def unpack_events(data):
+    """ The reverse of pack_events, returns push contexts from a binary batch, which may be followed by other data.
+    """
+    # type: (bytes) -> list
+
+    out = []
+
+    data_len, num_events = _batch_header.unpack_from(data)
+    if len(data) < _batch_header.size + data_len:
+        raise ValueError('Incomplete batch of events, expected {} bytes instead of {}'.format(
+            data_len, len(data) - _batch_header.size))
+
+    data = memoryview(data)
+    offset = _batch_header.size
+
+    for _x in range(num_events):
+
+        event_type, object_type, total_time_ms, *lengths = _event_header.unpack_from(data, offset)
+        offset += _event_header.size
+
+        ctx = PushCtx()
+        ctx.event_type = event_type
+        ctx.object_type = object_type
+        ctx.total_time_ms = None if total_time_ms == _none_time else total_time_ms
+
+        for name, length in zip(_string_fields, lengths):
+            if length == _none_len:
+                value = None
+            else:
+                value = bytes(data[offset:offset + length]).decode('utf8')
+                offset += length
+            setattr(ctx, name, value)
+
+        out.append(ctx)
+
+    return out
+
+# ################################################################################################################################
+# ################################################################################################################################
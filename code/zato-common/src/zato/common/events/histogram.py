@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from array import array
+from math import ceil
+
+# Zato
+from zato.common.events.common import EventInfo
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.events.common import PushCtx
+    from zato.common.typing_ import anydict, anylist
+
+    PushCtx = PushCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Values below 2 ** Sub_Bucket_Bits have a bucket each, larger ones are within 1 / 2 ** (Sub_Bucket_Bits - 1) of their bucket
+    Sub_Bucket_Bits = 6
+
+    # Values that need more bits than that go to the last bucket
+    Max_Value_Bits = 36
+
+    # Percentiles returned in tabulated data
+    Percentiles = (50, 90, 99)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_linear_count = 1 << ModuleCtx.Sub_Bucket_Bits
+_half_count = _linear_count // 2
+_num_buckets = _linear_count + (ModuleCtx.Max_Value_Bits - ModuleCtx.Sub_Bucket_Bits) * _half_count
+
+event_type_resp     = EventInfo.EventType.service_response
+object_type_service = EventInfo.CommonObject.service
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _get_bucket_idx(value:'int') -> 'int':
+
+    # Small values are stored exactly ..
+    if value < _linear_count:
+        return value
+
+    # .. whereas larger ones share a bucket with other values that have the same leading bits.
+    shift = value.bit_length() - ModuleCtx.Sub_Bucket_Bits
+    idx = _linear_count + (shift - 1) * _half_count + (value >> shift) - _half_count
+
+    return min(idx, _num_buckets - 1)
+
+# ################################################################################################################################
+
+def _get_bucket_value(idx:'int') -> 'int':
+    """ Returns the middle of the range of values that a bucket holds.
+    """
+    if idx < _linear_count:
+        return idx
+
+    idx -= _linear_count
+    shift = idx // _half_count + 1
+    prefix = idx % _half_count + _half_count
+
+    return (prefix << shift) + (1 << shift) // 2
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LatencyHistogram:
+    """ Keeps counts of response times in a fixed number of logarithmic buckets, HDR histogram-style, so that the memory
+    used does not depend on how many times were recorded, at the cost of percentiles being approximate.
+    """
+    def __init__(self) -> 'None':
+        self.counts = array('Q', bytes(8 * _num_buckets))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+# ################################################################################################################################
+
+    def record(self, value:'int') -> 'None':
+
+        value = max(int(value), 0)
+
+        self.counts[_get_bucket_idx(value)] += 1
+        self.total += value
+
+        if self.count:
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+        else:
+            self.min = value
+            self.max = value
+
+        self.count += 1
+
+# ################################################################################################################################
+
+    def merge(self, other:'LatencyHistogram') -> 'None':
+        """ Adds to this histogram all the values recorded by another one.
+        """
+        if not other.count:
+            return
+
+        for idx, count in enumerate(other.counts):
+            if count:
+                self.counts[idx] += count
+
+        if self.count:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        else:
+            self.min = other.min
+            self.max = other.max
+
+        self.count += other.count
+        self.total += other.total
+
+# ################################################################################################################################
+
+    def get_mean(self) -> 'float':
+        return self.total / self.count if self.count else 0.0
+
+# ################################################################################################################################
+
+    def get_percentile(self, percentile:'float') -> 'int':
+
+        if not self.count:
+            return 0
+
+        # The position, counted from one, of the value we are looking for ..
+        rank = max(ceil(percentile / 100 * self.count), 1)
+
+        # .. find the bucket it is in ..
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+
+        # .. and the exact values recorded are never exceeded.
+        return min(max(_get_bucket_value(idx), self.min), self.max) # type: ignore
+
+# ################################################################################################################################
+
+    def to_dict(self) -> 'anydict':
+
+        out = {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': round(self.get_mean(), 2),
+        }
+
+        for percentile in ModuleCtx.Percentiles:
+            out['p{}'.format(percentile)] = self.get_percentile(percentile)
+
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ServiceLatency:
+    """ Aggregates response times of services, as received in push events, into a histogram per service.
+    """
+    def __init__(self) -> 'None':
+        self.histograms = {} # type: dict[str, LatencyHistogram]
+
+# ################################################################################################################################
+
+    def add_event(self, ctx:'PushCtx') -> 'None':
+
+        # Only responses have response times ..
+        if ctx.event_type != event_type_resp or ctx.object_type != object_type_service:
+            return
+
+        if ctx.total_time_ms is None:
+            return
+
+        # .. and each service has a histogram of its own.
+        if not (histogram := self.histograms.get(ctx.object_id)):
+            histogram = LatencyHistogram()
+            self.histograms[ctx.object_id] = histogram
+
+        histogram.record(ctx.total_time_ms)
+
+# ################################################################################################################################
+
+    def add_events(self, events:'anylist') -> 'None':
+        for ctx in events:
+            self.add_event(ctx)
+
+# ################################################################################################################################
+
+    def get_table(self) -> 'anylist':
+        """ Returns statistics of each service, sorted by service name.
+        """
+        out = []
+
+        for name, histogram in sorted(self.histograms.items()):
+            item = histogram.to_dict()
+            item['name'] = name
+            out.append(item)
+
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
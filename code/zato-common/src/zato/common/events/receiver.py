@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from logging import getLogger
+
+# orjson
+from orjson import dumps, loads
+
+# Zato
+from zato.common.events.common import Action, get_batch_size, PushCtx, unpack_events
+from zato.common.events.histogram import ServiceLatency
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from socket import socket
+    from zato.common.typing_ import anylist
+
+    socket = socket
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_len_action = Action.LenAction
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Receiver:
+    """ The receiving end of events that events.client.Client sends. Response times of services from pushed events
+    are kept in a histogram per service and returned in reply to GetTable.
+
+    Each message is an action followed by its data and a newline, except for PushBatch, whose data is a binary batch
+    that begins with its own length and which is not followed by anything.
+    """
+    def __init__(self, max_msg_size:'int'=30_000_000, read_buffer_size:'int'=1_000_000) -> 'None':
+        self.max_msg_size = max_msg_size
+        self.read_buffer_size = read_buffer_size
+        self.latency = ServiceLatency()
+        self.buffer = bytearray()
+
+        self.handlers = {
+            Action.Ping: self.on_ping,
+            Action.Push: self.on_push,
+            Action.GetTable: self.on_get_table,
+            Action.SyncState: self.on_sync_state,
+        }
+
+# ################################################################################################################################
+
+    def handle_data(self, data:'bytes') -> 'anylist':
+        """ Handles data received from a client, which may contain any number of messages or only parts of them.
+        Returns replies to the messages that need them. Parts of messages are kept until the rest of them is received.
+        """
+        out = []
+        buffer = self.buffer
+        buffer += data
+
+        while len(buffer) > _len_action:
+
+            action = bytes(buffer[:_len_action])
+
+            # A batch says how long it is ..
+            if action == Action.PushBatch:
+                batch_size = get_batch_size(buffer, _len_action)
+                if batch_size is None or len(buffer) < _len_action + batch_size:
+                    break
+
+                msg_end = _len_action + batch_size
+                self.on_push_batch(bytes(buffer[_len_action:msg_end]))
+                del buffer[:msg_end]
+
+            # .. while other messages end with a newline.
+            else:
+                newline_idx = buffer.find(b'\n', _len_action)
+                if newline_idx == -1:
+                    break
+
+                msg = bytes(buffer[_len_action:newline_idx])
+                del buffer[:newline_idx + 1]
+
+                if handler := self.handlers.get(action):
+                    if (reply := handler(msg)) is not None:
+                        out.append(reply)
+                else:
+                    logger.warning('Ignoring unrecognised events action `%s`', action)
+
+        if len(buffer) > self.max_msg_size:
+            raise ValueError('Message would exceed max. size allowed `{}` > `{}`'.format(len(buffer), self.max_msg_size))
+
+        return out
+
+# ################################################################################################################################
+
+    def handle_connection(self, conn:'socket') -> 'None':
+        """ Handles all the messages from a connected client until it disconnects.
+        """
+        while data := conn.recv(self.read_buffer_size):
+            for reply in self.handle_data(data):
+                conn.sendall(reply)
+
+# ################################################################################################################################
+
+    def on_ping(self, _ignored:'bytes') -> 'bytes':
+        return Action.PingReply
+
+# ################################################################################################################################
+
+    def on_push(self, data:'bytes') -> 'None':
+
+        ctx = PushCtx()
+
+        for name, value in loads(data).items():
+            setattr(ctx, name, value)
+
+        self.latency.add_event(ctx)
+
+# ################################################################################################################################
+
+    def on_push_batch(self, data:'bytes') -> 'None':
+        self.latency.add_events(unpack_events(data))
+
+# ################################################################################################################################
+
+    def on_get_table(self, _ignored:'bytes') -> 'bytes':
+        return Action.GetTableReply + dumps(self.latency.get_table())
+
+# ################################################################################################################################
+
+    def on_sync_state(self, _ignored:'bytes') -> 'bytes':
+
+        # There is nothing to sync because everything is kept in RAM, but the client waits for a reply
+        return Action.SyncState
+
+# ################################################################################################################################
+# ################################################################################################################################
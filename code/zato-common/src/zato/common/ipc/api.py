@@ -13,14 +13,14 @@ import logging
 from zato.common.api import IPC
 from zato.common.ipc.client import IPCClient
 from zato.common.ipc.server import IPCServer
-from zato.common.util.api import fs_safe_name, load_ipc_pid_port
+from zato.common.util.api import fs_safe_name, get_ipc_pid_socket_path, load_ipc_pid_port, wait_for_file
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
     from zato.common.ipc.client import IPCResponse
-    from zato.common.typing_ import callable_
+    from zato.common.typing_ import callable_, intanydict
     from zato.server.base.parallel import ParallelServer
 
 # ################################################################################################################################
@@ -40,10 +40,18 @@ class IPCAPI:
     password: 'str'
     on_message_callback: 'callable_'
 
+    # Whether other processes should be invoked through Unix domain sockets rather than TCP
+    use_unix_socket: 'bool'
+
+    # Clients to other processes, keyed by their PIDs, each keeping persistent connections to its process
+    clients: 'intanydict'
+
     def __init__(self, parallel_server:'ParallelServer') -> 'None':
         self.parallel_server = parallel_server
         self.username = IPC.Credentials.Username
         self.password = ''
+        self.use_unix_socket = False
+        self.clients = {}
 
 # ################################################################################################################################
 
@@ -62,6 +70,7 @@ class IPCAPI:
         username='',   # type: str
         password='',   # type: str
         callback_func, # type: callable_
+        bind_unix_path='', # type: str
     ) -> 'None':
 
         username = username or self.username
@@ -76,9 +85,43 @@ class IPCAPI:
             username=username,
             password=password,
             callback_func=callback_func,
-            server_type_suffix=server_type_suffix
+            server_type_suffix=server_type_suffix,
+            bind_unix_path=bind_unix_path,
         )
 
+# ################################################################################################################################
+
+    def _get_client(self, use_tls:'bool', cluster_name:'str', server_name:'str', target_pid:'int') -> 'IPCClient':
+
+        # Return a client that we already have, if any ..
+        if client := self.clients.get(target_pid):
+            return client
+
+        # This is constant
+        ipc_host = '127.0.0.1'
+
+        # Get the port that we can find the PID listening on
+        ipc_port = load_ipc_pid_port(cluster_name, server_name, target_pid)
+
+        # Optionally, connect through a Unix socket that the process listens on too ..
+        if self.use_unix_socket:
+            unix_socket_path = get_ipc_pid_socket_path(cluster_name, server_name, target_pid)
+            wait_for_file(unix_socket_path, interval=0.1)
+        else:
+            unix_socket_path = ''
+
+        # .. create a new client ..
+        client = IPCClient(use_tls, ipc_host, ipc_port, IPC.Credentials.Username, self.password, unix_socket_path)
+
+        # .. and keep it for later use. Another greenlet may have created one in the meantime,
+        # in which case we use that one instead.
+        if existing := self.clients.get(target_pid):
+            client.close()
+            return existing
+        else:
+            self.clients[target_pid] = client
+            return client
+
 # ################################################################################################################################
 
     def invoke_by_pid(
@@ -94,33 +137,40 @@ class IPCAPI:
         """ Invokes a service in a specific process synchronously through IPC.
         """
 
-        # This is constant
-        ipc_host = '127.0.0.1'
+        # Get a client to the process, possibly one that is already connected to it ..
+        client = self._get_client(use_tls, cluster_name, server_name, target_pid)
 
-        # Get the port that we can find the PID listening on
-        ipc_port = load_ipc_pid_port(cluster_name, server_name, target_pid)
-
-        # Log what we are about to do
-        log_msg = f'Invoking {service} on {cluster_name}:{server_name}:{target_pid}-tcp:{ipc_port}'
+        # .. log what we are about to do ..
+        log_msg = f'Invoking {service} on {cluster_name}:{server_name}:{target_pid}-tcp:{client.port}'
         logger.debug(log_msg)
 
-        # Use this URL path to be able to easily find requests in logs
-        url_path = f'{cluster_name}:{server_name}:{target_pid}-tcp:{ipc_port}-service:{service}'
+        # .. use this URL path to be able to easily find requests in logs ..
+        url_path = f'{cluster_name}:{server_name}:{target_pid}-tcp:{client.port}-service:{service}'
         url_path = fs_safe_name(url_path)
 
-        client = IPCClient(use_tls, ipc_host, ipc_port, IPC.Credentials.Username, self.password)
-        response = client.invoke(
-            service,
-            request,
-            url_path,
-            cluster_name=cluster_name,
-            server_name=server_name,
-            server_pid=target_pid,
-            timeout=timeout,
-            source_server_name=self.parallel_server.name,
-            source_server_pid=self.parallel_server.pid,
-        )
-        return response
+        # .. and invoke the process now.
+        try:
+            response = client.invoke(
+                service,
+                request,
+                url_path,
+                cluster_name=cluster_name,
+                server_name=server_name,
+                server_pid=target_pid,
+                timeout=timeout,
+                source_server_name=self.parallel_server.name,
+                source_server_pid=self.parallel_server.pid,
+            )
+
+        # If the process could not be invoked, the next call will use a new client, e.g. in case the process restarted.
+        except Exception:
+            if self.clients.get(target_pid) is client:
+                _ = self.clients.pop(target_pid)
+                client.close()
+            raise
+
+        else:
+            return response
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -7,10 +7,16 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+import socket
 from json import dumps, loads
 
 # requests
-from requests import post as requests_post
+from requests import Session as RequestsSession
+from requests.adapters import HTTPAdapter
+
+# urllib3
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
 
 # Zato
 from zato.common.api import IPC as Common_IPC
@@ -22,11 +28,78 @@ from zato.common.typing_ import dataclass
 # ################################################################################################################################
 
 if 0:
+    from requests import PreparedRequest
     from zato.common.typing_ import any_, anydict, anylist
 
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How many idle connections to each peer process to keep open. This is also how many concurrent calls
+    # can reuse existing connections, additional ones will open new connections which are closed afterwards.
+    Pool_Max_Size = 20
+
+    # Unix sockets are local so the host is not used for anything except for the Host header
+    Unix_Socket_Host = 'localhost'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _UnixSocketConnection(HTTPConnection):
+    """ An HTTP connection over a Unix domain socket rather than TCP.
+    """
+    def __init__(self, *args:'any_', unix_socket_path:'str', **kwargs:'any_') -> 'None':
+        self.unix_socket_path = unix_socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self) -> 'socket.socket':
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        # Non-numeric values are sentinel objects meaning that no timeout was given
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+
+        sock.connect(self.unix_socket_path)
+        return sock
+
+# ################################################################################################################################
+
+class _UnixSocketConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _UnixSocketConnection
+
+# ################################################################################################################################
+
+class UnixSocketAdapter(HTTPAdapter):
+    """ A requests adapter sending all of its requests to a single Unix domain socket,
+    keeping a pool of persistent connections to it.
+    """
+    def __init__(self, unix_socket_path:'str', pool_maxsize:'int') -> 'None':
+        self.unix_socket_path = unix_socket_path
+        self.pool = _UnixSocketConnectionPool(
+            ModuleCtx.Unix_Socket_Host,
+            maxsize=pool_maxsize,
+            unix_socket_path=unix_socket_path,
+        )
+        super().__init__(pool_maxsize=pool_maxsize)
+
+    def get_connection(self, *ignored_args:'any_', **ignored_kwargs:'any_') -> 'HTTPConnectionPool':
+        return self.pool
+
+    def get_connection_with_tls_context(self, *ignored_args:'any_', **ignored_kwargs:'any_') -> 'HTTPConnectionPool':
+        return self.pool
+
+    def request_url(self, request:'PreparedRequest', *ignored_args:'any_', **ignored_kwargs:'any_') -> 'str':
+        return request.path_url
+
+    def close(self) -> 'None':
+        super().close()
+        self.pool.close()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 @dataclass(init=False)
 class IPCResponseMeta:
 
@@ -52,7 +125,9 @@ class IPCResponse:
 # ################################################################################################################################
 
 class IPCClient:
-
+    """ Invokes services in another process. Each instance keeps persistent connections to its peer process,
+    either over TCP or over a Unix domain socket, and it can be used by many greenlets concurrently.
+    """
     def __init__(
         self,
         use_tls:  'bool',
@@ -60,13 +135,35 @@ class IPCClient:
         port:     'int',
         username: 'str',
         password: 'str',
+        unix_socket_path: 'str' = '',
     ) -> 'None':
 
-        self.api_protocol = get_url_protocol_from_config_item(use_tls)
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.unix_socket_path = unix_socket_path
+
+        # Unix sockets never use TLS because they are local to the host
+        self.api_protocol = 'http' if unix_socket_path else get_url_protocol_from_config_item(use_tls)
+        self.address = f'{self.api_protocol}://{self.host}:{self.port}/'
+
+        # Each call reuses one of the connections to the peer kept open by the session ..
+        self.session = RequestsSession()
+        self.session.auth = (self.username, self.password)
+
+        # .. and the adapter decides what kind of connections they are.
+        if unix_socket_path:
+            adapter = UnixSocketAdapter(unix_socket_path, ModuleCtx.Pool_Max_Size)
+        else:
+            adapter = HTTPAdapter(pool_maxsize=ModuleCtx.Pool_Max_Size)
+
+        self.session.mount(self.address, adapter)
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        self.session.close()
 
 # ################################################################################################################################
 
@@ -85,7 +182,7 @@ class IPCClient:
     ) -> 'IPCResponse':
 
         # This is where we can find the IPC server to invoke ..
-        url = f'{self.api_protocol}://{self.host}:{self.port}/{url_path}'
+        url = self.address + url_path
 
         # .. prepare the full request ..
         dict_data = {
@@ -127,11 +224,8 @@ class IPCClient:
             if False:
                 params[key] = value
 
-        # .. build our credentials ..
-        auth = (self.username, self.password)
-
-        # .. invoke the server ..
-        response = requests_post(url, data, params=params, auth=auth)
+        # .. invoke the server, our credentials are already in the session ..
+        response = self.session.post(url, data, params=params)
 
         # .. de-serialize the response ..
         response = loads(response.text)
@@ -10,9 +10,10 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
+import re
 
 # globre
-from globre import match as globre_match
+from globre import compile as globre_compile
 
 # Paste
 from paste.util.converters import asbool
@@ -20,15 +21,83 @@ from paste.util.converters import asbool
 # Zato
 from zato.common.api import FALSE_TRUE, TRUE_FALSE
 
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anylist, strlist
+
+# ################################################################################################################################
+
 logger = logging.getLogger(__name__)
 
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How many decisions each matcher will cache before its cache is cleared
+    Cache_Max_Size = 10_000
+
+    # Named groups in combined patterns are prefixed with this string and followed by each pattern's index
+    Group_Prefix = 'p'
+
+# ################################################################################################################################
+
+def compile_patterns(patterns:'strlist', flags:'int'=re.UNICODE) -> 're.Pattern[str]':
+    """ Combines regular expressions into a single one in which each of them is a separate alternative, in the same order
+    as on input, and in which the group name of the alternative that matched indicates the pattern that did.
+    """
+    prefix = ModuleCtx.Group_Prefix
+    patterns = ['(?P<{}{}>{})'.format(prefix, idx, pattern) for idx, pattern in enumerate(patterns)]
+
+    return re.compile('|'.join(patterns), flags)
+
+# ################################################################################################################################
+
+class FirstMatch:
+    """ Returns the first item whose globre pattern matches a name, or False if none does. All the patterns are matched
+    in one pass and the results are kept in a bounded cache. Like with regular expressions, a name is matched from its beginning
+    but it may contain trailing characters that the patterns do not match.
+    """
+    __slots__ = 'items', 'regex', 'cache', 'cache_size'
+
+    def __init__(self, items:'anylist') -> 'None':
+
+        # A list of items, each one being a two-element list of the item returned and its globre-compiled pattern
+        self.items = items
+
+        self.regex = compile_patterns([elem[1].pattern for elem in items]) if items else None
+        self.cache = {}
+        self.cache_size = 0
+
+    def match(self, name:'str') -> 'any_':
+
+        try:
+            return self.cache[name]
+        except KeyError:
+
+            result = self.regex.match(name) if self.regex else None
+            result = self.items[int(result.lastgroup[1:])][0] if result else False
+
+            if self.cache_size >= ModuleCtx.Cache_Max_Size:
+                self.cache = {}
+                self.cache_size = 0
+
+            self.cache[name] = result
+            self.cache_size += 1
+
+            return result
+
+# ################################################################################################################################
+
 class Matcher:
     def __init__(self):
         self.config = None
         self.items = {True:[], False:[]}
+        self.regex = {True:None, False:None}
         self.order1 = None
         self.order2 = None
         self.is_allowed_cache = {}
+        self.is_allowed_cache_size = 0
         self.special_case = None
 
     def read_config(self, config):
@@ -51,13 +120,17 @@ class Matcher:
         for key in self.items:
             self.items[key] = sorted(self.items[key], reverse=True)
 
+            # All the patterns of a given kind are matched in one go. Which one of them matched is not important
+            # and each pattern needs to match whole values, hence the anchor at the end.
+            if self.items[key]:
+                self.regex[key] = compile_patterns([globre_compile(elem).pattern + r'\Z' for elem in self.items[key]])
+
         for empty, non_empty in ((True, False), (False, True)):
             if not self.items[empty] and '*' in self.items[non_empty]:
                 self.special_case = non_empty
                 break
 
     def is_allowed(self, value):
-        logger.debug('Cache:`%s`, value:`%s`', self.is_allowed_cache, value)
 
         if self.special_case is not None:
             return self.special_case
@@ -65,16 +138,26 @@ class Matcher:
         try:
             return self.is_allowed_cache[value]
         except KeyError:
-            _match = globre_match
-            is_allowed = None
 
-            for order in self.order1, self.order2:
-                for pattern in self.items[order]:
-                    if _match(pattern, value):
-                        is_allowed = order
+            # Patterns from order2 take precedence over the ones from order1 if both of them match
+            for order in self.order2, self.order1:
+                regex = self.regex[order]
+                if regex and regex.match(value):
+                    is_allowed = order
+                    break
 
             # No match at all - we don't allow it in that case
-            is_allowed = is_allowed if (is_allowed is not None) else False
+            else:
+                is_allowed = False
+
+            # Do not let the cache grow without limits if there are many distinct values
+            if self.is_allowed_cache_size >= ModuleCtx.Cache_Max_Size:
+                self.is_allowed_cache = {}
+                self.is_allowed_cache_size = 0
 
             self.is_allowed_cache[value] = is_allowed
+            self.is_allowed_cache_size += 1
+
             return is_allowed
+
+# ################################################################################################################################
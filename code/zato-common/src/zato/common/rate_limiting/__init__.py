@@ -21,19 +21,21 @@ from sqlalchemy import and_
 
 # Zato
 from zato.common.rate_limiting.common import Const, DefinitionItem, ObjectInfo
-from zato.common.rate_limiting.limiter import Approximate, Exact, RateLimitStateDelete, RateLimitStateTable
+from zato.common.rate_limiting.limiter import Approximate, Exact, Host, max_rate, RateLimitStateDelete, RateLimitStateTable
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
     from zato.common.rate_limiting.limiter import BaseLimiter
+    from zato.common.rate_limiting.shmem import SharedRateLimitStore
     from zato.common.typing_ import callable_, dict_, list_, strdict
     from zato.distlock import LockManager
     callable_ = callable_
     dict_ = dict_
     BaseLimiter = BaseLimiter
     LockManager = LockManager
+    SharedRateLimitStore = SharedRateLimitStore
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -81,15 +83,28 @@ class DefinitionParser:
             if rate_info == Const.rate_any:
                 rate = Const.rate_any
                 unit = Const.Unit.day # This is arbitrary but it does not matter because there is no rate limit in effect
+                algorithm = Const.Algorithm.fixed_window
             else:
                 rate, unit = rate_info.split('/') # type: str, str
                 rate = int(rate.strip())
-                unit = unit.strip()
+
+                # The unit may be followed by the name of an algorithm, e.g. 100/m token-bucket
+                unit, _ignored, algorithm = unit.strip().partition(' ')
+                algorithm = algorithm.strip() or Const.Algorithm.fixed_window
 
             all_units = Const.all_units()
             if unit not in all_units:
                 raise ValueError('Unit `{}` is not one of `{}`'.format(unit, all_units))
 
+            all_algorithms = Const.all_algorithms()
+            if algorithm not in all_algorithms:
+                raise ValueError('Algorithm `{}` is not one of `{}`'.format(algorithm, all_algorithms))
+
+            # Higher rates would not fit in the state that host limits keep in shared memory
+            if rate != Const.rate_any and rate > max_rate[unit]:
+                raise ValueError('Rate `{}` is higher than `{}/{}` (line:`{}`; idx:{})'.format(
+                    rate, max_rate[unit], unit, orig_line, idx))
+
             # In parse-only mode we do not build any actual output
             if parse_only:
                 continue
@@ -99,6 +114,7 @@ class DefinitionParser:
             item.from_ = from_
             item.rate = rate
             item.unit = unit
+            item.algorithm = algorithm
             item.object_id = object_id
             item.object_type = object_type
             item.object_name = object_name
@@ -139,7 +155,7 @@ class DefinitionParser:
 class RateLimiting:
     """ Main API for the management of rate limiting functionality.
     """
-    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id'
+    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id', 'host_store'
 
     def __init__(self) -> 'None':
         self.parser = DefinitionParser() # type: DefinitionParser
@@ -148,6 +164,7 @@ class RateLimiting:
         self.global_lock_func = None     # type: LockManager
         self.sql_session_func = None     # type: callable_
         self.cluster_id = None           # type: int
+        self.host_store = None           # type: SharedRateLimitStore | None
 
 # ################################################################################################################################
 
@@ -162,7 +179,28 @@ class RateLimiting:
 
 # ################################################################################################################################
 
-    def _create_config(self, object_dict:'strdict', definition:'str', is_exact:'bool') -> 'BaseLimiter':
+    def _create_limiter(self, object_name:'str', is_exact:'bool', is_host:'bool') -> 'BaseLimiter':
+
+        if is_exact:
+            return Exact(self.cluster_id, self.sql_session_func)
+
+        if is_host:
+
+            # Shared memory may be unavailable, e.g. under Windows, in which case each process keeps its own limits ..
+            if not self.host_store:
+                logger.warning('Host rate limits not available, using approximate ones for `%s`', object_name)
+
+            # .. otherwise, we can use it, possibly opening it first, if this is the first such limiter.
+            else:
+                if not self.host_store.is_open:
+                    self.host_store.open()
+                return Host(self.cluster_id, self.host_store)
+
+        return Approximate(self.cluster_id)
+
+# ################################################################################################################################
+
+    def _create_config(self, object_dict:'strdict', definition:'str', is_exact:'bool', is_host:'bool'=False) -> 'BaseLimiter':
 
         object_id = object_dict['id']
         object_type = object_dict['type_']
@@ -181,7 +219,7 @@ class RateLimiting:
         else:
             has_from_any = False
 
-        config = Exact(self.cluster_id, self.sql_session_func) if is_exact else Approximate(self.cluster_id) # type: BaseLimiter
+        config = self._create_limiter(object_name, is_exact, is_host)
         config.is_active = object_dict['is_active']
         config.is_exact = is_exact
         config.api = self
@@ -195,6 +233,7 @@ class RateLimiting:
             config.has_from_any = has_from_any
             config.from_any_rate = def_first.rate
             config.from_any_unit = def_first.unit
+            config.from_any_algorithm = def_first.algorithm
 
             config.from_any_object_id = object_id
             config.from_any_object_type = object_type
@@ -204,8 +243,8 @@ class RateLimiting:
 
 # ################################################################################################################################
 
-    def create(self, object_dict:'strdict', definition:'str', is_exact:'bool') -> 'None':
-        config = self._create_config(object_dict, definition, is_exact)
+    def create(self, object_dict:'strdict', definition:'str', is_exact:'bool', is_host:'bool'=False) -> 'None':
+        config = self._create_config(object_dict, definition, is_exact, is_host)
         self.config_store[config.get_config_key()] = config
 
 # ################################################################################################################################
@@ -220,9 +259,9 @@ class RateLimiting:
 
         # It is possible that we do not have configuration for such an object,
         # in which case we will log a warning.
+        # Each limiter acquires its own lock, if it needs one.
         if config:
-            with config.lock:
-                config.check_limit(cid, from_)
+            config.check_limit(cid, from_)
         else:
             if needs_warn:
                 logger.warning('No such rate limiting object `%s` (%s)', object_name, object_type)
@@ -280,7 +319,15 @@ class RateLimiting:
 
 # ################################################################################################################################
 
-    def edit(self, object_type:'str', old_object_name:'str', object_dict:'strdict', definition:'str', is_exact:'bool') -> 'None':
+    def edit(
+        self,
+        object_type:'str',
+        old_object_name:'str',
+        object_dict:'strdict',
+        definition:'str',
+        is_exact:'bool',
+        is_host:'bool'=False,
+    ) -> 'None':
         """ Changes, in place, an existing configuration entry to input data.
         """
 
@@ -298,7 +345,7 @@ class RateLimiting:
                     old_config.object_info.type_, object_type, old_object_name, object_dict))
 
             # Now, create a new config object ..
-            new_config = self._create_config(object_dict, definition, is_exact)
+            new_config = self._create_config(object_dict, definition, is_exact, is_host)
 
             # .. in case it was a rename ..
             if old_config.object_info.name != new_config.object_info.name:
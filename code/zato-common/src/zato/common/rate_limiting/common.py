@@ -37,10 +37,130 @@ class Const:
         hour   = 'h'
         day    = 'd'
 
+    class Algorithm:
+        fixed_window   = 'fixed-window'
+        sliding_window = 'sliding-window'
+        token_bucket   = 'token-bucket'
+
     @staticmethod
     def all_units() -> 'strset':
         return {Const.Unit.minute, Const.Unit.hour, Const.Unit.day}
 
+    @staticmethod
+    def all_algorithms() -> 'strset':
+        return {Const.Algorithm.fixed_window, Const.Algorithm.sliding_window, Const.Algorithm.token_bucket}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _NetworkNode:
+    """ A node of NetworkTree, i.e. the top length bits of a network's address, and the item stored for that network, if any.
+    """
+    __slots__ = 'prefix', 'length', 'item', 'children'
+
+    def __init__(self, prefix:'int', length:'int') -> 'None':
+        self.prefix = prefix
+        self.length = length
+        self.item = None # type: any_
+        self.children = [None, None] # type: list[_NetworkNode | None]
+
+# ################################################################################################################################
+
+class NetworkTree:
+    """ A path-compressed binary radix (Patricia) tree of networks of a single IP version, with addresses and networks
+    represented as integers. Each lookup visits at most one node per distinct prefix on the path to an address
+    and returns the smallest of the items stored for networks containing that address.
+    """
+    def __init__(self, bits:'int') -> 'None':
+
+        # 32 for IPv4 and 128 for IPv6
+        self.bits = bits
+
+        # The root matches all addresses
+        self.root = _NetworkNode(0, 0)
+
+# ################################################################################################################################
+
+    def _get_top_bits(self, value:'int', length:'int') -> 'int':
+        return value >> (self.bits - length)
+
+# ################################################################################################################################
+
+    def _get_bit(self, value:'int', position:'int') -> 'int':
+        return (value >> (self.bits - position - 1)) & 1
+
+# ################################################################################################################################
+
+    def insert(self, network:'int', prefix_length:'int', item:'any_') -> 'None':
+        """ Stores an item for a network, given as its first address and prefix length,
+        unless a smaller one is already stored for the same network.
+        """
+        node = self.root
+
+        while True:
+
+            # We are at the network's own node ..
+            if node.length == prefix_length:
+                if node.item is None or item < node.item:
+                    node.item = item
+                return
+
+            bit = self._get_bit(network, node.length)
+            child = node.children[bit]
+
+            # .. there is nothing below this node on the network's side yet ..
+            if child is None:
+                new_node = _NetworkNode(self._get_top_bits(network, prefix_length), prefix_length)
+                new_node.item = item
+                node.children[bit] = new_node
+                return
+
+            # .. find how many of the top bits the network and the child have in common ..
+            max_length = min(child.length, prefix_length)
+            child_top_bits = child.prefix >> (child.length - max_length)
+            diff = child_top_bits ^ self._get_top_bits(network, max_length)
+            common_length = max_length - diff.bit_length()
+
+            # .. the child is a supernet of the network so we go down ..
+            if common_length == child.length:
+                node = child
+                continue
+
+            # .. otherwise, the child and the network diverge, or the child is a subnet of the network,
+            # .. so we insert a node for their common prefix between the current node and the child.
+            split_node = _NetworkNode(self._get_top_bits(network, common_length), common_length)
+            split_node.children[(child.prefix >> (child.length - common_length - 1)) & 1] = child
+            node.children[bit] = split_node
+            node = split_node
+
+# ################################################################################################################################
+
+    def lookup(self, address:'int') -> 'any_':
+        """ Returns the smallest of the items stored for networks containing the address, or None if there are none.
+        """
+        bits = self.bits
+        node = self.root
+        out = None
+
+        while node:
+
+            length = node.length
+
+            # This node's network does not contain the address so none of the ones below it will
+            if length and (address >> (bits - length)) != node.prefix:
+                break
+
+            item = node.item
+            if item is not None and (out is None or item < out):
+                out = item
+
+            if length == bits:
+                break
+
+            node = node.children[(address >> (bits - length - 1)) & 1]
+
+        return out
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -57,19 +177,20 @@ class ObjectInfo:
 # ################################################################################################################################
 
 class DefinitionItem:
-    __slots__ = 'config_line', 'from_', 'rate', 'unit', 'object_id', 'object_type', 'object_name'
+    __slots__ = 'config_line', 'from_', 'rate', 'unit', 'algorithm', 'object_id', 'object_type', 'object_name'
 
     config_line:'int'
     from_:'any_'
     rate:'int'
     unit:'str'
+    algorithm:'str'
     object_id:'int'
     object_type:'str'
     object_name:'str'
 
     def __repr__(self) -> 'str':
-        return '<{} at {}; line:{}, from:{}, rate:{}, unit:{} ({} {} {})>'.format(
-            self.__class__.__name__, hex(id(self)), self.config_line, self.from_, self.rate, self.unit,
+        return '<{} at {}; line:{}, from:{}, rate:{}, unit:{}, algorithm:{} ({} {} {})>'.format(
+            self.__class__.__name__, hex(id(self)), self.config_line, self.from_, self.rate, self.unit, self.algorithm,
             self.object_id, self.object_name, self.object_type)
 
 # ################################################################################################################################
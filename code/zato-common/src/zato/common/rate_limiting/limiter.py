@@ -7,9 +7,11 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections import OrderedDict
 from contextlib import closing
 from copy import deepcopy
 from datetime import datetime
+from time import monotonic_ns, time
 
 # gevent
 from gevent.lock import RLock
@@ -20,7 +22,7 @@ from netaddr import IPAddress
 # Zato
 from zato.common.odb.model import RateLimitState
 from zato.common.odb.query.rate_limiting import current_period_list, current_state as current_state_query
-from zato.common.rate_limiting.common import Const, AddressNotAllowed, RateLimitReached
+from zato.common.rate_limiting.common import Const, AddressNotAllowed, NetworkTree, RateLimitReached
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -28,6 +30,7 @@ from zato.common.rate_limiting.common import Const, AddressNotAllowed, RateLimit
 if 0:
     from zato.common.rate_limiting import Approximate as RateLimiterApproximate, RateLimiting
     from zato.common.rate_limiting.common import DefinitionItem, ObjectInfo
+    from zato.common.rate_limiting.shmem import SharedRateLimitStore
     from zato.common.typing_ import any_, callable_, commondict, strcalldict, strdict, strlist
 
     # For pyflakes
@@ -35,6 +38,7 @@ if 0:
     ObjectInfo = ObjectInfo
     RateLimiterApproximate = RateLimiterApproximate
     RateLimiting = RateLimiting
+    SharedRateLimitStore = SharedRateLimitStore
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -42,6 +46,130 @@ if 0:
 RateLimitStateTable  = RateLimitState.__table__
 RateLimitStateDelete = RateLimitStateTable.delete
 
+# How many seconds there are in each unit that periods are counted in
+unit_seconds = {
+    Const.Unit.minute: 60,
+    Const.Unit.hour: 60 * 60,
+    Const.Unit.day: 60 * 60 * 24,
+}
+
+# The same in nanoseconds
+unit_ns = {unit: seconds * 1_000_000_000 for unit, seconds in unit_seconds.items()}
+
+# The highest rate per second that definitions may use. A request takes at least a thousand tokens
+# from a shared bucket then, which keeps the rounding in get_shared_token_cost below 0.1%.
+max_rate_per_second = 1_000_000
+
+# The same for each unit
+max_rate = {unit: seconds * max_rate_per_second for unit, seconds in unit_seconds.items()}
+
+# How many bits there are in addresses of each IP version
+ip_version_bits = {
+    4: 32,
+    6: 128,
+}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def token_bucket_step(now:'int', tokens:'int', last_refill:'int', rate:'int', unit_length:'int') -> 'tuple[int, int, bool]':
+    """ A bucket holds at most rate tokens and it is refilled at rate tokens per unit. Each request takes one token.
+    Tokens are kept multiplied by the unit's length in nanoseconds so that refilling them requires no division.
+    Returns the new number of tokens, the new refill time and whether the request is allowed.
+    """
+    capacity = rate * unit_length
+
+    # New buckets start full ..
+    if not last_refill:
+        tokens = capacity
+
+    # .. otherwise, add tokens for the time since the last refill ..
+    else:
+        tokens += (now - last_refill) * rate
+        if tokens > capacity:
+            tokens = capacity
+
+    # .. and we may not have enough for this request ..
+    if tokens < unit_length:
+        return tokens, now, False
+
+    # .. but if we do, take one.
+    return tokens - unit_length, now, True
+
+# ################################################################################################################################
+
+def sliding_window_step(
+    now:'int',
+    window_no:'int',
+    current:'int',
+    previous:'int',
+    rate:'int',
+    unit_length:'int',
+) -> 'tuple[int, int, int, bool]':
+    """ Requests are counted in fixed windows, one unit long each, but the count from the previous window is added
+    in proportion to how much of it is still within one unit of the current time. Returns the new window number,
+    requests in this and in the previous window, and whether the request is allowed.
+    """
+    now_window_no, window_offset = divmod(now, unit_length)
+
+    # This is the first request in a new window
+    if now_window_no != window_no:
+        previous = current if window_no == now_window_no - 1 else 0
+        current = 0
+        window_no = now_window_no
+
+    # Both sides are multiplied by the unit's length, which lets us compare them using integers only
+    if previous * (unit_length - window_offset) + current * unit_length >= rate * unit_length:
+        return window_no, current, previous, False
+
+    return window_no, current + 1, previous, True
+
+# ################################################################################################################################
+
+def _shared_fixed_window(now:'int', period_no:'int', requests:'int', _ignored:'int', current_period_no:'int',
+    rate:'int') -> 'tuple[int, int, int, bool]':
+
+    if period_no != current_period_no:
+        period_no = current_period_no
+        requests = 0
+
+    if requests >= rate:
+        return period_no, requests, 0, False
+
+    return period_no, requests + 1, 0, True
+
+def _shared_token_bucket(now:'int', tokens:'int', last_refill:'int', _ignored:'int', token_cost:'int',
+    unit_length:'int') -> 'tuple[int, int, int, bool]':
+    """ The same as token_bucket_step but with tokens divided by the rate, which means that the bucket is refilled
+    at one token per nanosecond, it holds at most unit_length of them and each request takes token_cost of them.
+    Unlike in token_bucket_step, the values do not grow with the rate so they always fit in a slot of a shared store.
+    """
+    # New buckets start full ..
+    if not last_refill:
+        tokens = unit_length
+
+    # .. otherwise, add tokens for the time since the last refill ..
+    else:
+        tokens += now - last_refill
+        if tokens > unit_length:
+            tokens = unit_length
+
+    # .. and we may not have enough for this request ..
+    if tokens < token_cost:
+        return tokens, now, 0, False
+
+    # .. but if we do, take one.
+    return tokens - token_cost, now, 0, True
+
+def get_shared_token_cost(rate:'int', unit_length:'int') -> 'int':
+    """ Returns how many tokens a request takes from a shared bucket. The remainder of the division is ignored,
+    which means that, for rates that do not divide the unit's length, slightly more requests than the rate may be let in.
+    """
+    # If no requests are allowed at all, the cost is more than a full bucket holds
+    return unit_length // rate if rate > 0 else unit_length + 1
+
+_shared_sliding_window = sliding_window_step
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -52,7 +180,8 @@ class BaseLimiter:
     __slots__ = 'current_idx', 'lock', 'api', 'object_info', 'definition', 'has_from_any', 'from_any_rate', 'from_any_unit', \
         'is_limit_reached', 'ip_address_cache', 'current_period_func', 'by_period', 'parent_type', 'parent_name', \
         'is_exact', 'from_any_object_id', 'from_any_object_type', 'from_any_object_name', 'cluster_id', 'is_active', \
-        'invocation_no'
+        'invocation_no', 'network_tree', 'ip_address_cache_max_size', 'from_any_algorithm', 'algorithm_func', \
+        'algorithm_state'
 
     api:'RateLimiting'
     object_info:'ObjectInfo'
@@ -60,13 +189,18 @@ class BaseLimiter:
     has_from_any:'bool'
     from_any_rate:'int'
     from_any_unit:'str'
+    from_any_algorithm:'str'
     parent_type:'str'
     parent_name:'str'
     is_exact:'bool'
     invocation_no:'int'
 
-    ip_address_cache:'strdict'
+    ip_address_cache:'OrderedDict'
+    ip_address_cache_max_size:'int'
+    network_tree:'strdict'
     by_period:'strdict'
+    algorithm_func:'strcalldict'
+    algorithm_state:'dict'
 
     from_any_object_id:'int'
     from_any_object_type:'str'
@@ -85,9 +219,19 @@ class BaseLimiter:
         self.is_active = False
         self.current_idx = 0
         self.lock = RLock()
-        self.ip_address_cache = {}
+        self.ip_address_cache = OrderedDict()
+        self.ip_address_cache_max_size = 10_000
+        self.network_tree = None
         self.by_period = {}
+
+        # Maps algorithms other than fixed windows to functions implementing them. Exact limiters do not support any,
+        # so definitions using other algorithms fall back to fixed windows in their case.
+        self.algorithm_func = {}
+
+        # Maps networks found to the current state of the algorithm used for each
+        self.algorithm_state = {}
         self.is_exact = False
+        self.has_from_any = False
         self.invocation_no = 0
 
         self.current_period_func:'strcalldict' = {
@@ -109,31 +253,26 @@ class BaseLimiter:
         """
         with self.lock:
 
-            # First, periodically clear out the IP cache to limit its size to 1,000 items
-            if len(self.ip_address_cache) >= 1000:
-                self.ip_address_cache.clear()
-
-            now = datetime.utcnow()
-            current_minute = self._get_current_minute(now)
-            current_hour = self._get_current_hour(now)
-            current_day = self._get_current_day(now)
+            now = int(time())
 
             # We need a copy so as not to modify the dict in place
             periods = self._get_current_periods()
             to_delete = set()
 
-            current_periods_map = {
-                Const.Unit.minute: current_minute,
-                Const.Unit.hour: current_hour,
-                Const.Unit.day: current_day
-            }
-
             for period in periods: # type: str
                 period_unit = period[0] # type: str # One of Const.Unit instances
-                current_period = current_periods_map[period_unit]
+
+                # Periods are compared as numbers because the number of digits in each may differ ..
+                try:
+                    period_no = int(period[2:])
+
+                # .. and periods from previous versions, in the %Y-%m-%d format, can always be deleted.
+                except ValueError:
+                    to_delete.add(period)
+                    continue
 
                 # If this period is in the past, add it to the ones to be deleted
-                if period < current_period:
+                if period_no < now // unit_seconds[period_unit]:
                     to_delete.add(period)
 
             if to_delete:
@@ -150,6 +289,9 @@ class BaseLimiter:
         self.by_period.clear()
         self.by_period.update(old_config.by_period)
 
+        self.algorithm_state.clear()
+        self.algorithm_state.update(old_config.algorithm_state)
+
 # ################################################################################################################################
 
     def get_config_key(self) -> 'str':
@@ -158,44 +300,86 @@ class BaseLimiter:
 
 # ################################################################################################################################
 
-    def _get_rate_config_by_from(self, orig_from, _from_any=Const.from_any) -> 'DefinitionItem':
-        # type: (str, str) -> DefinitionItem
+    def _build_network_tree(self, _from_any=Const.from_any) -> 'strdict':
+        """ Builds a tree of all the networks from configuration, for each IP version, plus the position of the first
+        catch-all * line, if there is any. Each network is stored along with its position so that, like in configuration,
+        the first line matching an address is the one used.
+        """
+        out = {
+            _from_any: None,
+        } # type: strdict
 
-        from_ = self.ip_address_cache.setdefault(orig_from, IPAddress(orig_from)) # type: IPAddress
-        found = None
+        for ip_version, bits in ip_version_bits.items():
+            out[ip_version] = NetworkTree(bits)
 
-        for line in self.definition: # type: DefinitionItem
+        for idx, line in enumerate(self.definition): # type: int, DefinitionItem
 
-            # A catch-all * pattern
+            # A catch-all * pattern, nothing after it will ever be used
             if line.from_ == _from_any:
-                found = line
+                out[_from_any] = (idx, line)
                 break
 
-            # A network match
-            elif from_ in line.from_:
-                found = line
-                break
+            # A network
+            else:
+                tree = out[line.from_.version] # type: NetworkTree
+                tree.insert(line.from_.first, line.from_.prefixlen, (idx, line))
+
+        return out
+
+# ################################################################################################################################
+
+    def _get_rate_config_by_from(self, orig_from, _from_any=Const.from_any) -> 'DefinitionItem':
+        # type: (str, str) -> DefinitionItem
+
+        # We may have already seen this address ..
+        found = self.ip_address_cache.get(orig_from)
+
+        if found:
+            self.ip_address_cache.move_to_end(orig_from)
+            return found
+
+        # .. if not, look it up now ..
+        if self.network_tree is None:
+            self.network_tree = self._build_network_tree()
+
+        from_ = IPAddress(orig_from)
+        tree = self.network_tree[from_.version] # type: NetworkTree
+        by_network = tree.lookup(from_.value)
+        by_from_any = self.network_tree[_from_any]
+
+        # .. whichever line comes first in configuration wins ..
+        if by_network and by_from_any:
+            found = min(by_network, by_from_any)[1]
+        elif by_network or by_from_any:
+            found = (by_network or by_from_any)[1]
 
         # We did not match any line from configuration
         if not found:
             raise AddressNotAllowed('Address not allowed `{}`'.format(orig_from))
 
+        # .. cache the match, keeping only the most recently used addresses ..
+        self.ip_address_cache[orig_from] = found
+        if len(self.ip_address_cache) > self.ip_address_cache_max_size:
+            _ = self.ip_address_cache.popitem(last=False)
+
         # We found a matching piece of from IP configuration
         return found
 
 # ################################################################################################################################
 
-    def _get_current_day(self, now, _prefix=Const.Unit.day, _format='%Y-%m-%d') -> 'str':
-        # type: (datetime, str, str) -> str
-        return '{}.{}'.format(_prefix, now.strftime(_format))
+    # Periods are numbers of whole days, hours or minutes since the Unix epoch, e.g. d.20742, h.497808 or m.29868480
+
+    def _get_current_day(self, now, _prefix=Const.Unit.day, _seconds=unit_seconds[Const.Unit.day]) -> 'str':
+        # type: (int, str, int) -> str
+        return '{}.{}'.format(_prefix, now // _seconds)
 
-    def _get_current_hour(self, now, _prefix=Const.Unit.hour, _format='%Y-%m-%dT%H') -> 'str':
-        # type: (datetime, str, str) -> str
-        return '{}.{}'.format(_prefix, now.strftime(_format))
+    def _get_current_hour(self, now, _prefix=Const.Unit.hour, _seconds=unit_seconds[Const.Unit.hour]) -> 'str':
+        # type: (int, str, int) -> str
+        return '{}.{}'.format(_prefix, now // _seconds)
 
-    def _get_current_minute(self, now, _prefix=Const.Unit.minute, _format='%Y-%m-%dT%H:%M') -> 'str':
-        # type: (datetime, str, str) -> str
-        return '{}.{}'.format(_prefix, now.strftime(_format))
+    def _get_current_minute(self, now, _prefix=Const.Unit.minute, _seconds=unit_seconds[Const.Unit.minute]) -> 'str':
+        # type: (int, str, int) -> str
+        return '{}.{}'.format(_prefix, now // _seconds)
 
 # ################################################################################################################################
 
@@ -214,21 +398,33 @@ class BaseLimiter:
             rate, unit, orig_from, network_found, self._format_last_info(current_state), cid, def_object_id, def_object_type,
             def_object_name))
 
+# ################################################################################################################################
+
+    def _raise_algorithm_limit_exceeded(self, rate, unit, orig_from, network_found, cid,
+            def_object_id, def_object_name, def_object_type) -> 'None':
+
+        # We do not keep information about previous requests for algorithms other than fixed windows
+        current_state = dict(self.initial_state)
+
+        self._raise_rate_limit_exceeded(rate, unit, orig_from, network_found, current_state, cid,
+            def_object_id, def_object_name, def_object_type)
+
 # ################################################################################################################################
 
     def _check_limit(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
-        _rate_any=Const.rate_any, _utcnow=datetime.utcnow) -> 'None':
+        _rate_any=Const.rate_any, _time=time, _utcfromtimestamp=datetime.utcfromtimestamp) -> 'None':
         # type: (str, str, str, int, str, str, object, str, str)
 
         # Increase invocation counter
         self.invocation_no += 1
 
         # Local aliases
-        now = _utcnow()
+        now_timestamp = _time()
+        now = _utcfromtimestamp(now_timestamp)
 
         # Get current period, e.g. current day, hour or minute
         current_period_func = self.current_period_func[unit]
-        current_period = current_period_func(now)
+        current_period = current_period_func(int(now_timestamp))
         current_state = self._get_current_state(current_period, network_found)
 
         # Unless we are allowed to have any rate ..
@@ -256,26 +452,41 @@ class BaseLimiter:
     def check_limit(self, cid, orig_from) -> 'None':
         # type: (str, str)
 
-        with self.lock:
-
-            if self.has_from_any:
-                rate = self.from_any_rate
-                unit = self.from_any_unit
-                network_found = Const.from_any
-                def_object_id = None
-                def_object_type = None
-                def_object_name = None
-            else:
-                found = self._get_rate_config_by_from(orig_from)
-                rate = found.rate
-                unit = found.unit
-                network_found = found.from_
-                def_object_id = found.object_id
-                def_object_type = found.object_type
-                def_object_name = found.object_name
-
-            # Now, check actual rate limits
-            self._check_limit(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type)
+        # Note that nothing here switches greenlets so we need the lock only when checking fixed windows,
+        # because these may need to access the ODB.
+
+        if self.has_from_any:
+            rate = self.from_any_rate
+            unit = self.from_any_unit
+            algorithm = self.from_any_algorithm
+            network_found = Const.from_any
+            def_object_id = None
+            def_object_type = None
+            def_object_name = None
+        else:
+            found = self._get_rate_config_by_from(orig_from)
+            rate = found.rate
+            unit = found.unit
+            algorithm = found.algorithm
+            network_found = found.from_
+            def_object_id = found.object_id
+            def_object_type = found.object_type
+            def_object_name = found.object_name
+
+        # Now, check actual rate limits, either using one of the algorithms that need only the current time ..
+        algorithm_func = self.algorithm_func.get(algorithm)
+
+        if algorithm_func:
+            algorithm_func(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type)
+
+            # Our own limit was not reached but a parent may still want to check its own one.
+            if self.has_parent:
+                self.api.check_limit(cid, self.parent_type, self.parent_name, orig_from)
+
+        # .. or using fixed windows.
+        else:
+            with self.lock:
+                self._check_limit(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type)
 
 # ################################################################################################################################
 
@@ -289,6 +500,54 @@ class BaseLimiter:
 
 class Approximate(BaseLimiter):
 
+    def __init__(self, cluster_id:'int') -> 'None':
+        super(Approximate, self).__init__(cluster_id)
+
+        self.algorithm_func.update({
+            Const.Algorithm.sliding_window: self._check_sliding_window,
+            Const.Algorithm.token_bucket: self._check_token_bucket,
+        })
+
+
+# ################################################################################################################################
+
+    def _check_token_bucket(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        _monotonic_ns=monotonic_ns, _unit_ns=unit_ns) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, str)
+
+        # A list of [tokens, last refill time]
+        state = self.algorithm_state.get(network_found)
+        if state is None:
+            state = [0, 0]
+            self.algorithm_state[network_found] = state
+
+        state[0], state[1], is_allowed = token_bucket_step(_monotonic_ns(), state[0], state[1], rate, _unit_ns[unit])
+
+        if not is_allowed:
+            self._raise_algorithm_limit_exceeded(rate, unit, orig_from, network_found, cid,
+                def_object_id, def_object_name, def_object_type)
+
+# ################################################################################################################################
+
+    def _check_sliding_window(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        _monotonic_ns=monotonic_ns, _unit_ns=unit_ns) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, str)
+
+        # A list of [window number, requests in this window, requests in the previous window]
+        state = self.algorithm_state.get(network_found)
+        if state is None:
+            state = [0, 0, 0]
+            self.algorithm_state[network_found] = state
+
+        state[0], state[1], state[2], is_allowed = sliding_window_step(
+            _monotonic_ns(), state[0], state[1], state[2], rate, _unit_ns[unit])
+
+        if not is_allowed:
+            self._raise_algorithm_limit_exceeded(rate, unit, orig_from, network_found, cid,
+                def_object_id, def_object_name, def_object_type)
+
+# ################################################################################################################################
+
     def _get_current_periods(self) -> 'strlist':
         return list(self.by_period.keys())
 
@@ -321,6 +580,103 @@ class Approximate(BaseLimiter):
 # ################################################################################################################################
 # ################################################################################################################################
 
+class Host(BaseLimiter):
+    """ A limiter whose state is kept in shared memory, updated by all the processes of a server, which makes its limits
+    exact for the whole of a host rather than for each process. All algorithms are supported.
+    """
+    def __init__(self, cluster_id:'int', store:'SharedRateLimitStore') -> 'None':
+        super(Host, self).__init__(cluster_id)
+        self.store = store
+
+        # Maps networks found to keys of their state in the store
+        self.store_keys = {}
+
+        self.algorithm_func.update({
+            Const.Algorithm.fixed_window: self._check_fixed_window,
+            Const.Algorithm.sliding_window: self._check_sliding_window,
+            Const.Algorithm.token_bucket: self._check_token_bucket,
+        })
+
+# ################################################################################################################################
+
+    def _get_store_key(self, network_found:'any_', unit:'str') -> 'str':
+        key = self.store_keys.get(network_found)
+        if not key:
+            key = '{}:{}:{}'.format(self.get_config_key(), network_found, unit)
+            self.store_keys[network_found] = key
+        return key
+
+# ################################################################################################################################
+
+    def _update_store(self, func, args, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name,
+        def_object_type) -> 'None':
+
+        key = self._get_store_key(network_found, unit)
+        is_allowed = self.store.update(key, func, *args)
+
+        if not is_allowed:
+            self._raise_algorithm_limit_exceeded(rate, unit, orig_from, network_found, cid,
+                def_object_id, def_object_name, def_object_type)
+
+# ################################################################################################################################
+
+    def _check_fixed_window(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        _rate_any=Const.rate_any, _time=time, _unit_seconds=unit_seconds) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, str)
+
+        # There is nothing to count if any rate is allowed
+        if rate == _rate_any:
+            return
+
+        # Periods are the same as with other limiters, i.e. they are based on wall-clock time
+        current_period_no = int(_time()) // _unit_seconds[unit]
+
+        self._update_store(_shared_fixed_window, (current_period_no, rate), cid, orig_from, network_found, rate, unit,
+            def_object_id, def_object_name, def_object_type)
+
+# ################################################################################################################################
+
+    def _check_token_bucket(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        _unit_ns=unit_ns) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, str)
+
+        unit_length = _unit_ns[unit]
+        token_cost = get_shared_token_cost(rate, unit_length)
+
+        self._update_store(_shared_token_bucket, (token_cost, unit_length), cid, orig_from, network_found, rate, unit,
+            def_object_id, def_object_name, def_object_type)
+
+# ################################################################################################################################
+
+    def _check_sliding_window(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        _unit_ns=unit_ns) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, str)
+
+        self._update_store(_shared_sliding_window, (rate, _unit_ns[unit]), cid, orig_from, network_found, rate, unit,
+            def_object_id, def_object_name, def_object_type)
+
+# ################################################################################################################################
+
+    def rewrite_rate_data(self, old_config) -> 'None':
+
+        # Our state is in shared memory, under keys that are the same as long as the object's name does not change
+        pass
+
+# ################################################################################################################################
+
+    def _get_current_periods(self) -> 'strlist':
+
+        # Periods are never kept in RAM and the store reuses slots that have been idle for too long
+        return []
+
+# ################################################################################################################################
+
+    def _delete_periods(self, to_delete) -> 'None':
+        pass
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class Exact(BaseLimiter):
 
     def __init__(self, cluster_id:'int', sql_session_func:'callable_') -> 'None':
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from errno import EACCES, EAGAIN
+from fcntl import lockf, LOCK_EX, LOCK_NB, LOCK_UN
+from hashlib import blake2b, sha256
+from logging import getLogger
+from mmap import mmap
+from struct import Struct
+from time import monotonic_ns
+
+try:
+    import posix_ipc as ipc
+except ImportError:
+    # Ignore it under Windows
+    pass
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, callable_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Identifies shared memory segments that have been already initialized
+    Magic = b'ZRL1'
+
+    # How many locks there are for slots, each lock protects every Num_Stripes-th slot
+    Num_Stripes = 256
+
+    # Byte offsets of locks other than the slot ones - these are only lock identifiers, not actual data
+    Lock_Allocator = Num_Stripes
+    Lock_Init      = Num_Stripes + 1
+
+    # Where slots begin
+    Slots_Offset = 64
+
+    # A slot that has not been used for that long, which is longer than any unit is, can be given to another key
+    Slot_Max_Idle_Time = 2 * 24 * 60 * 60 * 1_000_000_000 # Two days in nanoseconds
+
+    # How many slots there are by default
+    Default_Num_Slots = 65_536
+
+    # How long to wait, in seconds, before trying again to acquire a lock held by another process
+    Lock_Backoff_Min = 0.0001
+    Lock_Backoff_Max = 0.01
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Header fields and their offsets
+_magic_offset     = 0
+_num_slots_offset = 8
+
+_u64 = Struct('<Q')
+
+# key hash, last used, and three values that each algorithm interprets in its own way
+_slot = Struct('<Qqqqq')
+_slot_size = 48
+
+_stripe_mask = ModuleCtx.Num_Stripes - 1
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SharedRateLimitStoreFull(ValueError):
+    """ Raised if there are no free slots for a new key in a shared rate limiting store.
+    """
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_shmem_name(deployment_key:'str') -> 'str':
+    """ Returns a name of a shared memory segment for rate limits, the same in all the processes of a server.
+    """
+    suffix = sha256('{}.rate_limiting'.format(deployment_key).encode('utf8')).hexdigest()
+    return '/zr{}'.format(suffix)[:30]
+
+# ################################################################################################################################
+
+def _hash_key(key:'str') -> 'int':
+
+    # Zero means that a slot is free so it cannot be used by any key
+    return int.from_bytes(blake2b(key.encode('utf8'), digest_size=8).digest(), 'little') or 1
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SharedRateLimitStore:
+    """ Keeps the state of rate limits in a shared memory segment that all the processes of a server update directly.
+    Each key, e.g. an object and a network it is limited for, has a slot of three integers in an open-addressing
+    hash table. Slots are protected by POSIX record locks, with one lock per group of slots.
+
+    Slots are never deleted but one that has not been used for longer than the longest unit can be reused for another key.
+
+    Record locks are never waited for in a blocking call, which would stop the whole gevent hub. If another process holds
+    a lock, other greenlets run until it can be acquired. Greenlets of one process take turns through a gevent lock
+    because record locks belong to a process rather than to a greenlet.
+    """
+    def __init__(self, name:'str', num_slots:'int'=ModuleCtx.Default_Num_Slots) -> 'None':
+
+        self.name = name
+        self.num_slots = num_slots
+        self.size = ModuleCtx.Slots_Offset + num_slots * _slot_size
+
+        self._mem = None
+        self._mmap = None # type: mmap
+        self._fd = -1
+
+        # Maps keys to slots they were last found in
+        self._slot_cache = {}
+
+        # Record locks do not exclude greenlets of the same process from each other, this one does
+        self._process_lock = RLock()
+
+# ################################################################################################################################
+
+    @property
+    def is_open(self) -> 'bool':
+        return self._mmap is not None
+
+# ################################################################################################################################
+
+    def open(self) -> 'None':
+        """ Creates or opens the underlying shared memory segment and initializes it unless another process already has.
+        """
+        self._mem = ipc.SharedMemory(self.name, ipc.O_CREAT, size=self.size)
+        self._fd = self._mem.fd
+        self._mmap = mmap(self._fd, self.size)
+
+        self._lock(ModuleCtx.Lock_Init)
+        try:
+            if self._mmap[:4] != ModuleCtx.Magic:
+                self._mmap[:] = bytes(self.size)
+                _u64.pack_into(self._mmap, _num_slots_offset, self.num_slots)
+
+                # This goes last to indicate that the segment is ready to use
+                self._mmap[:4] = ModuleCtx.Magic
+            else:
+                self.num_slots = _u64.unpack_from(self._mmap, _num_slots_offset)[0]
+        finally:
+            self._unlock(ModuleCtx.Lock_Init)
+
+        logger.info('Opened shared rate limiting store `%s` (%s bytes, slots:%s)', self.name, self.size, self.num_slots)
+
+# ################################################################################################################################
+
+    def close(self, needs_unlink:'bool'=False) -> 'None':
+        """ Closes the underlying shared memory segment and, optionally, deletes it.
+        """
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+            self._mem.close_fd()
+
+            if needs_unlink:
+                try:
+                    self._mem.unlink()
+                except ipc.ExistentialError:
+                    pass
+
+# ################################################################################################################################
+
+    def _lock(self, start:'int') -> 'None':
+
+        # This is reentrant, so nested record locks are acquired under the same one
+        _ = self._process_lock.acquire()
+
+        try:
+            self._lock_record(start)
+        except BaseException:
+            self._process_lock.release()
+            raise
+
+    def _lock_record(self, start:'int') -> 'None':
+
+        backoff = 0.0
+
+        while True:
+            try:
+                lockf(self._fd, LOCK_EX | LOCK_NB, 1, start)
+            except OSError as e:
+                if e.errno not in (EACCES, EAGAIN):
+                    raise
+            else:
+                return
+
+            # Another process holds the lock so we let other greenlets run before trying again
+            sleep(backoff)
+            backoff = min(backoff * 2 or ModuleCtx.Lock_Backoff_Min, ModuleCtx.Lock_Backoff_Max)
+
+    def _unlock(self, start:'int') -> 'None':
+        try:
+            lockf(self._fd, LOCK_UN, 1, start)
+        finally:
+            self._process_lock.release()
+
+# ################################################################################################################################
+
+    def _get_slot_offset(self, slot_idx:'int') -> 'int':
+        return ModuleCtx.Slots_Offset + slot_idx * _slot_size
+
+# ################################################################################################################################
+
+    def _find_slot(self, key:'str', key_hash:'int', now:'int') -> 'int':
+        """ Returns the slot that a key is stored in, giving it a free one if it does not have any yet.
+        """
+        mm = self._mmap
+        num_slots = self.num_slots
+        slot_idx = key_hash % num_slots
+
+        # The first slot that could be reused if the key is not found
+        reusable_idx = -1
+
+        self._lock(ModuleCtx.Lock_Allocator)
+
+        try:
+            for _x in range(num_slots):
+
+                slot_hash, last_used, _, _, _ = _slot.unpack_from(mm, self._get_slot_offset(slot_idx))
+
+                # We have found our key ..
+                if slot_hash == key_hash:
+                    self._slot_cache[key] = slot_idx
+                    return slot_idx
+
+                # .. a free slot means that the key is not stored anywhere after it ..
+                if not slot_hash:
+                    if reusable_idx < 0:
+                        reusable_idx = slot_idx
+                    break
+
+                # .. but we need to keep looking if this is only an idle one.
+                if reusable_idx < 0 and now - last_used > ModuleCtx.Slot_Max_Idle_Time:
+                    reusable_idx = slot_idx
+
+                slot_idx = (slot_idx + 1) % num_slots
+
+            if reusable_idx < 0:
+                raise SharedRateLimitStoreFull('Shared rate limiting store `{}` is full ({} slots)'.format(
+                    self.name, num_slots))
+
+            # The slot's lock needs to be held too because another process may still be using it for another key
+            slot_lock = reusable_idx & _stripe_mask
+            self._lock(slot_lock)
+            try:
+                _slot.pack_into(mm, self._get_slot_offset(reusable_idx), key_hash, now, 0, 0, 0)
+            finally:
+                self._unlock(slot_lock)
+
+            self._slot_cache[key] = reusable_idx
+            return reusable_idx
+
+        finally:
+            self._unlock(ModuleCtx.Lock_Allocator)
+
+# ################################################################################################################################
+
+    def update(self, key:'str', func:'callable_', *args:'any_') -> 'any_':
+        """ Calls func with the current time, the three values stored for a key and extra arguments. The function returns
+        new values to store and a result that is returned to our caller. New keys start with all values set to zero.
+        """
+        mm = self._mmap
+        key_hash = _hash_key(key)
+        now = monotonic_ns()
+
+        slot_idx = self._slot_cache.get(key)
+        if slot_idx is None:
+            slot_idx = self._find_slot(key, key_hash, now)
+
+        while True:
+
+            slot_lock = slot_idx & _stripe_mask
+            offset = self._get_slot_offset(slot_idx)
+
+            self._lock(slot_lock)
+            try:
+                slot_hash, _, value1, value2, value3 = _slot.unpack_from(mm, offset)
+
+                # The slot is still ours so we can update it ..
+                if slot_hash == key_hash:
+                    value1, value2, value3, result = func(now, value1, value2, value3, *args)
+                    _slot.pack_into(mm, offset, key_hash, now, value1, value2, value3)
+                    return result
+
+            finally:
+                self._unlock(slot_lock)
+
+            # .. otherwise, it was idle for so long that another key took it over, so we need to find a new one.
+            slot_idx = self._find_slot(key, key_hash, now)
+
+# ################################################################################################################################
+# ################################################################################################################################
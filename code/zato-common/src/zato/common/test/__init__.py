@@ -350,6 +350,9 @@ class TestServiceStore:
     def new_instance(self, impl_name, is_active=True):
         return self.impl_name_to_service[impl_name](), is_active
 
+    def release_instance(self, service):
+        pass
+
 # ################################################################################################################################
 # ################################################################################################################################
 
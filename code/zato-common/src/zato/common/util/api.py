@@ -183,6 +183,7 @@ wait_until_port_taken = wait_until_port_taken
 
 class ModuleCtx:
     PID_To_Port_Pattern = 'zato-ipc-port-{cluster_name}-{server_name}-{pid}.txt'
+    PID_To_Socket_Pattern = 'zato-ipc-{cluster_name}-{server_name}-{pid}.sock'
 
 # ################################################################################################################################
 
@@ -2101,6 +2102,23 @@ def load_ipc_pid_port(cluster_name:'str', server_name:'str', pid:'int') -> 'int'
 
 # ################################################################################################################################
 
+def get_ipc_pid_socket_path(cluster_name:'str', server_name:'str', pid:'int') -> 'str':
+
+    # This is the name of the Unix socket file ..
+    file_name = ModuleCtx.PID_To_Socket_Pattern.format(
+        cluster_name=cluster_name,
+        server_name=server_name,
+        pid=pid,
+    )
+
+    # .. make sure the name is safe to use in the file-system ..
+    file_name = fs_safe_name(file_name)
+
+    # .. and return its full path in a temporary directory, where the port files are also kept.
+    return os.path.join(gettempdir(), file_name)
+
+# ################################################################################################################################
+
 def make_list_from_string_list(value:'str', separator:'str') -> 'strlist':
 
     value = value.split(separator) # type: ignore
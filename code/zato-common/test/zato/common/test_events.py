@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from random import Random
+from unittest import main, TestCase
+
+# Zato
+from zato.common.events.client import Client
+from zato.common.events.common import Action, EventInfo, get_batch_size, pack_events, PushCtx, unpack_events
+from zato.common.events.histogram import LatencyHistogram, ServiceLatency
+from zato.common.events.receiver import Receiver
+from zato.common.util.json_ import json_loads
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_ctx(service_name:'str', total_time_ms:'int', is_request:'bool'=False) -> 'PushCtx':
+
+    ctx = PushCtx()
+    ctx.id = 'id.{}'.format(total_time_ms)
+    ctx.cid = 'cid.{}'.format(total_time_ms)
+    ctx.timestamp = '2023-01-02T03:04:05.678'
+    ctx.event_type = EventInfo.EventType.service_request if is_request else EventInfo.EventType.service_response
+    ctx.object_type = EventInfo.CommonObject.service
+    ctx.object_id = service_name
+    ctx.total_time_ms = total_time_ms
+
+    return ctx
+
+class _Socket:
+
+    def __init__(self) -> 'None':
+        self.sent = []
+
+    def sendall(self, data:'bytes') -> 'None':
+        self.sent.append(data)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PackEventsTestCase(TestCase):
+
+    def test_pack_unpack(self):
+
+        ctx1 = get_ctx('my.service.1', 123)
+        ctx2 = get_ctx('my.service.ąę\n', 0, True)
+        ctx2.total_time_ms = None
+        ctx2.source_id = 'my.source'
+
+        data = pack_events([ctx1, ctx2])
+
+        # Data that follows a batch is ignored
+        result = unpack_events(data + b'\n')
+
+        self.assertEqual(len(result), 2)
+
+        for expected, given in zip([ctx1, ctx2], result):
+            for name in ('id', 'cid', 'timestamp', 'event_type', 'object_type', 'object_id', 'total_time_ms',
+                'source_type', 'source_id', 'recipient_type', 'recipient_id'):
+                self.assertEqual(getattr(given, name, None), getattr(expected, name, None), name)
+
+# ################################################################################################################################
+
+    def test_incomplete_batch(self):
+
+        data = pack_events([get_ctx('my.service', 123)])
+
+        with self.assertRaises(ValueError):
+            _ = unpack_events(data[:-1])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LatencyHistogramTestCase(TestCase):
+
+    def test_percentiles_approximate(self):
+
+        random = Random(123)
+        values = [int(random.lognormvariate(4, 1.5)) for _x in range(20_000)]
+
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+
+        values.sort()
+
+        self.assertEqual(histogram.count, len(values))
+        self.assertEqual(histogram.min, values[0])
+        self.assertEqual(histogram.max, values[-1])
+
+        for percentile in (50, 90, 99, 99.9):
+            expected = values[int(percentile / 100 * len(values)) - 1]
+            given = histogram.get_percentile(percentile)
+            self.assertLessEqual(abs(given - expected), max(expected * 0.04, 1), percentile)
+
+# ################################################################################################################################
+
+    def test_merge(self):
+
+        histogram1 = LatencyHistogram()
+        histogram2 = LatencyHistogram()
+
+        for value in range(100):
+            histogram1.record(value)
+            histogram2.record(value + 1000)
+
+        histogram1.merge(histogram2)
+
+        self.assertEqual(histogram1.count, 200)
+        self.assertEqual(histogram1.min, 0)
+        self.assertEqual(histogram1.max, 1099)
+        self.assertEqual(histogram1.get_percentile(50), 99)
+
+# ################################################################################################################################
+
+    def test_service_latency(self):
+
+        latency = ServiceLatency()
+        latency.add_events([
+            get_ctx('my.service.1', 10),
+            get_ctx('my.service.1', 20),
+            get_ctx('my.service.1', 999, is_request=True),
+            get_ctx('my.service.2', 30),
+        ])
+
+        table = latency.get_table()
+
+        self.assertEqual(len(table), 2)
+
+        self.assertEqual(table[0]['name'], 'my.service.1')
+        self.assertEqual(table[0]['count'], 2)
+        self.assertEqual(table[0]['max'], 20)
+        self.assertEqual(table[0]['mean'], 15)
+
+        self.assertEqual(table[1]['name'], 'my.service.2')
+        self.assertEqual(table[1]['p99'], 30)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ReceiverTestCase(TestCase):
+
+    def test_receive_from_client(self):
+
+        client = Client('localhost', 0)
+        client.socket = _Socket() # type: ignore
+
+        # Batches are binary so they may contain newlines anywhere ..
+        batch = [get_ctx('my.service.\n', time) for time in (10, 20, 30)]
+        batch.append(get_ctx('my.service.\n', 10, is_request=True))
+
+        client.send(Action.Ping)
+        client.push_many(batch)
+        client.push(get_ctx('my.service.2', 40))
+        client.push_many([get_ctx('my.service.2', 10)])
+        client.send(Action.GetTable)
+
+        # .. a batch is sent as it is, without a delimiter ..
+        sent_batch = client.socket.sent[1]
+        self.assertEqual(len(sent_batch), Action.LenAction + get_batch_size(sent_batch, Action.LenAction))
+
+        data = b''.join(client.socket.sent)
+        receiver = Receiver()
+        replies = []
+
+        # .. and messages can be received in parts.
+        for idx in range(0, len(data), 7):
+            replies.extend(receiver.handle_data(data[idx:idx + 7]))
+
+        self.assertEqual(len(replies), 2)
+        self.assertEqual(replies[0], Action.PingReply)
+        self.assertTrue(replies[1].startswith(Action.GetTableReply))
+        self.assertEqual(receiver.buffer, b'')
+
+        table = json_loads(replies[1][Action.LenAction:])
+
+        self.assertEqual(len(table), 2)
+
+        self.assertEqual(table[0]['name'], 'my.service.\n')
+        self.assertEqual(table[0]['count'], 3)
+        self.assertEqual(table[0]['mean'], 20)
+
+        self.assertEqual(table[1]['name'], 'my.service.2')
+        self.assertEqual(table[1]['count'], 2)
+        self.assertEqual(table[1]['max'], 40)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
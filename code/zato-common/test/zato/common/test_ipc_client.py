@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# This needs to be done as soon as possible
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+import os
+import socket
+from json import dumps, loads
+from tempfile import gettempdir
+from unittest import main, TestCase
+from uuid import uuid4
+
+# gevent
+from gevent import joinall, sleep, spawn
+from gevent.pywsgi import WSGIServer
+
+# Zato
+from zato.common.api import IPC
+from zato.common.ipc.client import IPCClient
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, anylist, callable_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Server(WSGIServer):
+    """ Echoes requests back and counts how many connections were opened to it.
+    """
+    conn_count = 0
+
+    def handle(self, *args:'any_', **kwargs:'any_') -> 'None':
+        self.conn_count += 1
+        super().handle(*args, **kwargs)
+
+# ################################################################################################################################
+
+def _app(env:'anydict', start_response:'callable_') -> 'anylist':
+
+    request = loads(env['wsgi.input'].read())
+
+    # Make concurrent requests overlap
+    sleep(0.01)
+
+    response = dumps({'cid': 'cid.1', 'status': IPC.Status_OK, 'response': {'data': request['data']}})
+    start_response('200 OK', [('Content-Type', 'application/json')])
+
+    return [response.encode('utf8')]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class IPCClientTestCase(TestCase):
+
+    def _invoke(self, client:'IPCClient', idx:'int') -> 'any_':
+        response = client.invoke('my.service', {'idx': idx}, 'my.url.path', cluster_name='cluster1', server_name='server1',
+            server_pid=123, source_server_name='server1', source_server_pid=456)
+        return response.data
+
+# ################################################################################################################################
+
+    def _check_client(self, server:'_Server', client:'IPCClient') -> 'None':
+
+        server.start()
+
+        try:
+            # Calls made one after another all use the same connection ..
+            for idx in range(10):
+                self.assertEqual(self._invoke(client, idx), {'data': {'idx': idx}})
+
+            self.assertEqual(server.conn_count, 1)
+
+            # .. whereas concurrent ones may open new connections, but all of them succeed.
+            greenlets = [spawn(self._invoke, client, idx) for idx in range(50)]
+            _ = joinall(greenlets, raise_error=True)
+
+            self.assertEqual([elem.value for elem in greenlets], [{'data': {'idx': idx}} for idx in range(50)])
+
+        finally:
+            client.close()
+            server.stop()
+
+# ################################################################################################################################
+
+    def test_tcp(self):
+
+        server = _Server(('127.0.0.1', 0), _app, log=None)
+        server.init_socket()
+
+        client = IPCClient(False, '127.0.0.1', server.server_port, 'username', 'password')
+        self._check_client(server, client)
+
+# ################################################################################################################################
+
+    def test_unix_socket(self):
+
+        path = os.path.join(gettempdir(), 'zato-test-ipc-{}.sock'.format(uuid4().hex[:8]))
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(128)
+
+        try:
+            server = _Server(listener, _app, log=None)
+
+            # The port is not used for anything in this case
+            client = IPCClient(False, '127.0.0.1', 1, 'username', 'password', unix_socket_path=path)
+            self._check_client(server, client)
+
+        finally:
+            os.remove(path)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -15,9 +15,12 @@ from unittest import TestCase
 # Bunch
 from bunch import Bunch
 
+# globre
+from globre import compile as globre_compile, match as globre_match
+
 # Zato
 from zato.common.api import FALSE_TRUE, TRUE_FALSE
-from zato.common.match import Matcher
+from zato.common.match import FirstMatch, Matcher, ModuleCtx
 
 default_config = Bunch({
     'order': FALSE_TRUE,
@@ -327,4 +330,112 @@ class MatcherTestCase(TestCase):
         m.is_allowed('aaa.zxc')
         self.assertEqual(m.is_allowed_cache, {})
 
+# 
+
+        # ##################################################################################
+
+    def test_is_allowed_same_as_individual_patterns(self):
+
+        patterns = ['*', '*.zxc', 'abc.*', 'qwe.*.zxc', 'a?c.*', '**.zxc', '[aq]*', 'abc']
+        values = ['aaa.zxc', 'qwe.333.zxc', 'qwe.444.aaa', 'abc', 'abc.', 'abc/zxc', 'a/b.zxc', 'abcd', 'zzz', '']
+
+        for order in FALSE_TRUE, TRUE_FALSE:
+            for idx in range(len(patterns)):
+
+                config = Bunch({'order': order})
+                for pattern_idx, pattern in enumerate(patterns[idx:] + patterns[:idx]):
+                    config[pattern] = pattern_idx % 2 == 0
+
+                m = Matcher()
+                m.read_config(config)
+
+                for value in values:
+
+                    # This is how each value used to be matched, one pattern at a time, with the last match winning
+                    expected = False
+                    for order_ in m.order1, m.order2:
+                        for pattern in m.items[order_]:
+                            if globre_match(pattern, value):
+                                expected = order_
+
+                    self.assertIs(m.is_allowed(value), expected, (config, value))
+
+# ################################################################################################################################
+
+    def test_is_allowed_cache_is_bounded(self):
+
+        m = Matcher()
+        m.read_config(default_config)
+
+        for idx in range(ModuleCtx.Cache_Max_Size):
+            m.is_allowed('{}.zxc'.format(idx))
+
+        self.assertEqual(len(m.is_allowed_cache), ModuleCtx.Cache_Max_Size)
+
+        # The cache is full so it is cleared before a new value is added
+        self.assertIs(m.is_allowed('abc.123'), True)
+        self.assertDictEqual(m.is_allowed_cache, {'abc.123':True})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FirstMatchTestCase(TestCase):
+
+    def _get_matcher(self, patterns:'list') -> 'FirstMatch':
+        return FirstMatch([[pattern, globre_compile(pattern)] for pattern in patterns])
+
+# ################################################################################################################################
+
+    def test_first_match(self):
+
+        matcher = self._get_matcher(['/customer/*/new', '/customer/**', '/*', '/invoice/[0-9]?'])
+
+        # The first pattern that matches is returned even if other ones match too ..
+        self.assertEqual(matcher.match('/customer/123/new'), '/customer/*/new')
+        self.assertEqual(matcher.match('/customer/123/updated'), '/customer/**')
+        self.assertEqual(matcher.match('/invoice'), '/*')
+
+        # .. names are matched from their beginning ..
+        self.assertIs(matcher.match('customer/123'), False)
+
+        # .. and nothing matches if there are no patterns at all.
+        self.assertIs(self._get_matcher([]).match('/customer/123'), False)
+
+# ################################################################################################################################
+
+    def test_same_as_individual_patterns(self):
+
+        patterns = ['/customer/*/new', '/customer/**', '/*', '/invoice/[0-9]?', '/a?c', '/abc/*.xml', 'abc']
+        names = ['/customer/123/new', '/customer/1/2', '/customer', '/invoice/1a', '/invoice/a1', '/abc', '/abd/',
+            '/abc/1.xml', '/abc/1.json', 'abc/def', '', '/']
+
+        for idx in range(len(patterns)):
+            items = [[pattern, globre_compile(pattern)] for pattern in patterns[idx:] + patterns[:idx]]
+            matcher = FirstMatch(items)
+
+            for name in names:
+
+                # This is how each name used to be matched, one pattern at a time, with the first match winning
+                for orig, pattern_matcher in items:
+                    if pattern_matcher.match(name):
+                        expected = orig
+                        break
+                else:
+                    expected = False
+
+                self.assertEqual(matcher.match(name), expected, (items, name))
+
+# ################################################################################################################################
+
+    def test_cache_is_bounded(self):
+
+        matcher = self._get_matcher(['/customer/**'])
+
+        for idx in range(ModuleCtx.Cache_Max_Size + 1):
+            self.assertEqual(matcher.match('/customer/{}'.format(idx)), '/customer/**')
+
+        self.assertEqual(len(matcher.cache), 1)
+        self.assertEqual(matcher.cache_size, 1)
+
+# ################################################################################################################################
 # ################################################################################################################################
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from fcntl import lockf, LOCK_EX, LOCK_UN
+from ipaddress import ip_address, ip_network
+from random import Random
+from time import sleep as time_sleep
+from unittest import main, skipIf, TestCase
+from uuid import uuid4
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.common.rate_limiting import DefinitionParser, RateLimiting
+from zato.common.rate_limiting.common import Const, NetworkTree, RateLimitReached
+from zato.common.rate_limiting.limiter import _shared_token_bucket, Approximate, get_shared_token_cost, Host, max_rate, unit_ns
+from zato.common.rate_limiting.shmem import _slot, get_shmem_name, ModuleCtx, SharedRateLimitStore
+
+try:
+    import posix_ipc
+except ImportError:
+    has_posix_ipc = False
+else:
+    has_posix_ipc = True
+    posix_ipc = posix_ipc
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class NetworkTreeTestCase(TestCase):
+
+    def get_tree(self, networks:'list') -> 'NetworkTree':
+        tree = NetworkTree(32)
+        for idx, network in enumerate(networks):
+            network = ip_network(network)
+            tree.insert(int(network.network_address), network.prefixlen, idx)
+        return tree
+
+    def lookup(self, tree:'NetworkTree', address:'str') -> 'int':
+        return tree.lookup(int(ip_address(address)))
+
+# ################################################################################################################################
+
+    def test_no_match(self):
+
+        tree = self.get_tree(['10.0.0.0/8', '192.168.1.0/24'])
+
+        self.assertIsNone(self.lookup(tree, '11.0.0.1'))
+        self.assertIsNone(self.lookup(tree, '192.168.2.1'))
+
+# ################################################################################################################################
+
+    def test_first_in_order_wins(self):
+
+        # A supernet before its subnet always wins ..
+        tree = self.get_tree(['10.0.0.0/8', '10.1.0.0/16'])
+        self.assertEqual(self.lookup(tree, '10.1.2.3'), 0)
+
+        # .. and a subnet before its supernet wins only for its own addresses.
+        tree = self.get_tree(['10.1.0.0/16', '10.0.0.0/8'])
+        self.assertEqual(self.lookup(tree, '10.1.2.3'), 0)
+        self.assertEqual(self.lookup(tree, '10.2.2.3'), 1)
+
+# ################################################################################################################################
+
+    def test_any_and_host(self):
+
+        tree = self.get_tree(['127.0.0.1/32', '0.0.0.0/0'])
+
+        self.assertEqual(self.lookup(tree, '127.0.0.1'), 0)
+        self.assertEqual(self.lookup(tree, '127.0.0.2'), 1)
+
+# ################################################################################################################################
+
+    def test_same_as_linear_scan(self):
+
+        random = Random(123)
+
+        networks = []
+        for _x in range(300):
+            prefix_length = random.randint(8, 32)
+            address = random.getrandbits(32) & (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF
+            networks.append(ip_network((address, prefix_length)))
+
+        tree = self.get_tree(networks)
+
+        for _x in range(2000):
+
+            # Pick addresses from within the networks most of the time
+            if random.random() < 0.8:
+                network = random.choice(networks)
+                address = int(network.network_address) + random.randrange(network.num_addresses)
+            else:
+                address = random.getrandbits(32)
+
+            expected = None
+            for idx, network in enumerate(networks):
+                if ip_address(address) in network:
+                    expected = idx
+                    break
+
+            self.assertEqual(tree.lookup(address), expected)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FakeClock:
+    def __init__(self) -> 'None':
+        self.now = 1_000 * unit_ns[Const.Unit.minute]
+
+    def __call__(self) -> 'int':
+        return self.now
+
+# ################################################################################################################################
+
+class AlgorithmTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.limiter = Approximate(1)
+        self.clock = FakeClock()
+
+    def check(self, func, rate:'int') -> 'bool':
+        try:
+            func('cid', '127.0.0.1', Const.from_any, rate, Const.Unit.minute, None, None, None, _monotonic_ns=self.clock)
+        except RateLimitReached:
+            return False
+        else:
+            return True
+
+# ################################################################################################################################
+
+    def test_parse_algorithm(self):
+
+        definition = '\n'.join([
+            '10.0.0.0/8 = 10/m token-bucket',
+            '10.1.0.0/16 = 20/h sliding-window',
+            '* = 30/d',
+        ])
+
+        lines = DefinitionParser.get_lines(definition, 1, 'service', 'my.service')
+
+        self.assertEqual(lines[0].algorithm, Const.Algorithm.token_bucket)
+        self.assertEqual(lines[1].algorithm, Const.Algorithm.sliding_window)
+        self.assertEqual(lines[2].algorithm, Const.Algorithm.fixed_window)
+
+        with self.assertRaises(ValueError):
+            _ = DefinitionParser.get_lines('* = 10/m leaky-bucket', 1, 'service', 'my.service')
+
+# ################################################################################################################################
+
+    def test_token_bucket(self):
+
+        func = self.limiter._check_token_bucket
+        rate = 6
+
+        # A new bucket is full ..
+        for _x in range(rate):
+            self.assertTrue(self.check(func, rate))
+
+        # .. and now it is empty ..
+        self.assertFalse(self.check(func, rate))
+
+        # .. one token is added every ten seconds ..
+        self.clock.now += unit_ns[Const.Unit.minute] // rate
+        self.assertTrue(self.check(func, rate))
+        self.assertFalse(self.check(func, rate))
+
+        # .. and there are never more tokens than the rate.
+        self.clock.now += unit_ns[Const.Unit.minute] * 10
+
+        for _x in range(rate):
+            self.assertTrue(self.check(func, rate))
+        self.assertFalse(self.check(func, rate))
+
+# ################################################################################################################################
+
+    def test_shared_token_bucket_large_rate(self):
+
+        rate = 200_000
+        day = unit_ns[Const.Unit.day]
+        token_cost = get_shared_token_cost(rate, day)
+
+        now = self.clock()
+        tokens = last_refill = 0
+
+        # A new bucket is full ..
+        for _x in range(rate):
+            tokens, last_refill, _ignored, is_allowed = _shared_token_bucket(now, tokens, last_refill, 0, token_cost, day)
+            self.assertTrue(is_allowed)
+
+            # .. its state always fits in a shared memory slot ..
+            _ = _slot.pack(1, now, tokens, last_refill, 0)
+
+        # .. and now it is empty ..
+        _, _, _, is_allowed = _shared_token_bucket(now, tokens, last_refill, 0, token_cost, day)
+        self.assertFalse(is_allowed)
+
+        # .. until enough time passes for one more request.
+        _, _, _, is_allowed = _shared_token_bucket(now + day // rate, tokens, last_refill, 0, token_cost, day)
+        self.assertTrue(is_allowed)
+
+# ################################################################################################################################
+
+    def test_parse_rate_too_high(self):
+
+        for unit in Const.all_units():
+
+            # The highest rate possible is accepted ..
+            _ = DefinitionParser.get_lines('* = {}/{} token-bucket'.format(max_rate[unit], unit), 1, 'service', 'my.service')
+
+            # .. but higher ones are not.
+            with self.assertRaises(ValueError):
+                _ = DefinitionParser.get_lines('* = {}/{}'.format(max_rate[unit] + 1, unit), 1, 'service', 'my.service')
+
+# ################################################################################################################################
+
+    def test_sliding_window(self):
+
+        func = self.limiter._check_sliding_window
+        rate = 10
+        minute = unit_ns[Const.Unit.minute]
+
+        # Use up the whole rate at the end of a window ..
+        self.clock.now += minute - 1
+
+        for _x in range(rate):
+            self.assertTrue(self.check(func, rate))
+        self.assertFalse(self.check(func, rate))
+
+        # .. at the beginning of the next one, almost all of the previous one still counts ..
+        self.clock.now += 2
+        self.assertTrue(self.check(func, rate))
+        self.assertFalse(self.check(func, rate))
+
+        # .. just before halfway through the next one, more than half of it does.
+        self.clock.now += minute // 2 - 2
+        for _x in range(rate // 2 - 1):
+            self.assertTrue(self.check(func, rate))
+        self.assertFalse(self.check(func, rate))
+
+        # .. and after two windows, none of it does.
+        self.clock.now += minute * 2
+        for _x in range(rate):
+            self.assertTrue(self.check(func, rate))
+        self.assertFalse(self.check(func, rate))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+@skipIf(not has_posix_ipc, 'posix_ipc is not available')
+class HostTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.name = get_shmem_name(uuid4().hex)
+        self.stores = []
+
+    def tearDown(self) -> 'None':
+        for store in self.stores:
+            store.close(needs_unlink=True)
+
+    def get_limiter(self, definition:'str') -> 'Host':
+        """ Returns a limiter with a store of its own, as though each one was in a separate process.
+        """
+        store = SharedRateLimitStore(self.name, 64)
+        self.stores.append(store)
+
+        rate_limiting = RateLimiting()
+        rate_limiting.cluster_id = 1
+        rate_limiting.host_store = store
+
+        rate_limiting.create({
+            'id': 1,
+            'type_': 'service',
+            'name': 'my.service',
+            'is_active': True,
+            'parent_type': None,
+            'parent_name': None,
+        }, definition, False, True)
+
+        return rate_limiting.get_config('service', 'my.service')
+
+    def check(self, limiter:'Host', orig_from:'str'='127.0.0.1') -> 'bool':
+        try:
+            limiter.check_limit('cid', orig_from)
+        except RateLimitReached:
+            return False
+        else:
+            return True
+
+# ################################################################################################################################
+
+    def test_limit_shared_by_processes(self):
+
+        for algorithm in Const.all_algorithms():
+
+            self.name = get_shmem_name(uuid4().hex)
+            definition = '127.0.0.0/8 = 10/h {}'.format(algorithm)
+
+            limiter1 = self.get_limiter(definition)
+            limiter2 = self.get_limiter(definition)
+
+            # Each process uses up a part of the limit ..
+            for _x in range(4):
+                self.assertTrue(self.check(limiter1), algorithm)
+
+            for _x in range(6):
+                self.assertTrue(self.check(limiter2), algorithm)
+
+            # .. and now the limit is reached for both of them.
+            self.assertFalse(self.check(limiter1), algorithm)
+            self.assertFalse(self.check(limiter2), algorithm)
+
+# ################################################################################################################################
+
+    def test_networks_limited_separately(self):
+
+        limiter = self.get_limiter('10.0.0.0/8 = 1/h\n127.0.0.0/8 = 1/h')
+
+        self.assertTrue(self.check(limiter, '10.0.0.1'))
+        self.assertTrue(self.check(limiter, '127.0.0.1'))
+
+        self.assertFalse(self.check(limiter, '10.0.0.2'))
+        self.assertFalse(self.check(limiter, '127.0.0.2'))
+
+# ################################################################################################################################
+
+    def test_large_daily_rate(self):
+
+        limiter = self.get_limiter('127.0.0.0/8 = 200000/d token-bucket')
+
+        for _x in range(100):
+            self.assertTrue(self.check(limiter))
+
+# ################################################################################################################################
+
+    def test_rate_any(self):
+
+        limiter = self.get_limiter('127.0.0.0/8 = *')
+
+        for _x in range(100):
+            self.assertTrue(self.check(limiter))
+
+# ################################################################################################################################
+
+    def test_lock_held_by_another_process(self):
+
+        limiter = self.get_limiter('127.0.0.0/8 = 10/h')
+        store = self.stores[0] # type: SharedRateLimitStore
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                child_store = SharedRateLimitStore(store.name, store.num_slots)
+                child_store.open()
+                lockf(child_store._fd, LOCK_EX, ModuleCtx.Num_Stripes + 1, 0)
+                _ = os.write(write_fd, b'1')
+                time_sleep(0.3)
+                lockf(child_store._fd, LOCK_UN, ModuleCtx.Num_Stripes + 1, 0)
+            finally:
+                os._exit(0)
+
+        # Wait until the child process holds all the slot locks and the allocator one ..
+        _ = os.read(read_fd, 1)
+
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(1)
+                sleep(0.01)
+
+        # .. now, checking a limit needs to wait for the child ..
+        ticker = spawn(tick)
+        checker = spawn(self.check, limiter)
+        is_allowed = checker.get()
+        ticker.kill()
+
+        _ = os.waitpid(pid, 0)
+        os.close(read_fd)
+        os.close(write_fd)
+
+        # .. but other greenlets could run in the meantime.
+        self.assertTrue(is_allowed)
+        self.assertGreater(len(ticks), 10)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -9,10 +9,13 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import inspect
 from base64 import b64decode
+from bisect import bisect_left, insort
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
 from email.utils import formatdate as stdlib_format_date
 from hashlib import sha256
+from heapq import heapify, heappop, heappush
 from json import dumps as json_dumps, JSONEncoder
 from logging import getLogger
 from sys import getsizeof
@@ -22,10 +25,9 @@ from time import time
 from arrow import Arrow
 
 # Cython
-from cpython.list cimport PyList_SetSlice
-from cpython.object cimport Py_EQ, PyObject, PyObject_RichCompareBool
-from cpython.sequence cimport PySequence_ITEM
+from cpython.mem cimport PyMem_Free, PyMem_Malloc
 from libc.stdint cimport uint64_t
+from libc.string cimport memset
 
 # gevent
 from gevent.lock import RLock
@@ -74,6 +76,127 @@ class _JSONEncoder(JSONEncoder):
 
 # ################################################################################################################################
 
+cdef object _get_iso(double timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+cdef object _get_http(double timestamp):
+    return stdlib_format_date(timestamp, usegmt=True) if timestamp else None
+
+# ################################################################################################################################
+
+# How many keys a block of _SortedKeys holds, a block that grows to twice that many keys is split in two
+cdef Py_ssize_t _sorted_block_size = 1000
+
+cdef class _SortedKeys:
+    """ String keys, sorted, kept in blocks of at most twice _sorted_block_size keys each. Adding or removing a key needs
+    a binary search over the blocks and moving keys within a single block only rather than within the whole of the index.
+    """
+    cdef:
+        list blocks # Sorted and non-empty lists of keys, each key in a block is lower than the ones in the next block
+        list maxes  # The last key of each block
+
+    def __cinit__(self):
+        self.blocks = []
+        self.maxes = []
+
+    def __len__(self):
+        return sum(len(block) for block in self.blocks)
+
+    cdef void build(self, list sorted_keys) except *:
+        """ Replaces all the keys with new ones, which must be already sorted.
+        """
+        cdef Py_ssize_t idx
+
+        self.blocks = [sorted_keys[idx:idx + _sorted_block_size] for idx in range(0, len(sorted_keys), _sorted_block_size)]
+        self.maxes = [block[-1] for block in self.blocks]
+
+    cdef void add(self, object key) except *:
+        cdef Py_ssize_t block_idx
+        cdef list block
+
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            return
+
+        block_idx = bisect_left(self.maxes, key)
+
+        # The key is higher than any other one so it goes to the end of the last block ..
+        if block_idx == len(self.maxes):
+            block_idx -= 1
+            block = self.blocks[block_idx]
+            block.append(key)
+            self.maxes[block_idx] = key
+
+        # .. otherwise, it goes to the first block whose keys are not all lower than it.
+        else:
+            block = self.blocks[block_idx]
+            insort(block, key)
+
+        # The block may need to be split now, in which case its first half keeps its index
+        if len(block) > 2 * _sorted_block_size:
+            self.blocks.insert(block_idx + 1, block[_sorted_block_size:])
+            del block[_sorted_block_size:]
+            self.maxes.insert(block_idx, block[-1])
+
+    cdef void remove(self, object key) except *:
+        """ Removes a key if it is in the index.
+        """
+        cdef Py_ssize_t block_idx = bisect_left(self.maxes, key)
+        cdef Py_ssize_t idx
+        cdef list block
+
+        if block_idx == len(self.maxes):
+            return
+
+        block = self.blocks[block_idx]
+        idx = bisect_left(block, key)
+
+        if idx == len(block) or block[idx] != key:
+            return
+
+        del block[idx]
+
+        if not block:
+            del self.blocks[block_idx]
+            del self.maxes[block_idx]
+
+        elif idx == len(block):
+            self.maxes[block_idx] = block[-1]
+
+    cdef list get_by_prefix(self, object prefix, int limit):
+        """ Returns keys that start with a given prefix, at most limit of them unless limit is 0.
+        """
+        cdef list out = []
+        cdef list block
+        cdef Py_ssize_t idx
+        cdef Py_ssize_t block_idx = bisect_left(self.maxes, prefix)
+        cdef Py_ssize_t len_blocks = len(self.blocks)
+
+        if block_idx == len_blocks:
+            return out
+
+        # Only the first block needs to be searched in, all the keys in the next ones are higher than the prefix
+        block = self.blocks[block_idx]
+        idx = bisect_left(block, prefix)
+
+        while block_idx < len_blocks:
+            block = self.blocks[block_idx]
+
+            for key in block[idx:]:
+                if not key.startswith(prefix):
+                    return out
+                out.append(key)
+                if len(out) == limit:
+                    return out
+
+            block_idx += 1
+            idx = 0
+
+        return out
+
+# ################################################################################################################################
+
 cdef class Entry:
     """ Represents an individual value stored in a cache.
     """
@@ -107,19 +230,14 @@ cdef class Entry:
         # This entry's position in index
         public long position
 
-        # Hashed in SHA256
-        public str hash
+        # Hashed in SHA256 - computed only when first read after the value is set
+        object _hash
 
-        # Non-float timestamps
-        public object last_read_iso
-        public object prev_read_iso
-        public object last_write_iso
-        public object prev_write_iso
+        # When this entry was last moved to the head of the LRU list, as a counter of such moves
+        long lru_stamp
 
-        public object last_read_http
-        public object prev_read_http
-        public object last_write_http
-        public object prev_write_http
+        # Under what expiration time this entry is currently kept in the expiry heap, 0.0 if it is not there
+        double heap_expires_at
 
     cpdef dict to_dict(self):
         return {
@@ -151,50 +269,148 @@ cdef class Entry:
         }
 
     cpdef set_metadata(self, bint log_details=False):
-        """ Configures metadata after set* operations.
+        """ Configures metadata after set* operations. The hash and timestamps in formats other than seconds since epoch
+        are not needed by most callers so they are computed only when they are first read.
         """
-        # Will contain the computed hash value
-        h = sha256()
-
-        # Make sure that we hash a canonical representation of the object,
-        # e.g. if it is a dictionary then we want to hash the same representation
-        # of this dictionary no matter in which order internally the keys are stored
-        # seeing as from our perspective there is no intrinsic order.
-        if isinstance(self.value, str_types):
-            value = self.value
-        else:
-            value = json_dumps(self.value, sort_keys=True, cls=_JSONEncoder)
-        value = value if isinstance(value, bytes) else value.encode('utf8')
+        self._hash = None
 
-        h.update(value)
-        self.hash = str(h.hexdigest())
+        if log_details:
+            logger.info('Set metadata %s', self.to_dict())
 
-        # Timestamps in formats other than seconds since epoch
+    @property
+    def hash(self):
 
-        if self.last_read:
-            self.last_read_iso = datetime.fromtimestamp(self.last_read).isoformat()
-            self.last_read_http = stdlib_format_date(self.last_read, usegmt=True)
+        if self._hash is None:
 
-        if self.prev_read:
-            self.prev_read_iso = datetime.fromtimestamp(self.prev_read).isoformat()
-            self.prev_read_http = stdlib_format_date(self.prev_read, usegmt=True)
+            # Will contain the computed hash value
+            h = sha256()
 
-        if self.prev_write:
-            self.prev_write_iso = datetime.fromtimestamp(self.prev_write).isoformat()
-            self.prev_write_http = stdlib_format_date(self.prev_write, usegmt=True)
+            # Make sure that we hash a canonical representation of the object,
+            # e.g. if it is a dictionary then we want to hash the same representation
+            # of this dictionary no matter in which order internally the keys are stored
+            # seeing as from our perspective there is no intrinsic order.
+            if isinstance(self.value, str_types):
+                value = self.value
+            else:
+                value = json_dumps(self.value, sort_keys=True, cls=_JSONEncoder)
+            value = value if isinstance(value, bytes) else value.encode('utf8')
 
-        # This is always available because it is set during the initial write
-        self.last_write_iso = datetime.fromtimestamp(self.last_write).isoformat()
-        self.last_write_http = stdlib_format_date(self.last_write, usegmt=True)
+            h.update(value)
+            self._hash = str(h.hexdigest())
 
-        if log_details:
-            logger.info('Set metadata %s', self.to_dict())
+        return self._hash
+
+    # Timestamps in formats other than seconds since epoch. Note that last_write is always available
+    # because it is set during the initial write.
+
+    @property
+    def last_read_iso(self):
+        return _get_iso(self.last_read)
+
+    @property
+    def prev_read_iso(self):
+        return _get_iso(self.prev_read)
+
+    @property
+    def last_write_iso(self):
+        return datetime.fromtimestamp(self.last_write).isoformat()
+
+    @property
+    def prev_write_iso(self):
+        return _get_iso(self.prev_write)
+
+    @property
+    def last_read_http(self):
+        return _get_http(self.last_read)
+
+    @property
+    def prev_read_http(self):
+        return _get_http(self.prev_read)
+
+    @property
+    def last_write_http(self):
+        return stdlib_format_date(self.last_write, usegmt=True)
+
+    @property
+    def prev_write_http(self):
+        return _get_http(self.prev_write)
+
+# ################################################################################################################################
+
+cdef class _LRUPositions:
+    """ A Fenwick tree of LRU stamps. Each key in cache holds a unique stamp, the higher the more recently the key was used,
+    which lets one tell in O(log n) time how many keys were used more recently than a given one, i.e. what its position is.
+    """
+    cdef:
+        long capacity
+        long size
+        long last_stamp
+        long *tree
+
+    def __dealloc__(self):
+        PyMem_Free(self.tree)
+
+    cdef void reset(self, long capacity) except *:
+        """ Removes all the stamps and makes room for up to capacity new ones.
+        """
+        PyMem_Free(self.tree)
+
+        self.tree = <long *>PyMem_Malloc((capacity + 1) * sizeof(long))
+        if not self.tree:
+            raise MemoryError()
+
+        memset(self.tree, 0, (capacity + 1) * sizeof(long))
+
+        self.capacity = capacity
+        self.size = 0
+        self.last_stamp = 0
+
+    cdef inline bint is_full(self):
+        return self.last_stamp == self.capacity
+
+    cdef inline void _add(self, long stamp, long delta):
+        while stamp <= self.capacity:
+            self.tree[stamp] += delta
+            stamp += stamp & -stamp
+
+    cdef inline long push(self):
+        """ Returns a new stamp, higher than any other one issued so far. Must not be called if self.is_full().
+        """
+        self.last_stamp += 1
+        self.size += 1
+        self._add(self.last_stamp, 1)
+
+        return self.last_stamp
+
+    cdef inline void remove(self, long stamp):
+        self.size -= 1
+        self._add(stamp, -1)
+
+    cdef inline long get_position(self, long stamp):
+        """ Returns how many stamps higher than the input one are still in use.
+        """
+        cdef long prefix_sum = 0
+
+        while stamp > 0:
+            prefix_sum += self.tree[stamp]
+            stamp -= stamp & -stamp
+
+        return self.size - prefix_sum
 
 # ################################################################################################################################
 
 cdef class Cache:
     """ An LRU cache that optionally rejects entries bigger than N bytes. Entries can have a TTL assigned - periodic processes
     will clean up entries older than allowed.
+
+    Keys are kept in an OrderedDict in the order of their use, from the least to the most recently used one,
+    and positions of keys are tracked in a Fenwick tree, so that get, set, delete and eviction don't depend on the size of cache.
+    Entries with expiry are kept in a min-heap ordered by their expiration time which lets delete_expired visit
+    only the ones that actually expired.
+
+    Operations by prefix or suffix use sorted lists of string keys, and of the same keys reversed, so that they visit only
+    the keys that match. The lists are built when such an operation is first used and are kept up to date afterwards,
+    which means that caches that never use these operations do not pay for maintaining them.
     """
     cdef:
         public long max_size
@@ -203,7 +419,10 @@ cdef class Cache:
         public bint extend_expiry_on_get
         public bint extend_expiry_on_set
         public dict _data
-        public list _index
+        public object _lru # Keys -> entries, from the least to the most recently used one
+        _LRUPositions _positions
+        public list _expiry_heap # (expires_at, sequence number, entry) tuples
+        public uint64_t _expiry_seq
         public uint64_t misses
         public uint64_t hits
         public uint64_t set_ops
@@ -213,10 +432,15 @@ cdef class Cache:
         public object _lock
         public object default_get # A singleton indicating that no default value was given for self.get
         public dict _regex_cache
+        public _SortedKeys _prefix_index # String keys, or None if no operation by prefix was used yet
+        public _SortedKeys _suffix_index # String keys, reversed, or None if no operation by suffix was used yet
 
     def __cinit__(self):
         self._data = {}
-        self._index = []
+        self._lru = OrderedDict()
+        self._positions = _LRUPositions()
+        self._expiry_heap = []
+        self._expiry_seq = 0
         self.hits_per_position = {}
         self._expired_on_op = []
         self.hits = 0
@@ -224,6 +448,8 @@ cdef class Cache:
         self.set_ops = 0
         self.get_ops = 0
         self._regex_cache = {}
+        self._prefix_index = None
+        self._suffix_index = None
 
     def __init__(self, max_size=None, max_item_size=None, extend_expiry_on_get=True, extend_expiry_on_set=True, lock=None):
         self._lock = lock or RLock()
@@ -238,6 +464,7 @@ cdef class Cache:
         self.extend_expiry_on_get = extend_expiry_on_get
         self.extend_expiry_on_set = extend_expiry_on_set
         self.hits_per_position.update(dict((key, 0) for key in xrange(self.max_size)))
+        self._renumber_lru()
 
     def update_config(self, config):
         with self._lock:
@@ -270,7 +497,7 @@ cdef class Cache:
 
     def __len__(self):
         with self._lock:
-            return len(self._index)
+            return len(self._data)
 
 # ################################################################################################################################
 
@@ -288,7 +515,7 @@ cdef class Cache:
 
     cpdef list keys_by_position(self):
         with self._lock:
-            return list(self._index)
+            return list(reversed(self._lru))
 
 # ################################################################################################################################
 
@@ -318,10 +545,11 @@ cdef class Cache:
 
     def get_slice(self, start, stop, step):
         with self._lock:
-            for key in self._index[start:stop:step]:
-                entry = self._data[key]
+            keys = list(reversed(self._lru))
+            for position in xrange(*slice(start, stop, step).indices(len(keys))):
+                entry = self._data[keys[position]]
                 as_dict = entry.to_dict()
-                as_dict['position'] = self._get_index(key)
+                as_dict['position'] = position
                 yield as_dict
 
 # ################################################################################################################################
@@ -332,8 +560,12 @@ cdef class Cache:
         # The attributes cleared below must be kept in sync with the ones from __cinit__.
         with self._lock:
             self._data.clear()
-            self._index[:] = []
-            self.hits_per_position.clear()
+            self._lru.clear()
+            self._expiry_heap[:] = []
+            self._prefix_index = None
+            self._suffix_index = None
+            self._renumber_lru()
+            self.hits_per_position = dict.fromkeys(xrange(self.max_size), 0)
             self._expired_on_op[:] = []
             self.hits = 0
             self.misses = 0
@@ -349,14 +581,43 @@ cdef class Cache:
         if not entry:
             return
         else:
-            # We run under self.lock so at this point we know that the key was valid
-            # and _remove_from_index_by_idx is safe to call.
+            # We run under self.lock so at this point we know that the key is also in self._lru.
+            # If the entry is in the expiry heap, it will be skipped by self.delete_expired.
             out = entry.value
             del self._data[key]
-            self._remove_from_index_by_idx(self._get_index(key))
+            del self._lru[key]
+            self._positions.remove(entry.lru_stamp)
+
+            if isinstance(key, str_types):
+                if self._prefix_index is not None:
+                    self._prefix_index.remove(key)
+                if self._suffix_index is not None:
+                    self._suffix_index.remove(key[::-1])
 
             return out
 
+# ################################################################################################################################
+
+    cdef list _keys_by_prefix(self, object data, int limit):
+        """ Returns keys starting with a given prefix, at most limit of them unless limit is 0. Builds the index of prefixes
+        if it does not exist yet. Must be called with self._lock held.
+        """
+        if self._prefix_index is None:
+            self._prefix_index = _SortedKeys()
+            self._prefix_index.build(sorted(key for key in self._data if isinstance(key, str_types)))
+
+        return self._prefix_index.get_by_prefix(data, limit)
+
+    cdef list _keys_by_suffix(self, object data, int limit):
+        """ Returns keys ending with a given suffix, at most limit of them unless limit is 0. Builds the index of suffixes
+        if it does not exist yet. Must be called with self._lock held.
+        """
+        if self._suffix_index is None:
+            self._suffix_index = _SortedKeys()
+            self._suffix_index.build(sorted(key[::-1] for key in self._data if isinstance(key, str_types)))
+
+        return [key[::-1] for key in self._suffix_index.get_by_prefix(data[::-1], limit)]
+
 # ################################################################################################################################
 
     cpdef object delete(self, object key):
@@ -375,23 +636,12 @@ cdef class Cache:
         cdef object key
         cdef dict out = {}
         cdef object value = None
-        cdef list to_delete = []
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-                    if return_found:
-                        out[key] = <Entry>self._data[key].value
-                    to_delete.append(key)
-                if idx == limit:
-                    break
-
-        # We could not do in the loop above because that would have changed self._data
-        # and result in 'RuntimeError: dictionary changed size during iteration'.
-        for key in to_delete:
-            self._delete(key)
+            for key in self._keys_by_prefix(data, limit):
+                if return_found:
+                    out[key] = <Entry>self._data[key].value
+                self._delete(key)
 
         return out
 
@@ -405,23 +655,12 @@ cdef class Cache:
         cdef object key
         cdef dict out = {}
         cdef object value = None
-        cdef list to_delete = []
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.endswith(data):
-                    if return_found:
-                        out[key] = <Entry>self._data[key].value
-                    to_delete.append(key)
-                if idx == limit:
-                    break
-
-        # We could not do in the loop above because that would have changed self._data
-        # and result in 'RuntimeError: dictionary changed size during iteration'.
-        for key in to_delete:
-            self._delete(key)
+            for key in self._keys_by_suffix(data, limit):
+                if return_found:
+                    out[key] = <Entry>self._data[key].value
+                self._delete(key)
 
         return out
 
@@ -599,16 +838,10 @@ cdef class Cache:
 
     cdef inline long _get_index(self, object key):
         """ C-only version of self.get_position that will always return a long - must be called only
-        if key is known to be in self._index or self._data and only with self._lock held.
+        if key is known to be in self._data and only with self._lock held.
         """
-        cdef Py_ssize_t index_idx = 0
-        cdef Py_ssize_t cache_size = len(self._index)
-        cdef bint index_key_eq
-
-        while index_idx < cache_size:
-            if PyObject_RichCompareBool(PySequence_ITEM(self._index, index_idx), <object>key, Py_EQ):
-                return index_idx
-            index_idx += 1
+        cdef Entry entry = <Entry>self._data[key]
+        return self._positions.get_position(entry.lru_stamp)
 
 # ################################################################################################################################
 
@@ -621,14 +854,39 @@ cdef class Cache:
 
 # ################################################################################################################################
 
-    cdef inline object _remove_from_index_by_idx(self, long idx):
-        """ Remove object from from index by its position - this is what listremove in Objects/listobject.c does
-        and we use the same technique because there is no public PyList_Remove function. Returns the removed key.
+    cdef void _renumber_lru(self) except *:
+        """ Gives new, consecutive, LRU stamps to all entries. Called when all the stamps have been used up,
+        which happens once in about max_size operations, or when max_size changes. Must be called with self._lock held.
         """
-        cdef object index_key = PySequence_ITEM(self._index, idx)
-        PyList_SetSlice(self._index, idx, idx+1, <object>NULL)
+        cdef Entry entry
+
+        self._positions.reset(2 * max(self.max_size, len(self._lru)) + 64)
 
-        return index_key
+        for entry in self._lru.values():
+            entry.lru_stamp = self._positions.push()
+
+# ################################################################################################################################
+
+    cdef inline void _stamp_lru_head(self, Entry entry) except *:
+        """ Gives a new LRU stamp to an entry that has just been added or moved to the end of self._lru.
+        """
+        # Renumbering includes the entry too because it is already in self._lru
+        if self._positions.is_full():
+            self._renumber_lru()
+        else:
+            entry.lru_stamp = self._positions.push()
+
+# ################################################################################################################################
+
+    cdef inline void _schedule_expiry(self, Entry entry) except *:
+        """ Adds an entry to the expiry heap unless it is already there with the same or an earlier expiration time.
+        Entries whose expiration time was extended are not added again - delete_expired will move them further in the heap
+        once it finds them not expired yet.
+        """
+        if entry.expires_at and (not entry.heap_expires_at or entry.expires_at < entry.heap_expires_at):
+            entry.heap_expires_at = entry.expires_at
+            self._expiry_seq += 1
+            heappush(self._expiry_heap, (entry.expires_at, self._expiry_seq, entry))
 
 # ################################################################################################################################
 
@@ -649,10 +907,6 @@ cdef class Cache:
         cdef Entry entry
         cdef double _now
         cdef double _orig_now = 0.0
-        cdef Py_ssize_t cache_size = len(self._index)
-        cdef Py_ssize_t index_idx
-        cdef bint old_key_eq
-        cdef long hits_per_position
         cdef long len_value
 
         # If multiple processes synchronize contents of their caches, the one that originally added the keys
@@ -708,12 +962,14 @@ cdef class Cache:
             entry.value = value
             entry.set_metadata()
 
+            self._schedule_expiry(entry)
+
         # No such key in cache - let's add it.
         else:
 
-            # Make sure there is room for the new key
-            if cache_size == self.max_size:
-                del self._data[self._index.pop()]
+            # Make sure there is room for the new key by evicting the least recently used ones
+            while len(self._data) >= self.max_size:
+                self._delete(next(iter(self._lru)))
 
             # Actually insert entry
             entry = Entry()
@@ -726,10 +982,19 @@ cdef class Cache:
             entry.hits = 0
             entry.expiry = expiry
             entry.expires_at = 0.0 if not expiry else _now + expiry
+            entry.heap_expires_at = 0.0
             entry.set_metadata()
 
             self._data[key] = entry
-            self._index.insert(0, key)
+            self._lru[key] = entry
+            self._stamp_lru_head(entry)
+            self._schedule_expiry(entry)
+
+            if isinstance(key, str_types):
+                if self._prefix_index is not None:
+                    self._prefix_index.add(key)
+                if self._suffix_index is not None:
+                    self._suffix_index.add(key[::-1])
 
         # If any output dict for metadata was passed in by reference, set its requires items.
         if meta_ref is not None:
@@ -758,27 +1023,20 @@ cdef class Cache:
         cdef double _now = orig_now if orig_now else self._get_timestamp()
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-
-                    # Set it before the update which would overwrite it, this is why we can return
-                    # value alone, without any metadata.
-                    if return_found:
-                        entry = <Entry>self._data[key]
-                        out[key] = entry if details else entry.value
+            for key in self._keys_by_prefix(data, limit):
 
-                    self._set(key, value, expiry, False, None, _now)
+                # Set it before the update which would overwrite it, this is why we can return
+                # value alone, without any metadata.
+                if return_found:
+                    entry = <Entry>self._data[key]
+                    out[key] = entry if details else entry.value
 
-                    # Indicate to our caller that there was at least one matching key
-                    if _needs_any_found_report:
-                        meta_ref['_any_found'] = True
-                        _needs_any_found_report = False
+                self._set(key, value, expiry, False, None, _now)
 
-                # Our caller knows how many keys to look up at most
-                if idx == limit:
-                    break
+                # Indicate to our caller that there was at least one matching key
+                if _needs_any_found_report:
+                    meta_ref['_any_found'] = True
+                    _needs_any_found_report = False
 
         if meta_ref:
             meta_ref['_now'] = _now
@@ -799,29 +1057,20 @@ cdef class Cache:
         cdef double _now = orig_now if orig_now else self._get_timestamp()
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
+            for key in self._keys_by_suffix(data, limit):
 
-                if not isinstance(key, str_types):
-                    continue
+                # Set it before the update which would overwrite it, this is why we can return
+                # value alone, without any metadata.
+                if return_found:
+                    entry = <Entry>self._data[key]
+                    out[key] = entry if details else entry.value
 
-                if key.endswith(data):
+                self._set(key, value, expiry, False, None, _now)
 
-                    # Set it before the update which would overwrite it, this is why we can return
-                    # value alone, without any metadata.
-                    if return_found:
-                        entry = <Entry>self._data[key]
-                        out[key] = entry if details else entry.value
-
-                    self._set(key, value, expiry, False, None, _now)
-
-                    # Indicate to our caller that there was at least one matching key
-                    if _needs_any_found_report:
-                        meta_ref['_any_found'] = True
-                        _needs_any_found_report = False
-
-                # Our caller knows how many keys to look up at most
-                if idx == limit:
-                    break
+                # Indicate to our caller that there was at least one matching key
+                if _needs_any_found_report:
+                    meta_ref['_any_found'] = True
+                    _needs_any_found_report = False
 
         if meta_ref:
             meta_ref['_now'] = _now
@@ -1064,9 +1313,7 @@ cdef class Cache:
         """
         cdef object _item
         cdef Entry entry
-        cdef Py_ssize_t index_idx
-        cdef Py_ssize_t cache_size
-        cdef object index_key
+        cdef long index_idx
         cdef double _now = self._get_timestamp()
 
         try:
@@ -1095,7 +1342,7 @@ cdef class Cache:
             self.hits += 1
 
             # Current position of that key in index
-            index_idx = self._get_index(key)
+            index_idx = self._positions.get_position(entry.lru_stamp)
 
             # We have the key's position so we can now update per-position counter
             # to be able to offer statistics on how often a key is found at a given position.
@@ -1103,11 +1350,10 @@ cdef class Cache:
             hits_per_position += 1
             self.hits_per_position[index_idx] = hits_per_position
 
-            # Remove key from index
-            index_key = self._remove_from_index_by_idx(index_idx)
-
-            # Now insert the key back at the head position.
-            self._index.insert(0, index_key)
+            # Move the key to the head position.
+            self._positions.remove(entry.lru_stamp)
+            self._lru.move_to_end(key)
+            self._stamp_lru_head(entry)
 
             # Update last/prev access information + hits
             entry.prev_read = entry.last_read
@@ -1146,13 +1392,8 @@ cdef class Cache:
         cdef dict out = {}
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-                    out[key] = self._get(key, self.default_get, details)
-                if idx == limit:
-                    break
+            for key in self._keys_by_prefix(data, limit):
+                out[key] = self._get(key, self.default_get, details)
 
         return out
 
@@ -1166,13 +1407,8 @@ cdef class Cache:
         cdef dict out = {}
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.endswith(data):
-                    out[key] = self._get(key, self.default_get, details)
-                if idx == limit:
-                    break
+            for key in self._keys_by_suffix(data, limit):
+                out[key] = self._get(key, self.default_get, details)
 
         return out
 
@@ -1328,14 +1564,9 @@ cdef class Cache:
         cdef bint found_any = False
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-                    self._expire(key, expiry, None)
-                    found_any = True
-                if idx == limit:
-                    break
+            for key in self._keys_by_prefix(data, limit):
+                self._expire(key, expiry, None)
+                found_any = True
 
         return found_any
 
@@ -1348,14 +1579,9 @@ cdef class Cache:
         cdef bint found_any = False
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.endswith(data):
-                    self._expire(key, expiry, None)
-                    found_any = True
-                if idx == limit:
-                    break
+            for key in self._keys_by_suffix(data, limit):
+                self._expire(key, expiry, None)
+                found_any = True
 
         return found_any
 
@@ -1503,6 +1729,7 @@ cdef class Cache:
                 if expires_at > entry.expires_at:
                     entry.expiry = expiry
                     entry.expires_at = expires_at
+                    self._schedule_expiry(entry)
 
 # ################################################################################################################################
 
@@ -1511,21 +1738,43 @@ cdef class Cache:
         """
         cdef list deleted
         cdef double _now = self._get_timestamp()
-        cdef double expires_at
-
-        # Collects all keys to be deleted and in another pass, delete them all.
-        # It's performed it two steps so as to be able to hold self._lock only once.
+        cdef double heap_expires_at
+        cdef Entry entry
+        cdef list heap = self._expiry_heap
 
         with self._lock:
 
             deleted = self._expired_on_op[:]
 
-            # Collect keys still in cache
-            for key, value in self._data.items():
-                expires_at = value.expires_at
-                if expires_at and _now > expires_at:
-                    self._delete(key)
-                    deleted.append(key)
+            # Visit only the entries whose expiration time, as it was when they were added to the heap, is in the past ..
+            while heap and _now > heap[0][0]:
+                heap_expires_at, _, entry = heappop(heap)
+
+                # .. skip the ones that were added to the heap again with an earlier expiration time ..
+                if heap_expires_at != entry.heap_expires_at:
+                    continue
+
+                entry.heap_expires_at = 0.0
+
+                # .. as well as the ones already deleted or with their expiry reset ..
+                if self._data.get(entry.key) is not entry or not entry.expires_at:
+                    continue
+
+                # .. delete the ones that actually expired ..
+                if _now > entry.expires_at:
+                    self._delete(entry.key)
+                    deleted.append(entry.key)
+
+                # .. and put back the ones whose expiration time was extended in the meantime.
+                else:
+                    self._schedule_expiry(entry)
+
+            # Deleted entries are not removed from the heap when they are deleted so we need to make sure
+            # that the heap does not grow indefinitely if they are deleted much sooner than they expire.
+            if len(heap) > 2 * len(self._data) + 64:
+                heap[:] = [elem for elem in heap
+                    if elem[0] == (<Entry>elem[2]).heap_expires_at and self._data.get((<Entry>elem[2]).key) is elem[2]]
+                heapify(heap)
 
             # Collect keys deleted by .get operations
             self._expired_on_op[:] = []
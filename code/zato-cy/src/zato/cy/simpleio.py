@@ -276,6 +276,20 @@ sio_text_type:int = ElemType.text
 
 # ################################################################################################################################
 
+@cy.cclass
+class OutputOp:
+    """ What a compiled output plan does with each element's value.
+    """
+    copy:int = 1 # The value is returned as it is
+    text:int = 2 # Strings are returned as they are, other values are converted to text
+    call:int = 3 # The value is converted by the element's own function
+
+# Same as above, to make sure there are no attribute lookups in runtime
+output_op_copy:int = OutputOp.copy
+output_op_text:int = OutputOp.text
+
+# ################################################################################################################################
+
 @cy.cclass
 class Elem:
     """ An individual input or output element. May be a ForceType instance or not.
@@ -1318,6 +1332,10 @@ class CySimpleIO:
     # A service class this SimpleIO object is attached to
     service_class = cy.declare(object, visibility='public') # type: object
 
+    # Input parsers and output serialisers, compiled for each data format the first time it is used
+    _input_plans  = cy.declare(dict, visibility='public') # type: dict
+    _output_plans = cy.declare(dict, visibility='public') # type: dict
+
 # ################################################################################################################################
 
     def __cinit__(self, server:object, server_config:SIOServerConfig, user_declaration:object):
@@ -1399,6 +1417,8 @@ class CySimpleIO:
             force_empty_output_set, empty_output_value)
 
         self.definition = SIODefinition(sio_default, sio_skip_empty)
+        self._input_plans = {}
+        self._output_plans = {}
         self.server = server
         self.server_config = server_config
         self.user_declaration = user_declaration
@@ -1815,6 +1835,43 @@ class CySimpleIO:
         # In all other cases, we explicitly say that this value should not be skipped
         return False
 
+# ################################################################################################################################
+
+    @cy.returns(list)
+    def _get_input_plan(self, data_format:object) -> list:
+        """ Returns a flat list of instructions to parse input elements in a given data format with. The list is compiled
+        the first time a data format is used, which means that the checks below, dependent only on the SimpleIO definition,
+        are not repeated for each element of each request.
+        """
+        plan:list = self._input_plans.get(data_format)
+
+        if plan is None:
+
+            plan = []
+            sio_item:Elem = None
+
+            for sio_item in self.definition.all_input_elems:
+                plan.append((
+                    sio_item,
+                    sio_item.name,
+                    sio_item.is_required,
+
+                    # This may be None and, if it is, an exception is raised only if there is a value to parse
+                    sio_item.parse_from.get(data_format),
+
+                    # Should the value be skipped no matter what it is ..
+                    self._should_skip_on_input(self.definition, sio_item, True),
+
+                    # .. or only if it is empty.
+                    self._should_skip_on_input(self.definition, sio_item, None),
+
+                    getattr(sio_item, 'is_secret', False),
+                ))
+
+            self._input_plans[data_format] = plan
+
+        return plan
+
 # ################################################################################################################################
 
     @cy.returns(object)
@@ -1848,7 +1905,11 @@ class CySimpleIO:
         idx:cy.int = -1
         sio_item:Elem = None
         sio_item_name:str = None
-        items:list = self.definition.all_input_elems
+        is_required:cy.bint
+        skip_always:cy.bint
+        skip_if_empty:cy.bint
+        is_secret:cy.bint
+        plan:list = self._get_input_plan(data_format)
 
         # Overwrite and append any keys found in extra and elem, first make a backup of shared keys for later use.
         if is_dict and extra:
@@ -1861,13 +1922,11 @@ class CySimpleIO:
                 # .. overwrite (note that there is no 'else').
                 elem[extra_key] = extra_value
 
-        for sio_item in items:
+        for sio_item, sio_item_name, is_required, parse_func, skip_always, skip_if_empty, is_secret in plan:
 
             # Start the loop with 0
             idx += 1
 
-            sio_item_name = sio_item.name
-
             # Parse the input dictionary
             if is_dict:
                 input_value = cy.cast(dict, elem).get(sio_item_name, InternalNotGiven)
@@ -1905,7 +1964,7 @@ class CySimpleIO:
             # We do not have such a elem on input so an exception needs to be raised if this is a require one
             if input_value is InternalNotGiven:
 
-                if sio_item.is_required:
+                if is_required:
 
                     if is_dict:
                         all_elems = cy.cast(dict, elem).keys()
@@ -1922,7 +1981,7 @@ class CySimpleIO:
                     raise ElementMissing(sio_item_name)
 
                 else:
-                    if self._should_skip_on_input(self.definition, sio_item, input_value):
+                    if skip_always or skip_if_empty:
                         continue
                     else:
                         if sio_item.get_default_value:
@@ -1930,16 +1989,17 @@ class CySimpleIO:
                         else:
                             value = sio_item.default_value
             else:
-                parse_func = sio_item.parse_from[data_format]
+                if parse_func is None:
+                    raise KeyError(data_format)
 
                 try:
-                    if self._should_skip_on_input(self.definition, sio_item, input_value):
+                    if skip_always or (skip_if_empty and not input_value):
                         continue
                     else:
 
                         value = parse_func(input_value)
-                        if getattr(sio_item, 'is_secret', False):
-                            value = self.eval_(sio_item.name, input_value, self.server.encrypt if self.server else None)
+                        if is_secret:
+                            value = self.eval_(sio_item_name, input_value, self.server.encrypt if self.server else None)
 
                 except NotImplementedError:
                     raise NotImplementedError('No parser for input `{}` ({})'.format(input_value, data_format))
@@ -1989,30 +2049,76 @@ class CySimpleIO:
                 out = self._parse_input_elem(data, data_format, extra=extra)
             return bunchify(out)
 
+# ################################################################################################################################
+
+    @cy.returns(list)
+    def _get_output_plan(self, data_format:object) -> list:
+        """ Returns a flat list of instructions to serialise output elements to a given data format with,
+        compiling it the first time a data format is used. Required elements come first, followed by optional ones.
+        """
+        plan:list = self._output_plans.get(data_format)
+
+        if plan is None:
+
+            plan = []
+            is_text:cy.bint
+            current_elems:dict = None
+            current_elem:Elem = None
+
+            # 1st item = is_required
+            # 2nd item = elems dict
+            all_elems:list = [
+                (True, self.definition._output_required.elems_by_name),
+                (False, self.definition._output_optional.elems_by_name),
+            ]
+
+            for is_required, current_elems in all_elems:
+                for current_elem in current_elems.values():
+
+                    parse_func = current_elem.parse_to[data_format]
+                    is_text = cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type)
+
+                    # Values of elements declared as-is never need to be converted ..
+                    if type(current_elem) is AsIs:
+                        op = OutputOp.copy
+
+                    # .. and strings do not need to be converted to text either ..
+                    elif type(current_elem) in (Text, Secret):
+                        op = OutputOp.text
+
+                    # .. whereas any other element has a function of its own.
+                    else:
+                        op = OutputOp.call
+
+                    plan.append((
+                        current_elem.name,
+                        is_required,
+                        op,
+                        parse_func,
+
+                        # Bytes produced for text elements are decoded, which is why we need their encoding
+                        current_elem.encoding if is_text else None,
+                    ))
+
+            self._output_plans[data_format] = plan
+
+        return plan
+
 # ################################################################################################################################
 
     def _yield_data_dicts(self, data:object, data_format:str):
 
-        required_elems:dict = self.definition._output_required.elems_by_name
-        optional_elems:dict = self.definition._output_optional.elems_by_name
+        plan:list = self._get_output_plan(data_format)
 
         # First yield calls- return only field names
-        yield list(required_elems.keys())
-        yield list(optional_elems.keys())
+        yield list(self.definition._output_required.elems_by_name.keys())
+        yield list(self.definition._output_optional.elems_by_name.keys())
 
         input_data:list = data if isinstance(data, (list, tuple)) else [data]
 
-        # 1st item = is_required
-        # 2nd item = elems dict
-        all_elems:list = [
-            (True, required_elems),
-            (False, optional_elems),
-        ]
-
         is_required:cy.bint
-        current_elems:dict = None
+        op:cy.int
         current_elem_name:object = None
-        current_elem:Elem = None
         input_data_dict = None
 
         for _input_data_dict in input_data:
@@ -2034,28 +2140,35 @@ class CySimpleIO:
             elif isinstance(_input_data_dict, SQLRow):
                 input_data_dict = _input_data_dict.get_value()
 
-            for is_required, current_elems in all_elems: # type: bool, dict
-                for current_elem_name, current_elem in current_elems.items():
-                    value = input_data_dict.get(current_elem_name, InternalNotGiven)
-                    if value is InternalNotGiven:
-                        if is_required:
-                            raise SerialisationError('Required element `{}` missing in `{}` ({})'.format(
-                                current_elem_name, input_data_dict, self.service_class))
-                    else:
-                        try:
-                            parse_func = None
-                            parse_func = current_elem.parse_to[data_format]
-                            value = parse_func(value)
-                        except Exception as e:
-                            raise SerialisationError('Exception `{!r}` while serialising `{}` ({}) ({}) (func:{})'.format(
-                                e, value, self.service_class, input_data_dict, parse_func))
-
-                        if cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type):
-                            if isinstance(value, bytes):
-                                value = value.decode(current_elem.encoding)
-
-                        # All checks passed - we can append this particular element to the output dictionary
-                        out_data_dict[current_elem_name] = value
+            for current_elem_name, is_required, op, parse_func, encoding in plan:
+
+                value = input_data_dict.get(current_elem_name, InternalNotGiven)
+
+                if value is InternalNotGiven:
+                    if is_required:
+                        raise SerialisationError('Required element `{}` missing in `{}` ({})'.format(
+                            current_elem_name, input_data_dict, self.service_class))
+                    continue
+
+                if op == output_op_copy:
+                    pass
+
+                elif op == output_op_text and type(value) is str:
+                    pass
+
+                else:
+                    try:
+                        value = parse_func(value)
+                    except Exception as e:
+                        raise SerialisationError('Exception `{!r}` while serialising `{}` ({}) ({}) (func:{})'.format(
+                            e, value, self.service_class, input_data_dict, parse_func))
+
+                    if encoding is not None:
+                        if isinstance(value, bytes):
+                            value = value.decode(encoding)
+
+                # All checks passed - we can append this particular element to the output dictionary
+                out_data_dict[current_elem_name] = value
 
             # More yields - to actually return data
 
@@ -10,6 +10,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import re as stdlib_re
+from collections import OrderedDict
 from datetime import datetime
 from logging import getLogger
 from operator import itemgetter
@@ -39,6 +40,15 @@ unused_marker = 'unused'
 
 _internal_url_path_indicator = '{}/zato/'.format(target_separator)
 
+# How many matched URL paths CyURLData keeps in its cache
+_default_url_path_cache_size = 10_000
+
+# A segment of a URL path that is a {parameter} in its entirety ..
+_param_segment_match = re_compile(r'^\{[^{}]+\}$').match
+
+# .. and characters that make it impossible for a segment to be matched as a static string.
+_non_static_segment_search = re_compile(r'[\\^$*+?{}\[\]|()]').search
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -52,7 +62,7 @@ cdef class Matcher:
         public unicode pattern
         public object matcher
         object match_func
-        public bint is_static, is_internal
+        public bint is_static, is_internal, match_slash
         object _brace_pattern
         object _elem_re_template
         set ignore_http_methods
@@ -62,6 +72,7 @@ cdef class Matcher:
         # If True, we will include slashes in pattern matching,
         # otherwise they will not be taken into account.
         slash_pattern = '\/' if match_slash else ''
+        self.match_slash = bool(match_slash)
 
         # HTTP methods to ignore in case one is set for a particular HTTP channel
         self.ignore_http_methods = set(['CONNECT', 'DELETE', 'GET', 'HEAD', 'OPTIONS', 'PATCH', 'POST', 'PUT', 'TRACE'])
@@ -132,35 +143,176 @@ cdef class Matcher:
 # ################################################################################################################################
 # ################################################################################################################################
 
+cdef class _RouteNode:
+    """ A single node of the routing trie that CyURLData builds out of URL paths of all its channels.
+    Each node represents one segment of a URL path, i.e. what is in between two slashes.
+    """
+    cdef:
+        public dict static_children
+        public _RouteNode param_child
+        public _RouteNode multi_param_child
+        public list items
+
+    def __init__(self):
+
+        # Segment -> _RouteNode for segments that are static strings
+        self.static_children = {}
+
+        # A node for a {parameter} that matches exactly one segment
+        self.param_child = None
+
+        # A node for a {parameter} that may match more than one segment, i.e. slashes too
+        self.multi_param_child = None
+
+        # Indexes in channel_data of all the channels whose URL paths end in this node
+        self.items = []
+
+# ################################################################################################################################
+
+    cdef _RouteNode get_child(self, unicode segment, bint match_slash):
+
+        cdef _RouteNode child
+
+        if _param_segment_match(segment):
+            if match_slash:
+                if self.multi_param_child is None:
+                    self.multi_param_child = _RouteNode()
+                return self.multi_param_child
+            else:
+                if self.param_child is None:
+                    self.param_child = _RouteNode()
+                return self.param_child
+        else:
+            child = self.static_children.get(segment)
+            if child is None:
+                child = _RouteNode()
+                self.static_children[segment] = child
+            return child
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+cdef class URLRouter:
+    """ A segment trie over URL paths of all the channels, with parameter nodes for {parameters}. Given a URL path
+    on input, it returns indexes of all the channels that may possibly match it, in time proportional to the length
+    of the path rather than to the number of channels. The candidates are always confirmed by each channel's own Matcher
+    so the trie only needs to never miss a channel that would match - it is fine if it returns a few extra ones.
+
+    URL paths that cannot be represented in the trie, e.g. ones with parameters that are only a part of a segment,
+    are kept in a separate list whose channels are always returned as candidates.
+    """
+    cdef:
+        public _RouteNode root
+        public list fallback
+
+    def __init__(self, list channel_data):
+
+        cdef int idx
+        cdef dict item
+
+        self.root = _RouteNode()
+        self.fallback = []
+
+        for idx, item in enumerate(channel_data):
+            self.add(idx, item['match_target'], item['match_target_compiled'].match_slash)
+
+# ################################################################################################################################
+
+    cpdef add(self, int idx, unicode match_target, bint match_slash):
+
+        cdef unicode segment
+        cdef list segments
+        cdef _RouteNode node
+
+        segments = match_target.split(target_separator, 3)[-1].split('/')
+
+        # Make sure that each segment can be stored in the trie ..
+        for segment in segments:
+            if _param_segment_match(segment):
+                continue
+            if _non_static_segment_search(segment):
+                self.fallback.append(idx)
+                return
+
+        # .. if it can, add all of them ..
+        node = self.root
+        for segment in segments:
+            node = node.get_child(segment, match_slash)
+
+        # .. and store the channel in the last node.
+        node.items.append(idx)
+
+# ################################################################################################################################
+
+    cdef _collect(self, _RouteNode node, list segments, int segment_idx, int len_segments, set out):
+
+        cdef _RouteNode child
+        cdef int next_idx
+
+        # We have consumed all the segments and the path ends in this node
+        if segment_idx == len_segments:
+            out.update(node.items)
+            return
+
+        child = node.static_children.get(segments[segment_idx])
+        if child is not None:
+            self._collect(child, segments, segment_idx + 1, len_segments, out)
+
+        if node.param_child is not None:
+            self._collect(node.param_child, segments, segment_idx + 1, len_segments, out)
+
+        # A parameter with slashes may consume any number of the remaining segments
+        if node.multi_param_child is not None:
+            for next_idx in range(segment_idx + 1, len_segments + 1):
+                self._collect(node.multi_param_child, segments, next_idx, len_segments, out)
+
+# ################################################################################################################################
+
+    cpdef list get_candidates(self, unicode url_path):
+        """ Returns a sorted list of indexes of channels that may match the input URL path.
+        """
+        cdef list segments = url_path.split('/')
+        cdef set out = set(self.fallback)
+
+        self._collect(self.root, segments, 0, len(segments), out)
+
+        return sorted(out)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 cdef class CyURLData:
 
     cdef:
         public list channel_data
-        public dict url_path_cache
+        public object url_path_cache
+        public int url_path_cache_size
+        URLRouter _router
         bint has_trace1
 
-    def __init__(self, channel_data=None):
+    def __init__(self, channel_data=None, url_path_cache_size=_default_url_path_cache_size):
         self.channel_data = channel_data
-        self.url_path_cache = {}
-        self.url_target_cache = {}
+        self.url_path_cache = OrderedDict()
+        self.url_path_cache_size = url_path_cache_size
+        self._router = None
         self.has_trace1 = logger.isEnabledFor(TRACE1)
 
 # ################################################################################################################################
 
-    cpdef _remove_from_cache(self, unicode match_target):
+    cpdef on_channel_data_changed(self):
+        """ Must be called each time self.channel_data is modified - the routing trie will be rebuilt
+        on the next match and all the cached matches are discarded.
+        """
+        self._router = None
+        self.url_path_cache.clear()
 
-        targets_to_remove = []
-        cached_targets = self.url_path_cache.keys()
+# ################################################################################################################################
 
-        for target in cached_targets:
-            for item in self.channel_data:
-                matcher = item['match_target_compiled']
-                if matcher.pattern == match_target:
-                    if matcher.match(target) is not None:
-                        targets_to_remove.append(target)
+    cpdef _remove_from_cache(self, unicode match_target):
 
-        for target in targets_to_remove:
-            del self.url_path_cache[target]
+        # Changes to channels are rare enough that it is cheaper to clear out the whole cache
+        # than to look up all the entries that the match target matches.
+        self.url_path_cache.clear()
 
 # ################################################################################################################################
 
@@ -170,10 +322,12 @@ cdef class CyURLData:
         """ Attemps to match the combination of SOAPt Action and URL path against
         the list of HTTP channel targets.
         """
-        cdef bint needs_user, has_target_in_cache=True
+        cdef bint needs_user
+        cdef int idx
         cdef Matcher matcher
         cdef dict item
         cdef object item_bunch
+        cdef tuple cached
 
         cdef unicode target = ''
         target += '' # This used to be a SOAP action, now it is always an empty string
@@ -184,39 +338,46 @@ cdef class CyURLData:
         target += sep
         target += url_path
 
-        try:
-            self.url_target_cache[target]
-        except KeyError:
-            has_target_in_cache = False
+        # Return from cache if already seen, marking the entry as the most recently used one ..
+        cached = self.url_path_cache.get(target)
+        if cached is not None:
+            self.url_path_cache.move_to_end(target)
+            match, item_bunch = cached
+            return dict(match), item_bunch
+
+        # .. otherwise, build the routing trie if there is none yet ..
+        if self._router is None:
+            self._router = URLRouter(self.channel_data or [])
+
+        needs_user = not url_path.startswith('/zato')
 
-        # Return from cache if already seen
-        try:
-            ctx, channel_item = {}, self.url_path_cache[target]
-            return ctx, channel_item
-        except KeyError:
-            needs_user = not url_path.startswith('/zato')
+        # .. and check only the channels that the trie returned. They are sorted in the same order
+        # as in self.channel_data so the first one matching is still the same one as if we checked all of them.
+        for idx in self._router.get_candidates(url_path):
 
-            for item in self.channel_data:
+            item = self.channel_data[idx]
 
-                matcher = item['match_target_compiled']
-                if needs_user and matcher.is_internal:
-                    continue
+            matcher = item['match_target_compiled']
+            if needs_user and matcher.is_internal:
+                continue
 
-                match = matcher.match(target)
+            match = matcher.match(target)
 
-                if match is not None:
-                    if self.has_trace1:
-                        _log_trace1(_trace1, 'Matched target:`%s` with:`%r`', target, item)
+            if match is not None:
+                if self.has_trace1:
+                    _log_trace1(_trace1, 'Matched target:`%s` with:`%r`', target, item)
 
-                    item_bunch = _bunchify(item)
+                item_bunch = _bunchify(item)
 
-                    # Cache that target but only if it's a static URL without dynamic variables
-                    if (not has_target_in_cache) and matcher.is_static:
-                        self.url_path_cache[target] = item_bunch
+                # Cache the match, making sure that the cache does not grow beyond its limit.
+                # Note that we cache only matches, which means that random URL paths will not fill it up.
+                self.url_path_cache[target] = (match, item_bunch)
+                if len(self.url_path_cache) > self.url_path_cache_size:
+                    _ = self.url_path_cache.popitem(last=False)
 
-                    return match, item_bunch
+                return dict(match), item_bunch
 
-            return None, None
+        return None, None
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -216,6 +216,35 @@ class JSONResponse(BaseSIOTestCase):
         with self.assertRaises(SerialisationError):
             MyService._sio.get_output(data, DATA_FORMAT.JSON)
 
+# ################################################################################################################################
+
+    def test_response_plan_compiled_once(self):
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa', Int('bbb'), AsIs('ccc'), '-ddd'
+
+        CySimpleIO.attach_sio(None, self.get_server_config(), MyService)
+
+        # Text elements accept bytes and other non-string values too
+        data1 = {'aaa': 'aaa-1', 'bbb': '1', 'ccc': [1, 2]}
+        data2 = {'aaa': b'aaa-2', 'bbb': 2, 'ccc': None, 'ddd': 333}
+
+        result1 = MyService._sio.get_output([data1, data2], DATA_FORMAT.JSON)
+        plan = MyService._sio._output_plans[DATA_FORMAT.DICT]
+
+        result2 = MyService._sio.get_output([data1, data2], DATA_FORMAT.JSON)
+
+        # The same plan is used for each response ..
+        self.assertIs(MyService._sio._output_plans[DATA_FORMAT.DICT], plan)
+        self.assertEqual(result1, result2)
+
+        # .. and it produces the same output that each element would on its own.
+        json_data = json_loads(result1)
+
+        self.assertDictEqual(json_data[0], {'aaa': 'aaa-1', 'bbb': 1, 'ccc': [1, 2]})
+        self.assertDictEqual(json_data[1], {'aaa': 'aaa-2', 'bbb': 2, 'ccc': None, 'ddd': '333'})
+
 # ################################################################################################################################
 # ################################################################################################################################
 
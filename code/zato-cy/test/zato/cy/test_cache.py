@@ -7,7 +7,11 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from datetime import datetime
 from decimal import Decimal
+from email.utils import formatdate
+from hashlib import sha256
+from random import Random
 from time import sleep
 from unittest import main as unittest_main, TestCase
 from uuid import uuid4
@@ -358,6 +362,58 @@ class CacheTestCace(TestCase):
         self.assertIn(key2, c)
         self.assertNotIn(key3, c)
 
+# ################################################################################################################################
+
+    def test_delete_expired_extended_expiry(self):
+
+        key1, expected1 = 'key1', 'value1'
+        key2, expected2 = 'key2', 'value2'
+
+        c = Cache()
+        c.set(key1, expected1, 0.1, None)
+        c.set(key2, expected2, 0.1, None)
+
+        sleep(0.06)
+
+        # Reading key1 extends its expiry time by another 0.1 seconds
+        c.get(key1, None, False)
+
+        sleep(0.06)
+
+        deleted = c.delete_expired()
+        self.assertEqual(deleted, [key2])
+        self.assertIn(key1, c)
+
+        sleep(0.06)
+
+        deleted = c.delete_expired()
+        self.assertEqual(deleted, [key1])
+        self.assertEqual(len(c), 0)
+
+# ################################################################################################################################
+
+    def test_positions_many_operations(self):
+
+        max_size = 10
+        c = Cache(max_size)
+
+        # Enough operations to make the cache renumber its internal LRU stamps a few times
+        for idx in range(max_size * 10):
+            key = 'key{}'.format(idx % (max_size + 2))
+            c.set(key, idx, 0.0, None)
+            c.get(key, None, False)
+
+        keys = c.keys_by_position()
+        self.assertEqual(len(keys), max_size)
+        self.assertEqual(keys[0], 'key3')
+
+        for idx, key in enumerate(keys):
+            self.assertEqual(c.index(key), idx)
+            self.assertEqual(c.get(key, None, True).position, idx)
+
+            # Each .get moves the key to the head position
+            self.assertEqual(c.index(key), 0)
+
 # ################################################################################################################################
 
     def test_get_deletes_expired_key(self):
@@ -474,6 +530,115 @@ class CacheTestCace(TestCase):
         returned1 = c.get(key1, None, False)
         self.assertIs(returned1, expected1)
 
+# ################################################################################################################################
+
+    def test_metadata(self):
+
+        c = Cache()
+        c.set('key1', {'b': 2, 'a': 1}, 0.0, None)
+
+        entry = c.get('key1', None, True)
+
+        # The hash does not depend on the order of keys ..
+        self.assertEqual(entry.hash, sha256(b'{"a": 1, "b": 2}').hexdigest())
+
+        # .. and it changes along with the value.
+        c.set('key1', 'value1', 0.0, None)
+        self.assertEqual(entry.hash, sha256(b'value1').hexdigest())
+
+        # Timestamps in other formats always reflect the current ones ..
+        self.assertEqual(entry.last_read_iso, datetime.fromtimestamp(entry.last_read).isoformat())
+        self.assertEqual(entry.last_write_iso, datetime.fromtimestamp(entry.last_write).isoformat())
+        self.assertEqual(entry.prev_write_http, formatdate(entry.prev_write, usegmt=True))
+
+        # .. unless there is no such timestamp at all.
+        self.assertIsNone(entry.prev_read_iso)
+        self.assertIsNone(entry.prev_read_http)
+
+        as_dict = entry.to_dict()
+        self.assertEqual(as_dict['hash'], entry.hash)
+        self.assertEqual(as_dict['last_write_http'], entry.last_write_http)
+
+# ################################################################################################################################
+
+    def test_by_prefix_suffix(self):
+
+        c = Cache(max_size=100)
+
+        for idx in range(10):
+            c.set('tenant1.key{}.json'.format(idx), idx, 0.0, None)
+            c.set('tenant2.key{}.xml'.format(idx), idx, 0.0, None)
+
+        # Non-string keys are ignored
+        c.set(123, 'value', 0.0, None)
+        c.set(b'tenant1.bytes', 'value', 0.0, None)
+
+        self.assertEqual(c.get_by_prefix('tenant1.', False, 0), {'tenant1.key{}.json'.format(idx): idx for idx in range(10)})
+        self.assertEqual(c.get_by_suffix('.xml', False, 0), {'tenant2.key{}.xml'.format(idx): idx for idx in range(10)})
+        self.assertEqual(c.get_by_prefix('tenant3.', False, 0), {})
+
+        # At most limit keys are returned
+        self.assertEqual(len(c.get_by_prefix('tenant', False, 5)), 5)
+
+        # Keys added, evicted or deleted after the indexes were built are reflected in them ..
+        c.set('tenant1.new.xml', 'new', 0.0, None)
+        c.delete('tenant1.key0.json')
+
+        self.assertIn('tenant1.new.xml', c.get_by_prefix('tenant1.', False, 0))
+        self.assertIn('tenant1.new.xml', c.get_by_suffix('.xml', False, 0))
+        self.assertNotIn('tenant1.key0.json', c.get_by_suffix('.json', False, 0))
+
+        # .. including the ones changed by operations by prefix and suffix themselves ..
+        out = c.delete_by_prefix('tenant1.', True, 0)
+        self.assertEqual(len(out), 10)
+        self.assertEqual(c.get_by_suffix('.json', False, 0), {})
+
+        meta_ref = {'_now': None, '_any_found': False}
+        _ = c.set_by_suffix('.xml', 'updated', 0.0, False, meta_ref, False, 0)
+        self.assertTrue(meta_ref['_any_found'])
+        self.assertEqual(set(c.get_by_prefix('tenant2.', False, 0).values()), {'updated'})
+
+        # .. as well as by clearing the cache.
+        c.clear()
+        self.assertEqual(c.get_by_prefix('tenant', False, 0), {})
+
+        c.set('tenant2.abc', 1, 0.0, None)
+        self.assertEqual(c.get_by_suffix('abc', False, 0), {'tenant2.abc': 1})
+
+# ################################################################################################################################
+
+    def test_by_prefix_suffix_many_keys(self):
+
+        # There are enough keys for the indexes to be split into many blocks
+        c = Cache(max_size=20_000)
+        random = Random(123)
+        keys = set()
+
+        def get_expected(prefix:'str', suffix:'str') -> 'set':
+            return {key for key in keys if key.startswith(prefix) and key.endswith(suffix)}
+
+        # Build the indexes first so that all the changes below need to be reflected in them
+        self.assertEqual(c.get_by_prefix('t', False, 0), {})
+        self.assertEqual(c.get_by_suffix('t', False, 0), {})
+
+        for idx in range(30_000):
+
+            key = 'tenant{}.key{}'.format(random.randint(1, 20), random.randint(1, 500))
+
+            # Most operations add keys and some delete them
+            if random.random() < 0.7:
+                c.set(key, idx, 0.0, None)
+                keys.add(key)
+            else:
+                c.delete(key)
+                keys.discard(key)
+
+        for prefix in ('tenant1', 'tenant1.', 'tenant20.', 'tenant3.key4', 'tenant99', ''):
+            self.assertEqual(set(c.get_by_prefix(prefix, False, 0)), get_expected(prefix, ''), prefix)
+
+        for suffix in ('key1', '.key499', '0', 'missing'):
+            self.assertEqual(set(c.get_by_suffix(suffix, False, 0)), get_expected('', suffix), suffix)
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
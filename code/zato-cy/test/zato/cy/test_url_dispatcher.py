@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main as unittest_main, TestCase
+
+# Zato
+from zato.url_dispatcher import CyURLData, Matcher
+
+# ################################################################################################################################
+
+_methods = '(GET|POST|PUT|DELETE)'
+_accept = 'haanyHTTP_SEPhaany'
+
+# ################################################################################################################################
+
+class _URLData(CyURLData):
+    pass
+
+# ################################################################################################################################
+
+class URLDispatcherTestCase(TestCase):
+
+    def _get_url_data(self, url_paths, match_slash=False, url_path_cache_size=100):
+
+        channel_data = []
+
+        for idx, url_path in enumerate(url_paths):
+            match_target = ':::{}:::{}:::{}'.format(_methods, _accept, url_path)
+            channel_data.append({
+                'name': 'channel.{}'.format(idx),
+                'match_target': match_target,
+                'match_target_compiled': Matcher(match_target, match_slash),
+                'is_internal': url_path.startswith('/zato'),
+            })
+
+        return _URLData(channel_data, url_path_cache_size)
+
+# ################################################################################################################################
+
+    def test_match_static_and_params(self):
+
+        url_data = self._get_url_data([
+            '/api/users',
+            '/api/users/me',
+            '/api/users/{user_id}',
+            '/api/users/{user_id}/groups/{group_id}',
+        ])
+
+        match, item = url_data.match('/api/users', 'GET', '*/*')
+        self.assertEqual(match, {})
+        self.assertEqual(item['name'], 'channel.0')
+
+        match, item = url_data.match('/api/users/me', 'GET', '*/*')
+        self.assertEqual(match, {})
+        self.assertEqual(item['name'], 'channel.1')
+
+        match, item = url_data.match('/api/users/123', 'POST', '*/*')
+        self.assertEqual(match, {'user_id': '123'})
+        self.assertEqual(item['name'], 'channel.2')
+
+        match, item = url_data.match('/api/users/123/groups/456', 'GET', '*/*')
+        self.assertEqual(match, {'user_id': '123', 'group_id': '456'})
+        self.assertEqual(item['name'], 'channel.3')
+
+        match, item = url_data.match('/api/users/123/groups', 'GET', '*/*')
+        self.assertIsNone(match)
+        self.assertIsNone(item)
+
+        # This HTTP method is not allowed
+        match, item = url_data.match('/api/users', 'PATCH', '*/*')
+        self.assertIsNone(item)
+
+# ################################################################################################################################
+
+    def test_match_params_with_slashes(self):
+
+        url_data = self._get_url_data(['/files/{path}/meta'], match_slash=True)
+
+        match, item = url_data.match('/files/a/b/c/meta', 'GET', '*/*')
+        self.assertEqual(match, {'path': 'a/b/c'})
+        self.assertEqual(item['name'], 'channel.0')
+
+# ################################################################################################################################
+
+    def test_match_partial_segment_params(self):
+
+        url_data = self._get_url_data(['/api/report.{format}'])
+
+        match, item = url_data.match('/api/report.json', 'GET', '*/*')
+        self.assertEqual(match, {'format': 'json'})
+        self.assertEqual(item['name'], 'channel.0')
+
+# ################################################################################################################################
+
+    def test_cache_is_bounded(self):
+
+        url_data = self._get_url_data(['/api/users/{user_id}'], url_path_cache_size=10)
+
+        for idx in range(100):
+            match, _ = url_data.match('/api/users/{}'.format(idx), 'GET', '*/*')
+            self.assertEqual(match, {'user_id': str(idx)})
+
+        self.assertEqual(len(url_data.url_path_cache), 10)
+
+        # Paths that do not match anything are never cached
+        for idx in range(100):
+            _ = url_data.match('/no/such/path/{}'.format(idx), 'GET', '*/*')
+
+        self.assertEqual(len(url_data.url_path_cache), 10)
+
+# ################################################################################################################################
+
+    def test_channel_data_changed(self):
+
+        url_data = self._get_url_data(['/api/users'])
+
+        _, item = url_data.match('/api/orders', 'GET', '*/*')
+        self.assertIsNone(item)
+
+        match_target = ':::{}:::{}:::/api/orders'.format(_methods, _accept)
+        url_data.channel_data.append({
+            'name': 'channel.new',
+            'match_target': match_target,
+            'match_target_compiled': Matcher(match_target, False),
+            'is_internal': False,
+        })
+        url_data.on_channel_data_changed()
+
+        _, item = url_data.match('/api/orders', 'GET', '*/*')
+        self.assertEqual(item['name'], 'channel.new')
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = unittest_main()
+
+# ################################################################################################################################
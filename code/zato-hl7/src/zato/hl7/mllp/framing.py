@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import byteslist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FramingError(ValueError):
+    """ Raised when data received from a remote end is not valid MLLP. The connection should be closed when it happens.
+    """
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FrameReader:
+    """ Splits a stream of bytes from a single connection into MLLP frames. All the data received is kept in one growable
+    buffer which is scanned for the start and end sequences. Each call to feed returns all the frames completed by the data
+    given on input, which means that messages pipelined by a sender into a single TCP segment are all found,
+    and any partial data trailing them is kept until the next call.
+    """
+    __slots__ = 'start_seq', 'start_seq_len', 'end_seq', 'end_seq_len', 'max_msg_size', 'buffer', 'scan_from'
+
+    start_seq: 'bytes'
+    start_seq_len: 'int'
+
+    end_seq: 'bytes'
+    end_seq_len: 'int'
+
+    max_msg_size: 'int'
+
+    buffer: 'bytearray'
+    scan_from: 'int'
+
+    def __init__(self, start_seq:'bytes', end_seq:'bytes', max_msg_size:'int') -> 'None':
+
+        self.start_seq = start_seq
+        self.start_seq_len = len(start_seq)
+
+        self.end_seq = end_seq
+        self.end_seq_len = len(end_seq)
+
+        self.max_msg_size = max_msg_size
+
+        # Data received that is not part of any complete frame yet. It always begins where the next frame should.
+        self.buffer = bytearray()
+
+        # Where to resume looking for end_seq from in the buffer, so that each byte is scanned once only,
+        # except for the last few ones that may be part of an end_seq split across two reads.
+        self.scan_from = 0
+
+# ################################################################################################################################
+
+    def __len__(self) -> 'int':
+        return len(self.buffer)
+
+# ################################################################################################################################
+
+    def _check_header(self, pos:'int') -> 'bool':
+        """ Returns True if the buffer has a full header at pos, False if there are not enough bytes to tell yet
+        and raises an exception if what was received is not a header.
+        """
+        buffer = self.buffer
+        available = len(buffer) - pos
+
+        # We have enough data to check the whole of the header ..
+        if available >= self.start_seq_len:
+            if buffer.startswith(self.start_seq, pos):
+                return True
+            else:
+                received = bytes(buffer[pos:pos + self.start_seq_len])
+
+        # .. otherwise, whatever we have must be at least the beginning of one.
+        else:
+            received = bytes(buffer[pos:])
+            if self.start_seq.startswith(received):
+                return False
+
+        raise FramingError('header mismatch `{!r}` != `{!r}`'.format(received, self.start_seq))
+
+# ################################################################################################################################
+
+    def feed(self, data:'bytes') -> 'byteslist':
+        """ Appends data to the buffer and returns payloads of all the frames that are complete now,
+        without their start and end sequences.
+        """
+        # Local aliases
+        buffer = self.buffer
+        start_seq_len = self.start_seq_len
+        end_seq = self.end_seq
+        end_seq_len = self.end_seq_len
+
+        buffer += data
+        out = [] # type: byteslist
+
+        # Where the current frame begins
+        pos = 0
+
+        while pos < len(buffer):
+
+            # Each frame needs to begin with a header ..
+            if not self._check_header(pos):
+                break
+
+            # .. and it ends with the first end_seq after the header.
+            end = buffer.find(end_seq, max(pos + start_seq_len, self.scan_from))
+
+            # We have a full frame so its payload can be returned ..
+            if end > -1:
+
+                # Copy the payload out of the buffer exactly once, through a view, since it will outlive the buffer's contents
+                with memoryview(buffer) as view:
+                    out.append(bytes(view[pos + start_seq_len:end]))
+
+                pos = end + end_seq_len
+                self.scan_from = pos
+
+            # .. otherwise, we need more data but next time we only need to look at what comes after this read,
+            # except for the last few bytes that may turn out to be the beginning of an end_seq.
+            else:
+                self.scan_from = max(pos + start_seq_len, len(buffer) - end_seq_len + 1)
+                break
+
+        # Remove all the complete frames in one go rather than one by one ..
+        if pos:
+            del buffer[:pos]
+            self.scan_from = max(self.scan_from - pos, 0)
+
+        # .. and make sure that whatever is left does not exceed our limit.
+        if len(buffer) > self.max_msg_size:
+            raise FramingError('message exceeds max. size allowed `{}` > `{}`'.format(len(buffer), self.max_msg_size))
+
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
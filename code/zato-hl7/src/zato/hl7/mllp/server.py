@@ -21,6 +21,7 @@ from zato.common.audit_log import DataReceived, DataSent
 from zato.common.typing_ import cast_
 from zato.common.util.api import new_cid
 from zato.common.util.tcp import get_fqdn_by_ip, ZatoStreamServer
+from zato.hl7.mllp.framing import FrameReader, FramingError
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -30,8 +31,7 @@ if 0:
     from socket import socket as Socket
     from bunch import Bunch
     from zato.common.audit_log import AuditLog
-    from zato.common.typing_ import any_, anydict, anylist, anytuple, boolnone, byteslist, bytesnone, callable_, type_
-    byteslist = byteslist
+    from zato.common.typing_ import any_, anydict, anytuple, bytesnone, callable_, type_
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -59,9 +59,6 @@ def new_msg_id(
 
 class HandleCompleteMessageArgs:
 
-    _buffer:           'anylist'
-    _buffer_join_func: 'callable_'
-
     conn_ctx:    'ConnCtx'
     request_ctx: 'RequestCtx'
 
@@ -209,7 +206,6 @@ class HL7MLLPServer:
 
     start_seq: 'str'
     start_seq_len: 'int'
-    start_seq_len_eq_one: 'bool'
 
     end_seq: 'str'
     end_seq_len: 'int'
@@ -247,7 +243,6 @@ class HL7MLLPServer:
 
         self.start_seq     = cast_('str', config.start_seq)
         self.start_seq_len = len(self.start_seq)
-        self.start_seq_len_eq_one = self.start_seq_len == 1
 
         self.end_seq     = cast_('str', config.end_seq)
         self.end_seq_len = len(self.end_seq)
@@ -319,16 +314,6 @@ class HL7MLLPServer:
 
         self._logger_info('Waiting for HL7 MLLP data from %s', conn_ctx.get_conn_pretty_info())
 
-        # Current message whose contents we are accumulating
-        _buffer = []
-
-        # Details of the current message
-        request_ctx = RequestCtx()
-        request_ctx.conn_id = conn_ctx.conn_id
-
-        # To indicate if message header is already checked or not
-        _needs_header_check = True
-
         # To make fewer namespace lookups
         _max_msg_size = int(cast_('str', self.config.max_msg_size))
         _recv_timeout = self.config.recv_timeout # type: float
@@ -336,24 +321,28 @@ class HL7MLLPServer:
         # We do not want for this to be too small
         _read_buffer_size = max(self.read_buffer_size, self.min_read_buffer_size)
 
+        # Splits data received into individual messages, including ones pipelined by the sender into a single read
+        _frame_reader = FrameReader(cast_('bytes', self.start_seq), cast_('bytes', self.end_seq), _max_msg_size)
+
+        # Details of the current message
+        request_ctx = RequestCtx()
+        request_ctx.conn_id = conn_ctx.conn_id
+
         _has_debug_log = self._has_debug_log
         _log_debug = self._logger_debug
 
         _run_callback = self._run_callback
-        _check_header = self._check_header
         _close_connection = self._close_connection
+        _handle_complete_message = self._handle_complete_message
         _request_ctx_reset = request_ctx.reset
-        _buffer_append = _buffer.append
-        _buffer_len    = _buffer.__len__
-        _buffer_join_func = b''.join
+        _frame_reader_feed = _frame_reader.feed
+        _frame_overhead = self.start_seq_len + self.end_seq_len
 
         _socket_recv = conn_ctx.socket.recv
         _socket_send = conn_ctx.socket.send
         _socket_settimeout = conn_ctx.socket.settimeout
 
         _handle_complete_message_args = HandleCompleteMessageArgs()
-        _handle_complete_message_args._buffer = _buffer
-        _handle_complete_message_args._buffer_join_func = _buffer_join_func
         _handle_complete_message_args.conn_ctx = conn_ctx
         _handle_complete_message_args.request_ctx = request_ctx
         _handle_complete_message_args._socket_send = _socket_send
@@ -367,8 +356,9 @@ class HL7MLLPServer:
                 # In each iteration, assume that no data was received
                 data = None
 
-                # Check whether reading the data would not exceed our message size limit
-                new_size = request_ctx.msg_size + _read_buffer_size
+                # Check whether reading the data would not exceed our message size limit,
+                # given how many bytes of a message that is not complete yet we already have.
+                new_size = len(_frame_reader) + _read_buffer_size
                 if new_size > _max_msg_size:
                     reason = 'message would exceed max. size allowed `{}` > `{}`'.format(new_size, _max_msg_size)
                     _close_connection(conn_ctx, reason)
@@ -397,120 +387,22 @@ class HL7MLLPServer:
                 # .. no timeout = we may have received some data from the socket ..
                 else:
 
-                    # .. something was received so we can append it to our buffer ..
+                    # .. something was received so we can look up all the messages that it completes, if any.
+                    # The reader checks that each message begins with a header and it keeps any trailing data
+                    # that is only a part of a message until we receive the rest of it ..
                     if data:
 
-                        # If we are here, it means that the recv call succeeded so we can increase the message size
-                        # by how many bytes were actually read from the socket.
-                        request_ctx.msg_size += len(data)
-
-                        # At this point we either do not have all the bytes required to check the header
-                        # or the header is already checked, so we can just append data to our current buffer ..
-                        _buffer_append(data)
-
-                        # The first byte may be a header and we need to check whether we require it or not at this stage of parsing.
-                        # This method will close the connection if anything to do with header parsing is invalid.
-                        if _needs_header_check:
-
-                            # If we have a single-byte header, we can check it immediately. This is because
-                            # we received some data, which means one byte at the very least, so we can go ahead
-                            # with checking the header ..
-                            if self.start_seq_len_eq_one:
-                                if not _check_header(conn_ctx, request_ctx, data):
-                                    return
-                                else:
-                                    _needs_header_check = False
-
-                            # .. but if we have a multi-byte header, we need to ensure we have already
-                            # read as many bytes as there are in the expected header. We do it by iterating
-                            # over the buffer of bytes received so far and concatenating them until we have
-                            # at least as many bytes as there are in the header to check.
-                            else:
-                                to_check_buffer = [] # type: byteslist
-                                to_check_len = 0
-
-                                # Go through each, potentially multi-byte, element in the buffer so far ..
-                                for elem in _buffer:
-                                    elem = cast_('bytes', elem)
-
-                                    # .. break if we have already all the bytes that we need ..
-                                    if to_check_len >= self.start_seq_len:
-                                        break
-
-                                    # .. otherwise, append bytes from the current element
-                                    # and increase the bytes read so far counter.
-                                    else:
-                                        to_check_buffer.append(elem)
-                                        to_check_len += len(elem)
-
-                                # We still need to check if we have the full header worth of bytes already ..
-                                if to_check_len >= self.start_seq_len:
-
-                                    # .. and if we do, we can look up the header now.
-                                    to_check = b''.join(to_check_buffer)
-
-                                    if not _check_header(conn_ctx, request_ctx, to_check):
-                                        return
-                                    else:
-                                        _needs_header_check = False
-
-                                else:
-                                    # .. otherwise, if we do not have enough bytes,
-                                    # we do nothing and this block is added to make it explicit that it is the case.
-                                    pass
-
-                        # .. the line that have just received may have been part of a trailer
-                        # or the trailer itself so we need to check it ..
-
-                        # .. but we need to take into account the fact that the trailer has been split into two or more
-                        # segments. For instance, the previous segment of bytes returned by _socket_recv
-                        # ended with the first byte of end_seq and now we have received the second byte.
-                        # E.g. our _read_buffer_size is 2048 and if the overall message happens to be 2049 bytes
-                        # then the first byte of end_seq will be in the buffer already and the data currently
-                        # received contains the second byte. Note that if someone uses end_seq longer than two bytes
-                        # this will still work because our _read_buffer_size is always at least 2048 bytes
-                        # so end_seq may be split across two segments at most (unless someone uses a multi-kilobyte end_seq,
-                        # which is not something to be expected).
-
-                        # First, try to check if data currently received ends in end_seq ..
-                        if self._points_to_full_message(data):
-
-                            # .. even if it does, make sure we have a header already and reject the message otherwise ..
-                            if _needs_header_check:
-                                reason = 'end bytes `{}` received without a preceeding header `{}` (#1)'.format(
-                                    self.end_seq, self.start_seq)
-                                self._close_connection(conn_ctx, reason)
-                                return
-
-                            # .. it is a match so it means that data was the last part of a message that we can already process ..
-                            self._handle_complete_message(_handle_complete_message_args)
-
-                        # .. otherwise, try to check if in combination with the previous segment,
-                        # the data received now points to a full message. However, for this to work
-                        # we require that there be at least one previous segment - otherwise we are the first one
-                        # and if we were the ending one we would have been caught in the if above ..
-                        else:
-
-                            if _buffer_len() > 1:
-
-                                # Index -1 is our own segment (data) previously appended,
-                                # which is why we use -2 to get the segment preceeding it.
-                                last_data = _buffer[-2] # type: bytes
-                                concatenated = last_data + data
-
-                                # .. now that we have it concatenated, check if that indicates that a full message
-                                # is already received.
-                                if self._points_to_full_message(concatenated):
-
-                                    # Again, even if it does but have not received the header yet,
-                                    # we need to reject the whole message.
-                                    if _needs_header_check:
-                                        reason = 'end bytes `{}` received without a preceeding header `{}` (#2)'.format(
-                                            self.end_seq, self.start_seq)
-                                        self._close_connection(conn_ctx, reason)
-                                        return
-
-                                    self._handle_complete_message(_handle_complete_message_args)
+                        try:
+                            messages = _frame_reader_feed(data)
+                        except FramingError as e:
+                            _close_connection(conn_ctx, e.args[0])
+                            return
+
+                        # .. and each complete message is handled in the order that it was received in.
+                        for message in messages:
+                            request_ctx.data = message
+                            request_ctx.msg_size = len(message) + _frame_overhead
+                            _handle_complete_message(_handle_complete_message_args)
 
                     # No data received = remote end is no longer connected.
                     else:
@@ -529,31 +421,12 @@ class HL7MLLPServer:
                 # .. and sleep for a while in case we cannot re-enter the loop immediately.
                 sleep(2)
 
-# ################################################################################################################################
-
-    def _points_to_full_message(self, data:'bytes') -> 'bool':
-        """ Returns True if input bytes indicate that we have a full message from the socket.
-        """
-        # Get as many bytes from data as we expected for our end_seq to be the length of ..
-        data_last_bytes = data[-self.end_seq_len:]
-
-        # .. return True if the last bytes point to our having a complete message to process.
-        return data_last_bytes == self.end_seq
-
 # ################################################################################################################################
 
     def _handle_complete_message(self, args:'HandleCompleteMessageArgs') -> 'None':
 
-        # Produce the message to invoke the callback with ..
-        _buffer_data = args._buffer_join_func(args._buffer)
-
-        # .. remove the header and trailer ..
-        _buffer_data = _buffer_data[self.start_seq_len:-self.end_seq_len]
-
-        # .. asign the actual business data to message ..
-        args.request_ctx.data = _buffer_data
-
-        # .. update our runtime metadata first (data received) ..
+        # Our caller has already assigned the actual business data, without the header and trailer, to the message,
+        # so we can update our runtime metadata first (data received) ..
         if self.is_audit_log_received_active:
             self._store_data_received(args.request_ctx)
 
@@ -666,50 +539,6 @@ class HL7MLLPServer:
         self._logger_info('Closing connection; %s; %s', reason, conn_ctx.get_conn_pretty_info())
         conn_ctx.socket.close()
 
-# ################################################################################################################################
-
-    def _check_meta(
-        self,
-        conn_ctx,       # type: ConnCtx
-        request_ctx,    # type: RequestCtx
-        data,           # type: bytes
-        bytes_to_check, # type: bytes
-        meta_attr,      # type: str
-        has_meta_attr,  # type: str
-        meta_seq        # type: str
-    ) -> 'boolnone':
-
-        # If we already have the meta element then we do not expect another one
-        # while we are still processing the same message and if one is found, we close the connection.
-        if request_ctx.meta[has_meta_attr]:
-            if bytes_to_check == meta_seq:
-                reason = 'unexpected {} found `{!r}` == `{!r}` in data `{!r}`'.format(meta_attr, bytes_to_check, meta_seq, data)
-                self._close_connection(conn_ctx, reason)
-                return
-
-        # If we do not have the element, it must be a new message that we are receiving.
-        # In such a case, we expect for it to begin with a header. Otherwise, we reject the entire connection.
-        else:
-            if bytes_to_check != meta_seq:
-                reason = '{} mismatch `{!r}` != `{!r}` in data `{!r}`'.format(meta_attr, bytes_to_check, meta_seq, data)
-                self._close_connection(conn_ctx, reason)
-                return
-
-        # If we are here, it means that the meta attribute is correct
-        request_ctx.meta[has_meta_attr] = True
-        return True
-
-# ################################################################################################################################
-
-    def _check_header(self, conn_ctx:'ConnCtx', request_ctx:'RequestCtx', data:'bytes') -> 'boolnone':
-
-        bytes_to_check = data[:self.start_seq_len]
-        meta_attr = 'header'
-        has_meta_attr  = 'has_start_seq'
-        meta_seq = self.start_seq
-
-        return self._check_meta(conn_ctx, request_ctx, data, bytes_to_check, meta_attr, has_meta_attr, meta_seq)
-
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# Zato
+from zato.hl7.mllp.framing import FrameReader, FramingError
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+start_seq = b'\x0b'
+end_seq = b'\x1c\x0d'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FrameReaderTestCase(TestCase):
+
+    def _get_reader(self, start_seq:'bytes'=start_seq, max_msg_size:'int'=1_000_000) -> 'FrameReader':
+        return FrameReader(start_seq, end_seq, max_msg_size)
+
+# ################################################################################################################################
+
+    def test_pipelined_messages(self):
+
+        reader = self._get_reader()
+
+        # Three messages in one read, the last one incomplete ..
+        data = b'\x0bmsg1\x1c\x0d' + b'\x0bmsg2\x1c\x0d' + b'\x0bmsg3'
+        self.assertEqual(reader.feed(data), [b'msg1', b'msg2'])
+
+        # .. only the incomplete one is kept ..
+        self.assertEqual(len(reader), 5)
+
+        # .. and it is returned once the rest of it is received.
+        self.assertEqual(reader.feed(b'\x1c\x0d'), [b'msg3'])
+        self.assertEqual(len(reader), 0)
+
+# ################################################################################################################################
+
+    def test_sequences_split_across_reads(self):
+
+        reader = self._get_reader(start_seq=b'\x0b\x0b')
+        data = b'\x0b\x0bmsg1\x1c\x0d\x0b\x0bmsg2\x1c\x0d'
+
+        # Feed one byte at a time so that each start and end sequence is split across reads
+        out = []
+        for idx in range(len(data)):
+            out.extend(reader.feed(data[idx:idx+1]))
+
+        self.assertEqual(out, [b'msg1', b'msg2'])
+
+# ################################################################################################################################
+
+    def test_invalid_header(self):
+
+        reader = self._get_reader()
+
+        # The first message is still returned ..
+        self.assertEqual(reader.feed(b'\x0bmsg1\x1c\x0d'), [b'msg1'])
+
+        # .. but the next one does not begin with a header.
+        with self.assertRaises(FramingError):
+            _ = reader.feed(b'msg2\x1c\x0d')
+
+# ################################################################################################################################
+
+    def test_max_msg_size(self):
+
+        reader = self._get_reader(max_msg_size=10)
+
+        # Complete messages are never kept so they do not count towards the limit ..
+        self.assertEqual(reader.feed(b'\x0bmsg1\x1c\x0d' * 10), [b'msg1'] * 10)
+
+        # .. unlike the ones that are still incomplete.
+        with self.assertRaises(FramingError):
+            _ = reader.feed(b'\x0b' + b'a' * 10)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -8,7 +8,10 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import datetime
+from heapq import heappop, heappush
+from itertools import count
 from logging import getLogger
+from time import time
 from traceback import format_exc
 
 # datetime
@@ -17,6 +20,7 @@ from dateutil.rrule import rrule, SECONDLY
 # gevent
 import gevent # Imported directly so it can be mocked out in tests
 from gevent import lock, sleep
+from gevent.event import Event
 
 # paodate
 from paodate import Delta
@@ -48,6 +52,18 @@ logger = getLogger(__name__)
 
 initial_sleep = 0.1
 
+_utc_epoch = datetime.datetime(1970, 1, 1)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _to_timestamp(value:'datetime.datetime') -> 'float':
+    """ Converts a UTC datetime object, with or without timezone information, to seconds since epoch.
+    """
+    if value.tzinfo:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (value - _utc_epoch).total_seconds()
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -245,6 +261,23 @@ class Job:
         """
         return spawn_greenlet(*args, **kwargs)
 
+    def fire(self):
+        """ Runs the job once, without waiting for its callback to complete.
+        """
+        self.current_run += 1
+
+        # Perhaps we've already been executed enough times
+        if self.max_repeats and self.current_run == self.max_repeats:
+            self.keep_running = False
+            self.max_repeats_reached = True
+            self.max_repeats_reached_at = datetime.datetime.utcnow()
+
+            if self.on_max_repeats_reached_cb:
+                self.on_max_repeats_reached_cb(self)
+
+        # Invoke callback in a new greenlet so it doesn't block the current one.
+        self._spawn(self.callback, **{'ctx':self.get_context()})
+
     def main_loop(self):
 
         logger.info('Job entering main loop `%s`', self)
@@ -254,19 +287,7 @@ class Job:
         try:
             while self.keep_running:
                 try:
-                    self.current_run += 1
-
-                    # Perhaps we've already been executed enough times
-                    if self.max_repeats and self.current_run == self.max_repeats:
-                        self.keep_running = False
-                        self.max_repeats_reached = True
-                        self.max_repeats_reached_at = datetime.datetime.utcnow()
-
-                        if self.on_max_repeats_reached_cb:
-                            self.on_max_repeats_reached_cb(self)
-
-                    # Invoke callback in a new greenlet so it doesn't block the current one.
-                    self._spawn(self.callback, **{'ctx':self.get_context()})
+                    self.fire()
 
                 except Exception:
                     logger.warning(format_exc())
@@ -287,6 +308,23 @@ class Job:
 
         return True
 
+# ################################################################################################################################
+
+    def can_start(self):
+        """ Returns True if the job has everything it needs to start running.
+        """
+        # If we are a job that triggers file transfer channels we do not start
+        # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
+        if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
+            logger.warning('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
+            return False
+
+        if not self.start_time:
+            logger.warning('Job `%s` cannot start without start_time set', self.name)
+            return False
+
+        return True
+
 # ################################################################################################################################
 
     def run(self):
@@ -294,14 +332,7 @@ class Job:
         # OK, we're ready
         try:
 
-            # If we are a job that triggers file transfer channels we do not start
-            # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
-            if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
-                logger.warning('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
-                return
-
-            if not self.start_time:
-                logger.warning('Job `%s` cannot start without start_time set', self.name)
+            if not self.can_start():
                 return
 
             logger.info('Job starting `%s`', self)
@@ -328,6 +359,159 @@ class Job:
 # ################################################################################################################################
 # ################################################################################################################################
 
+class TimerHeap:
+    """ Runs all the jobs from a single greenlet instead of each job running in a greenlet of its own. Jobs are kept
+    in a min-heap ordered by the absolute time of their next run. The next run time is computed from the time the job
+    was scheduled to run at rather than from when it actually ran, which means that intervals do not drift.
+    """
+    def __init__(self, max_batch_size:'int'=SCHEDULER.Timer_Heap_Max_Batch_Size) -> 'None':
+
+        # How many due jobs to run at most before letting other greenlets run
+        self.max_batch_size = max_batch_size
+
+        # Tuples of (next run time, sequence number, job) - the sequence number makes sure that jobs are never compared
+        self.heap = []
+
+        # Job names -> jobs currently scheduled. Removed jobs stay in self.heap and are skipped when they are due.
+        self.jobs = {}
+
+        self.sequence = count()
+        self.keep_running = True
+        self.wakeup_event = Event()
+
+# ################################################################################################################################
+
+    def _push(self, next_run:'float', job:'Job') -> 'None':
+        heappush(self.heap, (next_run, next(self.sequence), job))
+
+# ################################################################################################################################
+
+    def add(self, job:'Job') -> 'None':
+        """ Schedules a job to run for the first time at its start_time, or as soon as possible if it is in the past.
+        """
+        if not job.can_start():
+            return
+
+        next_run = _to_timestamp(job.start_time)
+        is_earliest = not self.heap or next_run < self.heap[0][0]
+
+        self.jobs[job.name] = job
+        self._push(next_run, job)
+
+        # Wake up the main loop if it is waiting for a job that is due later than this one
+        if is_earliest:
+            self.wakeup_event.set()
+
+# ################################################################################################################################
+
+    def remove(self, name:'str') -> 'bool':
+        """ Unschedules a job by its name. Returns True if the job was scheduled.
+        """
+        job = self.jobs.pop(name, None)
+
+        # If many jobs have been removed, e.g. after many edits, remove their entries from the heap too.
+        if len(self.heap) > 2 * len(self.jobs) + self.max_batch_size:
+            self.heap[:] = [elem for elem in self.heap if self.jobs.get(elem[2].name) is elem[2]]
+            self.heap.sort()
+
+        return job is not None
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+        self.wakeup_event.set()
+
+# ################################################################################################################################
+
+    def get_next_run(self, job:'Job', last_run:'float', now:'float') -> 'float | None':
+        """ Returns when the job should run next, given the time it was last scheduled to run at,
+        or None if it should not run anymore.
+        """
+        if job.type == SCHEDULER.JOB_TYPE.ONE_TIME or not job.keep_running:
+            return None
+
+        if job.type == SCHEDULER.JOB_TYPE.INTERVAL_BASED:
+            interval = job.interval.in_seconds
+            next_run = last_run + interval
+
+            # We are late by at least one full interval, e.g. because the process was suspended,
+            # in which case we skip the runs that were missed instead of running them all in a row.
+            if next_run <= now and interval > 0:
+                next_run += ((now - next_run) // interval + 1) * interval
+
+        else:
+            last_run_dt = datetime.datetime.utcfromtimestamp(last_run)
+            next_run = last_run + job.get_sleep_time(last_run_dt)
+
+            # The previous run time itself may be considered to match the cron definition ..
+            if next_run <= last_run:
+
+                # .. in which case we look for the first match after it.
+                last_run_dt += datetime.timedelta(seconds=1)
+                next_run = last_run + 1 + job.get_sleep_time(last_run_dt)
+
+        return next_run
+
+# ################################################################################################################################
+
+    def run_due_jobs(self, now:'float') -> 'int':
+        """ Runs jobs that are due as of now, up to self.max_batch_size of them, and returns how many were run.
+        """
+        heap = self.heap
+        jobs = self.jobs
+        run_count = 0
+
+        while heap and heap[0][0] <= now and run_count < self.max_batch_size:
+
+            last_run, _, job = heappop(heap)
+
+            # This job has been unscheduled or replaced with a new one since it was added to the heap
+            if jobs.get(job.name) is not job:
+                continue
+
+            try:
+                job.fire()
+            except Exception:
+                logger.warning(format_exc())
+
+            run_count += 1
+
+            next_run = self.get_next_run(job, last_run, now)
+
+            if next_run is None:
+                del jobs[job.name]
+            else:
+                self._push(next_run, job)
+
+        return run_count
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+        """ The main loop - waits until the earliest job is due, or until a job due even earlier is added, and runs due jobs.
+        """
+        logger.info('Scheduler timer heap started')
+
+        while self.keep_running:
+            try:
+                self.wakeup_event.clear()
+
+                # If there were more due jobs than we could run at once, let the greenlets spawned for them run first ..
+                if self.run_due_jobs(time()) == self.max_batch_size:
+                    sleep(0)
+                    continue
+
+                # .. otherwise, wait until the next job is due or until we are woken up.
+                timeout = max(self.heap[0][0] - time(), 0) if self.heap else None
+                _ = self.wakeup_event.wait(timeout)
+
+            except Exception:
+                logger.warning(format_exc())
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class Scheduler:
 
     def __init__(self, config:'SchedulerServerConfig', api:'SchedulerAPI') -> 'None':
@@ -350,6 +534,10 @@ class Scheduler:
         self.job_log = getattr(logger, config.job_log_level)
         self.initial_sleep_time = self.config.main.get('misc', {}).get('initial_sleep_time') or SCHEDULER.InitialSleepTime
 
+        # Jobs run either in a greenlet each or all together from a timer heap
+        self.engine = self.config.main.get('misc', {}).get('engine') or SCHEDULER.Engine.Default
+        self.timer_heap = TimerHeap() if self.engine == SCHEDULER.Engine.Timer_Heap else None
+
         # We set it to True for backward compatibility with pre-3.2
         self.prefer_odb_config = self.config.raw_config.server.get('server_prefer_odb_config', True)
 
@@ -410,6 +598,9 @@ class Scheduler:
             del self.job_greenlets[name]
             found = True
 
+        if self.timer_heap and self.timer_heap.remove(name):
+            found = True
+
         return found
 
 # ################################################################################################################################
@@ -532,7 +723,11 @@ class Scheduler:
         """
         job.callback = self.on_job_executed
         job.on_max_repeats_reached_cb = self.on_max_repeats_reached
-        self.job_greenlets[job.name] = self._spawn(job.run)
+
+        if self.timer_heap:
+            self.timer_heap.add(job)
+        else:
+            self.job_greenlets[job.name] = self._spawn(job.run)
 
 # ################################################################################################################################
 
@@ -585,6 +780,10 @@ class Scheduler:
             _sleep = self.sleep
             _sleep_time = self.sleep_time
 
+            if self.timer_heap:
+                logger.info('Using scheduler engine `%s`', self.engine)
+                self._spawn(self.timer_heap.run)
+
             with self.lock:
                 for job in sorted(itervalues(self.jobs)):
 
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep
+
+# Zato
+from zato.broker.client import BrokerClient
+from zato.common.broker_message import Common as BROKER_COMMON, SERVICE
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _ServerRPC:
+    def __init__(self) -> 'None':
+        self.requests = []
+
+    def invoke_all(self, service:'str', request:'dict', **kwargs) -> 'None':
+        self.requests.append(request)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class BrokerClientBatchTestCase(TestCase):
+
+    def test_messages_sent_in_batches_in_order(self):
+
+        server_rpc = _ServerRPC()
+        client = BrokerClient(server_rpc=server_rpc) # type: ignore
+
+        # The first message is sent on its own because nothing else is waiting yet ..
+        client.publish({'action': SERVICE.EDIT.value, 'idx': 0})
+        sleep(0.1)
+
+        # .. whereas all of these are published before the client has a chance to send them ..
+        for idx in range(1, 10):
+            client.publish({'action': SERVICE.EDIT.value, 'idx': idx})
+        sleep(0.1)
+
+        self.assertEqual(len(server_rpc.requests), 2)
+
+        first, second = server_rpc.requests
+
+        self.assertEqual(first['idx'], 0)
+        self.assertEqual(second['action'], BROKER_COMMON.Batch.value)
+
+        # .. and they are all sent in the order they were published in.
+        self.assertListEqual([msg['idx'] for msg in second['messages']], list(range(1, 10)))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
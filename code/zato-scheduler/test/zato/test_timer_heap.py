@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# This needs to be done as soon as possible
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+import os
+from datetime import datetime, timedelta
+from logging import basicConfig, getLogger, INFO
+from time import time
+from unittest import main, TestCase
+
+# crontab
+from crontab import CronTab
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.common.api import SCHEDULER
+from zato.scheduler.backend import _to_timestamp, Interval, Job, TimerHeap
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+basicConfig(level=INFO, format='%(asctime)s - %(message)s')
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# How many jobs the benchmark should run, it is not run at all unless this is set
+benchmark_environ_key = 'Zato_Test_Scheduler_Timer_Heap_Benchmark_Jobs'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Job(Job):
+    """ A job whose callback is invoked directly rather than in a new greenlet.
+    """
+    def _spawn(self, func:'any_', **kwargs:'any_') -> 'None':
+        func(**kwargs)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TimerHeapTestCase(TestCase):
+
+    def _get_job(
+        self,
+        name,     # type: str
+        start_time, # type: datetime
+        fired,      # type: anylist
+        job_type=SCHEDULER.JOB_TYPE.INTERVAL_BASED, # type: str
+        interval=Interval(in_seconds=10), # type: any_
+        max_repeats=None, # type: int | None
+    ) -> 'Job':
+        return _Job(1, name, job_type, interval, start_time, callback=lambda ctx: fired.append(ctx['name']),
+            max_repeats=max_repeats, clone_start_time=True)
+
+# ################################################################################################################################
+
+    def test_interval_does_not_drift(self):
+
+        fired = []
+        start_time = datetime(2030, 1, 1)
+        start = _to_timestamp(start_time)
+
+        heap = TimerHeap()
+        heap.add(self._get_job('job1', start_time, fired))
+
+        # Nothing is due yet
+        self.assertEqual(heap.run_due_jobs(start - 1), 0)
+
+        # The job runs 3 seconds late ..
+        self.assertEqual(heap.run_due_jobs(start + 3), 1)
+        self.assertEqual(fired, ['job1'])
+
+        # .. but its next run is still computed from when it should have run.
+        self.assertEqual(heap.heap[0][0], start + 10)
+
+        # If we are late by more than one interval, the missed runs are skipped.
+        self.assertEqual(heap.run_due_jobs(start + 35), 1)
+        self.assertEqual(heap.heap[0][0], start + 40)
+
+# ################################################################################################################################
+
+    def test_cron_next_run(self):
+
+        fired = []
+        start_time = datetime(2030, 1, 1, 12, 0, 0)
+        start = _to_timestamp(start_time)
+
+        heap = TimerHeap()
+        heap.add(self._get_job('job1', start_time, fired, SCHEDULER.JOB_TYPE.CRON_STYLE, CronTab('* * * * *')))
+
+        # The cron definition matches the start time itself so the next run must be a full minute later
+        self.assertEqual(heap.run_due_jobs(start + 2), 1)
+        self.assertEqual(heap.heap[0][0], start + 60)
+
+# ################################################################################################################################
+
+    def test_remove(self):
+
+        fired = []
+        start_time = datetime(2030, 1, 1)
+        start = _to_timestamp(start_time)
+
+        heap = TimerHeap()
+        heap.add(self._get_job('job1', start_time, fired))
+        heap.add(self._get_job('job2', start_time, fired))
+
+        self.assertTrue(heap.remove('job1'))
+        self.assertFalse(heap.remove('job1'))
+
+        self.assertEqual(heap.run_due_jobs(start), 1)
+        self.assertEqual(fired, ['job2'])
+
+        # A job can be replaced with a new one by the same name, e.g. when it is edited
+        heap.add(self._get_job('job2', start_time + timedelta(seconds=1), fired))
+
+        self.assertEqual(heap.run_due_jobs(start + 10), 1)
+        self.assertEqual(fired, ['job2', 'job2'])
+
+# ################################################################################################################################
+
+    def test_one_time_and_max_repeats(self):
+
+        fired = []
+        start_time = datetime(2030, 1, 1)
+        start = _to_timestamp(start_time)
+
+        heap = TimerHeap()
+        heap.add(self._get_job('job1', start_time, fired, SCHEDULER.JOB_TYPE.ONE_TIME))
+        heap.add(self._get_job('job2', start_time, fired, max_repeats=2))
+
+        for idx in range(5):
+            _ = heap.run_due_jobs(start + idx * 10)
+
+        self.assertEqual(sorted(fired), ['job1', 'job2', 'job2'])
+        self.assertEqual(heap.jobs, {})
+
+# ################################################################################################################################
+
+    def test_run_wakes_up_for_earlier_job(self):
+
+        fired = []
+        now = datetime.utcnow()
+
+        heap = TimerHeap()
+        heap.add(self._get_job('job1', now + timedelta(hours=1), fired))
+
+        runner = spawn(heap.run)
+        sleep(0.05)
+
+        # The main loop is now waiting for the job above and must be woken up to run this one.
+        heap.add(self._get_job('job2', now, fired))
+        sleep(0.05)
+
+        heap.stop()
+        runner.join(1)
+
+        self.assertEqual(fired, ['job2'])
+
+# ################################################################################################################################
+
+    def test_benchmark_skew(self):
+
+        job_count = int(os.environ.get(benchmark_environ_key) or 0)
+        if not job_count:
+            return
+
+        run_for = 5
+        interval = 1
+        skew = [] # type: anylist
+
+        def on_fired(ctx:'any_') -> 'None':
+            expected = _to_timestamp(datetime.fromisoformat(ctx['start_time'])) + (ctx['current_run'] - 1) * interval
+            skew.append(time() - expected)
+
+        # Jobs start evenly spread within one interval
+        start = datetime.utcnow() + timedelta(seconds=1)
+
+        heap = TimerHeap()
+        for idx in range(job_count):
+            start_time = start + timedelta(seconds=interval * idx / job_count)
+            job = Job(idx, 'job.{}'.format(idx), SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(in_seconds=interval),
+                start_time, callback=on_fired, clone_start_time=True)
+            heap.add(job)
+
+        runner = spawn(heap.run)
+        sleep(1 + run_for)
+
+        heap.stop()
+        runner.join(1)
+
+        skew.sort()
+        p50 = skew[len(skew) // 2]
+        p99 = skew[int(len(skew) * 0.99)]
+
+        logger.info('Jobs:%s; runs:%s; skew p50:%.4f, p99:%.4f, max:%.4f', job_count, len(skew), p50, p99, skew[-1])
+
+        # Each job should have run once per interval ..
+        self.assertGreaterEqual(len(skew), job_count * (run_for - 1))
+
+        # .. and within a fraction of the interval.
+        self.assertLess(p99, interval / 10)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
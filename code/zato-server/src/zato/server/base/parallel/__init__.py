@@ -16,11 +16,12 @@ from pathlib import Path
 from platform import system as platform_system
 from random import seed as random_seed
 from tempfile import mkstemp
+from time import monotonic
 from traceback import format_exc
 from uuid import uuid4
 
 # gevent
-from gevent import sleep
+from gevent import joinall, sleep, spawn
 from gevent.lock import RLock
 
 # Needed for Cassandra
@@ -54,10 +55,11 @@ from zato.common.odb.api import PoolStore
 from zato.common.odb.post_process import ODBPostProcess
 from zato.common.pubsub import SkipDelivery
 from zato.common.rate_limiting import RateLimiting
+from zato.common.rate_limiting.shmem import get_shmem_name as get_rate_limiting_shmem_name, SharedRateLimitStore
 from zato.common.typing_ import cast_, intnone, optional
 from zato.common.util.api import absolutize, as_bool, get_config_from_file, get_kvdb_config_for_log, get_user_config_name, \
-    fs_safe_name, hot_deploy, invoke_startup_services as _invoke_startup_services, make_list_from_string_list, new_cid, \
-    register_diag_handlers, save_ipc_pid_port, spawn_greenlet, StaticConfig
+    fs_safe_name, get_ipc_pid_socket_path, hot_deploy, invoke_startup_services as _invoke_startup_services, \
+    make_list_from_string_list, new_cid, register_diag_handlers, save_ipc_pid_port, spawn_greenlet, StaticConfig
 from zato.common.util.env import populate_environment_from_file
 from zato.common.util.file_transfer import path_string_list_to_list
 from zato.common.util.hot_deploy_ import extract_pickup_from_items
@@ -68,7 +70,7 @@ from zato.common.util.time_ import TimeUtil
 from zato.common.util.tcp import wait_until_port_taken
 from zato.distlock import LockManager
 from zato.server.base.parallel.config import ConfigLoader
-from zato.server.base.parallel.http import HTTPHandler
+from zato.server.base.parallel.http import AccessLogWriter, HTTPHandler
 from zato.server.base.parallel.subprocess_.api import CurrentState as SubprocessCurrentState, \
      StartConfig as SubprocessStartConfig
 from zato.server.base.parallel.subprocess_.ftp import FTPIPC
@@ -76,6 +78,7 @@ from zato.server.base.parallel.subprocess_.ibm_mq import IBMMQIPC
 from zato.server.base.parallel.subprocess_.outconn_sftp import SFTPIPC
 from zato.server.base.worker import WorkerStore
 from zato.server.config import ConfigStore
+from zato.server.connection.cache_shmem import get_shmem_cache_names, get_shmem_name, unlink_shmem
 from zato.server.connection.kvdb.api import KVDB as ZatoKVDB
 from zato.server.connection.pool_wrapper import ConnectionPoolWrapper
 from zato.server.connection.stats import ServiceStatsClient
@@ -95,8 +98,8 @@ if 0:
     from zato.common.ipc.client import IPCResponse
     from zato.common.odb.api import ODBManager
     from zato.common.odb.model import Cluster as ClusterModel
-    from zato.common.typing_ import any_, anydict, anylist, anyset, callable_, dictlist, intset, listorstr, strdict, strbytes, \
-        strlist, strorlistnone, strnone, strorlist, strset
+    from zato.common.typing_ import any_, anydict, anylist, anyset, callable_, dictlist, intlist, intset, listorstr, strdict, \
+        strbytes, strlist, strorlistnone, strnone, strorlist, strset
     from zato.server.connection.cache import Cache, CacheAPI
     from zato.server.connection.connector.subprocess_.ipc import SubprocessIPC
     from zato.server.ext.zunicorn.arbiter import Arbiter
@@ -132,6 +135,9 @@ megabyte = 10 ** 6
 
 _ipc_timeout = IPC.Default.Timeout
 
+# For how many seconds the PIDs of our own worker processes can be reused before they are read again
+_worker_pids_max_age = 10
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -226,6 +232,8 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.pid = -1
         self.sync_internal = False
         self.ipc_api = IPCAPI(self)
+        self.worker_pids:'intlist' = []
+        self.worker_pids_expire_at = 0.0
         self.fifo_response_buffer_size = -1
         self.is_first_worker = False
         self.process_idx = -1
@@ -276,7 +284,8 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # In-RAM statistics
         self.slow_responses = self.zato_kvdb.internal_create_list_repo(CommonZatoKVDB.SlowResponsesName)
         self.usage_samples = self.zato_kvdb.internal_create_list_repo(CommonZatoKVDB.UsageSamplesName)
-        self.current_usage = self.zato_kvdb.internal_create_number_repo(CommonZatoKVDB.CurrentUsageName)
+        self.current_usage = self.zato_kvdb.internal_create_number_repo(
+            CommonZatoKVDB.CurrentUsageName, num_stripes=CommonZatoKVDB.CurrentUsageNumStripes)
         self.pub_sub_metadata = self.zato_kvdb.internal_create_object_repo(CommonZatoKVDB.PubSubMetadataName)
 
         self.stats_client = ServiceStatsClient()
@@ -314,6 +323,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 
         self.access_logger = logging.getLogger('zato_access_log')
         self.access_logger_log = self.access_logger._log
+        self.access_log_writer = AccessLogWriter(self.access_logger)
         self.needs_access_log = self.access_logger.isEnabledFor(INFO)
         self.needs_all_access_log = True
         self.access_log_ignore = set()
@@ -920,6 +930,15 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 # ################################################################################################################################
 
     def _run_stats_client(self, events_tcp_port:'int') -> 'None':
+
+        # Whether and how to push events in batches is optional in server.conf
+        events_config = self.fs_server_config.get('events') or {}
+
+        self.stats_client.is_buffered = as_bool(events_config.get('push_is_buffered', EventsDefault.push_is_buffered))
+        self.stats_client.push_batch_size = int(events_config.get('push_batch_size') or EventsDefault.push_batch_size)
+        self.stats_client.push_batch_interval = float(
+            events_config.get('push_batch_interval') or EventsDefault.push_batch_interval)
+
         self.stats_client.init('127.0.0.1', events_tcp_port)
         self.stats_client.run()
 
@@ -1124,6 +1143,10 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.rate_limiting.global_lock_func = self.zato_lock_manager
         self.rate_limiting.sql_session_func = self.odb.session
 
+        # Host rate limits are kept in shared memory, which is opened only if any object uses them
+        if self.has_posix_ipc:
+            self.rate_limiting.host_store = SharedRateLimitStore(get_rate_limiting_shmem_name(self.deployment_key))
+
         # Set up rate limiting for ConfigDict-based objects, which includes everything except for:
         # * services  - configured in ServiceStore
         # * SSO       - configured in the next call
@@ -1296,6 +1319,13 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # .. this is set to a different value for each process ..
         bind_port = (self.fs_server_config.main.get('ipc_port_start') or IPC.Default.TCP_Port_Start) + self.process_idx
 
+        # .. optionally, other processes will invoke us through a Unix socket rather than TCP ..
+        if as_bool(self.fs_server_config.main.get('ipc_use_unix_socket')):
+            self.ipc_api.use_unix_socket = True
+            bind_unix_path = get_ipc_pid_socket_path(self.cluster_name, self.name, self.pid)
+        else:
+            bind_unix_path = ''
+
         # .. now, the IPC server can be started ..
         _:'any_' = spawn_greenlet(self.ipc_api.start_server,
             self.pid,
@@ -1305,6 +1335,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             username=IPC.Credentials.Username,
             password=ipc_password,
             callback_func=self.on_ipc_invoke_callback,
+            bind_unix_path=bind_unix_path,
         )
 
         # .. we can now store the information about what IPC port to use with this PID.
@@ -1598,6 +1629,31 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 
         return data
 
+# ################################################################################################################################
+
+    def get_worker_pids(self) -> 'intlist':
+        """ Returns PIDs of all the worker processes of this server, reading them anew only if the ones we have are not current.
+        """
+        if monotonic() >= self.worker_pids_expire_at:
+
+            response = self.invoke('zato.info.get-worker-pids', serialize=False)
+
+            # Use current PID if none were received (this is required on Mac)
+            self.worker_pids = response['pids'] or [self.pid]
+            self.worker_pids_expire_at = monotonic() + _worker_pids_max_age
+
+        return self.worker_pids
+
+# ################################################################################################################################
+
+    def _invoke_pid(self, service:'str', request:'any_', pid:'int', *args:'any_', **kwargs:'any_') -> 'IPCResponse | None':
+        """ Invokes a service in a PID, logging any exception raised instead of propagating it.
+        """
+        try:
+            return self.invoke_by_pid(service, request, pid, *args, **kwargs)
+        except Exception:
+            logger.warning('PID invocation error `%s` -> `%s` (%s)', pid, format_exc(), service)
+
 # ################################################################################################################################
 
     def invoke_all_pids(self, service:'str', request:'any_', timeout:'int'=5, *args:'any_', **kwargs:'any_') -> 'dictlist':
@@ -1609,15 +1665,27 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 
         try:
             # Get all current PIDs
-            all_pids_response = self.invoke('zato.info.get-worker-pids', serialize=False)
-            pids = all_pids_response['pids']
+            pids = self.get_worker_pids()
 
-            # Use current PID if none were received (this is required on Mac)
-            pids = pids or [self.pid]
+            # Invoke each of them concurrently, waiting up to timeout seconds for all of them ..
+            greenlets = [spawn(self._invoke_pid, service, request, pid, *args, timeout=timeout, **kwargs) for pid in pids]
+            _ = joinall(greenlets, timeout=timeout)
 
-            # Invoke each of them
-            for pid in pids:
-                pid_response = self.invoke_by_pid(service, request, pid, timeout=timeout, *args, **kwargs)
+            # .. and collect the responses in the same order that the PIDs were in.
+            for pid, greenlet in zip(pids, greenlets):
+
+                # This PID either raised an exception or did not reply in time ..
+                if not (greenlet.ready() and greenlet.value):
+
+                    if not greenlet.ready():
+                        greenlet.kill(block=False)
+                        logger.warning('PID invocation error `%s` -> no response within %ss (%s)', pid, timeout, service)
+
+                    # .. which may mean that the process no longer exists so we will look up all the PIDs again next time.
+                    self.worker_pids_expire_at = 0.0
+                    continue
+
+                pid_response = cast_('IPCResponse', greenlet.value)
                 if pid_response.data is not None:
 
                     # If this is an internal service, we want to remove its root-level response element.
@@ -1833,6 +1901,17 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             os.path.join(self.kvdb_dir, CommonZatoKVDB.PubSubMetadataPath),
         )
 
+        #
+        # .. each repository may append its changes to a journal instead of rewriting all of its data each time ..
+        #
+
+        use_journal = asbool(self.fs_server_config.misc.get('zato_kvdb_use_journal', False))
+
+        self.slow_responses.use_journal = use_journal
+        self.usage_samples.use_journal = use_journal
+        self.current_usage.use_journal = use_journal
+        self.pub_sub_metadata.use_journal = use_journal
+
         #
         # .. and now we can load all the data.
         #
@@ -1896,6 +1975,30 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
     def before_pid_kill(arbiter:'Arbiter', worker:'GeventWorker') -> 'None':
         pass
 
+# ################################################################################################################################
+
+    @staticmethod
+    def on_exit(arbiter:'Arbiter') -> 'None':
+        """ A Gunicorn hook called in the arbiter right before it exits, once all of its workers have stopped.
+        """
+        app:'ParallelServer' = arbiter.app.zato_wsgi_app
+        app.unlink_shared_memory(arbiter.zato_deployment_key)
+
+# ################################################################################################################################
+
+    def unlink_shared_memory(self, deployment_key:'str') -> 'None':
+        """ Deletes shared memory segments that all the workers used. Their names depend on a deployment key,
+        which is different each time the server starts, so nothing would ever delete them otherwise.
+        Workers only close the segments because the arbiter may start new workers that need to attach to the same ones.
+        """
+        if not self.has_posix_ipc:
+            return
+
+        unlink_shmem(get_rate_limiting_shmem_name(deployment_key))
+
+        for cache_name in get_shmem_cache_names(self.fs_server_config):
+            unlink_shmem(get_shmem_name(deployment_key, cache_name))
+
 # ################################################################################################################################
 
     def cleanup_wsx(self, needs_pid:'bool'=False) -> 'None':
@@ -1933,6 +2036,9 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             # Store Zato KVDB data on disk
             self.save_zato_main_proc_state()
 
+            # Write any access log entries that are still enqueued
+            self.access_log_writer.flush()
+
             # Set the flag to True only the first time we are called, otherwise simply return
             if self._is_process_closing:
                 return
@@ -1947,6 +2053,11 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
                 self.server_startup_ipc.close()
                 self.connector_config_ipc.close()
 
+                if self.rate_limiting.host_store:
+                    self.rate_limiting.host_store.close()
+
+                self.worker_store.cache_api.cleanup_on_stop()
+
             # WSX connections for this server cleanup
             self.cleanup_wsx(True)
 
@@ -44,6 +44,7 @@ class ModuleCtx:
     Audit_Max_Len_Messages = AuditLog.Default.max_len_messages
     Config_Store = ('apikey', 'basic_auth', 'jwt')
     Rate_Limit_Exact = RATE_LIMIT.TYPE.EXACT.id
+    Rate_Limit_Host = RATE_LIMIT.TYPE.HOST.id
     Rate_Limit_Sec_Def = RATE_LIMIT.OBJECT_TYPE.SEC_DEF
     Rate_Limit_HTTP_SOAP = RATE_LIMIT.OBJECT_TYPE.HTTP_SOAP
 
@@ -478,6 +479,7 @@ class ConfigLoader:
             # This is reusable no matter if it is edit or create action
             rate_limit_def = config['rate_limit_def']
             is_exact = config['rate_limit_type'] == ModuleCtx.Rate_Limit_Exact
+            is_host = config['rate_limit_type'] == ModuleCtx.Rate_Limit_Host
 
             # Base dict that will be used as is, if we are to create the rate limiting configuration,
             # or it will be updated with existing configuration, if it already exists.
@@ -498,11 +500,11 @@ class ConfigLoader:
                 rate_limit_config['parent_type'] = existing_config.parent_type
                 rate_limit_config['parent_name'] = existing_config.parent_name
 
-                self.rate_limiting.edit(object_type, object_name, rate_limit_config, rate_limit_def, is_exact)
+                self.rate_limiting.edit(object_type, object_name, rate_limit_config, rate_limit_def, is_exact, is_host)
 
             # .. otherwise, we will be creating a new one
             else:
-                self.rate_limiting.create(rate_limit_config, rate_limit_def, is_exact)
+                self.rate_limiting.create(rate_limit_config, rate_limit_def, is_exact, is_host)
 
         # We are not to have any rate limits, but it is possible that previously we were required to,
         # in which case this needs to be cleaned up.
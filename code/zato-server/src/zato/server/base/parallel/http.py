@@ -7,10 +7,15 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections import deque
 from datetime import datetime
 from logging import getLogger, INFO
 from traceback import format_exc
 
+# gevent
+from gevent import spawn
+from gevent.event import Event
+
 # pytz
 from pytz import UTC
 
@@ -25,8 +30,9 @@ from zato.common.util.api import new_cid
 # ################################################################################################################################
 
 if 0:
+    from logging import Logger
     from pytz.tzinfo import BaseTzInfo
-    from zato.common.typing_ import any_, callable_, list_, stranydict
+    from zato.common.typing_ import any_, anytuple, callable_, list_, stranydict
     from zato.server.base.parallel import ParallelServer
 
 # ################################################################################################################################
@@ -43,6 +49,121 @@ _has_log_info = logger.isEnabledFor(INFO)
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # Access log entries are written once there are that many of them ..
+    Access_Log_Batch_Size = 1000
+
+    # .. or once in that many seconds.
+    Access_Log_Interval = 0.5
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class AccessLogWriter:
+    """ Writes HTTP access log entries in a background greenlet. Requests only enqueue their raw details,
+    which are formatted and handed over to the access logger in batches.
+    """
+    def __init__(
+        self,
+        access_logger, # type: Logger
+        local_zone=None, # type: BaseTzInfo | None
+        batch_size=ModuleCtx.Access_Log_Batch_Size, # type: int
+        interval=ModuleCtx.Access_Log_Interval, # type: float
+    ) -> 'None':
+        self.access_logger = access_logger
+        self.local_zone = local_zone or get_localzone()
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self.pending = deque()
+        self.needs_flush = Event()
+        self.is_running = False
+
+        # Timestamps have a resolution of one second so requests received within the same second can share them
+        self._timestamp_key = None
+        self._timestamps = ('', '')
+
+# ################################################################################################################################
+
+    def enqueue(self, item:'anytuple') -> 'None':
+
+        self.pending.append(item)
+
+        # The writer is started in the process that handles requests, not in the one the server was created in ..
+        if not self.is_running:
+            self.is_running = True
+            _ = spawn(self._run)
+
+        # .. and it is woken up early if there are already enough entries to write.
+        elif len(self.pending) >= self.batch_size:
+            self.needs_flush.set()
+
+# ################################################################################################################################
+
+    def _run(self) -> 'None':
+        while True:
+            _ = self.needs_flush.wait(self.interval)
+            self.needs_flush.clear()
+            self.flush()
+
+# ################################################################################################################################
+
+    def _get_timestamps(self, request_ts_utc:'datetime') -> 'anytuple':
+
+        key = request_ts_utc.replace(microsecond=0)
+
+        if key != self._timestamp_key:
+            request_ts_local = request_ts_utc.replace(tzinfo=UTC).astimezone(self.local_zone)
+            self._timestamps = (
+                request_ts_utc.strftime(Access_Log_Date_Time_Format),
+                request_ts_local.strftime(Access_Log_Date_Time_Format),
+            )
+            self._timestamp_key = key
+
+        return self._timestamps
+
+# ################################################################################################################################
+
+    def flush(self) -> 'None':
+        """ Writes all the entries enqueued so far.
+        """
+        # Local aliases
+        pending = self.pending
+        access_logger = self.access_logger
+        logger_name = access_logger.name
+
+        while pending:
+
+            remote_ip, cid, resp_time, channel_name, request_ts_utc, method, path, http_version, \
+                status_code, response_size, user_agent = pending.popleft()
+
+            try:
+                req_timestamp_utc, req_timestamp = self._get_timestamps(request_ts_utc)
+
+                # Records are built directly because the caller's details would be those of this writer anyway
+                record = access_logger.makeRecord(logger_name, INFO, '(unknown file)', 0, '', None, None, extra={
+                    'remote_ip': remote_ip,
+                    'cid_resp_time': '%s/%s' % (cid, resp_time.total_seconds()),
+                    'channel_name': channel_name,
+                    'req_timestamp_utc': req_timestamp_utc,
+                    'req_timestamp': req_timestamp,
+                    'method': method,
+                    'path': path,
+                    'http_version': http_version,
+                    'status_code': status_code,
+                    'response_size': response_size,
+                    'user_agent': user_agent,
+                })
+
+                access_logger.handle(record)
+
+            except Exception:
+                logger.warning('Access log entry could not be written `%s` -> %s', cid, format_exc())
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class HTTPHandler:
     """ Handles incoming HTTP requests.
     """
@@ -53,9 +174,7 @@ class HTTPHandler:
         _new_cid=new_cid, # type: callable_
         _local_zone=get_localzone(), # type: BaseTzInfo
         _utcnow=datetime.utcnow, # type: callable_
-        _INFO=INFO, # type: int
         _UTC=UTC,   # type: any_
-        _Access_Log_Date_Time_Format=Access_Log_Date_Time_Format, # type: str
         _no_remote_address=NO_REMOTE_ADDRESS, # type: str
         **kwargs:'any_'
     ) -> 'list_[bytes]':
@@ -74,7 +193,7 @@ class HTTPHandler:
         # .. basic context details ..
         wsgi_environ['zato.local_tz'] = _local_zone
         wsgi_environ['zato.request_timestamp_utc'] = request_ts_utc
-        wsgi_environ['zato.request_timestamp'] = request_ts_local = request_ts_utc.replace(tzinfo=_UTC).astimezone(_local_zone)
+        wsgi_environ['zato.request_timestamp'] = request_ts_utc.replace(tzinfo=_UTC).astimezone(_local_zone)
 
         # .. this is always needed ..
         wsgi_environ['zato.http.response.headers'] = {}
@@ -140,24 +259,19 @@ class HTTPHandler:
             # .. is not in a list of paths to ignore ..
             if self.needs_all_access_log or wsgi_environ['PATH_INFO'] not in self.access_log_ignore:
 
-                self.access_logger_log(
-                    _INFO,
-                    '',
-                    None, # type: ignore
-                    None,
-                    {
-                        'remote_ip': remote_addr,
-                        'cid_resp_time': '%s/%s' % (cid, (_utcnow() - request_ts_utc).total_seconds()),
-                        'channel_name': channel_name,
-                        'req_timestamp_utc': request_ts_utc.strftime(_Access_Log_Date_Time_Format),
-                        'req_timestamp': request_ts_local.strftime(_Access_Log_Date_Time_Format),
-                        'method': wsgi_environ['REQUEST_METHOD'],
-                        'path': wsgi_environ['PATH_INFO'],
-                        'http_version': wsgi_environ['SERVER_PROTOCOL'],
-                        'status_code': status_code,
-                        'response_size': response_size,
-                        'user_agent': user_agent,
-                })
+                self.access_log_writer.enqueue((
+                    remote_addr,
+                    cid,
+                    _utcnow() - request_ts_utc,
+                    channel_name,
+                    request_ts_utc,
+                    wsgi_environ['REQUEST_METHOD'],
+                    wsgi_environ['PATH_INFO'],
+                    wsgi_environ['SERVER_PROTOCOL'],
+                    status_code,
+                    response_size,
+                    user_agent,
+                ))
 
         # .. this goes to the server log ..
         if _has_log_info:
@@ -1976,14 +1976,17 @@ class WorkerStore(_WorkerStoreBase):
             self.broker_client.invoke_async(cb_msg)
 
         if kwargs.get('needs_response'):
-
-            if skip_response_elem:
-                return response
-            else:
+            if not skip_response_elem:
                 response = service.response.payload
                 if hasattr(response, 'getvalue'):
                     response = response.getvalue(serialize=kwargs.get('serialize'))
-                return response
+        else:
+            response = None
+
+        # The service is no longer needed
+        self.server.service_store.release_instance(service)
+
+        return response
 
 # ################################################################################################################################
 
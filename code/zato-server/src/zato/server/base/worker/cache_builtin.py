@@ -294,4 +294,13 @@ class CacheBuiltin(WorkerImpl):
         if msg.source_worker_id != self.server.worker_id:
             self.cache_api.sync_after_clear(CACHE.TYPE.BUILTIN, msg)
 
+# ################################################################################################################################
+
+    def on_broker_msg_CACHE_BUILTIN_STATE_CHANGED_BATCH(
+        self:'WorkerStore', # type: ignore
+        msg, # type: Bunch
+    ) -> 'None':
+        if msg.source_worker_id != self.server.worker_id:
+            self.cache_api.sync_batch(CACHE.TYPE.BUILTIN, msg)
+
 # ################################################################################################################################
@@ -7,12 +7,16 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
-from base64 import b64encode
+from base64 import b64decode, b64encode
+from itertools import count
 from logging import getLogger
 from traceback import format_exc
 
+# Bunch
+from bunch import Bunch
+
 # gevent
-from gevent import sleep, spawn
+from gevent import sleep, spawn, spawn_later
 from gevent.lock import RLock
 
 # python-memcached
@@ -27,17 +31,17 @@ from zato.common.api import CACHE, ZATO_NOT_GIVEN
 from zato.common.broker_message import CACHE as CACHE_BROKER_MSG
 from zato.common.typing_ import cast_
 from zato.common.util.api import parse_extra_into_dict
+from zato.server.connection.cache_shmem import get_shmem_cache_names, get_shmem_name, SharedMemoryCache
 
 # Python 2/3 compatibility
 from zato.common.ext.future.utils import iteritems, itervalues
-from zato.common.py23_.past.builtins import basestring
-from zato.common.py23_ import pickle_dumps
+from zato.common.py23_ import pickle_dumps, pickle_loads
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_
+    from zato.common.typing_ import any_, anydict, anylist
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -66,33 +70,51 @@ builtin_ops = [
     'SET_CONTAINS_ALL', 'SET_CONTAINS_ANY',
 ]
 
-builtin_op_to_broker_msg = {}
+# Maps each built-in operation to the name of a method that synchronizes caches after it
+_sync_op_to_func_name = {getattr(CACHE.STATE_CHANGED, op): 'sync_after_{}'.format(op.lower()) for op in builtin_ops}
 
-for builtin_op in builtin_ops:
-    common_key = getattr(CACHE.STATE_CHANGED, builtin_op)
-    broker_msg_value = getattr(CACHE_BROKER_MSG, 'BUILTIN_STATE_CHANGED_{}'.format(builtin_op)).value
+_OP_Clear  = CACHE.STATE_CHANGED.CLEAR
+_OP_Delete = CACHE.STATE_CHANGED.DELETE
+_OP_Expire = CACHE.STATE_CHANGED.EXPIRE
+_OP_Set    = CACHE.STATE_CHANGED.SET
 
-    builtin_op_to_broker_msg[common_key] = broker_msg_value
+# A state change of a single key, queued to be sent to other processes, makes the previous one of the same key obsolete
+# if it is one of the operations below, and if it is not a set with an expiration time different from the new one.
+_coalesce_ops = {
+    _OP_Delete: {_OP_Delete, _OP_Set},
+    _OP_Set:    {_OP_Set},
+}
 
 # ################################################################################################################################
 
 default_get = ZATO_NOT_GIVEN # A singleton to indicate that no default for Cache.get was given on input
 
-_no_key = 'zato-no-key'
-_no_value = 'zato-no-value'
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # For how long, in seconds, state changes are collected before they are sent to other processes in one batch
+    Sync_Batch_Window = 0.05
+
+    # A batch is sent immediately if it has this many state changes, without waiting for the window to close
+    Sync_Batch_Max_Size = 1000
 
 # ################################################################################################################################
 
 class Cache:
     """ The cache API through which services access the built-in self.cache objects.
-    Attribute self.impl is the actual Cython-based cache implementation.
+    Attribute self.impl is the actual Cython-based cache implementation, unless a shared memory one is given on input,
+    in which case the cache is shared by all the processes of a server and there is nothing to synchronize among them.
     """
-    def __init__(self, config):
+    def __init__(self, config, impl=None):
         self.config = config
         self.after_state_changed_callback = self.config.after_state_changed_callback
-        self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id
-        self.impl = _CyCache(self.config.max_size, self.config.max_item_size, self.config.extend_expiry_on_get,
-            self.config.extend_expiry_on_set)
+        self.is_shared = impl is not None
+        self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id and not self.is_shared
+        if impl is None:
+            impl = _CyCache(self.config.max_size, self.config.max_item_size, self.config.extend_expiry_on_get,
+                self.config.extend_expiry_on_set)
+        self.impl = impl
         spawn(self._delete_expired)
 
 # ################################################################################################################################
@@ -648,7 +670,7 @@ class Cache:
 # ################################################################################################################################
 
     def update_config(self, config):
-        self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id
+        self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id and not self.is_shared
         self.impl.update_config(config)
 
 # ################################################################################################################################
@@ -844,54 +866,128 @@ class CacheAPI:
         self.builtin = self.caches[CACHE.TYPE.BUILTIN]
         self.memcached = self.caches[CACHE.TYPE.MEMCACHED]
 
+        # State changes to be sent to other worker processes, in the order they were made.
+        # Maps an ever-increasing number to an (op, cache_name, data) tuple.
+        self._sync_queue = {}
+        self._sync_queue_counter = count()
+        self._sync_flush_scheduled = False
+
+        # Maps (cache_name, key) to the number under which the latest state change of that key is queued,
+        # but only if the next state change of that key may make the queued one obsolete.
+        self._sync_coalesce_index = {}
+
     def _maybe_set_default(self, config, cache):
         if config.is_default:
             self.default = cache
 
 # ################################################################################################################################
 
-    def after_state_changed(self, op, cache_name, data, _broker_msg=builtin_op_to_broker_msg, _pickle_dumps=pickle_dumps):
+    def after_state_changed(self, op:'str', cache_name:'str', data:'anydict') -> 'None':
         """ Callback method invoked by each cache if it requires synchronization with other worker processes.
+        State changes are collected for a short while and then sent to other processes in batches.
         """
         try:
 
-            data['action'] = _broker_msg[op]
-            data['cache_name'] = cache_name
-            data['source_worker_id'] = self.server.worker_id
+            key = data.get('key')
 
-            key = data.get('key', _no_key)
-            value = data.get('value', _no_value)
+            # A state change of a single key makes a previous one obsolete if the new one alone has the same effect ..
+            if op in _coalesce_ops:
 
-            if isinstance(key, basestring):
-                data['is_key_pickled'] = False
-            else:
-                data['is_key_pickled'] = True
-                data['key'] = _pickle_dumps(key)
+                coalesce_key = (cache_name, key)
+                pending_key = self._sync_coalesce_index.get(coalesce_key)
 
-            if value:
-                if isinstance(value, basestring):
-                    data['is_value_pickled'] = False
-                else:
-                    data['is_value_pickled'] = True
-                    value = _pickle_dumps(value)
-                    value = b64encode(value)
-                    value = value.decode('utf8')
-                    data['value'] = value
+                if pending_key is not None:
+                    pending_op, _, pending_data = self._sync_queue[pending_key]
+                    if pending_op in _coalesce_ops[op]:
+                        if op == _OP_Delete or pending_data['expiry'] == data['expiry']:
+                            del self._sync_queue[pending_key]
+
+                # .. and this one may be made obsolete by yet another one later on ..
+                pending_key = next(self._sync_queue_counter)
+                self._sync_coalesce_index[coalesce_key] = pending_key
+
+            # .. any other change may affect keys that have not been given on input, or it may depend on what happened
+            # .. to a given key earlier on, which is why nothing queued before it can be made obsolete after it is queued.
             else:
-                data['is_value_pickled'] = False
+                pending_key = next(self._sync_queue_counter)
+                if op == _OP_Expire:
+                    _ = self._sync_coalesce_index.pop((cache_name, key), None)
+                else:
+                    self._sync_coalesce_index.clear()
+
+            self._sync_queue[pending_key] = (op, cache_name, data)
+
+            # Send the batch now if it is full ..
+            if len(self._sync_queue) >= ModuleCtx.Sync_Batch_Max_Size:
+                self.flush_sync_queue()
+
+            # .. or make sure it will be sent once the window closes.
+            elif not self._sync_flush_scheduled:
+                self._sync_flush_scheduled = True
+                _ = spawn_later(ModuleCtx.Sync_Batch_Window, self.flush_sync_queue)
 
-            self.server.broker_client.publish(data)
         except Exception:
             logger.warning('Could not run `%s` after_state_changed in cache `%s`, data:`%s`, e:`%s`',
                 op, cache_name, data, format_exc())
 
+# ################################################################################################################################
+
+    def flush_sync_queue(self, _action=CACHE_BROKER_MSG.BUILTIN_STATE_CHANGED_BATCH.value) -> 'None':
+        """ Sends to other worker processes all the state changes collected so far, in one broker message.
+        """
+        self._sync_flush_scheduled = False
+
+        if not self._sync_queue:
+            return
+
+        items = list(self._sync_queue.values())
+        self._sync_queue.clear()
+        self._sync_coalesce_index.clear()
+
+        try:
+
+            # Keys and values can be of any type so the whole batch is pickled, which also makes it more compact
+            # than individual changes would have been. It is then encoded so as to be able to travel in JSON messages.
+            data = b64encode(pickle_dumps(items, -1)).decode('utf8')
+
+            self.server.broker_client.publish({
+                'action': _action,
+                'source_worker_id': self.server.worker_id,
+                'data': data,
+            })
+
+        except Exception:
+            logger.warning('Could not publish a batch of %d cache state changes, e:`%s`', len(items), format_exc())
+
 # ################################################################################################################################
 
     def _create_builtin(self, config):
         """ A low-level method building a bCache object for built-in caches. Must be called with self.lock held.
         """
         config.after_state_changed_callback = self.after_state_changed
-        return Cache(config)
+        return Cache(config, self._get_shared_impl(config))
+
+# ################################################################################################################################
+
+    def _get_shared_impl(self, config) -> 'SharedMemoryCache | None':
+        """ Returns a shared memory implementation for a built-in cache if server.conf lists the cache among shared ones.
+        """
+        if not getattr(self.server, 'has_posix_ipc', False):
+            return None
+
+        if config.name not in get_shmem_cache_names(self.server.fs_server_config):
+            return None
+
+        shmem_config = self.server.fs_server_config.get('shmem') or {}
+
+        # Size is in megabytes
+        size = int(float(shmem_config.get('cache_size') or 100) * 10**6)
+
+        impl = SharedMemoryCache(get_shmem_name(self.server.deployment_key, config.name), size, config.max_size,
+            config.max_item_size, config.extend_expiry_on_get, config.extend_expiry_on_set)
+        impl.open()
+
+        return impl
 
 # ################################################################################################################################
 
@@ -971,6 +1067,8 @@ class CacheAPI:
 
         if cache_type == CACHE.TYPE.BUILTIN:
             self._clear(cache_type, name)
+            if cache.is_shared:
+                cache.impl.close(needs_unlink=True)
         else:
             cache.disconnect_all()
 
@@ -984,6 +1082,18 @@ class CacheAPI:
         with self.lock:
             self._delete(config.cache_type, config.name)
 
+# ################################################################################################################################
+
+    def cleanup_on_stop(self) -> 'None':
+        """ Closes shared memory segments of built-in caches in this process. They are not deleted here because other
+        workers, including ones that the arbiter may start in place of this one, still use them. The arbiter deletes them
+        when the whole server stops.
+        """
+        with self.lock:
+            for cache in self.caches[CACHE.TYPE.BUILTIN].values():
+                if cache.is_shared:
+                    cache.impl.close()
+
 # ################################################################################################################################
 
     def _clear(self, cache_type, name):
@@ -1170,4 +1280,33 @@ class CacheAPI:
         """
         self.caches[cache_type][data.cache_name].sync_after_clear()
 
+# ################################################################################################################################
+
+    def sync_batch(self, cache_type:'str', data:'Bunch') -> 'None':
+        """ Synchronizes the state of this worker's cache after a batch of operations in another worker process.
+        All the operations are applied in one pass, in the same order that they were carried out in.
+        """
+        items = pickle_loads(b64decode(data.data)) # type: anylist
+        caches = self.caches[cache_type]
+
+        for op, cache_name, op_data in items:
+
+            cache = caches.get(cache_name)
+
+            # The cache may have been deleted in the meantime
+            if cache is None:
+                continue
+
+            try:
+                if op == _OP_Clear:
+                    cache.sync_after_clear()
+                else:
+                    func = getattr(cache, _sync_op_to_func_name[op])
+                    func(Bunch(op_data))
+            except KeyError:
+                # Keys to delete may have expired in this process already
+                pass
+            except Exception:
+                logger.warning('Could not sync `%s` in cache `%s`, data:`%s`, e:`%s`', op, cache_name, op_data, format_exc())
+
 # ################################################################################################################################
@@ -0,0 +1,1164 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from errno import EACCES, EAGAIN
+from fcntl import lockf, LOCK_EX, LOCK_NB, LOCK_SH, LOCK_UN
+from hashlib import sha256
+from logging import getLogger
+from mmap import mmap
+from struct import Struct
+from time import time
+from zlib import crc32
+
+try:
+    import posix_ipc as ipc
+except ImportError:
+    # Ignore it under Windows
+    pass
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
+# regex
+from regex import compile as re_compile
+
+# Zato
+from zato.cache import Entry, KeyExpiredError
+from zato.common.api import CACHE
+from zato.common.py23_ import pickle_dumps, pickle_loads
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, anylist, callable_, dictnone, intnone
+    from zato.server.base.parallel import ParallelServer
+    ParallelServer = ParallelServer
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Identifies shared memory segments that have been already initialized
+    Magic = b'ZSC1'
+
+    # How many locks there are for buckets, each lock protects every Num_Stripes-th bucket
+    Num_Stripes = 256
+
+    # Byte offsets of locks other than the bucket ones - these are only lock identifiers, not actual data
+    Lock_Allocator = Num_Stripes
+    Lock_Init      = Num_Stripes + 1
+
+    # Each block of memory allocated for an entry has a size of Min_Block_Size multiplied by a power of two
+    Min_Block_Size = 64
+    Num_Size_Classes = 40
+
+    # Where the list of free blocks for each size class begins and where the bucket array begins
+    Free_List_Offset = 64
+    Buckets_Offset = 512
+
+    # How values are stored
+    Value_Str = 0
+    Value_Bytes = 1
+    Value_Pickle = 2
+
+    # How long to wait, in seconds, before trying again to acquire a lock held by another process
+    Lock_Backoff_Min = 0.0001
+    Lock_Backoff_Max = 0.01
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Header fields and their offsets
+_magic_offset       = 0
+_num_buckets_offset = 8
+_data_start_offset  = 16
+_bump_offset        = 24
+_count_offset       = 32
+_min_expires_offset = 40
+
+_u64 = Struct('<Q')
+_f64 = Struct('<d')
+
+# next, size class, value type, (unused), key length, value length, expiry, expires_at, last_write
+_entry = Struct('<QBBHIIddd')
+_entry_header_size = 48
+_entry_next = _u64
+
+# Where expiry and expires_at are within an entry's header
+_expiry_offset = Struct('<QBBHII').size
+_expires_at_offset = _expiry_offset + _f64.size
+
+_str_types = (str,)
+_key_types = (str, bytes, int)
+
+_max_size_classes = ModuleCtx.Num_Size_Classes
+_stripe_mask = ModuleCtx.Num_Stripes - 1
+_no_expiration = float('inf')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SharedMemoryCacheFull(ValueError):
+    """ Raised if there is no room for a new entry in a shared memory cache even after expired entries were deleted.
+    """
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _encode_key(key:'any_') -> 'bytes':
+    if isinstance(key, str):
+        return b's' + key.encode('utf8')
+    elif isinstance(key, bytes):
+        return b'b' + key
+    elif isinstance(key, int):
+        return b'i' + str(key).encode('ascii')
+    else:
+        raise ValueError('Key must be an instance of one of {}'.format(_key_types))
+
+def _decode_key(data:'bytes') -> 'any_':
+    prefix = data[:1]
+    if prefix == b's':
+        return data[1:].decode('utf8')
+    elif prefix == b'b':
+        return data[1:]
+    else:
+        return int(data[1:])
+
+# ################################################################################################################################
+
+def _encode_value(value:'any_') -> 'tuple[int, bytes]':
+    if isinstance(value, str):
+        return ModuleCtx.Value_Str, value.encode('utf8')
+    elif isinstance(value, bytes):
+        return ModuleCtx.Value_Bytes, value
+    else:
+        return ModuleCtx.Value_Pickle, pickle_dumps(value, -1)
+
+def _decode_value(value_type:'int', data:'bytes') -> 'any_':
+    if value_type == ModuleCtx.Value_Str:
+        return data.decode('utf8')
+    elif value_type == ModuleCtx.Value_Bytes:
+        return data
+    else:
+        return pickle_loads(data)
+
+# ################################################################################################################################
+
+def get_shmem_name(deployment_key:'str', cache_name:'str') -> 'str':
+    """ Returns a name of a shared memory segment for a cache, the same in all the processes of a server.
+    """
+    suffix = sha256('{}.{}'.format(deployment_key, cache_name).encode('utf8')).hexdigest()
+    return '/zc{}'.format(suffix)[:30]
+
+# ################################################################################################################################
+
+def get_shmem_cache_names(fs_server_config:'any_') -> 'set[str]':
+    """ Returns names of built-in caches that server.conf says should be kept in shared memory.
+    """
+    shmem_config = fs_server_config.get('shmem') or {}
+    cache_names = shmem_config.get('cache_names') or ''
+
+    return {elem.strip() for elem in cache_names.split(',') if elem.strip()}
+
+# ################################################################################################################################
+
+def unlink_shmem(name:'str') -> 'None':
+    """ Deletes a shared memory segment, unless it has been already deleted.
+    """
+    try:
+        ipc.unlink_shared_memory(name)
+    except ipc.ExistentialError:
+        pass
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SharedMemoryCache:
+    """ A cache kept in a shared memory segment that all the processes of a server read and write directly.
+    Entries are kept in a hash table with chaining. Buckets are protected by POSIX record locks, with one lock per group
+    of buckets, so processes that access different groups do not block each other. Readers take shared locks.
+
+    Record locks are never waited for in a blocking call, which would stop the whole gevent hub. If another process holds
+    a lock, other greenlets run until it can be acquired. Record locks belong to a process, not to a greenlet,
+    so greenlets of one process also need to take turns through a gevent lock. No lock is held across anything
+    that may yield, apart from waiting for another record lock, so each is held only for as long as it takes
+    to read or write a few entries in memory.
+
+    Unlike with the in-process caches, there is no LRU order to evict entries by. If the cache is full, entries that have
+    expired are deleted and, if there is still no room, SharedMemoryCacheFull is raised. Likewise, no per-read statistics
+    are kept, because that would require each read to write to the shared memory.
+    """
+    def __init__(
+        self,
+        name:'str',
+        size:'int',
+        max_size:'intnone'=None,
+        max_item_size:'intnone'=None,
+        extend_expiry_on_get:'bool'=True,
+        extend_expiry_on_set:'bool'=True,
+    ) -> 'None':
+
+        self.name = name
+        self.size = size
+        self.default_get = object()
+
+        self._mem = None
+        self._mmap = None # type: mmap
+        self._fd = -1
+        self._regex_cache = {}
+        self._process_lock = RLock()
+
+        self.update_config_values(max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set)
+
+# ################################################################################################################################
+
+    def update_config_values(
+        self,
+        max_size:'intnone',
+        max_item_size:'intnone',
+        extend_expiry_on_get:'bool',
+        extend_expiry_on_set:'bool',
+    ) -> 'None':
+        self.max_size = max_size or CACHE.DEFAULT.MAX_SIZE
+        self.max_item_size = max_item_size or CACHE.DEFAULT.MAX_ITEM_SIZE
+        self.has_max_item_size = self.max_item_size > 0
+        self.extend_expiry_on_get = extend_expiry_on_get
+        self.extend_expiry_on_set = extend_expiry_on_set
+
+    def update_config(self, config:'anydict') -> 'None':
+        self.update_config_values(config['max_size'], config['max_item_size'], config['extend_expiry_on_get'],
+            config['extend_expiry_on_set'])
+
+# ################################################################################################################################
+
+    def open(self) -> 'None':
+        """ Creates or opens the underlying shared memory segment and initializes it unless another process already has.
+        """
+        self._mem = ipc.SharedMemory(self.name, ipc.O_CREAT, size=self.size)
+        self._fd = self._mem.fd
+        self._mmap = mmap(self._fd, self.size)
+
+        self._lock(LOCK_EX, ModuleCtx.Lock_Init)
+        try:
+            if self._mmap[:4] != ModuleCtx.Magic:
+                self._init_segment()
+        finally:
+            self._unlock(ModuleCtx.Lock_Init)
+
+        logger.info('Opened shared memory cache `%s` (%s bytes, buckets:%s)', self.name, self.size, self._num_buckets)
+
+# ################################################################################################################################
+
+    def _init_segment(self, num_buckets:'int'=0) -> 'None':
+
+        # As many buckets as there may be entries, rounded up to a power of two, unless we are clearing an existing segment
+        # that other processes may be reading the number of buckets from.
+        num_buckets = num_buckets or 1 << max(self.max_size - 1, 1).bit_length()
+
+        # Entries are kept after the buckets
+        data_start = ModuleCtx.Buckets_Offset + num_buckets * _u64.size
+        data_start += -data_start % ModuleCtx.Min_Block_Size
+
+        if data_start >= self.size:
+            raise ValueError('Shared memory size {} is too small for {} entries'.format(self.size, self.max_size))
+
+        # The magic bytes and the number of buckets are not zeroed out because other processes may be reading them
+        self._mmap[_data_start_offset:data_start] = bytes(data_start - _data_start_offset)
+
+        _u64.pack_into(self._mmap, _num_buckets_offset, num_buckets)
+        _u64.pack_into(self._mmap, _data_start_offset, data_start)
+        _u64.pack_into(self._mmap, _bump_offset, data_start)
+        _f64.pack_into(self._mmap, _min_expires_offset, _no_expiration)
+
+        # This goes last to indicate that the segment is ready to use
+        self._mmap[:4] = ModuleCtx.Magic
+
+# ################################################################################################################################
+
+    def close(self, needs_unlink:'bool'=False) -> 'None':
+        """ Closes the underlying shared memory segment and, optionally, deletes it.
+        """
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+            self._mem.close_fd()
+
+            if needs_unlink:
+                try:
+                    self._mem.unlink()
+                except ipc.ExistentialError:
+                    pass
+
+# ################################################################################################################################
+
+    @property
+    def _num_buckets(self) -> 'int':
+        return _u64.unpack_from(self._mmap, _num_buckets_offset)[0]
+
+# ################################################################################################################################
+
+    def _lock(self, mode:'int', start:'int', length:'int'=1) -> 'None':
+
+        # This is reentrant, so nested record locks are acquired under the same one
+        _ = self._process_lock.acquire()
+
+        try:
+            self._lock_record(mode | LOCK_NB, start, length)
+        except BaseException:
+            self._process_lock.release()
+            raise
+
+    def _lock_record(self, mode:'int', start:'int', length:'int') -> 'None':
+
+        backoff = 0.0
+
+        while True:
+            try:
+                lockf(self._fd, mode, length, start)
+            except OSError as e:
+                if e.errno not in (EACCES, EAGAIN):
+                    raise
+            else:
+                return
+
+            # Another process holds the lock, let other greenlets run before we try again
+            sleep(backoff)
+            backoff = min(backoff * 2 or ModuleCtx.Lock_Backoff_Min, ModuleCtx.Lock_Backoff_Max)
+
+    def _unlock(self, start:'int', length:'int'=1) -> 'None':
+        try:
+            lockf(self._fd, LOCK_UN, length, start)
+        finally:
+            self._process_lock.release()
+
+    def _lock_all(self, mode:'int') -> 'None':
+        self._lock(mode, 0, ModuleCtx.Num_Stripes)
+
+    def _unlock_all(self) -> 'None':
+        self._unlock(0, ModuleCtx.Num_Stripes)
+
+# ################################################################################################################################
+
+    def _alloc(self, size:'int') -> 'tuple[int, int]':
+        """ Returns a new block of memory for an entry along with its size class. Must be called with a bucket lock held.
+        """
+        size_class = max(size - 1, 1).bit_length() - 6
+        size_class = max(size_class, 0)
+
+        if size_class >= _max_size_classes:
+            raise ValueError('Entry too large ({} bytes)'.format(size))
+
+        mm = self._mmap
+        free_list_offset = ModuleCtx.Free_List_Offset + size_class * _u64.size
+
+        self._lock(LOCK_EX, ModuleCtx.Lock_Allocator)
+
+        try:
+
+            # Reuse a free block if there is one ..
+            offset = _u64.unpack_from(mm, free_list_offset)[0]
+            if offset:
+                _u64.pack_into(mm, free_list_offset, _entry_next.unpack_from(mm, offset)[0])
+                return offset, size_class
+
+            # .. otherwise, allocate a new one.
+            offset = _u64.unpack_from(mm, _bump_offset)[0]
+            block_size = ModuleCtx.Min_Block_Size << size_class
+
+            if offset + block_size > self.size:
+                raise SharedMemoryCacheFull('Shared memory cache `{}` is full'.format(self.name))
+
+            _u64.pack_into(mm, _bump_offset, offset + block_size)
+            return offset, size_class
+
+        finally:
+            self._unlock(ModuleCtx.Lock_Allocator)
+
+# ################################################################################################################################
+
+    def _free(self, offset:'int', size_class:'int') -> 'None':
+        """ Returns a block of memory to the list of free ones. Must be called with a bucket lock held.
+        """
+        mm = self._mmap
+        free_list_offset = ModuleCtx.Free_List_Offset + size_class * _u64.size
+
+        self._lock(LOCK_EX, ModuleCtx.Lock_Allocator)
+
+        try:
+            _entry_next.pack_into(mm, offset, _u64.unpack_from(mm, free_list_offset)[0])
+            _u64.pack_into(mm, free_list_offset, offset)
+        finally:
+            self._unlock(ModuleCtx.Lock_Allocator)
+
+# ################################################################################################################################
+
+    def _add_to_count(self, value:'int') -> 'None':
+        """ Updates the number of entries. Must be called with a bucket lock held.
+        """
+        self._lock(LOCK_EX, ModuleCtx.Lock_Allocator)
+        try:
+            _u64.pack_into(self._mmap, _count_offset, _u64.unpack_from(self._mmap, _count_offset)[0] + value)
+        finally:
+            self._unlock(ModuleCtx.Lock_Allocator)
+
+    def _set_min_expires_at(self, expires_at:'float') -> 'None':
+        """ Makes note of the earliest expiration time so that it is known when to look for expired entries.
+        Must be called with a bucket lock held.
+        """
+        self._lock(LOCK_EX, ModuleCtx.Lock_Allocator)
+        try:
+            if expires_at < _f64.unpack_from(self._mmap, _min_expires_offset)[0]:
+                _f64.pack_into(self._mmap, _min_expires_offset, expires_at)
+        finally:
+            self._unlock(ModuleCtx.Lock_Allocator)
+
+# ################################################################################################################################
+
+    def _get_bucket(self, key_bytes:'bytes') -> 'tuple[int, int]':
+        """ Returns the offset of the bucket that a key belongs to, along with the lock that protects it.
+        """
+        bucket_idx = crc32(key_bytes) & (self._num_buckets - 1)
+        return ModuleCtx.Buckets_Offset + bucket_idx * _u64.size, bucket_idx & _stripe_mask
+
+# ################################################################################################################################
+
+    def _find(self, bucket:'int', key_bytes:'bytes') -> 'tuple[int, int]':
+        """ Returns offsets of an entry by its key, and of the previous entry, or of the bucket. The entry's offset is 0
+        if there is no such key. Must be called with a bucket lock held.
+        """
+        mm = self._mmap
+        key_len = len(key_bytes)
+
+        prev = bucket
+        offset = _u64.unpack_from(mm, bucket)[0]
+
+        while offset:
+            _, _, _, _, entry_key_len, _, _, _, _ = _entry.unpack_from(mm, offset)
+            if entry_key_len == key_len:
+                key_start = offset + _entry_header_size
+                if mm[key_start:key_start+key_len] == key_bytes:
+                    return prev, offset
+
+            prev = offset
+            offset = _entry_next.unpack_from(mm, offset)[0]
+
+        return prev, 0
+
+# ################################################################################################################################
+
+    def _read_value(self, offset:'int') -> 'any_':
+        _, _, value_type, _, key_len, value_len, _, _, _ = _entry.unpack_from(self._mmap, offset)
+        value_start = offset + _entry_header_size + key_len
+        return _decode_value(value_type, self._mmap[value_start:value_start+value_len])
+
+    def _read_key(self, offset:'int') -> 'any_':
+        key_len = _entry.unpack_from(self._mmap, offset)[4]
+        key_start = offset + _entry_header_size
+        return _decode_key(self._mmap[key_start:key_start+key_len])
+
+# ################################################################################################################################
+
+    def _get_entry(self, offset:'int', key:'any_') -> 'Entry':
+        """ Returns an entry object, the same as the in-process caches return when details are requested.
+        """
+        _, _, _, _, _, _, expiry, expires_at, last_write = _entry.unpack_from(self._mmap, offset)
+
+        entry = Entry()
+        entry.key = key
+        entry.value = self._read_value(offset)
+        entry.expiry = expiry
+        entry.expires_at = expires_at
+        entry.last_write = last_write
+        entry.set_metadata()
+
+        return entry
+
+# ################################################################################################################################
+
+    def _delete_entry(self, prev:'int', offset:'int') -> 'None':
+        """ Removes an entry from its bucket's chain and frees its memory. Must be called with a bucket lock held.
+        """
+        mm = self._mmap
+        _u64.pack_into(mm, prev, _entry_next.unpack_from(mm, offset)[0])
+        self._free(offset, _entry.unpack_from(mm, offset)[1])
+        self._add_to_count(-1)
+
+# ################################################################################################################################
+
+    def _write_entry(
+        self,
+        prev:'int',
+        offset:'int',
+        key_bytes:'bytes',
+        value_type:'int',
+        value_bytes:'bytes',
+        expiry:'float',
+        expires_at:'float',
+        now:'float',
+    ) -> 'None':
+        """ Stores an entry, either in place of an existing one, if there is any and the new one fits in, or in a new block.
+        Must be called with a bucket lock held.
+        """
+        mm = self._mmap
+        key_len = len(key_bytes)
+        value_len = len(value_bytes)
+        size = _entry_header_size + key_len + value_len
+
+        # This is an update of an existing entry ..
+        if offset:
+            next_offset, size_class, _, _, _, _, _, _, _ = _entry.unpack_from(mm, offset)
+
+            # .. which needs more memory than its block has, in which case it is moved to a new block ..
+            if size > ModuleCtx.Min_Block_Size << size_class:
+                new_offset, size_class = self._alloc(size)
+                self._free(offset, _entry.unpack_from(mm, offset)[1])
+                offset = new_offset
+                _u64.pack_into(mm, prev, offset)
+
+        # .. this is a new entry, added to the front of its bucket's chain.
+        else:
+            if _u64.unpack_from(mm, _count_offset)[0] >= self.max_size:
+                raise SharedMemoryCacheFull('Shared memory cache `{}` has reached its max. size of {}'.format(
+                    self.name, self.max_size))
+
+            offset, size_class = self._alloc(size)
+            next_offset = _u64.unpack_from(mm, prev)[0]
+            _u64.pack_into(mm, prev, offset)
+            self._add_to_count(1)
+
+        _entry.pack_into(mm, offset, next_offset, size_class, value_type, 0, key_len, value_len, expiry, expires_at, now)
+
+        key_start = offset + _entry_header_size
+        value_start = key_start + key_len
+
+        mm[key_start:value_start] = key_bytes
+        mm[value_start:value_start+value_len] = value_bytes
+
+        if expires_at:
+            self._set_min_expires_at(expires_at)
+
+# ################################################################################################################################
+
+    def _get_new_expiration(self, offset:'int', expiry:'float', now:'float') -> 'tuple[float, float]':
+        """ Returns expiry and expiration time of a key that is about to be set. The rules are the same as in in-process caches.
+        Must be called with a bucket lock held.
+        """
+        _, _, _, _, _, _, entry_expiry, entry_expires_at, _ = _entry.unpack_from(self._mmap, offset)
+
+        # If we have a key that previously was not using expiry, we must set it now if expiry is given on input.
+        if not entry_expires_at:
+            if expiry:
+                return expiry, now + expiry
+            else:
+                return entry_expiry, entry_expires_at
+
+        # If expiry == 0.0 it means that we are resetting an already existing expiry time
+        elif expiry == 0.0:
+            return 0.0, 0.0
+
+        # The entry exists and has not expired so now, if we are configured to, prolong its expiration time
+        elif self.extend_expiry_on_set and entry_expiry:
+            return entry_expiry, now + entry_expiry
+
+        else:
+            return entry_expiry, entry_expires_at
+
+# ################################################################################################################################
+
+    def _is_expired(self, offset:'int', now:'float') -> 'bool':
+        expires_at = _entry.unpack_from(self._mmap, offset)[7]
+        return bool(expires_at) and now >= expires_at
+
+# ################################################################################################################################
+
+    def _set(self, key:'any_', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone', now:'float') -> 'any_':
+        """ Sets a key to a value. Must be called with a bucket lock held.
+        """
+        key_bytes = _encode_key(key)
+        value_type, value_bytes = _encode_value(value)
+
+        if self.has_max_item_size:
+            if isinstance(value, (str, bytes)):
+                if len(value) > self.max_item_size:
+                    raise ValueError('Value too long {} > {}'.format(len(value), self.max_item_size))
+
+        bucket, _ = self._get_bucket(key_bytes)
+        prev, offset = self._find(bucket, key_bytes)
+
+        out = None
+
+        if offset:
+
+            # Mark as deleted an entry that has already expired
+            if self._is_expired(offset, now):
+                self._delete_entry(prev, offset)
+                raise KeyExpiredError(key)
+
+            out = self._read_value(offset) if not details else None
+            new_expiry, expires_at = self._get_new_expiration(offset, expiry, now)
+
+        else:
+            new_expiry, expires_at = expiry, (now + expiry if expiry else 0.0)
+            prev = bucket
+
+        self._write_entry(prev, offset, key_bytes, value_type, value_bytes, new_expiry, expires_at, now)
+
+        # If any output dict for metadata was passed in by reference, set its requires items.
+        if meta_ref is not None:
+            meta_ref['expires_at'] = expires_at
+            meta_ref['orig_now'] = now
+
+        if details:
+            return self._get_entry(self._find(bucket, key_bytes)[1], key)
+        else:
+            return out
+
+# ################################################################################################################################
+
+    def _with_room(self, func:'callable_', *args:'any_') -> 'any_':
+        """ Invokes a function that may need room for new entries, deleting expired ones if there is not enough of it.
+        """
+        try:
+            return func(*args)
+        except SharedMemoryCacheFull:
+            _ = self.delete_expired()
+            return func(*args)
+
+# ################################################################################################################################
+
+    def set(self, key:'any_', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone'=None,
+        orig_now:'float | None'=None) -> 'any_':
+        return self._with_room(self._set_locked, key, value, expiry, details, meta_ref, orig_now or time())
+
+    def _set_locked(self, key:'any_', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        now:'float') -> 'any_':
+
+        _, stripe = self._get_bucket(_encode_key(key))
+
+        self._lock(LOCK_EX, stripe)
+        try:
+            return self._set(key, value, expiry, details, meta_ref, now)
+        finally:
+            self._unlock(stripe)
+
+# ################################################################################################################################
+
+    def get(self, key:'any_', default:'any_', details:'bool') -> 'any_':
+        """ Returns data for key in cache if present. Otherwise returns None or the default value given on input.
+        If 'details' is True, returns an entry object with the value and its metadata.
+        """
+        key_bytes = _encode_key(key)
+        bucket, stripe = self._get_bucket(key_bytes)
+        now = time()
+
+        # Most reads need to read data only ..
+        self._lock(LOCK_SH, stripe)
+        try:
+            _, offset = self._find(bucket, key_bytes)
+            if offset:
+                expires_at = _entry.unpack_from(self._mmap, offset)[7]
+                if not expires_at:
+                    return self._get_entry(offset, key) if details else self._read_value(offset)
+            else:
+                return None if default is self.default_get else default
+        finally:
+            self._unlock(stripe)
+
+        # .. but entries with an expiration time may need to be deleted or have their expiration time extended.
+        self._lock(LOCK_EX, stripe)
+        try:
+            prev, offset = self._find(bucket, key_bytes)
+
+            # The entry may have been deleted since we last checked
+            if not offset:
+                return None if default is self.default_get else default
+
+            if self._is_expired(offset, now):
+                self._delete_entry(prev, offset)
+                raise KeyExpiredError(key)
+
+            if self.extend_expiry_on_get:
+                expiry = _entry.unpack_from(self._mmap, offset)[6]
+                if expiry:
+                    _f64.pack_into(self._mmap, offset + _expires_at_offset, now + expiry)
+
+            return self._get_entry(offset, key) if details else self._read_value(offset)
+
+        finally:
+            self._unlock(stripe)
+
+# ################################################################################################################################
+
+    def delete(self, key:'any_') -> 'any_':
+        """ Deletes a key, returning its previous value, or None if there was no such key.
+        """
+        key_bytes = _encode_key(key)
+        bucket, stripe = self._get_bucket(key_bytes)
+
+        self._lock(LOCK_EX, stripe)
+        try:
+            prev, offset = self._find(bucket, key_bytes)
+            if offset:
+                out = self._read_value(offset)
+                self._delete_entry(prev, offset)
+                return out
+        finally:
+            self._unlock(stripe)
+
+# ################################################################################################################################
+
+    def expire(self, key:'any_', expiry:'float', meta_ref:'dictnone') -> 'bool':
+        """ Makes a given cache entry expire after 'expiry' seconds.
+        """
+        key_bytes = _encode_key(key)
+        bucket, stripe = self._get_bucket(key_bytes)
+
+        self._lock(LOCK_EX, stripe)
+        try:
+            return self._expire(bucket, key, key_bytes, expiry, meta_ref, time())
+        finally:
+            self._unlock(stripe)
+
+    def _expire(self, bucket:'int', key:'any_', key_bytes:'bytes', expiry:'float', meta_ref:'dictnone', now:'float') -> 'bool':
+        """ Sets a new expiration time of a key. Must be called with a bucket lock held.
+        """
+        prev, offset = self._find(bucket, key_bytes)
+
+        if not offset:
+            return False
+
+        if self._is_expired(offset, now):
+            self._delete_entry(prev, offset)
+            raise KeyExpiredError(key)
+
+        new_expiry, expires_at = self._get_new_expiration(offset, expiry, now)
+
+        _f64.pack_into(self._mmap, offset + _expiry_offset, new_expiry)
+        _f64.pack_into(self._mmap, offset + _expires_at_offset, expires_at)
+
+        if expires_at:
+            self._set_min_expires_at(expires_at)
+
+        if meta_ref is not None:
+            meta_ref['expires_at'] = expires_at
+            meta_ref['orig_now'] = now
+
+        return True
+
+# ################################################################################################################################
+
+    def set_expiration_data(self, key:'any_', expiry:'float', expires_at:'float') -> 'None':
+        """ Entries are shared by all processes so there is nothing to synchronize.
+        """
+
+# ################################################################################################################################
+
+    def _iter_entries(self) -> 'any_':
+        """ Yields (prev, offset) pairs for all entries. Must be called with all bucket locks held.
+        """
+        mm = self._mmap
+        buckets_offset = ModuleCtx.Buckets_Offset
+
+        for idx in range(self._num_buckets):
+            prev = buckets_offset + idx * _u64.size
+            offset = _u64.unpack_from(mm, prev)[0]
+            while offset:
+                next_offset = _entry_next.unpack_from(mm, offset)[0]
+                yield prev, offset
+
+                # The entry may have been deleted by our caller
+                if _u64.unpack_from(mm, prev)[0] == offset:
+                    prev = offset
+                offset = next_offset
+
+# ################################################################################################################################
+
+    def _get_matching(self, match_func:'callable_', data:'any_', limit:'int') -> 'anylist':
+        """ Returns keys of entries whose keys match input data. Non-string-like keys are ignored.
+        Must be called with all bucket locks held.
+        """
+        out = []
+
+        for idx, (_, offset) in enumerate(self._iter_entries(), 1):
+            key = self._read_key(offset)
+            if isinstance(key, _str_types) and match_func(key, data):
+                out.append(key)
+            if idx == limit:
+                break
+
+        return out
+
+# ################################################################################################################################
+
+    def _get_by(self, match_func:'callable_', data:'any_', details:'bool', limit:'int') -> 'anydict':
+        """ Returns all key:value mappings for keys matching input data.
+        """
+        out = {}
+
+        self._lock_all(LOCK_SH)
+        try:
+            keys = self._get_matching(match_func, data, limit)
+        finally:
+            self._unlock_all()
+
+        for key in keys:
+            try:
+                value = self.get(key, self.default_get, details)
+            except KeyExpiredError:
+                continue
+            else:
+                if value is not None:
+                    out[key] = value
+
+        return out
+
+# ################################################################################################################################
+
+    def _set_by(self, match_func:'callable_', data:'any_', value:'any_', expiry:'float', details:'bool',
+        meta_ref:'dictnone', return_found:'bool', limit:'int', orig_now:'float | None') -> 'anydict':
+        """ Sets a given value for all keys matching input data. Optionally, returns a dict of keys that matched
+        along with their previous values.
+        """
+        out = {}
+        now = orig_now or time()
+
+        self._lock_all(LOCK_EX)
+        try:
+            for key in self._get_matching(match_func, data, limit):
+
+                if return_found:
+                    bucket, _ = self._get_bucket(_encode_key(key))
+                    offset = self._find(bucket, _encode_key(key))[1]
+                    out[key] = self._get_entry(offset, key) if details else self._read_value(offset)
+
+                try:
+                    self._set(key, value, expiry, False, None, now)
+                except KeyExpiredError:
+                    continue
+
+                # Indicate to our caller that there was at least one matching key
+                if meta_ref is not None:
+                    meta_ref['_any_found'] = True
+        finally:
+            self._unlock_all()
+
+        if meta_ref is not None:
+            meta_ref['_now'] = now
+
+        return out
+
+# ################################################################################################################################
+
+    def _delete_by(self, match_func:'callable_', data:'any_', return_found:'bool', limit:'int') -> 'anydict':
+        """ Deletes keys matching input data. Optionally, returns a dict of keys that matched along with their previous values.
+        """
+        out = {}
+
+        self._lock_all(LOCK_EX)
+        try:
+            for key in self._get_matching(match_func, data, limit):
+                key_bytes = _encode_key(key)
+                bucket, _ = self._get_bucket(key_bytes)
+                prev, offset = self._find(bucket, key_bytes)
+                if return_found:
+                    out[key] = self._read_value(offset)
+                self._delete_entry(prev, offset)
+        finally:
+            self._unlock_all()
+
+        return out
+
+# ################################################################################################################################
+
+    def _expire_by(self, match_func:'callable_', data:'any_', expiry:'float', limit:'int') -> 'bool':
+        """ Sets expiration for all keys matching input data.
+        """
+        found_any = False
+        now = time()
+
+        self._lock_all(LOCK_EX)
+        try:
+            for key in self._get_matching(match_func, data, limit):
+                key_bytes = _encode_key(key)
+                bucket, _ = self._get_bucket(key_bytes)
+                try:
+                    found_any = self._expire(bucket, key, key_bytes, expiry, None, now) or found_any
+                except KeyExpiredError:
+                    continue
+        finally:
+            self._unlock_all()
+
+        return found_any
+
+# ################################################################################################################################
+
+    def _match_regex(self, key:'str', data:'str') -> 'bool':
+        regex = self._regex_cache.get(data)
+        if not regex:
+            regex = self._regex_cache[data] = re_compile(data)
+        return bool(regex.match(key))
+
+# ################################################################################################################################
+
+    def get_by_prefix(self, data:'str', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(_match_prefix, data, details, limit)
+
+    def get_by_suffix(self, data:'str', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(_match_suffix, data, details, limit)
+
+    def get_by_regex(self, data:'str', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(self._match_regex, data, details, limit)
+
+    def get_contains(self, data:'str', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(_match_contains, data, details, limit)
+
+    def get_not_contains(self, data:'str', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(_match_not_contains, data, details, limit)
+
+    def get_contains_all(self, data:'anylist', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(_match_contains_all, data, details, limit)
+
+    def get_contains_any(self, data:'anylist', details:'bool', limit:'int') -> 'anydict':
+        return self._get_by(_match_contains_any, data, details, limit)
+
+# ################################################################################################################################
+
+    def set_by_prefix(self, data:'str', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(_match_prefix, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_by_suffix(self, data:'str', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(_match_suffix, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_by_regex(self, data:'str', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(self._match_regex, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_contains(self, data:'str', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(_match_contains, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_not_contains(self, data:'str', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(_match_not_contains, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_contains_all(self, data:'anylist', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(_match_contains_all, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_contains_any(self, data:'anylist', value:'any_', expiry:'float', details:'bool', meta_ref:'dictnone',
+        return_found:'bool', limit:'int', orig_now:'float | None'=None) -> 'anydict':
+        return self._set_by(_match_contains_any, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+# ################################################################################################################################
+
+    def delete_by_prefix(self, data:'str', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(_match_prefix, data, return_found, limit)
+
+    def delete_by_suffix(self, data:'str', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(_match_suffix, data, return_found, limit)
+
+    def delete_by_regex(self, data:'str', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(self._match_regex, data, return_found, limit)
+
+    def delete_contains(self, data:'str', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(_match_contains, data, return_found, limit)
+
+    def delete_not_contains(self, data:'str', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(_match_not_contains, data, return_found, limit)
+
+    def delete_contains_all(self, data:'anylist', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(_match_contains_all, data, return_found, limit)
+
+    def delete_contains_any(self, data:'anylist', return_found:'bool', limit:'int') -> 'anydict':
+        return self._delete_by(_match_contains_any, data, return_found, limit)
+
+# ################################################################################################################################
+
+    def expire_by_prefix(self, data:'str', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(_match_prefix, data, expiry, limit)
+
+    def expire_by_suffix(self, data:'str', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(_match_suffix, data, expiry, limit)
+
+    def expire_by_regex(self, data:'str', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(self._match_regex, data, expiry, limit)
+
+    def expire_contains(self, data:'str', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(_match_contains, data, expiry, limit)
+
+    def expire_not_contains(self, data:'str', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(_match_not_contains, data, expiry, limit)
+
+    def expire_contains_all(self, data:'anylist', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(_match_contains_all, data, expiry, limit)
+
+    def expire_contains_any(self, data:'anylist', expiry:'float', limit:'int'=0) -> 'bool':
+        return self._expire_by(_match_contains_any, data, expiry, limit)
+
+# ################################################################################################################################
+
+    def delete_expired(self) -> 'anylist':
+        """ Deletes all entries expired as of now, returning their keys. Entries are visited only if at least one of them
+        may have expired.
+        """
+        now = time()
+        deleted = []
+
+        # The cache may have been already closed
+        if not self._mmap:
+            return deleted
+
+        if now < _f64.unpack_from(self._mmap, _min_expires_offset)[0]:
+            return deleted
+
+        min_expires_at = _no_expiration
+
+        self._lock_all(LOCK_EX)
+        try:
+            for prev, offset in self._iter_entries():
+                expires_at = _entry.unpack_from(self._mmap, offset)[7]
+                if expires_at:
+                    if now >= expires_at:
+                        deleted.append(self._read_key(offset))
+                        self._delete_entry(prev, offset)
+                    else:
+                        min_expires_at = min(min_expires_at, expires_at)
+
+            _f64.pack_into(self._mmap, _min_expires_offset, min_expires_at)
+
+        finally:
+            self._unlock_all()
+
+        return deleted
+
+# ################################################################################################################################
+
+    def clear(self) -> 'None':
+        """ Deletes all entries.
+        """
+        self._lock_all(LOCK_EX)
+        try:
+            self._lock(LOCK_EX, ModuleCtx.Lock_Allocator)
+            try:
+                self._init_segment(self._num_buckets)
+            finally:
+                self._unlock(ModuleCtx.Lock_Allocator)
+        finally:
+            self._unlock_all()
+
+# ################################################################################################################################
+
+    def _get_all(self, needs_key:'bool', needs_value:'bool') -> 'anylist':
+
+        out = []
+
+        self._lock_all(LOCK_SH)
+        try:
+            for _, offset in self._iter_entries():
+                if needs_key and needs_value:
+                    out.append((self._read_key(offset), self._read_value(offset)))
+                elif needs_key:
+                    out.append(self._read_key(offset))
+                else:
+                    out.append(self._read_value(offset))
+        finally:
+            self._unlock_all()
+
+        return out
+
+# ################################################################################################################################
+
+    def keys(self) -> 'anylist':
+        return self._get_all(True, False)
+
+    def values(self) -> 'anylist':
+        return self._get_all(False, True)
+
+    def items(self) -> 'anylist':
+        return self._get_all(True, True)
+
+    def iterkeys(self) -> 'any_':
+        return iter(self.keys())
+
+    def itervalues(self) -> 'any_':
+        return iter(self.values())
+
+    def iteritems(self) -> 'any_':
+        return iter(self.items())
+
+    keys_by_position = keys
+
+# ################################################################################################################################
+
+    def get_slice(self, start:'intnone', stop:'intnone', step:'intnone') -> 'any_':
+
+        self._lock_all(LOCK_SH)
+        try:
+            entries = [self._get_entry(offset, self._read_key(offset)) for _, offset in self._iter_entries()]
+        finally:
+            self._unlock_all()
+
+        for position in range(*slice(start, stop, step).indices(len(entries))):
+            as_dict = entries[position].to_dict()
+            as_dict['position'] = position
+            yield as_dict
+
+# ################################################################################################################################
+
+    def __len__(self) -> 'int':
+        return _u64.unpack_from(self._mmap, _count_offset)[0]
+
+    def __contains__(self, key:'any_') -> 'bool':
+        key_bytes = _encode_key(key)
+        bucket, stripe = self._get_bucket(key_bytes)
+
+        self._lock(LOCK_SH, stripe)
+        try:
+            return bool(self._find(bucket, key_bytes)[1])
+        finally:
+            self._unlock(stripe)
+
+    def __repr__(self) -> 'str':
+        return '<{} at {}, name:{}, size:{}/{}, max_item_size:{}>'.format(
+            self.__class__.__name__, hex(id(self)), self.name, len(self) if self._mmap else '-', self.max_size,
+            self.max_item_size)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _match_prefix(key:'str', data:'str') -> 'bool':
+    return key.startswith(data)
+
+def _match_suffix(key:'str', data:'str') -> 'bool':
+    return key.endswith(data)
+
+def _match_contains(key:'str', data:'str') -> 'bool':
+    return data in key
+
+def _match_not_contains(key:'str', data:'str') -> 'bool':
+    return data not in key
+
+def _match_contains_all(key:'str', data:'anylist') -> 'bool':
+    return all(elem in key for elem in data)
+
+def _match_contains_any(key:'str', data:'anylist') -> 'bool':
+    return any(elem in key for elem in data)
+
+# ################################################################################################################################
+# ################################################################################################################################
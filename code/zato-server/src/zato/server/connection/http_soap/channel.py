@@ -11,7 +11,7 @@ import logging
 import os
 from datetime import datetime
 from gzip import GzipFile
-from hashlib import sha256
+from hashlib import blake2b, sha256
 from http.client import BAD_REQUEST, FORBIDDEN, INTERNAL_SERVER_ERROR, METHOD_NOT_ALLOWED, NOT_FOUND, UNAUTHORIZED
 from io import StringIO
 from traceback import format_exc
@@ -19,9 +19,14 @@ from traceback import format_exc
 # regex
 from regex import compile as regex_compile
 
+try:
+    from xxhash import xxh3_128_hexdigest
+except ImportError:
+    xxh3_128_hexdigest = None
+
 # Zato
-from zato.common.api import CHANNEL, CONTENT_TYPE, DATA_FORMAT, HL7, HTTP_SOAP, MISC, RATE_LIMIT, SEC_DEF_TYPE, SIMPLE_IO, \
-    SSO, TRACE1, URL_PARAMS_PRIORITY, ZATO_NONE
+from zato.common.api import CACHE, CHANNEL, CONTENT_TYPE, DATA_FORMAT, HL7, HTTP_SOAP, MISC, RATE_LIMIT, SEC_DEF_TYPE, \
+    SIMPLE_IO, SSO, TRACE1, URL_PARAMS_PRIORITY, ZATO_NONE
 from zato.common.audit_log import DataReceived, DataSent
 from zato.common.const import ServiceConst
 from zato.common.exception import HTTP_RESPONSES, ServiceMissingException
@@ -177,6 +182,65 @@ class _CachedResponse:
 
 # ################################################################################################################################
 
+def _get_cache_key_data(wsgi_environ:'stranydict', channel_params:'stranydict') -> 'bytes':
+    query_string = str(sorted(channel_params.items()))
+    data = '%s\x00%s\x00%s\x00' % (wsgi_environ['REQUEST_METHOD'], wsgi_environ['PATH_INFO'], query_string)
+    return data.encode('utf8')
+
+# ################################################################################################################################
+
+def _get_fast_hash(data:'bytes', raw_request:'any_'=b'') -> 'str':
+
+    if raw_request:
+        if isinstance(raw_request, str):
+            raw_request = raw_request.encode('utf8')
+        data += raw_request
+
+    # Prefer xxHash if it is installed ..
+    if xxh3_128_hexdigest:
+        return xxh3_128_hexdigest(data)
+
+    # .. otherwise, this is the fastest 128-bit hash that is always available.
+    else:
+        return blake2b(data, digest_size=16).hexdigest()
+
+# ################################################################################################################################
+
+def _get_cache_key_sha256(wsgi_environ:'stranydict', channel_params:'stranydict', raw_request:'any_') -> 'str':
+    query_string = str(sorted(channel_params.items()))
+    data = '%s%s%s%s' % (wsgi_environ['REQUEST_METHOD'], wsgi_environ['PATH_INFO'], query_string, raw_request)
+    hash_value = sha256(data.encode('utf8')).hexdigest()
+    return '-'.join(split_re(hash_value)) # type: ignore
+
+def _get_cache_key_fast_hash(wsgi_environ:'stranydict', channel_params:'stranydict', raw_request:'any_') -> 'str':
+    return _get_fast_hash(_get_cache_key_data(wsgi_environ, channel_params), raw_request)
+
+def _get_cache_key_no_payload(wsgi_environ:'stranydict', channel_params:'stranydict', raw_request:'any_') -> 'str':
+    return _get_fast_hash(_get_cache_key_data(wsgi_environ, channel_params))
+
+# Maps types of keys that channels can be configured with to functions computing them
+cache_key_func = {
+    CACHE.HTTP_KEY_TYPE.SHA256: _get_cache_key_sha256,
+    CACHE.HTTP_KEY_TYPE.FAST_HASH: _get_cache_key_fast_hash,
+    CACHE.HTTP_KEY_TYPE.NO_PAYLOAD: _get_cache_key_no_payload,
+}
+
+# ################################################################################################################################
+
+def _get_payload_to_send(payload:'any_') -> 'any_':
+    """ Returns a response payload the way it is returned to HTTP clients.
+    """
+    if isinstance(payload, CySimpleIOPayload):
+        payload = payload.getvalue()
+        if isinstance(payload, dict):
+            if 'response' in payload:
+                payload = payload['response']
+                payload = dumps(payload)
+
+    return payload
+
+# ################################################################################################################################
+
 class _HashCtx:
     """ Encapsulates information needed to compute a hash value of an incoming request.
     """
@@ -463,16 +527,7 @@ class RequestDispatcher:
                     self.server.audit_log.store_data_sent(data_event)
 
                 # Finally, return payload to the client, potentially deserializing it from CySimpleIO first.
-                if isinstance(response.payload, CySimpleIOPayload):
-                    payload = response.payload.getvalue()
-                    if isinstance(payload, dict):
-                        if 'response' in payload:
-                            payload = payload['response']
-                            payload = dumps(payload)
-                else:
-                    payload = response.payload
-
-                return payload
+                return _get_payload_to_send(response.payload)
 
             except Exception as e:
                 _format_exc = format_exc()
@@ -775,16 +830,18 @@ class RequestHandler:
           * payload bytes         # E.g. '{"customer_id":"123"}' - a string object, before parsing
         Note that query string is sorted which means that ?foo=123&bar=456 is equal to ?bar=456&foo=123,
         that is, the order of parameters in query string does not matter.
+
+        Channels can use a cheaper non-cryptographic hash instead of sha256 by setting their cache_key_type
+        to 'fast-hash', or to 'no-payload' to leave out the payload from the hash altogether.
         """
         if service.get_request_hash:# type: ignore
             hash_value = service.get_request_hash(
                 _HashCtx(raw_request, channel_item, channel_params, wsgi_environ) # type: ignore
                 )
         else:
-            query_string = str(sorted(channel_params.items()))
-            data = '%s%s%s%s' % (wsgi_environ['REQUEST_METHOD'], wsgi_environ['PATH_INFO'], query_string, raw_request)
-            hash_value = sha256(data.encode('utf8')).hexdigest()
-            hash_value = '-'.join(split_re(hash_value)) # type: ignore
+            key_type = channel_item.get('cache_key_type') or CACHE.HTTP_KEY_TYPE.SHA256
+            get_cache_key = cache_key_func[key_type]
+            hash_value = get_cache_key(wsgi_environ, channel_params, raw_request)
 
         # No matter if hash value is default or from service, always prefix it with channel's type and ID
         cache_key = 'http-channel-%s-%s' % (channel_item['id'], hash_value)
@@ -792,11 +849,16 @@ class RequestHandler:
         # We have the key so now we can check if there is any matching response already stored in cache
         response = self.server.get_from_cache(channel_item['cache_type'], channel_item['cache_name'], cache_key)
 
-        # If there is any response, we can now load into a format that our callers expect
+        # If there is any response, it is already in the form that it can be returned in ..
         if response:
-            response = loads(response)
-            response = _CachedResponse(response['payload'], response['content_type'], response['headers'],
-                response['status_code'])
+            if isinstance(response, tuple):
+                response = _CachedResponse(*response)
+
+            # .. unless it was cached as JSON by a previous version.
+            else:
+                response = loads(response)
+                response = _CachedResponse(response['payload'], response['content_type'], response['headers'],
+                    response['status_code'])
 
         return cache_key, response
 
@@ -804,13 +866,18 @@ class RequestHandler:
 
     def set_response_in_cache(self, channel_item:'any_', key:'str', response:'any_'):
         """ Caches responses from this channel's invocation for as long as the cache is configured to keep it.
+        Responses are stored ready to be sent, which means that cache hits do not need to deserialise them.
         """
-        self.server.set_in_cache(channel_item['cache_type'], channel_item['cache_name'], key, dumps({
-            'payload': response.payload,
-            'content_type': response.content_type,
-            'headers': response.headers,
-            'status_code': response.status_code,
-        }))
+        payload = _get_payload_to_send(response.payload)
+        if isinstance(payload, str):
+            payload = payload.encode('utf8')
+
+        self.server.set_in_cache(channel_item['cache_type'], channel_item['cache_name'], key, (
+            payload,
+            response.content_type,
+            response.headers,
+            response.status_code,
+        ))
 
 # ################################################################################################################################
 
@@ -843,6 +910,7 @@ class RequestHandler:
         if channel_item['cache_type']:
             cache_key, response = self.get_response_from_cache(service, raw_request, channel_item, channel_params, wsgi_environ)
             if response:
+                self.server.service_store.release_instance(service)
                 return response
 
         # Add any path params matched to WSGI environment so it can be easily accessible later on
@@ -866,6 +934,9 @@ class RequestHandler:
         if channel_item['cache_type']:
             self.set_response_in_cache(channel_item, cache_key, response)
 
+        # The service is no longer needed
+        self.server.service_store.release_instance(service)
+
         # Having used the cache or not, we can return the response now
         return response
 
@@ -507,6 +507,7 @@ class URLData(CyURLData, OAuthDataStore):
         # No error, let's delete channel info
         if match_idx != ZATO_NONE:
             self.channel_data.pop(match_idx)
+            self.on_channel_data_changed()
 
 # ################################################################################################################################
 
@@ -899,7 +900,7 @@ class URLData(CyURLData, OAuthDataStore):
 
     def sort_channel_data(self):
         """ Sorts channel items by name and then re-arranges the result so that user-facing services are closer to the begining
-        of the list which makes it faster to look them up - searches in the list are O(n).
+        of the list which means that they take precedence over internal ones if more than one channel matches a URL path.
         """
         channel_data = []
         user_services = []
@@ -919,6 +920,9 @@ class URLData(CyURLData, OAuthDataStore):
 
         self.channel_data[:] = channel_data
 
+        # Indexes of channels have changed so the routing structures need to be rebuilt
+        self.on_channel_data_changed()
+
 # ################################################################################################################################
 
     def _channel_item_from_msg(self, msg, match_target, old_data=None):
@@ -929,7 +933,7 @@ class URLData(CyURLData, OAuthDataStore):
         for name in('connection', 'content_type', 'data_format', 'host', 'id', 'has_rbac', 'impl_name', 'is_active',
             'is_internal', 'merge_url_params_req', 'method', 'name', 'params_pri', 'ping_method', 'pool_size', 'service_id',
             'service_name', 'soap_action', 'soap_version', 'transport', 'url_params_pri', 'url_path', 'sec_use_rbac',
-            'cache_type', 'cache_id', 'cache_name', 'cache_expiry', 'content_encoding', 'match_slash', 'hl7_version',
+            'cache_type', 'cache_id', 'cache_name', 'cache_expiry', 'cache_key_type', 'content_encoding', 'match_slash', 'hl7_version',
             'json_path', 'should_parse_on_input', 'should_validate', 'should_return_errors', 'data_encoding',
             'is_audit_log_sent_active', 'is_audit_log_received_active', 'max_len_messages_sent', 'max_len_messages_received',
             'max_bytes_per_message_sent', 'max_bytes_per_message_received', 'security_groups', 'security_groups_ctx'):
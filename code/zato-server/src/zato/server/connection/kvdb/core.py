@@ -43,6 +43,29 @@ logger = getLogger('zato')
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # Journals are kept next to snapshots, under the same name with this suffix added
+    Journal_Suffix = '.journal'
+
+    # A new snapshot is written, and the journal is emptied, once the journal is bigger than the snapshot
+    # and than this many bytes.
+    Journal_Compact_Min_Size = 1_000_000
+
+# ################################################################################################################################
+
+class JournalOp:
+    """ Opcodes of journal records, each pointing to a function that applies a given record to a repository.
+    """
+    Append     = 'append'
+    Clear      = 'clear'
+    Delete     = 'delete'
+    Remove_All = 'remove_all'
+    Set        = 'set'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 @dataclass(init=False)
 class ObjectCtx:
 
@@ -58,17 +81,35 @@ class ObjectCtx:
     # The actual business data
     data: 'any_' = None
 
+    @staticmethod
+    def from_dict(data:'stranydict') -> 'ObjectCtx':
+        out = ObjectCtx()
+        out.id = data['id']
+        out.cid = data.get('cid')
+        out.timestamp = data.get('timestamp')
+        out.data = data.get('data')
+        return out
+
 # ################################################################################################################################
 # ################################################################################################################################
 
 class BaseRepo(InRAMStore):
-
+    """ Base class for repositories. By default, the whole of a repository's data is written to a file each time its state
+    is synchronised. Alternatively, if use_journal is True, each change is appended to a journal file as soon as it is made,
+    and synchronising the state only writes the whole data, i.e. a snapshot, if the journal has grown bigger than the snapshot is.
+    When data is loaded, the journal is replayed on top of the snapshot.
+
+    Subclasses using the journal call self._record for each change and map opcodes of the records to functions that apply them
+    in self.opcode_to_func. Applying a record must be idempotent because the same record may be replayed again
+    if the process stops after a new snapshot is written but before the journal is emptied.
+    """
     def __init__(
         self,
         name,      # type: str
         data_path, # type: str
         sync_threshold=ZatoKVDB.DefaultSyncThreshold, # type: int
-        sync_interval=ZatoKVDB.DefaultSyncInterval    # type: int
+        sync_interval=ZatoKVDB.DefaultSyncInterval,   # type: int
+        use_journal=False # type: bool
     ) -> 'None':
 
         super().__init__(sync_threshold, sync_interval)
@@ -85,6 +126,19 @@ class BaseRepo(InRAMStore):
         # Where we persist data on disk
         self.data_path = data_path
 
+        # Whether changes are appended to a journal instead of rewriting the whole of data each time
+        self.use_journal = use_journal
+
+        # The journal file that records are appended to, opened when the first one is
+        self._journal_file = None # type: any_
+
+        # Sizes of data on disk, used to decide when to write a new snapshot
+        self._journal_size = 0
+        self._snapshot_size = 0
+
+        # Set to True while the journal is being replayed so that replayed changes are not recorded again
+        self._is_replaying = False
+
 # ################################################################################################################################
 
     def _append(self, *args:'any_', **kwargs:'any_') -> 'ObjectCtx':
@@ -211,11 +265,78 @@ class BaseRepo(InRAMStore):
             if os.path.exists(self.data_path):
                 with open(self.data_path, 'rb') as f:
                     data = f.read()
+                    self._snapshot_size = len(data)
                     if data:
                         self._loads(data)
             else:
                 logger.info('Skipping repo data path `%s` (%s)', self.data_path, self.name)
 
+            if self.use_journal:
+                self._replay_journal()
+
+# ################################################################################################################################
+
+    @property
+    def journal_path(self) -> 'str':
+        return self.data_path + ModuleCtx.Journal_Suffix
+
+# ################################################################################################################################
+
+    def _record(self, opcode:'str', data:'any_'=None) -> 'None':
+        """ Appends a record of a change to the journal. The file is not buffered so the record is handed over
+        to the operating system right away and it is not lost if the process stops before the state is synchronised.
+        """
+        if self.use_journal and not self._is_replaying:
+
+            record = json_dumps([opcode, data]) + b'\n'
+
+            if not self._journal_file:
+                self._journal_file = open(self.journal_path, 'ab', buffering=0)
+
+            _ = self._journal_file.write(record)
+            self._journal_size += len(record)
+
+# ################################################################################################################################
+
+    def _close_journal(self) -> 'None':
+        if self._journal_file:
+            self._journal_file.close()
+            self._journal_file = None
+
+# ################################################################################################################################
+
+    def _replay_journal(self) -> 'None':
+        """ Applies all the records from the journal to data already loaded from the snapshot.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'rb') as f:
+            data = f.read()
+
+        num_records = 0
+        self._is_replaying = True
+
+        try:
+            for line in data.splitlines():
+
+                # The last record may have been written only partially if the process stopped while writing it
+                try:
+                    opcode, record_data = json_loads(line)
+                except Exception as e:
+                    logger.info('Ignoring the rest of KVDB journal (%s -> %s) -> %s', self.name, self.journal_path, e)
+                    break
+                else:
+                    self.opcode_to_func[opcode](record_data)
+                    num_records += 1
+        finally:
+            self._is_replaying = False
+
+        # Start with a new snapshot and an empty journal so that what follows is not appended after a partial record
+        if data:
+            logger.info('Replayed %d record(s) from KVDB journal (%s -> %s)', num_records, self.name, self.journal_path)
+            self.save_data()
+
 # ################################################################################################################################
 
     def _dumps(self):
@@ -233,19 +354,48 @@ class BaseRepo(InRAMStore):
 
     def save_data(self) -> 'None':
         with self.update_lock:
-            with open(self.data_path, 'wb') as f:
-                data = self._dumps()
-                f.write(data)
+
+            data = self._dumps()
+
+            # Write to a temporary file first so that the previous snapshot is not lost if we stop while writing ..
+            temp_path = self.data_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                _ = f.write(data)
+
+            # .. and replace the previous snapshot with the new one.
+            os.replace(temp_path, self.data_path)
+            self._snapshot_size = len(data)
+
+            # Everything in the journal is in the snapshot now
+            if self.use_journal:
+                self._close_journal()
+                with open(self.journal_path, 'wb'):
+                    self._journal_size = 0
+
+# ################################################################################################################################
+
+    def compact_journal(self) -> 'None':
+        """ Writes a new snapshot, and empties the journal, if the journal has grown too big. Records are already on disk
+        so there is nothing to do otherwise.
+        """
+        with self.update_lock:
+            if self._journal_size > max(self._snapshot_size, ModuleCtx.Journal_Compact_Min_Size):
+                self.save_data()
 
 # ################################################################################################################################
 
     def set_data_path(self, data_path:'str') -> 'None':
-        self.data_path = data_path
+        with self.update_lock:
+            self._close_journal()
+            self.data_path = data_path
 
 # ################################################################################################################################
 
     def sync_state(self) -> 'None':
-        self.save_data()
+        if self.use_journal:
+            self.compact_journal()
+        else:
+            self.save_data()
 
 # ################################################################################################################################
 
@@ -285,13 +435,14 @@ class KVDB:
         repo_name,     # type: str
         data_path='',  # type: str
         max_size=1000, # type: int
-        page_size=50   # type: int
+        page_size=50,  # type: int
+        use_journal=False # type: bool
     ) -> 'ListRepo':
 
         # Zato
         from zato.server.connection.kvdb.list_ import ListRepo
 
-        repo = ListRepo(repo_name, data_path, max_size, page_size)
+        repo = ListRepo(repo_name, data_path, max_size, page_size, use_journal)
         return self.repo.setdefault(repo_name, repo)
 
 # ################################################################################################################################
@@ -301,13 +452,15 @@ class KVDB:
         repo_name,     # type: str
         data_path='',  # type: str
         max_size=1000, # type: int
-        page_size=50   # type: int
+        page_size=50,  # type: int
+        use_journal=False, # type: bool
+        num_stripes=0      # type: int
     ) -> 'NumberRepo':
 
         # Zato
         from zato.server.connection.kvdb.number import NumberRepo
 
-        repo = NumberRepo(repo_name, data_path, max_size, page_size)
+        repo = NumberRepo(repo_name, data_path, max_size, page_size, use_journal=use_journal, num_stripes=num_stripes)
         return self.repo.setdefault(repo_name, repo)
 
 # ################################################################################################################################
@@ -315,13 +468,14 @@ class KVDB:
     def internal_create_object_repo(
         self,
         repo_name,     # type: str
-        data_path=''   # type: str
+        data_path='',  # type: str
+        use_journal=False # type: bool
     ) -> 'ObjectRepo':
 
         # Zato
         from zato.server.connection.kvdb.object_ import ObjectRepo
 
-        repo = ObjectRepo(repo_name, data_path)
+        repo = ObjectRepo(repo_name, data_path, use_journal)
         return self.repo.setdefault(repo_name, repo)
 
 # ################################################################################################################################
@@ -14,7 +14,8 @@ from gevent.lock import RLock
 
 # Zato
 from zato.common.util.search import SearchResults
-from zato.server.connection.kvdb.core import BaseRepo, ObjectCtx
+from zato.common.util.json_ import json_loads
+from zato.server.connection.kvdb.core import BaseRepo, JournalOp, ObjectCtx
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -38,10 +39,11 @@ class ListRepo(BaseRepo):
         name='<ListRepo-name>',           # type: str
         data_path='<ListRepo-data_path>', # type: str
         max_size=1000, # type: int
-        page_size=50   # type: int
+        page_size=50,  # type: int
+        use_journal=False # type: bool
     ) -> 'None':
 
-        super().__init__(name, data_path)
+        super().__init__(name, data_path, use_journal=use_journal)
 
         # How many objects we will keep at most
         self.max_size = max_size
@@ -55,11 +57,19 @@ class ListRepo(BaseRepo):
         # Used to synchronise updates
         self.lock = RLock()
 
+        # Used when the journal is replayed
+        self.opcode_to_func[JournalOp.Append] = self._replay_append
+        self.opcode_to_func[JournalOp.Delete] = self._delete
+        self.opcode_to_func[JournalOp.Remove_All] = self._replay_remove_all
+
 # ################################################################################################################################
 
     def _append(self, ctx:'ObjectCtx') -> 'ObjectCtx':
 
-        # Push new data ..
+        # Record the change for the journal ..
+        self._record(JournalOp.Append, ctx)
+
+        # .. push new data ..
         self.in_ram_store.append(ctx)
 
         # .. and ensure our max_size is not exceeded ..
@@ -92,14 +102,50 @@ class ListRepo(BaseRepo):
 
         for item in self.in_ram_store: # type: ObjectCtx
             if item.id == object_id:
+                self._record(JournalOp.Delete, object_id)
                 self.in_ram_store.remove(item)
                 return item
 
 # ################################################################################################################################
 
     def _remove_all(self) -> 'None':
+        self._record(JournalOp.Remove_All)
         self.in_ram_store[:] = []
 
+# ################################################################################################################################
+
+    def _replay_append(self, data:'any_') -> 'None':
+
+        # Objects are recorded as dicts ..
+        ctx = ObjectCtx.from_dict(data) if isinstance(data, dict) else data
+
+        # .. and the same one may be already in the snapshot if we stopped before the journal was emptied.
+        if isinstance(ctx, ObjectCtx):
+            for item in self.in_ram_store:
+                if isinstance(item, ObjectCtx) and item.id == ctx.id:
+                    return
+
+        _ = self._append(ctx)
+
+# ################################################################################################################################
+
+    def _replay_remove_all(self, _ignored:'any_') -> 'None':
+        self._remove_all()
+
+# ################################################################################################################################
+
+    def _loads(self, data:'bytes') -> 'None':
+
+        try:
+            data_ = json_loads(data) # type: list
+        except Exception as e:
+            logger.info('KVDB load error (%s -> %s) -> %s', self.name, self.data_path, e)
+        else:
+            if data_:
+                for item in data_:
+                    ctx = ObjectCtx.from_dict(item) if isinstance(item, dict) else item
+                    self.in_ram_store.append(ctx)
+
 # ################################################################################################################################
 
     def _get_size(self) -> 'int':
@@ -9,19 +9,23 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import sys
 from datetime import datetime
+from time import monotonic_ns, time_ns
 from logging import getLogger
 from operator import add as op_add, gt as op_gt, lt as op_lt, sub as op_sub
 
+# gevent
+from gevent import getcurrent
+
 # Zato
 from zato.common.api import StatsKey
 from zato.common.typing_ import dataclass
-from zato.server.connection.kvdb.core import BaseRepo
+from zato.server.connection.kvdb.core import BaseRepo, JournalOp
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, anydict, callable_, callnone
+    from zato.common.typing_ import any_, anydict, anylistnone, callable_, callnone
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -32,6 +36,7 @@ logger = getLogger('zato')
 # ################################################################################################################################
 
 utcnow = datetime.utcnow
+utcfromtimestamp = datetime.utcfromtimestamp
 
 _stats_key_current_value = StatsKey.CurrentValue
 
@@ -59,6 +64,12 @@ class IntData:
 
 class NumberRepo(BaseRepo):
     """ Stores integer counters for string labels.
+
+    If num_stripes is greater than zero, increments and decrements do not go through the repository's locks. Instead,
+    each greenlet adds its changes to one of that many stripes, where only a running total and a monotonic timestamp
+    in nanoseconds are kept. Stripes are aggregated, and timestamps formatted, only when a key is read
+    or when the state is synchronised. In this mode, max_value and allow_negative apply to aggregated values only,
+    and incr and decr return None - the current value needs to be read with get.
     """
     def __init__(
         self,
@@ -67,10 +78,12 @@ class NumberRepo(BaseRepo):
         sync_threshold=120_000, # type: int
         sync_interval=120_000,  # type: int
         max_value=max_value,    # type: int
-        allow_negative=True     # type: bool
+        allow_negative=True,    # type: bool
+        use_journal=False,      # type: bool
+        num_stripes=0           # type: int
     ) -> 'None':
 
-        super().__init__(name, data_path, sync_threshold, sync_interval)
+        super().__init__(name, data_path, sync_threshold, sync_interval, use_journal)
 
         # We will never allow for a value to be greater than that
         self.max_value = max_value
@@ -85,6 +98,24 @@ class NumberRepo(BaseRepo):
 
         self.current_value = self.in_ram_store[_stats_key_current_value] # type: anydict
 
+        # How many stripes to keep changes in before they are added to self.current_value, if any
+        self.num_stripes = num_stripes
+
+        # Each stripe maps keys to a list of [change of value, last update time in monotonic nanoseconds].
+        # Stripes need no locks because nothing that accesses them yields to other greenlets.
+        self._stripes = [{} for _ in range(num_stripes)] # type: list[anydict]
+
+        # Keys changed in any of the stripes since they were last added to self.current_value
+        self._dirty_keys = set() # type: set[str]
+
+        # Turns monotonic timestamps into wall-clock ones when they are formatted
+        self._monotonic_offset_ns = time_ns() - monotonic_ns()
+
+        # Used when the journal is replayed
+        self.opcode_to_func[JournalOp.Set] = self._replay_set
+        self.opcode_to_func[JournalOp.Clear] = self._replay_clear
+        self.opcode_to_func[JournalOp.Remove_All] = self._replay_remove_all
+
 # ################################################################################################################################
 
     def _change_value(
@@ -105,16 +136,7 @@ class NumberRepo(BaseRepo):
         if not current_data:
 
             # .. zero out all the counters ..
-            current_data = {
-
-                _stats_key_per_key_value: default_value,
-                _stats_key_per_key_last_timestamp: utcnow().isoformat(),
-                _stats_key_per_key_last_duration: None,
-
-                _stats_key_per_key_min:  None,
-                _stats_key_per_key_max:  None,
-                _stats_key_per_key_mean: None,
-            }
+            current_data = self._get_default_data(default_value, utcnow().isoformat())
 
             # .. and assign them to our key ..
             self.current_value[key] = current_data
@@ -144,12 +166,29 @@ class NumberRepo(BaseRepo):
         # .. store the new value in RAM ..
         self.current_value[key] = current_data
 
+        # .. record the whole of the key's data for the journal, which means that replaying it is idempotent ..
+        self._record(JournalOp.Set, [key, current_data])
+
         # .. update metadata  ..
         self.post_modify_state()
 
         # .. finally, return the value set.
         return current_data[_stats_key_per_key_value]
 
+# ################################################################################################################################
+
+    def _get_default_data(self, default_value:'int', timestamp:'str') -> 'anydict':
+        return {
+
+            _stats_key_per_key_value: default_value,
+            _stats_key_per_key_last_timestamp: timestamp,
+            _stats_key_per_key_last_duration: None,
+
+            _stats_key_per_key_min:  None,
+            _stats_key_per_key_max:  None,
+            _stats_key_per_key_mean: None,
+        }
+
 # ################################################################################################################################
 
     def _is_negative_allowed(self) -> 'bool':
@@ -175,22 +214,191 @@ class NumberRepo(BaseRepo):
 
         return self._change_value(value_op, cmp_op, value_limit, key, change_by, self._is_negative_allowed)
 
+# ################################################################################################################################
+
+    def incr(self, key:'str', change_by:'int'=1) -> 'int | None':
+        if self.num_stripes:
+            self._change_striped_value(key, change_by)
+        else:
+            return super().incr(key, change_by)
+
+# ################################################################################################################################
+
+    def decr(self, key:'str', change_by:'int'=1) -> 'int | None':
+        if self.num_stripes:
+            self._change_striped_value(key, -change_by)
+        else:
+            return super().decr(key, change_by)
+
+# ################################################################################################################################
+
+    def _change_striped_value(self, key:'str', change_by:'int') -> 'None':
+
+        # Each greenlet keeps using the same stripe ..
+        stripe = self._stripes[hash(getcurrent()) % self.num_stripes]
+
+        # .. add the change to what the stripe already has for this key ..
+        data = stripe.get(key)
+        if data is None:
+            stripe[key] = [change_by, monotonic_ns()]
+        else:
+            data[0] += change_by
+            data[1] = monotonic_ns()
+
+        # .. the key will be added to self.current_value during the next synchronisation ..
+        self._dirty_keys.add(key)
+
+        # .. and, finally, update metadata.
+        self.post_modify_state()
+
+# ################################################################################################################################
+
+    def _apply_limits(self, value:'int') -> 'int':
+
+        if value > self.max_value:
+            value = self.max_value
+
+        if value < 0 and not self.allow_negative:
+            value = 0
+
+        return value
+
+# ################################################################################################################################
+
+    def _format_timestamp(self, monotonic_timestamp_ns:'int') -> 'str':
+        timestamp = (monotonic_timestamp_ns + self._monotonic_offset_ns) / 1_000_000_000
+        return utcfromtimestamp(timestamp).isoformat()
+
+# ################################################################################################################################
+
+    def _get_striped_change(self, key:'str', needs_pop:'bool') -> 'anylistnone':
+        """ Returns the sum of all changes to a key from all the stripes and the latest time any of them was made,
+        or None if there have been no changes. Optionally, removes the changes from the stripes.
+        """
+        has_change = False
+        change = 0
+        last_timestamp_ns = 0
+
+        for stripe in self._stripes:
+
+            if needs_pop:
+                data = stripe.pop(key, None)
+            else:
+                data = stripe.get(key)
+
+            if data:
+                has_change = True
+                change += data[0]
+                last_timestamp_ns = max(last_timestamp_ns, data[1])
+
+        if has_change:
+            return [change, last_timestamp_ns]
+
+# ################################################################################################################################
+
+    def _get_striped(self, key:'str') -> 'anydict':
+
+        current_data = self.current_value.get(key)
+        striped_change = self._get_striped_change(key, False)
+
+        # Nothing has changed so we can return what we already have, possibly None ..
+        if not striped_change:
+            return current_data # type: ignore
+
+        change, last_timestamp_ns = striped_change
+
+        # .. otherwise, we return a copy with all the changes from the stripes added.
+        out = dict(current_data) if current_data else self._get_default_data(0, '')
+        out[_stats_key_per_key_value] = self._apply_limits(out[_stats_key_per_key_value] + change)
+        out[_stats_key_per_key_last_timestamp] = self._format_timestamp(last_timestamp_ns)
+
+        return out
+
+# ################################################################################################################################
+
+    def _merge_stripes(self) -> 'None':
+        """ Adds all the changes from the stripes to self.current_value.
+        """
+        dirty_keys = self._dirty_keys
+        self._dirty_keys = set()
+
+        for key in dirty_keys:
+
+            # This key could have been already merged if it was changed while we were iterating
+            striped_change = self._get_striped_change(key, True)
+            if not striped_change:
+                continue
+
+            change, last_timestamp_ns = striped_change
+
+            current_data = self.current_value.get(key) or self._get_default_data(0, '')
+            current_data[_stats_key_per_key_value] = self._apply_limits(current_data[_stats_key_per_key_value] + change)
+            current_data[_stats_key_per_key_last_timestamp] = self._format_timestamp(last_timestamp_ns)
+
+            self.current_value[key] = current_data
+            self._record(JournalOp.Set, [key, current_data])
+
 # ################################################################################################################################
 
     def _get(self, key:'str') -> 'anydict':
-        return self.current_value.get(key) # type: ignore
+        if self.num_stripes:
+            return self._get_striped(key)
+        else:
+            return self.current_value.get(key) # type: ignore
+
+# ################################################################################################################################
+
+    def _dumps(self) -> 'bytes':
+        if self.num_stripes:
+            self._merge_stripes()
+        return super()._dumps()
+
+# ################################################################################################################################
+
+    def sync_state(self) -> 'None':
+        if self.num_stripes:
+            with self.update_lock:
+                self._merge_stripes()
+        super().sync_state()
 
 # ################################################################################################################################
 
     def _remove_all(self) -> 'None':
+        self._record(JournalOp.Remove_All)
         self.current_value.clear()
+        self._clear_stripes()
 
 # ################################################################################################################################
 
     def _clear(self):
         # type: () -> None
+        self._record(JournalOp.Clear)
         for key in self.in_ram_store: # type: str
             self.in_ram_store[key] = 0
+        self._clear_stripes()
+
+# ################################################################################################################################
+
+    def _clear_stripes(self) -> 'None':
+        for stripe in self._stripes:
+            stripe.clear()
+        self._dirty_keys.clear()
+
+# ################################################################################################################################
+
+    def _replay_set(self, data:'any_') -> 'None':
+        key, value = data
+        self.current_value[key] = value
+
+# ################################################################################################################################
+
+    def _replay_clear(self, _ignored:'any_') -> 'None':
+        self._clear()
+
+# ################################################################################################################################
+
+    def _replay_remove_all(self, _ignored:'any_') -> 'None':
+        self._remove_all()
 
 # ################################################################################################################################
 # ################################################################################################################################
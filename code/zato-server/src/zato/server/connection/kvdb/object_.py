@@ -10,7 +10,7 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 from logging import getLogger
 
 # Zato
-from zato.server.connection.kvdb.core import BaseRepo
+from zato.server.connection.kvdb.core import BaseRepo, JournalOp
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -32,10 +32,16 @@ class ObjectRepo(BaseRepo):
     def __init__(
         self,
         name='<ObjectRepo-name>',          # type: str
-        data_path='<ObjectRepo-data_path>' # type: str
+        data_path='<ObjectRepo-data_path>', # type: str
+        use_journal=False # type: bool
     ) -> 'None':
 
-        super().__init__(name, data_path)
+        super().__init__(name, data_path, use_journal=use_journal)
+
+        # Used when the journal is replayed
+        self.opcode_to_func[JournalOp.Set] = self._replay_set
+        self.opcode_to_func[JournalOp.Delete] = self._delete
+        self.opcode_to_func[JournalOp.Remove_All] = self._replay_remove_all
 
 # ################################################################################################################################
 
@@ -51,6 +57,7 @@ class ObjectRepo(BaseRepo):
 
     def _set(self, object_id:'str', value:'any_') -> 'None':
         # type: (object, object) -> None
+        self._record(JournalOp.Set, [object_id, value])
         self.in_ram_store[object_id] = value
         self.post_modify_state()
 
@@ -58,12 +65,25 @@ class ObjectRepo(BaseRepo):
 
     def _delete(self, object_id:'str') -> 'None':
         # type: (str) -> None
+        self._record(JournalOp.Delete, object_id)
         self.in_ram_store.pop(object_id, None)
 
 # ################################################################################################################################
 
     def _remove_all(self) -> 'None':
-        self.in_ram_store[:] = []
+        self._record(JournalOp.Remove_All)
+        self.in_ram_store.clear()
+
+# ################################################################################################################################
+
+    def _replay_set(self, data:'anylist') -> 'None':
+        object_id, value = data
+        self._set(object_id, value)
+
+# ################################################################################################################################
+
+    def _replay_remove_all(self, _ignored:'any_') -> 'None':
+        self._remove_all()
 
 # ################################################################################################################################
 
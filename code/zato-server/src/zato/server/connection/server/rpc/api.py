@@ -8,17 +8,23 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 from logging import getLogger
+from time import monotonic
+from traceback import format_exc
+
+# gevent
+from gevent import joinall, spawn
+from gevent.lock import RLock
 
 # Zato
 from zato.common.ext.dataclasses import dataclass
-from zato.common.typing_ import cast_, list_field
+from zato.common.typing_ import cast_, dict_field, list_field
 from zato.server.connection.server.rpc.invoker import LocalServerInvoker, RemoteServerInvoker
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, anylist, generator_, stranydict
+    from zato.common.typing_ import any_, anylist, anytuple, generator_, list_, stranydict, strdict
     from zato.server.base.parallel import ParallelServer
     from zato.server.connection.server.rpc.config import ConfigSource, RPCServerInvocationCtx
     from zato.server.connection.server.rpc.invoker import PerPIDResponse, ServerInvoker
@@ -31,6 +37,20 @@ if 0:
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # For how many seconds the list of servers read from ODB can be reused before it is read again
+    Invoker_List_Max_Age = 30
+
+    # How many seconds to wait for each server if no timeout is given on input
+    Default_Timeout = 90
+
+    # Remote servers apply the timeout to each of their PIDs so we wait a little longer for the servers themselves
+    Timeout_Margin = 2
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 @dataclass
 class InvokeAllResult:
 
@@ -41,6 +61,9 @@ class InvokeAllResult:
     # This is a list of responses from each PID of each server
     data: 'anylist' = list_field()
 
+    # Details of why each server that could not be invoked failed, keyed by server name
+    errors: 'strdict' = dict_field()
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -85,6 +108,10 @@ class ServerRPC:
         self._invokers = {} # type: stranydict
         self.logger = getLogger('zato')
 
+        # The list of invokers is reused until this time, as given by time.monotonic, or until it is invalidated
+        self._invokers_expire_at = 0.0
+        self._invokers_lock = RLock()
+
 # ################################################################################################################################
 
     def _get_invoker_by_server_name(self, server_name:'str') -> 'ServerInvoker':
@@ -115,8 +142,57 @@ class ServerRPC:
 # ################################################################################################################################
 
     def populate_invokers(self) -> 'None':
+        """ Reads all the servers from the config source, reusing existing invokers of the ones that did not change.
+        """
+        invokers = {} # type: stranydict
+
         for invoker in self.config_ctx.get_remote_server_invoker_list():
-            self._invokers[invoker.server_name] = invoker
+
+            # Reuse an existing invoker if it is the same kind and points to the same place ..
+            existing = self._invokers.get(invoker.server_name)
+            if existing and type(existing) is type(invoker):
+                if getattr(existing, 'invocation_ctx', None) == getattr(invoker, 'invocation_ctx', None):
+                    invoker = existing
+
+            # .. either way, this is what we will use from now on.
+            invokers[invoker.server_name] = invoker
+
+        # Servers that no longer exist are not carried over
+        self._invokers = invokers
+        self._invokers_expire_at = monotonic() + ModuleCtx.Invoker_List_Max_Age
+
+# ################################################################################################################################
+
+    def invalidate_invokers(self) -> 'None':
+        """ Makes the next server-wide invocation read the list of servers anew, e.g. because one of them changed.
+        """
+        self._invokers_expire_at = 0.0
+
+# ################################################################################################################################
+
+    def get_invoker_list(self) -> 'list_[ServerInvoker]':
+        """ Returns invokers for all the servers, reading them from the config source only if the list is not current.
+        """
+        if monotonic() >= self._invokers_expire_at:
+            with self._invokers_lock:
+
+                # Another greenlet may have populated it while we were waiting for the lock
+                if monotonic() >= self._invokers_expire_at:
+                    self.populate_invokers()
+
+        return list(self._invokers.values())
+
+# ################################################################################################################################
+
+    def _invoke_server(self, invoker:'ServerInvoker', service:'str', request:'any_', *args:'any_', **kwargs:'any_') -> 'anytuple':
+        """ Invokes all the PIDs of a single server, returning a flag indicating if it succeeded and its response or error.
+        """
+        try:
+            response = invoker.invoke_all_pids(service, request, *args, **kwargs)
+        except Exception:
+            return False, format_exc()
+        else:
+            return True, response
 
 # ################################################################################################################################
 
@@ -129,19 +205,46 @@ class ServerRPC:
     ) -> 'InvokeAllResult':
 
         # First, make sure that we are aware of all the servers currently available
-        self.populate_invokers()
+        invokers = self.get_invoker_list()
 
         # Response to produce
         out = InvokeAllResult()
 
-        # Now, invoke all the servers ..
-        for invoker in self._invokers.values():
-            invoker = cast_('ServerInvoker', invoker)
+        # How long to wait for each server, all of them are invoked at the same time so this is also the overall limit
+        if timeout := kwargs.get('timeout'):
+            timeout = timeout + ModuleCtx.Timeout_Margin
+        else:
+            timeout = ModuleCtx.Default_Timeout
+
+        # Now, invoke all the servers concurrently ..
+        greenlets = [spawn(self._invoke_server, invoker, service, request, *args, **kwargs) for invoker in invokers]
+        _ = joinall(greenlets, timeout=timeout)
+
+        for invoker, greenlet in zip(invokers, greenlets):
 
             # .. each response object received is a list of sub-responses,
             # .. with each sub-response representing a specific PID ..
-            response = invoker.invoke_all_pids(service, request, *args, **kwargs)
-            out.data.extend(response)
+            if greenlet.ready():
+                is_ok, response = greenlet.value
+                if is_ok:
+                    out.data.extend(response or [])
+                    continue
+                else:
+                    error = response
+
+            # .. if we are here, the server either raised an exception or it did not reply in time ..
+            else:
+                greenlet.kill(block=False)
+                error = 'No response from server within {}s'.format(timeout)
+
+            # .. which means that the whole invocation did not succeed ..
+            out.is_ok = False
+            out.errors[invoker.server_name] = error
+
+            self.logger.warning('Could not invoke `%s` in server `%s`; e:`%s`', service, invoker.server_name, error)
+
+            # .. and that the server may no longer exist, so we will read them all again next time.
+            self.invalidate_invokers()
 
         # .. now we can return the result.
         return out
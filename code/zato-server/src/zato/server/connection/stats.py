@@ -10,11 +10,12 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 from logging import getLogger
 
 # gevent
+from gevent import sleep, spawn
 from gevent.lock import RLock
 
 # Zato
 from zato.common.events.client import Client as EventsClient
-from zato.common.events.common import EventInfo, PushCtx
+from zato.common.events.common import Default as EventsDefault, EventInfo, PushCtx
 from zato.common.util.api import new_cid
 
 # ################################################################################################################################
@@ -33,8 +34,14 @@ object_type_service = EventInfo.CommonObject.service
 # ################################################################################################################################
 
 class ServiceStatsClient:
-    def __init__(self, impl_class=None):
-        # type: (object) -> None
+    def __init__(
+        self,
+        impl_class=None,
+        is_buffered=False,
+        push_batch_size=EventsDefault.push_batch_size,
+        push_batch_interval=EventsDefault.push_batch_interval,
+    ):
+        # type: (object, bool, int, float) -> None
         self.host = '<ServiceStatsClient-host>'
         self.port = -1
         self.impl = None # type: EventsClient
@@ -42,6 +49,11 @@ class ServiceStatsClient:
         self.backlog = []
         self.lock = RLock()
 
+        # In the buffered mode, events are pushed in batches, once there are enough of them or periodically
+        self.is_buffered = is_buffered
+        self.push_batch_size = push_batch_size
+        self.push_batch_interval = push_batch_interval
+
 # ################################################################################################################################
 
     def init(self, host, port):
@@ -58,6 +70,41 @@ class ServiceStatsClient:
     def run(self):
         self.impl.run()
 
+        if self.is_buffered:
+            _ = spawn(self._push_backlog_periodically)
+
+# ################################################################################################################################
+
+    def _push_backlog_periodically(self):
+        """ Pushes all the buffered events, if there are any, once in push_batch_interval seconds.
+        """
+        while True:
+            sleep(self.push_batch_interval)
+            try:
+                self._push_backlog_batch()
+            except Exception as e:
+                logger.info('Events batch push error `%s` -> %s:%s', e.args, self.host, self.port)
+
+# ################################################################################################################################
+
+    def _push_backlog_batch(self):
+        """ Pushes all the events from the backlog to the backend as a single batch.
+        """
+        if self.impl:
+
+            with self.lock:
+
+                # .. there may be nothing to push ..
+                if not self.backlog:
+                    return
+
+                # .. the backlog can be replaced because the lock is held ..
+                batch = self.backlog
+                self.backlog = []
+
+                # .. and this sends all the events at once.
+                self.impl.push_many(batch)
+
 # ################################################################################################################################
 
     def _push_backlog(self):
@@ -103,8 +150,14 @@ class ServiceStatsClient:
         with self.lock:
             self.backlog.append(ctx)
 
-        # .. and try to send it to the backend now.
-        self._push_backlog()
+        # .. in the buffered mode, the backlog is sent only if it is big enough, otherwise it will be sent periodically ..
+        if self.is_buffered:
+            if len(self.backlog) >= self.push_batch_size:
+                self._push_backlog_batch()
+
+        # .. and without buffering, try to send it to the backend now.
+        else:
+            self._push_backlog()
 
 # ################################################################################################################################
 
@@ -157,6 +157,7 @@ class ZatoGunicornApplication(Application):
         self.cfg.set('on_starting', self.zato_wsgi_app.on_starting) # Generates the deployment key
         self.cfg.set('before_pid_kill', self.zato_wsgi_app.before_pid_kill) # Cleans up before the worker exits
         self.cfg.set('worker_exit', self.zato_wsgi_app.worker_exit) # Cleans up after the worker exits
+        self.cfg.set('on_exit', self.zato_wsgi_app.on_exit) # Cleans up after all the workers exit
 
         for k, v in self.config_main.items():
             if k.startswith('gunicorn') and v:
@@ -31,6 +31,7 @@ from zato.common.typing_ import cast_, dict_, optional
 from zato.common.util.api import as_bool, spawn_greenlet, wait_for_dict_key, wait_for_dict_key_by_get_func
 from zato.common.util.time_ import datetime_from_ms, utcnow_as_ms
 from zato.server.pubsub.core.endpoint import EndpointAPI
+from zato.server.pubsub.core.group_commit import GDGroupCommitter
 from zato.server.pubsub.core.trigger import NotifyPubSubTasksTrigger
 from zato.server.pubsub.core.hook import HookAPI
 from zato.server.pubsub.core.pubapi import PubAPI
@@ -79,6 +80,7 @@ default_sub_pattern_matched = '(No sub pattern)'
 class PubSub:
 
     endpoint_api: 'EndpointAPI'
+    gd_group_committer: 'GDGroupCommitter | None'
     notify_pub_sub_tasks_trigger: 'NotifyPubSubTasksTrigger'
 
     def __init__(
@@ -150,13 +152,30 @@ class PubSub:
         # Creates SQL sessions
         self.new_session_func = self.server.odb.session
 
+        # Optionally, GD messages from concurrent publications may be committed to SQL in shared transactions
+        if as_bool(self.server.fs_server_config.pubsub.get('gd_group_commit', False)):
+            self.gd_group_committer = GDGroupCommitter(
+                cluster_id = self.cluster_id,
+                new_session_func = self.new_session_func,
+                get_pub_counter_func = self.server.get_pub_counter,
+                incr_pub_counter_func = self.server.incr_pub_counter,
+                batch_window = float(self.server.fs_server_config.pubsub.get('gd_group_commit_window') or \
+                    _ps_default.GD_Group_Commit_Window) / 1000.0,
+                max_batch_size = int(self.server.fs_server_config.pubsub.get('gd_group_commit_max_size') or \
+                    _ps_default.GD_Group_Commit_Max_Size),
+            )
+            _ = spawn_greenlet(self.gd_group_committer.run)
+        else:
+            self.gd_group_committer = None
+
         # A low level implementation that publishes messages to SQL
         self.impl_publisher = Publisher(
             pubsub = self,
             server = self.server,
             marshal_api = self.server.marshal_api,
             service_invoke_func = self.invoke_service,
-            new_session_func = self.new_session_func
+            new_session_func = self.new_session_func,
+            gd_group_committer = self.gd_group_committer
         )
 
         # Manages hooks
@@ -208,6 +227,11 @@ class PubSub:
     def stop(self) -> 'None':
         """ Stops all pub/sub tools, which in turn stops all the delivery tasks.
         """
+        self.notify_pub_sub_tasks_trigger.stop()
+
+        if self.gd_group_committer:
+            self.gd_group_committer.stop()
+
         for item in self.pubsub_tools:
             try:
                 item.stop()
@@ -1297,10 +1321,13 @@ class PubSub:
             cid, topic_id, topic_name, sub_keys, [elem['pub_msg_id'] for elem in non_gd_msg_list], error_source)
 
         with self.lock:
-
-            # Store the non-GD messages in backlog ..
             topic = self.topic_api.get_topic_by_id(topic_id)
-            self.sync_backlog.add_messages(cid, topic_id, topic_name, topic.max_depth_non_gd, sub_keys, non_gd_msg_list)
+
+        # Store the non-GD messages in backlog - this is done without self.lock held because the backlog
+        # has its own, per-shard, locks and publications to unrelated topics should not have to wait for each other ..
+        self.sync_backlog.add_messages(cid, topic_id, topic_name, topic.max_depth_non_gd, sub_keys, non_gd_msg_list)
+
+        with self.lock:
 
             # .. and set a flag to signal that there are some available.
             self._set_sync_has_msg(topic_id, False, True, 'PubSub.store_in_ram ({})'.format(error_source))
@@ -1604,6 +1631,10 @@ class PubSub:
         else:
             topic.sync_has_non_gd_msg = value
 
+        # If there are new messages, wake up the trigger so that it notifies the delivery tasks
+        if value:
+            self.notify_pub_sub_tasks_trigger.mark_topic_dirty(topic_id)
+
 # ################################################################################################################################
 
     def set_sync_has_msg(
@@ -17,6 +17,8 @@ from zato.server.pubsub.model import Endpoint
 
 if 0:
     from zato.common.typing_ import anydict, anytuple, callable_, dict_, intdict, intnone, strcalldict
+    from zato.common.match import FirstMatch
+    FirstMatch = FirstMatch
     strcalldict = strcalldict
 
 # ################################################################################################################################
@@ -190,17 +192,14 @@ class EndpointAPI:
                 return False
 
         # Alright, this endpoint has the correct role, but are there are any matching patterns for this topic?
-        for orig, matcher in getattr(endpoint, target):
-            if matcher.match(name):
-                return orig
-        else:
-            return False
+        matcher = getattr(endpoint, target) # type: FirstMatch
+        return matcher.match(name)
 
 # ################################################################################################################################
 
     def is_allowed_pub_topic(self, *, name:'str', security_id:'int'=0, ws_channel_id:'int'=0) -> 'str | bool':
         return self._is_allowed(
-            target='pub_topic_patterns',
+            target='pub_topic_matcher',
             name=name,
             is_pub=True,
             security_id=security_id,
@@ -211,7 +210,7 @@ class EndpointAPI:
 
     def is_allowed_pub_topic_by_endpoint_id(self, *, name:'str', endpoint_id:'int') -> 'str | bool':
         return self._is_allowed(
-            target='pub_topic_patterns',
+            target='pub_topic_matcher',
             name=name,
             is_pub=True,
             security_id=0,
@@ -223,7 +222,7 @@ class EndpointAPI:
 
     def is_allowed_sub_topic(self, *, name:'str', security_id:'int'=0, ws_channel_id:'int'=0) -> 'str | bool':
         return self._is_allowed(
-            target='sub_topic_patterns',
+            target='sub_topic_matcher',
             name=name,
             is_pub=False,
             security_id=security_id,
@@ -234,7 +233,7 @@ class EndpointAPI:
 
     def is_allowed_sub_topic_by_endpoint_id(self, name:'str', endpoint_id:'int') -> 'str | bool':
         return self._is_allowed(
-            target='sub_topic_patterns',
+            target='sub_topic_matcher',
             name=name,
             is_pub=False,
             security_id=0,
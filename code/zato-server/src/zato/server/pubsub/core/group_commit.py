@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from logging import getLogger
+from traceback import format_exc
+
+# gevent
+from gevent import Timeout
+from gevent.event import AsyncResult
+from gevent.queue import Empty, Queue
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.common.odb.query.pubsub.publish import sql_publish_with_retry
+from zato.common.util.time_ import utcnow_as_ms
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, callable_, dict_, list_, tuple_
+    from zato.server.pubsub.publisher import PubCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato')
+logger_pubsub = getLogger('zato_pubsub.srv')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class GroupCommitError(Exception):
+    """ Raised when GD messages could not be committed as part of a group commit.
+    """
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PendingGDPublication:
+    """ A publication of GD messages waiting in the queue for its group commit.
+    """
+    __slots__ = ('ctx', 'result')
+
+    def __init__(self, ctx:'PubCtx') -> 'None':
+        self.ctx = ctx
+        self.result = AsyncResult()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class GDGroupCommitter:
+    """ Collects GD publications arriving concurrently from many greenlets and writes them to SQL in a single transaction.
+
+    A batch is closed when either max_batch_size publications have been collected or when batch_window seconds
+    have elapsed since the first publication in the batch arrived. Publications for the same topic and the same
+    subscribers are merged so that their messages are inserted with one multi-row INSERT. Each publisher is released
+    only after the shared commit succeeded, which means that the durability guarantees are the same as if each message
+    were committed on its own.
+    """
+    def __init__(
+        self,
+        *,
+        cluster_id,       # type: int
+        new_session_func, # type: callable_
+        get_pub_counter_func,  # type: callable_
+        incr_pub_counter_func, # type: callable_
+        batch_window,   # type: float
+        max_batch_size, # type: int
+        publish_timeout=PUBSUB.DEFAULT.GD_Group_Commit_Timeout, # type: float
+    ) -> 'None':
+
+        self.cluster_id = cluster_id
+        self.new_session_func = new_session_func
+        self.get_pub_counter_func = get_pub_counter_func
+        self.incr_pub_counter_func = incr_pub_counter_func
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.publish_timeout = publish_timeout
+
+        self.queue = Queue()
+        self.keep_running = True
+
+# ################################################################################################################################
+
+    def publish(self, ctx:'PubCtx') -> 'None':
+        """ Enqueues GD messages from ctx for the next group commit and blocks until they are committed.
+        Raises the same exception that a standalone publication would have raised if the commit failed.
+        """
+        if not self.keep_running:
+            raise GroupCommitError('GD group committer already stopped, cid:`{}`'.format(ctx.cid))
+
+        pending = PendingGDPublication(ctx)
+        self.queue.put(pending)
+
+        # This will either return or re-raise an exception from the committing greenlet ..
+        try:
+            _ = pending.result.get(timeout=self.publish_timeout)
+
+        # .. unless the committing greenlet is stuck, in which case we cannot tell whether the messages will be committed or not.
+        except Timeout:
+            raise GroupCommitError('GD messages not committed within {}s, cid:`{}`'.format(self.publish_timeout, ctx.cid))
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+
+        # Reject all the publications that have not been committed yet ..
+        while True:
+            try:
+                pending = self.queue.get_nowait()
+            except Empty:
+                break
+            else:
+                if pending and not pending.result.ready():
+                    pending.result.set_exception(GroupCommitError('GD group committer stopped, cid:`{}`'.format(
+                        pending.ctx.cid)))
+
+        # .. and wake up the main loop in case it is waiting for new publications.
+        self.queue.put(None)
+
+# ################################################################################################################################
+
+    def _collect_batch(self, first:'PendingGDPublication') -> 'list_[PendingGDPublication]':
+        """ Returns a batch of publications, beginning with the first one, waiting at most self.batch_window seconds.
+        """
+        batch = [first]
+        deadline = utcnow_as_ms() + self.batch_window
+
+        while len(batch) < self.max_batch_size:
+
+            # Take everything that is already waiting without blocking ..
+            try:
+                pending = self.queue.get_nowait()
+            except Empty:
+
+                # .. and then wait for more but only until the window closes.
+                remaining = deadline - utcnow_as_ms()
+                if remaining <= 0:
+                    break
+
+                try:
+                    pending = self.queue.get(timeout=remaining)
+                except Empty:
+                    break
+
+            # We have been stopped
+            if pending is None:
+                self.keep_running = False
+                break
+
+            batch.append(pending)
+
+        return batch
+
+# ################################################################################################################################
+
+    def _group_batch(
+        self,
+        batch, # type: list_[PendingGDPublication]
+    ) -> 'dict_[tuple_[int, tuple_], list_[PendingGDPublication]]':
+        """ Groups publications by their topic and subscribers - all publications in a group can be inserted together.
+        """
+        out = {} # type: dict_[tuple_[int, tuple_], list_[PendingGDPublication]]
+
+        for pending in batch:
+            ctx = pending.ctx
+            sub_keys = tuple(sorted(sub.sub_key for sub in ctx.subscriptions_by_topic))
+            _ = out.setdefault((ctx.topic.id, sub_keys), []).append(pending)
+
+        return out
+
+# ################################################################################################################################
+
+    def _insert_group(self, session:'any_', group:'list_[PendingGDPublication]', is_shared:'bool') -> 'None':
+        """ Inserts GD messages of all the publications from the group using an already existing session.
+        """
+        first_ctx = group[0].ctx
+        gd_msg_list = []
+        queue_insert_attempts = []
+
+        def before_queue_insert(*ignored:'any_') -> 'None':
+
+            # A queue insert is retried only if the previous attempt rolled back the whole transaction,
+            # which, if the session is shared, includes rows inserted for other publications too. This is why,
+            # instead of retrying, we reject the whole batch and let the caller commit each publication on its own.
+            if queue_insert_attempts and is_shared:
+                raise GroupCommitError('Queue insert retried in a shared GD transaction, cid:`{}`'.format(first_ctx.cid))
+
+            queue_insert_attempts.append(True)
+
+        # The SQL layer modifies the messages in place so we give it shallow copies
+        # in case the group needs to be inserted again, e.g. after a failed group commit.
+        for pending in group:
+            gd_msg_list.extend(dict(msg) for msg in pending.ctx.gd_msg_list)
+
+        _ = sql_publish_with_retry(
+
+            now = max(pending.ctx.now for pending in group),
+            cid = first_ctx.cid,
+            topic_id = first_ctx.topic.id,
+            topic_name = first_ctx.topic.name,
+            cluster_id = self.cluster_id,
+            pub_counter = self.get_pub_counter_func(),
+
+            session = session,
+            new_session_func = self.new_session_func,
+            before_queue_insert_func = before_queue_insert,
+
+            gd_msg_list = gd_msg_list,
+            subscriptions_by_topic = first_ctx.subscriptions_by_topic,
+            should_collect_ctx = False
+        )
+
+# ################################################################################################################################
+
+    def _commit(self, groups:'list_[list_[PendingGDPublication]]') -> 'None':
+        """ Inserts all the groups and commits them in one transaction.
+        """
+        is_shared = sum(len(group) for group in groups) > 1
+
+        with closing(self.new_session_func()) as session:
+            for group in groups:
+                self._insert_group(session, group, is_shared)
+            session.commit()
+
+# ################################################################################################################################
+
+    def _on_committed(self, group:'list_[PendingGDPublication]') -> 'None':
+        for pending in group:
+            self.incr_pub_counter_func()
+            pending.result.set(None)
+
+# ################################################################################################################################
+
+    def commit_batch(self, batch:'list_[PendingGDPublication]') -> 'None':
+        """ Commits all the publications from the batch, releasing each publisher once its messages are committed.
+        """
+        groups = list(self._group_batch(batch).values())
+
+        try:
+            self._commit(groups)
+        except Exception as e:
+
+            # There is nothing else to try if the batch consisted of a single publication ..
+            if len(batch) == 1:
+                batch[0].result.set_exception(e)
+                return
+
+            # .. otherwise, one of the publications may have been the sole culprit, e.g. because it had a duplicate
+            # message ID, so we commit each one separately to make sure that only the offending one is rejected.
+            logger_pubsub.info('GD group commit failed, committing %d publications one by one; e:`%s`',
+                len(batch), format_exc())
+
+            for pending in batch:
+                try:
+                    self._commit([[pending]])
+                except Exception as e:
+                    pending.result.set_exception(e)
+                else:
+                    self._on_committed([pending])
+        else:
+            for group in groups:
+                self._on_committed(group)
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+        """ A background greenlet that keeps committing batches of GD publications until stopped.
+        """
+        while self.keep_running:
+
+            # Block until the first publication of a new batch arrives ..
+            first = self.queue.get()
+
+            # .. we may have been stopped in the meantime ..
+            if first is None:
+                break
+
+            # .. collect everything else that arrives within the batch window ..
+            batch = self._collect_batch(first)
+
+            # .. and commit it all in one go.
+            try:
+                self.commit_batch(batch)
+            except Exception as e:
+                logger.warning('Unexpected exception in GD group commit, e:`%s`', format_exc())
+                for pending in batch:
+                    if not pending.result.ready():
+                        pending.result.set_exception(e)
+
+# ################################################################################################################################
+# ################################################################################################################################
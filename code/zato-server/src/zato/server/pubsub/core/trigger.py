@@ -13,7 +13,8 @@ import logging
 from traceback import format_exc
 
 # gevent
-from gevent import sleep, spawn
+from gevent import spawn
+from gevent.event import Event
 from zato.common.typing_ import cast_
 from zato.common.util.api import new_cid
 
@@ -22,7 +23,7 @@ from zato.common.util.api import new_cid
 
 if 0:
     from gevent.lock import RLock
-    from zato.common.typing_ import anydict, callable_, intanydict, intnone
+    from zato.common.typing_ import anydict, callable_, floatnone, intanydict, intnone, intset
     from zato.server.pubsub.model import inttopicdict, sublist
 
 # ################################################################################################################################
@@ -35,7 +36,10 @@ logger_zato = logging.getLogger('zato')
 # ################################################################################################################################
 
 class NotifyPubSubTasksTrigger:
-
+    """ Lets delivery tasks know that there are new messages for their topics. Publishers mark topics as dirty
+    through self.mark_topic_dirty, which wakes up the trigger, and only topics that have been marked this way
+    are ever looked at, which means that idle topics cost nothing.
+    """
     def __init__(
         self,
         *,
@@ -58,13 +62,33 @@ class NotifyPubSubTasksTrigger:
         self.get_delivery_server_by_sub_key_func = get_delivery_server_by_sub_key_func
         self.sync_backlog_get_delete_messages_by_sub_keys_func = sync_backlog_get_delete_messages_by_sub_keys_func
 
+        # IDs of topics that have had messages published to them since they were last synced
+        self.dirty_topic_ids = set() # type: intset
+
+        # Set each time a topic is marked as dirty to wake up the main loop
+        self.wakeup_event = Event()
+
         self.keep_running = True
 
+# ################################################################################################################################
+
+    def mark_topic_dirty(self, topic_id:'int') -> 'None':
+        """ Signals that there are new messages for a given topic.
+        """
+        self.dirty_topic_ids.add(topic_id)
+        self.wakeup_event.set()
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+        self.wakeup_event.set()
+
 # ################################################################################################################################
 
     def run(self) -> 'None':
-        """ A background greenlet which periodically lets delivery tasks know that there are perhaps
-        new GD messages for the topic that this class represents.
+        """ A background greenlet which lets delivery tasks know that there are perhaps new messages
+        for the topics that have been marked as dirty.
         """
 
         # Local aliases
@@ -72,9 +96,9 @@ class NotifyPubSubTasksTrigger:
         _current_iter = 0
         _new_cid      = new_cid
         _spawn        = cast_('callable_', spawn)
-        _sleep        = cast_('callable_', sleep)
         _self_lock    = self.lock
         _self_topics  = self.topics
+        _self_wakeup_event = self.wakeup_event
 
         _logger_info      = logger.info
         _logger_warn      = logger.warning
@@ -91,6 +115,10 @@ class NotifyPubSubTasksTrigger:
         def _cmp_non_gd_msg(elem:'anydict') -> 'float':
             return elem['pub_time']
 
+        # How long to wait for a wakeup signal - None means that we wait until a topic is marked as dirty
+        # and a number means that at least one topic is dirty but it cannot be synced just yet.
+        wait_time = None # type: floatnone
+
         # Loop forever or until stopped
         while self.keep_running:
 
@@ -103,9 +131,11 @@ class NotifyPubSubTasksTrigger:
             # This may be handy for logging purposes, even if there is no max. for the loop iters
             _current_iter += 1
 
-            # Sleep for a while before continuing - the call to sleep is here because this while loop is quite long
-            # so it would be inconvenient to have it down below.
-            _sleep(0.01)
+            # Wait until there are new messages or until the nearest dirty topic is due for a sync,
+            # unless this is the last iteration of a limited run in which case we wait only for the latter.
+            if self.keep_running or wait_time is not None:
+                _ = _self_wakeup_event.wait(wait_time)
+            _self_wakeup_event.clear()
 
             # Blocks other pub/sub processes for a moment
             with _self_lock:
@@ -113,20 +143,35 @@ class NotifyPubSubTasksTrigger:
                 # Will map a few temporary objects down below
                 topic_id_dict = {} # type: intanydict
 
-                # Get all topics ..
-                for _topic in _self_topics.values():
+                # Topics that will have to be looked at again in a later iteration
+                still_dirty = set() # type: intset
 
-                    # Does the topic require task synchronization now?
-                    if not _topic.needs_task_sync():
+                # Topics whose tasks have been already notified in this iteration
+                synced = set() # type: intset
+
+                # Take over all the topics marked as dirty so far ..
+                dirty_topic_ids = self.dirty_topic_ids
+                self.dirty_topic_ids = set()
+
+                # .. and go through each of them.
+                for topic_id in dirty_topic_ids:
+
+                    # The topic may have been deleted in the meantime
+                    _topic = _self_topics.get(topic_id)
+                    if not _topic:
                         continue
-                    else:
-                        _topic.update_task_sync_time()
 
-                    # OK, the time has come for this topic to sync its state with subscribers
-                    # but still skip it if we know that there have been no messages published to it since the last time.
+                    # Skip it if the messages have been already synced in the meantime.
                     if not (_topic.sync_has_gd_msg or _topic.sync_has_non_gd_msg):
                         continue
 
+                    # Does the topic require task synchronization now? If not, we will get back to it later.
+                    if not _topic.needs_task_sync():
+                        still_dirty.add(topic_id)
+                        continue
+                    else:
+                        _topic.update_task_sync_time()
+
                     # There are some messages, let's see if there are subscribers ..
                     subs = [] # type: sublist
                     _subs = _self_get_subscriptions_by_topic(_topic.name)
@@ -136,9 +181,12 @@ class NotifyPubSubTasksTrigger:
                         if _self_get_delivery_server_by_sub_key(_sub.sub_key):
                             subs.append(_sub)
 
-                    # .. if there are any subscriptions at all, we store that information for later use.
+                    # .. if there are any subscriptions at all, we store that information for later use,
+                    # otherwise, the messages are kept until someone subscribes so we will need to check it again.
                     if subs:
                         topic_id_dict[_topic.id] = (_topic.name, subs)
+                    else:
+                        still_dirty.add(topic_id)
 
                 # OK, if we had any subscriptions for at least one topic and there are any messages waiting,
                 # we can continue.
@@ -203,11 +251,27 @@ class NotifyPubSubTasksTrigger:
                         # OK, we can now reset message flags for the topic
                         _self_set_sync_has_msg(topic_id, True, False, 'PubSub.loop')
                         _self_set_sync_has_msg(topic_id, False, False, 'PubSub.loop')
+                        synced.add(topic_id)
 
                 except Exception:
                     e_formatted = format_exc()
                     _logger_zato_warn(e_formatted)
                     _logger_warn(e_formatted)
 
+                    # Topics that we did not get to, or the one that failed, will be tried again unless they have been deleted
+                    for topic_id in topic_id_dict:
+                        if topic_id not in synced and topic_id in _self_topics:
+                            still_dirty.add(topic_id)
+
+                # Topics that could not be synced yet are put back ..
+                self.dirty_topic_ids.update(still_dirty)
+
+                # .. and we will wake up again when the first of them is due for a sync,
+                # or we will wait until any topic is marked as dirty if there are none.
+                if still_dirty:
+                    wait_time = min(_self_topics[topic_id].get_task_sync_wait_time() for topic_id in still_dirty)
+                else:
+                    wait_time = None
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -22,6 +22,7 @@ from zato.common.ext.future.utils import iteritems
 # Zato
 from zato.common.api import PUBSUB
 from zato.common.exception import BadRequest
+from zato.common.match import FirstMatch
 from zato.common.pubsub import dict_keys
 from zato.common.typing_ import cast_, dict_, list_, optional
 from zato.common.util.api import make_repr
@@ -165,6 +166,9 @@ class Endpoint(ToDictBase):
     pub_topic_patterns: 'strlist'
     sub_topic_patterns: 'strlist'
 
+    pub_topic_matcher: 'FirstMatch'
+    sub_topic_matcher: 'FirstMatch'
+
     pub_topics: 'anydict'
     sub_topics: 'anydict'
 
@@ -240,6 +244,10 @@ class Endpoint(ToDictBase):
                     msg = 'Ignoring invalid %s pattern `%s` for `%s` (role:%s) (reason: no pub=/sub= prefix found)'
                     logger.warning(msg, key, line, self.name, self.role)
 
+        # Permission checks use all the patterns of each kind at once
+        self.pub_topic_matcher = FirstMatch(self.pub_topic_patterns)
+        self.sub_topic_matcher = FirstMatch(self.sub_topic_patterns)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -368,6 +376,16 @@ class Topic(ToDictBase):
 
         return needs_sync
 
+# ################################################################################################################################
+
+    def get_task_sync_wait_time(self, _utcnow_as_ms:'callable_'=utcnow_as_ms) -> 'float':
+        """ Returns how many seconds are left until this topic will need a task sync, or 0.0 if it needs it already.
+        """
+        now = _utcnow_as_ms()
+        wait_time = self.task_sync_interval - (now - self.last_synced)
+
+        return max(wait_time, 0.0)
+
 # ################################################################################################################################
 
     def needs_depth_check(self) -> 'bool':
@@ -47,9 +47,11 @@ if 0:
     from zato.common.typing_ import anylist, callable_, dictlist, strlist, tuple_
     from zato.server.base.parallel import ParallelServer
     from zato.server.pubsub import PubSub, Topic
+    from zato.server.pubsub.core.group_commit import GDGroupCommitter
     from zato.server.pubsub.model import sublist
     from zato.server.service import Service
     dictlist = dictlist
+    GDGroupCommitter = GDGroupCommitter
     strlist = strlist
     sublist = sublist
     Service = Service
@@ -199,6 +201,7 @@ class Publisher:
     marshal_api: 'MarshalAPI'
     service_invoke_func: 'callable_'
     new_session_func: 'callable_'
+    gd_group_committer: 'GDGroupCommitter | None'
 
     def __init__(
         self,
@@ -207,7 +210,8 @@ class Publisher:
         server: 'ParallelServer',
         marshal_api: 'MarshalAPI',
         service_invoke_func: 'callable_',
-        new_session_func: 'callable_'
+        new_session_func: 'callable_',
+        gd_group_committer: 'GDGroupCommitter | None' = None
     ) -> 'None':
         self.pubsub = pubsub
         self.server = server
@@ -215,6 +219,9 @@ class Publisher:
         self.service_invoke_func = service_invoke_func
         self.new_session_func = new_session_func
 
+        # If given, GD messages are committed in batches shared with other concurrent publications
+        self.gd_group_committer = gd_group_committer
+
 # ################################################################################################################################
 
     def get_data_prefixes(self, data:'str') -> 'tuple_[str, str]':
@@ -605,6 +612,67 @@ class Publisher:
 
         return out
 
+# ################################################################################################################################
+
+    def _check_gd_depth(self, session:'any_', ctx:'PubCtx', len_gd_msg_list:'int') -> 'None':
+        """ Rejects the publication if it would exceed the topic's max. GD depth.
+        """
+        # Get current depth of this topic ..
+        ctx.current_depth = get_gd_depth_topic(session, ctx.cluster_id, ctx.topic.id)
+
+        # .. and abort if max depth is already reached ..
+        if ctx.current_depth + len_gd_msg_list > ctx.topic.max_depth_gd:
+
+            # .. note thath is call raises an exception.
+            self.reject_publication(ctx.cid, ctx.topic.name, True)
+
+        else:
+
+            # This only updates the local ctx variable
+            ctx.current_depth = ctx.current_depth + len_gd_msg_list
+
+# ################################################################################################################################
+
+    def _publish_gd_msg_list(self, ctx:'PubCtx', len_gd_msg_list:'int') -> 'None':
+        """ Inserts GD messages and commits them in a transaction of their own.
+        """
+        with closing(ctx.new_session_func()) as session:
+
+            # Test first if we should check the depth in this iteration.
+            if ctx.topic.needs_depth_check():
+                self._check_gd_depth(session, ctx, len_gd_msg_list)
+
+            pub_msg_list = [elem['pub_msg_id'] for elem in ctx.gd_msg_list]
+
+            if has_logger_pubsub_debug:
+                logger_pubsub.debug(_inserting_gd_msg, ctx.topic.name, pub_msg_list, ctx.endpoint_name,
+                    ctx.ext_client_id, ctx.cid)
+
+            # This is the call that runs SQL INSERT statements with messages for topics and subscriber queues
+            _ = sql_publish_with_retry(
+
+                now = ctx.now,
+                cid = ctx.cid,
+                topic_id = ctx.topic.id,
+                topic_name = ctx.topic.name,
+                cluster_id = ctx.cluster_id,
+                pub_counter = self.server.get_pub_counter(),
+
+                session = session,
+                new_session_func = ctx.new_session_func,
+                before_queue_insert_func = None,
+
+                gd_msg_list = ctx.gd_msg_list,
+                subscriptions_by_topic = ctx.subscriptions_by_topic,
+                should_collect_ctx = False
+            )
+
+            # Run an SQL commit for all queries above ..
+            session.commit()
+
+            # .. and increase the publication counter now that we have committed the messages.
+            self.server.incr_pub_counter()
+
 # ################################################################################################################################
 
     def _publish(self, ctx:'PubCtx') -> 'PublicationResult':
@@ -640,55 +708,25 @@ class Publisher:
         # We don't always have GD messages on request so there is no point in running an SQL transaction otherwise.
         if has_gd_msg_list:
 
-            with closing(ctx.new_session_func()) as session:
+            # In the group commit mode, our messages are committed along with other publications
+            # and we are blocked until the shared commit succeeds ..
+            if self.gd_group_committer:
 
-                # Test first if we should check the depth in this iteration.
+                # .. the depth is not checked in each iteration so we do not always need a session ..
                 if ctx.topic.needs_depth_check():
-
-                    # Get current depth of this topic ..
-                    ctx.current_depth = get_gd_depth_topic(session, ctx.cluster_id, ctx.topic.id)
-
-                    # .. and abort if max depth is already reached ..
-                    if ctx.current_depth + len_gd_msg_list > ctx.topic.max_depth_gd:
-
-                        # .. note thath is call raises an exception.
-                        self.reject_publication(ctx.cid, ctx.topic.name, True)
-
-                    else:
-
-                        # This only updates the local ctx variable
-                        ctx.current_depth = ctx.current_depth + len_gd_msg_list
-
-                pub_msg_list = [elem['pub_msg_id'] for elem in ctx.gd_msg_list]
+                    with closing(ctx.new_session_func()) as session:
+                        self._check_gd_depth(session, ctx, len_gd_msg_list)
 
                 if has_logger_pubsub_debug:
-                    logger_pubsub.debug(_inserting_gd_msg, ctx.topic.name, pub_msg_list, ctx.endpoint_name,
-                        ctx.ext_client_id, ctx.cid)
-
-                # This is the call that runs SQL INSERT statements with messages for topics and subscriber queues
-                _ = sql_publish_with_retry(
+                    logger_pubsub.debug(_inserting_gd_msg, ctx.topic.name, [elem['pub_msg_id'] for elem in ctx.gd_msg_list],
+                        ctx.endpoint_name, ctx.ext_client_id, ctx.cid)
 
-                    now = ctx.now,
-                    cid = ctx.cid,
-                    topic_id = ctx.topic.id,
-                    topic_name = ctx.topic.name,
-                    cluster_id = ctx.cluster_id,
-                    pub_counter = self.server.get_pub_counter(),
+                # .. this returns only after the commit and it increases the publication counter too.
+                self.gd_group_committer.publish(ctx)
 
-                    session = session,
-                    new_session_func = ctx.new_session_func,
-                    before_queue_insert_func = None,
-
-                    gd_msg_list = ctx.gd_msg_list,
-                    subscriptions_by_topic = ctx.subscriptions_by_topic,
-                    should_collect_ctx = False
-                )
-
-                # Run an SQL commit for all queries above ..
-                session.commit()
-
-                # .. increase the publication counter now that we have committed the messages ..
-                self.server.incr_pub_counter()
+            # .. otherwise, we run a transaction of our own.
+            else:
+                self._publish_gd_msg_list(ctx, len_gd_msg_list)
 
             # .. and set a flag to signal that there are some GD messages available
             ctx.pubsub.set_sync_has_msg(
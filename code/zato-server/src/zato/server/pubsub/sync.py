@@ -26,7 +26,7 @@ from zato.common.util.time_ import utcnow_as_ms
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, anydict, anylist, anyset, anytuple, callable_, dict_, dictlist, intsetdict, strlist, \
+    from zato.common.typing_ import any_, anydict, anylist, anyset, anytuple, callable_, dict_, dictlist, intsetdict, list_, strlist, \
         strdictdict, strset, strsetdict
     from zato.server.pubsub import PubSub
     from zato.server.pubsub.model import Endpoint
@@ -34,6 +34,7 @@ if 0:
     anyset = anyset
     anytuple = anytuple
     dict_ = dict_
+    list_ = list_
     strset = strset
     Endpoint = Endpoint
 
@@ -68,6 +69,7 @@ _update_attrs = (
 # ################################################################################################################################
 
 _default_expiration = PUBSUB.DEFAULT.EXPIRATION
+_default_shard_count = PUBSUB.DEFAULT.Sync_Backlog_Shards
 default_sk_server_table_columns = 6, 15, 8, 6, 17, 80
 
 # ################################################################################################################################
@@ -108,24 +110,21 @@ def get_expiration(
 
 # ################################################################################################################################
 
-class InRAMSync:
-    """ A backlog of messages kept in RAM for whom there are subscriptions - that is, they are known to have subscribers
-    and will be ultimately delivered to them. Stores a list of sub_keys and all messages that a sub_key points to.
-    It acts as a multi-key dict and keeps only a single copy of message for each sub_key.
+class InRAMSyncShard:
+    """ A single partition of the in-RAM backlog. Each shard has its own lock and it keeps the very same look-up structures
+    that InRAMSync once kept globally, but only for the topics that were assigned to this particular shard.
     """
 
     lock: 'RLock'
-    pubsub: 'PubSub'
 
     msg_id_to_msg:     'strdictdict'
     topic_id_msg_id:   'intsetdict'
     sub_key_to_msg_id: 'strsetdict'
     msg_id_to_sub_key: 'strsetdict'
 
-    def __init__(self, pubsub:'PubSub') -> 'None':
+    def __init__(self) -> 'None':
 
         self.lock = RLock()
-        self.pubsub = pubsub
 
         # Msg ID   -> Message data - What is the actual contents of each message
         self.msg_id_to_msg = {}
@@ -139,9 +138,63 @@ class InRAMSync:
         # Msg ID   -> Sub key set  - What subscribers are interested in a given message
         self.msg_id_to_sub_key = {}
 
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InRAMSync:
+    """ A backlog of messages kept in RAM for whom there are subscriptions - that is, they are known to have subscribers
+    and will be ultimately delivered to them. Stores a list of sub_keys and all messages that a sub_key points to.
+    It acts as a multi-key dict and keeps only a single copy of message for each sub_key.
+
+    The backlog is partitioned into shards keyed by topic ID - each message and each sub_key belongs to exactly one topic
+    so all the structures related to a given topic are always in the same shard and publications to topics
+    in different shards never need to wait for each other's locks. Operations that are given only a message ID
+    or a sub_key find their shards through indexes that are updated each time a message or sub_key is added or removed.
+    """
+
+    pubsub: 'PubSub'
+    shards: 'list_[InRAMSyncShard]'
+    shard_count: 'int'
+
+    msg_id_to_shard:  'dict_[str, InRAMSyncShard]'
+    sub_key_to_shard: 'dict_[str, InRAMSyncShard]'
+
+    def __init__(self, pubsub:'PubSub', shard_count:'int'=_default_shard_count) -> 'None':
+
+        self.pubsub = pubsub
+        self.shard_count = shard_count
+        self.shards = [InRAMSyncShard() for _ in range(shard_count)]
+
+        # Msg ID  -> Shard - Which shard the contents of each message are in
+        self.msg_id_to_shard = {}
+
+        # Sub key -> Shard - Which shard keeps messages for a given subscriber
+        self.sub_key_to_shard = {}
+
         # Start in background a cleanup task that deletes all expired and removed messages
         _ = spawn_greenlet(self.run_cleanup_task)
 
+# ################################################################################################################################
+
+    def get_shard_by_topic_id(self, topic_id:'int') -> 'InRAMSyncShard':
+        """ Returns a shard that a given topic is assigned to.
+        """
+        return self.shards[hash(topic_id) % self.shard_count]
+
+# ################################################################################################################################
+
+    def _get_shard_by_msg_id(self, msg_id:'str') -> 'InRAMSyncShard | None':
+        """ Returns a shard that contains a given message or None if there is no such message in any shard.
+        """
+        return self.msg_id_to_shard.get(msg_id)
+
+# ################################################################################################################################
+
+    def _get_shard_by_sub_key(self, sub_key:'str') -> 'InRAMSyncShard | None':
+        """ Returns a shard that contains messages for a given sub_key or None if there are no such messages anywhere.
+        """
+        return self.sub_key_to_shard.get(sub_key)
+
 # ################################################################################################################################
 
     def add_messages(
@@ -156,12 +209,14 @@ class InRAMSync:
     ) -> 'None':
         """ Adds all input messages to sub_keys for the topic.
         """
-        with self.lock:
+        shard = self.get_shard_by_topic_id(topic_id)
+
+        with shard.lock:
 
             # Local aliases
             msg_ids = [msg['pub_msg_id'] for msg in messages]
             len_messages = len(messages)
-            topic_messages = self.topic_id_msg_id.setdefault(topic_id, set())
+            topic_messages = shard.topic_id_msg_id.setdefault(topic_id, set())
 
             # Try to append the messages for each of their subscribers ..
             for sub_key in sub_keys:
@@ -175,12 +230,14 @@ class InRAMSync:
                     continue
 
                 # .. otherwise, we make it known that the sub_key is interested in this message ..
-                sub_key_msg = self.sub_key_to_msg_id.setdefault(sub_key, set())
+                sub_key_msg = shard.sub_key_to_msg_id.setdefault(sub_key, set())
                 sub_key_msg.update(msg_ids)
+                self.sub_key_to_shard[sub_key] = shard
 
             # For each message given on input, store its actual contents ..
             for msg in messages:
-                self.msg_id_to_msg[msg['pub_msg_id']] = msg
+                shard.msg_id_to_msg[msg['pub_msg_id']] = msg
+                self.msg_id_to_shard[msg['pub_msg_id']] = shard
 
                 # We received timestamps as strings whereas our recipients require floats
                 # so we need to do the conversion here.
@@ -197,7 +254,7 @@ class InRAMSync:
                     msg['priority'] = _default_pri
 
                 # .. add a reverse mapping, from message ID to sub_key ..
-                msg_sub_key = self.msg_id_to_sub_key.setdefault(msg['pub_msg_id'], set())
+                msg_sub_key = shard.msg_id_to_sub_key.setdefault(msg['pub_msg_id'], set())
                 msg_sub_key.update(sub_keys)
 
             # .. and add a reference to it to the topic.
@@ -212,8 +269,15 @@ class InRAMSync:
         _warn='No such message in sync backlog `%s`' # type: str
         ) -> 'bool':
 
-        with self.lock:
-            _msg = self.msg_id_to_msg.get(msg['msg_id'])
+        shard = self._get_shard_by_msg_id(msg['msg_id'])
+
+        if not shard:
+            logger.warning(_warn, msg['msg_id'])
+            logger_zato.warning(_warn, msg['msg_id'])
+            return False # No such message
+
+        with shard.lock:
+            _msg = shard.msg_id_to_msg.get(msg['msg_id'])
             if not _msg:
                 logger.warning(_warn, msg['msg_id'])
                 logger_zato.warning(_warn, msg['msg_id'])
@@ -234,20 +298,21 @@ class InRAMSync:
 
 # ################################################################################################################################
 
-    def _delete_messages(self, msg_list:'strlist') -> 'None':
-        """ Low-level implementation of self.delete_messages - must be called with self.lock held.
+    def _delete_messages(self, shard:'InRAMSyncShard', msg_list:'strlist') -> 'None':
+        """ Low-level implementation of self.delete_messages - must be called with shard.lock held.
         """
         logger.info('Deleting non-GD messages `%s`', msg_list)
 
         for msg_id in list(msg_list):
 
-            found_to_sub_key = self.msg_id_to_sub_key.pop(msg_id, None)
-            found_to_msg = self.msg_id_to_msg.pop(msg_id, None)
+            found_to_sub_key = shard.msg_id_to_sub_key.pop(msg_id, None)
+            found_to_msg = shard.msg_id_to_msg.pop(msg_id, None)
+            _ = self.msg_id_to_shard.pop(msg_id, None)
 
             _has_topic_msg = False # Was the ID found for at least one topic
             _has_sk_msg = False     # Ditto but for sub_keys
 
-            for _topic_msg_set in self.topic_id_msg_id.values():
+            for _topic_msg_set in shard.topic_id_msg_id.values():
                 try:
                     _ = _topic_msg_set.remove(msg_id)
                 except KeyError:
@@ -255,7 +320,7 @@ class InRAMSync:
                 else:
                     _has_topic_msg = True
 
-            for _sk_msg_set in self.sub_key_to_msg_id.values():
+            for _sk_msg_set in shard.sub_key_to_msg_id.values():
                 try:
                     _ = _sk_msg_set.remove(msg_id)
                 except KeyError:
@@ -284,14 +349,30 @@ class InRAMSync:
     def delete_messages(self, msg_list:'strlist') -> 'None':
         """ Deletes all messages from input msg_list.
         """
-        with self.lock:
-            self._delete_messages(msg_list)
+        # Group the messages by the shard they are in so that each lock is acquired only once ..
+        by_shard = {} # type: dict_[InRAMSyncShard, strlist]
+
+        for msg_id in msg_list:
+
+            # .. messages that cannot be found anywhere are still handed over to the first shard
+            # so that the same warnings are logged as previously ..
+            shard = self._get_shard_by_msg_id(msg_id) or self.shards[0]
+            by_shard.setdefault(shard, []).append(msg_id)
+
+        # .. and now, delete them from each shard.
+        for shard, shard_msg_list in by_shard.items():
+            with shard.lock:
+                self._delete_messages(shard, shard_msg_list)
 
 # ################################################################################################################################
 
     def has_messages_by_sub_key(self, sub_key:'str') -> 'bool':
-        with self.lock:
-            msg_id_set = self.sub_key_to_msg_id.get(sub_key) or set()
+        shard = self._get_shard_by_sub_key(sub_key)
+        if not shard:
+            return False
+
+        with shard.lock:
+            msg_id_set = shard.sub_key_to_msg_id.get(sub_key) or set()
             return len(msg_id_set) > 0
 
 # ################################################################################################################################
@@ -299,14 +380,16 @@ class InRAMSync:
     def clear_topic(self, topic_id:'int') -> 'None':
         logger.info('Clearing topic `%s` (id:%s)', self.pubsub.get_topic_by_id(topic_id).name, topic_id)
 
-        with self.lock:
+        shard = self.get_shard_by_topic_id(topic_id)
+
+        with shard.lock:
 
             # Not all servers will have messages for the topic, hence .get
-            messages = self.topic_id_msg_id.get(topic_id, set())
+            messages = shard.topic_id_msg_id.get(topic_id, set())
 
             if messages:
                 messages = list(messages) # We need a copy so as not to change the input set during iteration later on
-                self._delete_messages(messages)
+                self._delete_messages(shard, messages)
             else:
                 logger.info(
                     'Did not find any non-GD messages to delete for topic `%s`',
@@ -321,7 +404,7 @@ class InRAMSync:
         delete_msg=True, # type: bool
         delete_sub=False # type: bool
     ) -> 'dictlist':
-        """ Low-level implementation of retrieve_messages_by_sub_keys which must be called with self.lock held.
+        """ Low-level implementation of retrieve_messages_by_sub_keys. Acquires the lock of the topic's shard.
         """
 
         # Forward declaration
@@ -339,66 +422,73 @@ class InRAMSync:
         # A list of messages that will be optionally deleted before they are returned
         to_delete_msg = set() # type: anyset
 
-        # First, collect data for all sub_keys ..
-        for sub_key in sub_keys:
+        # All the messages and sub_keys of the topic are in the same shard
+        shard = self.get_shard_by_topic_id(topic_id)
 
-            for msg_id in self.sub_key_to_msg_id.get(sub_key, []):
+        with shard.lock:
 
-                # We already had this message marked for output
-                if msg_id in msg_seen:
-                    continue
-                else:
-                    # Mark as already seen
-                    msg_seen.add(msg_id)
+            # First, collect data for all sub_keys ..
+            for sub_key in sub_keys:
 
-                    # Filter out expired messages
-                    msg = self.msg_id_to_msg.get(msg_id)
-                    if not msg:
-                        logger.warning('Msg `%s` not found in self.msg_id_to_msg', msg_id)
-                        continue
-                    if now >= msg['expiration_time']:
+                for msg_id in shard.sub_key_to_msg_id.get(sub_key, []):
+
+                    # We already had this message marked for output
+                    if msg_id in msg_seen:
                         continue
                     else:
-                        out.append(self.msg_id_to_msg[msg_id])
+                        # Mark as already seen
+                        msg_seen.add(msg_id)
+
+                        # Filter out expired messages
+                        msg = shard.msg_id_to_msg.get(msg_id)
+                        if not msg:
+                            logger.warning('Msg `%s` not found in self.msg_id_to_msg', msg_id)
+                            continue
+                        if now >= msg['expiration_time']:
+                            continue
+                        else:
+                            out.append(shard.msg_id_to_msg[msg_id])
 
-                if delete_msg:
-                    to_delete_msg.add(msg_id)
+                    if delete_msg:
+                        to_delete_msg.add(msg_id)
 
-        # Delete all messages marked to be deleted ..
-        for msg_id in to_delete_msg:
+            # Delete all messages marked to be deleted ..
+            for msg_id in to_delete_msg:
 
-            # .. first, direct mappings ..
-            _ = self.msg_id_to_msg.pop(msg_id, None)
+                # .. first, direct mappings ..
+                _ = shard.msg_id_to_msg.pop(msg_id, None)
+                _ = self.msg_id_to_shard.pop(msg_id, None)
 
-            logger.info('Deleting msg from mapping dict `%s`, before:`%s`', msg_id, self.msg_id_to_msg)
+                logger.info('Deleting msg from mapping dict `%s`, before:`%s`', msg_id, shard.msg_id_to_msg)
 
-            # .. now, remove the message from topic ..
-            self.topic_id_msg_id[topic_id].remove(msg_id)
+                # .. now, remove the message from topic ..
+                shard.topic_id_msg_id[topic_id].remove(msg_id)
 
-            logger.info('Deleting msg from mapping topic `%s`, after:`%s`', msg_id, self.topic_id_msg_id)
+                logger.info('Deleting msg from mapping topic `%s`, after:`%s`', msg_id, shard.topic_id_msg_id)
 
-            # .. now, find the message for each sub_key ..
-            for sub_key in sub_keys:
-                sub_key_to_msg_id = self.sub_key_to_msg_id.get(sub_key)
-
-                # We need this if statement because it is possible that a client is subscribed to a topic
-                # but it will not receive a particular message. This is possible if the message is a response
-                # to a previous request and the latter used reply_to_sk, in which case only that one sub_key pointed to
-                # by reply_to_sk will get the response, which ultimately means that self.sub_key_to_msg_id
-                # will not have this response for current sub_key.
-                if sub_key_to_msg_id:
-
-                    # .. delete the message itself - but we need to catch ValueError because
-                    # to_delete_msg is a list of all messages to be deleted and we do not know
-                    # if this particular message belonged to this particular sub_key or not.
-                    try:
-                        sub_key_to_msg_id.remove(msg_id)
-                    except KeyError:
-                        pass # OK, message was not found for this sub_key
-
-                    # .. now delete the sub_key either because we are explicitly told to (e.g. during unsubscribe)
-                    if delete_sub:# or (not sub_key_to_msg_id):
-                        del self.sub_key_to_msg_id[sub_key]
+                # .. now, find the message for each sub_key ..
+                for sub_key in sub_keys:
+                    sub_key_to_msg_id = shard.sub_key_to_msg_id.get(sub_key)
+
+                    # We need this if statement because it is possible that a client is subscribed to a topic
+                    # but it will not receive a particular message. This is possible if the message is a response
+                    # to a previous request and the latter used reply_to_sk, in which case only that one sub_key pointed to
+                    # by reply_to_sk will get the response, which ultimately means that shard.sub_key_to_msg_id
+                    # will not have this response for current sub_key.
+                    if sub_key_to_msg_id:
+
+                        # .. delete the message itself - but we need to catch ValueError because
+                        # to_delete_msg is a list of all messages to be deleted and we do not know
+                        # if this particular message belonged to this particular sub_key or not.
+                        try:
+                            sub_key_to_msg_id.remove(msg_id)
+                        except KeyError:
+                            pass # OK, message was not found for this sub_key
+
+                        # .. now delete the sub_key either because we are explicitly told to (e.g. during unsubscribe)
+                        if delete_sub:# or (not sub_key_to_msg_id):
+                            del shard.sub_key_to_msg_id[sub_key]
+                            _ = self.sub_key_to_shard.pop(sub_key, None)
 
         return out
 
@@ -407,8 +497,7 @@ class InRAMSync:
     def retrieve_messages_by_sub_keys(self, topic_id:'int', sub_keys:'strlist') -> 'dictlist':
         """ Retrieves and returns all messages matching input - messages are deleted from RAM.
         """
-        with self.lock:
-            return self.get_delete_messages_by_sub_keys(topic_id, sub_keys)
+        return self.get_delete_messages_by_sub_keys(topic_id, sub_keys)
 
 # ################################################################################################################################
 
@@ -424,8 +513,10 @@ class InRAMSync:
         # Forward declaration
         msg_id: 'str'
 
-        with self.lock:
-            msg_id_list = self.topic_id_msg_id.get(topic_id, [])
+        shard = self.get_shard_by_topic_id(topic_id)
+
+        with shard.lock:
+            msg_id_list = shard.topic_id_msg_id.get(topic_id, [])
             if not msg_id_list:
                 return []
 
@@ -434,7 +525,7 @@ class InRAMSync:
             msg_list = [] # type: dictlist
 
             for msg_id in msg_id_list:
-                msg = self.msg_id_to_msg[msg_id]
+                msg = shard.msg_id_to_msg[msg_id]
                 if query:
                     if query not in msg['data'][:self.pubsub.data_prefix_len]:
                         continue
@@ -451,8 +542,12 @@ class InRAMSync:
 # ################################################################################################################################
 
     def get_message_by_id(self, msg_id:'str') -> 'anydict':
-        with self.lock:
-            return self.msg_id_to_msg[msg_id]
+        shard = self._get_shard_by_msg_id(msg_id)
+        if not shard:
+            raise KeyError(msg_id)
+
+        with shard.lock:
+            return shard.msg_id_to_msg[msg_id]
 
 # ################################################################################################################################
 
@@ -470,14 +565,17 @@ class InRAMSync:
         msg_id:  'str'
         sub_key: 'str'
 
+        shard = self.get_shard_by_topic_id(topic_id)
+
         # Always acquire a lock for this kind of operation
-        with self.lock:
+        with shard.lock:
 
             # For each sub_key ..
             for sub_key in sub_keys:
 
                 # .. get all messages waiting for this subscriber, assuming there are any at all ..
-                msg_ids = self.sub_key_to_msg_id.pop(sub_key, [])
+                msg_ids = shard.sub_key_to_msg_id.pop(sub_key, [])
+                _ = self.sub_key_to_shard.pop(sub_key, None)
 
                 # .. for each message found we need to check if it is needed by any other subscriber,
                 # and if it's not, then we delete all the reference to this message. Otherwise, we leave it
@@ -485,14 +583,15 @@ class InRAMSync:
                 for msg_id in msg_ids:
 
                     # Get all subscribers interested in this message ..
-                    current_subs = self.msg_id_to_sub_key[msg_id]
+                    current_subs = shard.msg_id_to_sub_key[msg_id]
                     current_subs.remove(sub_key)
 
                     # .. if the list is empty, it means that there no some subscribers left for that message,
                     # in which case we may deleted references to this message from other look-up structures.
                     if not current_subs:
-                        del self.msg_id_to_msg[msg_id]
-                        topic_msg = self.topic_id_msg_id[topic_id]
+                        del shard.msg_id_to_msg[msg_id]
+                        _ = self.msg_id_to_shard.pop(msg_id, None)
+                        topic_msg = shard.topic_id_msg_id[topic_id]
                         topic_msg.remove(msg_id)
 
         logger.info(pattern, sub_keys, topic_name)
@@ -500,8 +599,13 @@ class InRAMSync:
 
 # ################################################################################################################################
 
-    def run_cleanup_task(self, _utcnow:'callable_'=utcnow_as_ms, _sleep:'callable_'=sleep) -> 'None':
-        """ A background task waking up periodically to remove all expired and retrieved messages from backlog.
+    def _cleanup_shard(
+        self,
+        shard,      # type: InRAMSyncShard
+        now,        # type: float
+        publishers, # type: dict_[int, Endpoint]
+    ) -> 'int':
+        """ Removes all expired messages from a single shard - must be called with shard.lock held.
         """
 
         # Forward declarations
@@ -509,62 +613,77 @@ class InRAMSync:
         sub_key:  'str'
         topic_id: 'int'
 
-        while True:
-            try:
-                with self.lock:
+        # We keep them separate so as not to modify any objects during iteration.
+        expired_msg = [] # type: anylist
 
-                    # Local alias
-                    publishers = {} # type: dict_[int, Endpoint]
+        for _, msg in shard.msg_id_to_msg.items():
 
-                    # We keep them separate so as not to modify any objects during iteration.
-                    expired_msg = [] # type: anylist
+            if now >= msg['expiration_time']:
 
-                    # Calling it once will suffice.
-                    now = _utcnow()
+                # It's possible that there will be many expired messages all sent by the same publisher
+                # so there is no need to query self.pubsub for each message.
+                if msg['published_by_id'] not in publishers:
+                    publishers[msg['published_by_id']] = self.pubsub.get_endpoint_by_id(msg['published_by_id'])
 
-                    for _, msg in self.msg_id_to_msg.items():
+                # We can be sure that it is always found
+                publisher = publishers[msg['published_by_id']] # type: Endpoint
 
-                        if now >= msg['expiration_time']:
+                # Log the message to make sure the expiration event is always logged ..
+                logger_zato.info('Found an expired msg:`%s`, topic:`%s`, publisher:`%s`, pub_time:`%s`, exp:`%s`',
+                    msg['pub_msg_id'], msg['topic_name'], publisher.name, msg['pub_time'], msg['expiration'])
+
+                # .. and append it to the list of messages to be deleted.
+                expired_msg.append((msg['pub_msg_id'], msg['topic_id']))
 
-                            # It's possible that there will be many expired messages all sent by the same publisher
-                            # so there is no need to query self.pubsub for each message.
-                            if msg['published_by_id'] not in publishers:
-                                publishers[msg['published_by_id']] = self.pubsub.get_endpoint_by_id(msg['published_by_id'])
+        # Iterate over all the expired messages found and delete them from in-RAM structures
+        for msg_id, topic_id in expired_msg:
 
-                            # We can be sure that it is always found
-                            publisher = publishers[msg['published_by_id']] # type: Endpoint
+            # Get all sub_keys waiting for these messages and delete the message from each one,
+            # but note that there may be possibly no subscribers at all if the message was published
+            # to a topic without any subscribers.
+            for sub_key in shard.msg_id_to_sub_key.pop(msg_id):
+                shard.sub_key_to_msg_id[sub_key].remove(msg_id)
 
-                            # Log the message to make sure the expiration event is always logged ..
-                            logger_zato.info('Found an expired msg:`%s`, topic:`%s`, publisher:`%s`, pub_time:`%s`, exp:`%s`',
-                                msg['pub_msg_id'], msg['topic_name'], publisher.name, msg['pub_time'], msg['expiration'])
+            # Remove all references to the message from topic
+            shard.topic_id_msg_id[topic_id].remove(msg_id)
 
-                            # .. and append it to the list of messages to be deleted.
-                            expired_msg.append((msg['pub_msg_id'], msg['topic_id']))
+            # And finally, remove the message's contents
+            del shard.msg_id_to_msg[msg_id]
+            _ = self.msg_id_to_shard.pop(msg_id, None)
 
-                    # For logging what was done
-                    len_expired = len(expired_msg)
+        return len(expired_msg)
 
-                    # Iterate over all the expired messages found and delete them from in-RAM structures
-                    for msg_id, topic_id in expired_msg:
+# ################################################################################################################################
 
-                        # Get all sub_keys waiting for these messages and delete the message from each one,
-                        # but note that there may be possibly no subscribers at all if the message was published
-                        # to a topic without any subscribers.
-                        for sub_key in self.msg_id_to_sub_key.pop(msg_id):
-                            self.sub_key_to_msg_id[sub_key].remove(msg_id)
+    def run_cleanup_task(self, _utcnow:'callable_'=utcnow_as_ms, _sleep:'callable_'=sleep) -> 'None':
+        """ A background task waking up periodically to remove all expired and retrieved messages from backlog.
+        """
+        while True:
+            try:
+
+                # Local alias
+                publishers = {} # type: dict_[int, Endpoint]
 
-                        # Remove all references to the message from topic
-                        self.topic_id_msg_id[topic_id].remove(msg_id)
+                # For logging what was done
+                len_expired = 0
+                len_messages = 0
 
-                        # And finally, remove the message's contents
-                        del self.msg_id_to_msg[msg_id]
+                # Calling it once will suffice.
+                now = _utcnow()
+
+                # Each shard is cleaned up separately, with only its own lock held,
+                # and we yield control to other greenlets after each one.
+                for shard in self.shards:
+                    with shard.lock:
+                        len_expired += self._cleanup_shard(shard, now, publishers)
+                        len_messages += len(shard.msg_id_to_msg)
+                    _sleep(0)
 
                 suffix = 's' if (len_expired==0 or len_expired > 1) else ''
-                len_messages = len(self.msg_id_to_msg)
                 if len_expired or len_messages:
-                    logger.info('In-RAM. Deleted %s pub/sub message%s. Left:%s' % (len_expired, suffix, self.msg_id_to_msg))
+                    logger.info('In-RAM. Deleted %s pub/sub message%s. Left:%s' % (len_expired, suffix, len_messages))
 
-                # Sleep for a moment before checking again but don't do it with self.lock held.
+                # Sleep for a moment before checking again but don't do it with any lock held.
                 _sleep(2)
 
             except Exception:
@@ -600,8 +719,10 @@ class InRAMSync:
     def get_topic_depth(self, topic_id:'int') -> 'int':
         """ Returns depth of a given in-RAM queue for the topic.
         """
-        with self.lock:
-            return len(self.topic_id_msg_id.get(topic_id, set()))
+        shard = self.get_shard_by_topic_id(topic_id)
+
+        with shard.lock:
+            return len(shard.topic_id_msg_id.get(topic_id, set()))
 
 # ################################################################################################################################
 # ################################################################################################################################
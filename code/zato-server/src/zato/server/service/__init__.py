@@ -9,6 +9,7 @@ Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import logging
 from datetime import datetime, timedelta
+from functools import cached_property
 from http.client import BAD_REQUEST, METHOD_NOT_ALLOWED
 from inspect import isclass
 from json import loads
@@ -205,6 +206,9 @@ class ModuleCtx:
     Channel_Service = CHANNEL.SERVICE
     Pattern_Call_Channels = {CHANNEL.FANOUT_CALL, CHANNEL.PARALLEL_EXEC_CALL}
 
+    # Lazily created facades that pooled service instances keep across invocations
+    Reusable_Instance_Attrs = ('out', 'outgoing', 'security')
+
 # ################################################################################################################################
 
 @dataclass(init=False)
@@ -387,9 +391,7 @@ class Service:
     """ A base class for all services deployed on Zato servers, no matter the transport and protocol, be it REST, IBM MQ
     or any other, regardless whether they arere built-in or user-defined ones.
     """
-    rest: 'RESTFacade'
     schedule: 'SchedulerFacade'
-    security: 'SecurityFacade'
 
     call_hooks:'bool' = True
     _filter_by = None
@@ -488,6 +490,11 @@ class Service:
 
     cache: 'CacheAPI'
 
+    # Whether instances of this service can be reused across invocations instead of being created each time.
+    # Only services that do not access self after their handle method returns, e.g. in greenlets they spawn,
+    # may set it to True. Before an instance is reused, its reset_instance method is called.
+    pool_instances:'bool' = False
+
     def __init__(
         self,
         *ignored_args:'any_',
@@ -518,7 +525,14 @@ class Service:
         self.usage = 0 # How many times the service has been invoked
         self.slow_threshold = maxint # After how many ms to consider the response came too late
 
-        self.out = self.outgoing = Outgoing(
+# ################################################################################################################################
+
+    # Facades below are not needed by most services so they are created only when first accessed.
+
+    @cached_property
+    def out(self) -> 'Outgoing':
+
+        out = Outgoing(
             self.amqp,
             self._out_ftp,
             WMQFacade(self) if self.component_enabled_ibm_mq else None,
@@ -538,12 +552,53 @@ class Service:
             self.kvdb
         ) # type: Outgoing
 
-        # REST facade for outgoing connections
-        self.rest = RESTFacade()
-
         if self.component_enabled_hl7:
             hl7_api = HL7API(self._worker_store.outconn_hl7_fhir, self._worker_store.outconn_hl7_mllp)
-            self.out.hl7 = hl7_api
+            out.hl7 = hl7_api
+
+        return out
+
+    @cached_property
+    def outgoing(self) -> 'Outgoing':
+        return self.out
+
+    @cached_property
+    def rest(self) -> 'RESTFacade':
+        """ REST facade for outgoing connections.
+        """
+        rest = RESTFacade()
+        rest.init(self.cid, self._out_plain_http)
+        return rest
+
+    @cached_property
+    def keysight(self) -> 'KeysightContainer':
+        keysight = KeysightContainer()
+        keysight.init(self.cid, self._out_plain_http)
+        return keysight
+
+    @cached_property
+    def security(self) -> 'SecurityFacade':
+        return SecurityFacade(self.server)
+
+# ################################################################################################################################
+
+    def reset_instance(self) -> 'None':
+        """ Called by the service store before an instance of a service whose pool_instances is True is reused.
+        Brings the instance back to the state it had right after it was created, except for the facades that do not depend
+        on any particular invocation. Services that keep their own state in self, and want to keep it across invocations,
+        can override this method and call super().reset_instance() before restoring their state.
+        """
+        instance_dict = self.__dict__
+        to_keep = {}
+
+        for name in ModuleCtx.Reusable_Instance_Attrs:
+            if name in instance_dict:
+                to_keep[name] = instance_dict[name]
+
+        instance_dict.clear()
+        instance_dict.update(to_keep)
+
+        self.__init__()
 
 # ################################################################################################################################
 
@@ -652,13 +707,6 @@ class Service:
         # Cache is always enabled
         self.cache = self._worker_store.cache_api
 
-        # REST facade
-        self.rest.init(self.cid, self._out_plain_http)
-
-        # Vendors - Keysight
-        self.keysight = KeysightContainer()
-        self.keysight.init(self.cid, self._out_plain_http)
-
 # ################################################################################################################################
 
     def set_response_data(self, service:'Service', **kwargs:'any_') -> 'any_':
@@ -886,6 +934,9 @@ class Service:
                         else:
                             payload = service.response.payload
 
+                        # The callback will still use the service after we return so its instance cannot be reused
+                        service.pool_instances = False
+
                         spawn_greenlet(func, service, payload, exc_data)
 
                     # It is possible that, on behalf of our caller (e.g. pub.zato.service.service-invoker),
@@ -1014,7 +1065,9 @@ class Service:
                 if raise_timeout:
                     raise
         else:
-            return self.update_handle(*invoke_args, **kwargs)
+            response = self.update_handle(*invoke_args, **kwargs)
+            self.server.service_store.release_instance(service)
+            return response
 
 # ################################################################################################################################
 
@@ -1354,7 +1407,6 @@ class Service:
         service.user_config = server.user_config
         service.static_config = server.static_config
         service.time = server.time_util
-        service.security = SecurityFacade(service.server)
 
         if channel_params:
             service.request.channel_params.update(channel_params)
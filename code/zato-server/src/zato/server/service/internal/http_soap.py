@@ -14,7 +14,7 @@ from traceback import format_exc
 from paste.util.converters import asbool
 
 # Zato
-from zato.common.api import CONNECTION, DEFAULT_HTTP_PING_METHOD, DEFAULT_HTTP_POOL_SIZE, \
+from zato.common.api import CACHE, CONNECTION, DEFAULT_HTTP_PING_METHOD, DEFAULT_HTTP_POOL_SIZE, \
      Groups, HL7, HTTP_SOAP_SERIALIZATION_TYPE, MISC, PARAMS_PRIORITY, SEC_DEF_TYPE, URL_PARAMS_PRIORITY, URL_TYPE, \
      ZATO_DEFAULT, ZATO_NONE, ZatoNotGiven, ZATO_SEC_USE_RBAC
 from zato.common.broker_message import CHANNEL, OUTGOING
@@ -93,7 +93,7 @@ class _BaseGet(AdminService):
         output_optional = 'service_id', 'service_name', 'security_id', 'security_name', 'sec_type', \
             'method', 'soap_action', 'soap_version', 'data_format', 'host', 'ping_method', 'pool_size', 'merge_url_params_req', \
             'url_params_pri', 'params_pri', 'serialization_type', 'timeout', AsIs('sec_tls_ca_cert_id'), Boolean('has_rbac'), \
-            'content_type', Boolean('sec_use_rbac'), 'cache_id', 'cache_name', Integer('cache_expiry'), 'cache_type', \
+            'content_type', Boolean('sec_use_rbac'), 'cache_id', 'cache_name', Integer('cache_expiry'), 'cache_type', 'cache_key_type', \
             'content_encoding', Boolean('match_slash'), 'http_accept', List('service_whitelist'), 'is_rate_limit_active', \
                 'rate_limit_type', 'rate_limit_def', Boolean('rate_limit_check_parent_def'), \
                 'hl7_version', 'json_path', 'should_parse_on_input', 'should_validate', 'should_return_errors', \
@@ -250,6 +250,13 @@ class _CreateEdit(AdminService, _HTTPSOAPService):
                 filter(TLSCACert.id==sec_tls_ca_cert_id).\
                 one()[0]
 
+# ################################################################################################################################
+
+    def _validate_cache_key_type(self, input):
+        if input.get('cache_key_type') and input.cache_key_type not in CACHE.HTTP_KEY_TYPE.ALL:
+            raise Exception('Cache key type must be empty or one of {}'.format(', '.join(
+                '`{}`'.format(elem) for elem in CACHE.HTTP_KEY_TYPE.ALL)))
+
 # ################################################################################################################################
 
     def _raise_error(self, name, url_path, http_accept, http_method, soap_action, source):
@@ -394,7 +401,7 @@ class Create(_CreateEdit):
         input_optional = 'service', 'service_id', AsIs('security_id'), 'method', 'soap_action', 'soap_version', 'data_format', \
             'host', 'ping_method', 'pool_size', Boolean('merge_url_params_req'), 'url_params_pri', 'params_pri', \
             'serialization_type', 'timeout', AsIs('sec_tls_ca_cert_id'), Boolean('has_rbac'), 'content_type', \
-            'cache_id', Integer('cache_expiry'), 'content_encoding', Boolean('match_slash'), 'http_accept', \
+            'cache_id', Integer('cache_expiry'), 'cache_key_type', 'content_encoding', Boolean('match_slash'), 'http_accept', \
             List('service_whitelist'), 'is_rate_limit_active', 'rate_limit_type', 'rate_limit_def', \
             Boolean('rate_limit_check_parent_def'), Boolean('sec_use_rbac'), 'hl7_version', 'json_path', \
             'should_parse_on_input', 'should_validate', 'should_return_errors', 'data_encoding', \
@@ -457,6 +464,8 @@ class Create(_CreateEdit):
         if input.content_encoding and input.content_encoding != 'gzip':
             raise Exception('Content encoding must be empty or equal to `gzip`')
 
+        self._validate_cache_key_type(input)
+
         with closing(self.odb.session()) as session:
             existing_one = session.query(HTTPSOAP.id).\
                 filter(HTTPSOAP.cluster_id==input.cluster_id).\
@@ -585,7 +594,7 @@ class Edit(_CreateEdit):
         input_optional = 'service', 'service_id', AsIs('security_id'), 'method', 'soap_action', 'soap_version', \
             'data_format', 'host', 'ping_method', 'pool_size', Boolean('merge_url_params_req'), 'url_params_pri', \
             'params_pri', 'serialization_type', 'timeout', AsIs('sec_tls_ca_cert_id'), Boolean('has_rbac'), 'content_type', \
-            'cache_id', Integer('cache_expiry'), 'content_encoding', Boolean('match_slash'), 'http_accept', \
+            'cache_id', Integer('cache_expiry'), 'cache_key_type', 'content_encoding', Boolean('match_slash'), 'http_accept', \
             List('service_whitelist'), 'is_rate_limit_active', 'rate_limit_type', 'rate_limit_def', \
             Boolean('rate_limit_check_parent_def'), Boolean('sec_use_rbac'), 'hl7_version', 'json_path', \
             'should_parse_on_input', 'should_validate', 'should_return_errors', 'data_encoding', \
@@ -647,6 +656,8 @@ class Edit(_CreateEdit):
         if input.content_encoding and input.content_encoding != 'gzip':
             raise Exception('Content encoding must be empty or equal to `gzip`')
 
+        self._validate_cache_key_type(input)
+
         with closing(self.odb.session()) as session:
 
             existing_one = session.query(
@@ -75,6 +75,9 @@ class Edit(AdminService):
                 session.add(item)
                 session.commit()
 
+                # Server-wide invocations need to use the new name
+                self.server.rpc.invalidate_invokers()
+
                 self.response.payload = item
 
                 for name in('last_join_mod_date', 'up_mod_date'):
@@ -143,6 +146,9 @@ class Delete(AdminService):
                 session.delete(server)
                 session.commit()
 
+                # Server-wide invocations should no longer include this server
+                self.server.rpc.invalidate_invokers()
+
             except Exception:
                 session.rollback()
                 msg = 'Could not delete the server, e:`{}`'.format(format_exc())
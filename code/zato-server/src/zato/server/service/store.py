@@ -44,7 +44,6 @@ except ImportError:
 
 # Zato
 from zato.common.api import CHANNEL, DONT_DEPLOY_ATTR_NAME, RATE_LIMIT, SourceCodeInfo, TRACE1
-from zato.common.facade import SecurityFacade
 from zato.common.json_internal import dumps
 from zato.common.json_schema import get_service_config, ValidationConfig as JSONSchemaValidationConfig, \
      Validator as JSONSchemaValidator
@@ -129,6 +128,9 @@ class ModuleCtx:
     Rate_Limit_Exact   = RATE_LIMIT.TYPE.EXACT.id,
     Rate_Limit_Service = RATE_LIMIT.OBJECT_TYPE.SERVICE
 
+    # How many idle instances of a service with pool_instances set to True to keep at most
+    Instance_Pool_Max_Size = 100
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -842,20 +844,53 @@ class ServiceStore:
         # .. extract details ..
         service_class = _info['service_class']
         is_active = _info['is_active']
+        instance_pool = _info['instance_pool']
 
-        # .. do create a new instance ..
-        service:'Service' = service_class(*args, **kwargs)
+        # .. reuse an idle instance, if there is any, or create a new one ..
+        service:'Service'
+        if instance_pool:
+            service = instance_pool.pop()
+        else:
+            service = service_class(*args, **kwargs)
 
         # .. populate its basic attributes ..
         service.server = self.server
         service.config = self.server.user_config
         service.user_config = self.server.user_config
         service.time = self.server.time_util
-        service.security = SecurityFacade(service.server)
 
         # .. and return everything to our caller.
         return service, is_active
 
+# ################################################################################################################################
+
+    def release_instance(self, service:'Service') -> 'None':
+        """ Returns to its pool an instance of a service that is no longer needed, if the service's class allows it.
+        Must be called only once the invocation has fully completed and nothing else refers to the instance.
+        """
+        # This service is not pooled ..
+        if not service.pool_instances:
+            return
+
+        # .. or it was redeployed or undeployed after this instance was created ..
+        _info = self.services.get(service.impl_name)
+        if not _info or _info['service_class'] is not service.__class__:
+            return
+
+        # .. or there are enough idle instances already ..
+        instance_pool = _info['instance_pool']
+        if len(instance_pool) >= ModuleCtx.Instance_Pool_Max_Size:
+            return
+
+        # .. otherwise, make sure nothing from the previous invocation is carried over ..
+        try:
+            service.reset_instance()
+        except Exception:
+            logger.warning('Could not reset an instance of `%s`, e:`%s`', service.impl_name, format_exc())
+        else:
+            # .. and keep the instance for later use.
+            instance_pool.append(service)
+
 # ################################################################################################################################
 
     def new_instance_by_id(self, service_id:'int', *args:'any_', **kwargs:'any_') -> 'tuple_[Service, bool]':
@@ -1061,6 +1096,7 @@ class ServiceStore:
                 self.services[item.impl_name]['name'] = item_name
                 self.services[item.impl_name]['deployment_info'] = item_deployment_info
                 self.services[item.impl_name]['service_class'] = item_service_class
+                self.services[item.impl_name]['instance_pool'] = []
                 self.services[item.impl_name]['path'] = item.source_code_info.path
                 self.services[item.impl_name]['source_code'] = item.source_code_info.source.decode('utf8')
 
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Run gevent patches first
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+import os
+from fcntl import LOCK_EX
+from time import sleep
+from unittest import main, skipIf, TestCase
+from uuid import uuid4
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import spawn
+
+# Zato
+from zato.cache import KeyExpiredError
+from zato.common.api import CACHE
+from zato.server.connection.cache import CacheAPI
+from zato.server.connection.cache_shmem import get_shmem_cache_names, get_shmem_name, SharedMemoryCache, SharedMemoryCacheFull, unlink_shmem
+
+try:
+    import posix_ipc
+except ImportError:
+    has_posix_ipc = False
+else:
+    has_posix_ipc = True
+    posix_ipc = posix_ipc
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Server:
+
+    def __init__(self, deployment_key:'str') -> 'None':
+        self.worker_id = 1
+        self.deployment_key = deployment_key
+        self.has_posix_ipc = True
+        self.fs_server_config = Bunch({
+            'shmem': Bunch({
+                'cache_names': 'cache1, cache2',
+                'cache_size': 1,
+            })
+        })
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+@skipIf(not has_posix_ipc, 'posix_ipc is not installed')
+class SharedMemoryCacheTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.deployment_key = uuid4().hex
+        self.to_close = []
+
+    def tearDown(self) -> 'None':
+        for cache in self.to_close:
+            cache.close(needs_unlink=True)
+
+# ################################################################################################################################
+
+    def _get_cache(self, max_size:'int'=1000, size:'int'=10**6, **kwargs:'any_') -> 'SharedMemoryCache':
+        cache = SharedMemoryCache('/zt' + self.deployment_key[:20], size, max_size, 10_000, **kwargs)
+        cache.open()
+        self.to_close.append(cache)
+        return cache
+
+# ################################################################################################################################
+
+    def _get_cache_api(self) -> 'CacheAPI':
+
+        cache_api = CacheAPI(_Server(self.deployment_key))
+        cache_api.create(Bunch({
+            'name': 'cache1',
+            'cache_type': CACHE.TYPE.BUILTIN,
+            'is_default': True,
+            'max_size': 1000,
+            'max_item_size': 10_000,
+            'extend_expiry_on_get': True,
+            'extend_expiry_on_set': True,
+            'sync_method': CACHE.SYNC_METHOD.IN_BACKGROUND.id,
+        }))
+
+        return cache_api
+
+# ################################################################################################################################
+
+    def test_get_set_delete(self):
+
+        cache = self._get_cache()
+
+        values = {
+            'key1': 'value1',
+            'key2': b'value2',
+            123: {'value': [3]},
+            b'key4': 'a' * 1000,
+        }
+
+        for key, value in values.items():
+            self.assertIsNone(cache.set(key, value, 0.0, False))
+
+        for key, value in values.items():
+            self.assertEqual(cache.get(key, cache.default_get, False), value)
+
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(sorted(cache.keys(), key=str), sorted(values, key=str))
+
+        # Values of different sizes are stored in place or moved elsewhere as needed ..
+        self.assertEqual(cache.set('key1', 'b' * 5000, 0.0, False), 'value1')
+        self.assertEqual(cache.set('key1', 'c', 0.0, False), 'b' * 5000)
+        self.assertEqual(cache.get('key1', cache.default_get, False), 'c')
+
+        # .. metadata is available on request ..
+        entry = cache.get('key2', cache.default_get, True)
+        self.assertEqual(entry.key, 'key2')
+        self.assertEqual(entry.value, b'value2')
+        self.assertTrue(entry.last_write)
+
+        # .. deleting keys returns their values ..
+        self.assertEqual(cache.delete(123), {'value': [3]})
+        self.assertIsNone(cache.delete(123))
+        self.assertNotIn(123, cache)
+        self.assertEqual(cache.get(123, 'default', False), 'default')
+        self.assertEqual(len(cache), 3)
+
+        # .. and clearing the cache removes everything.
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.keys(), [])
+
+# ################################################################################################################################
+
+    def test_expiry(self):
+
+        cache = self._get_cache()
+
+        _ = cache.set('key1', 'value1', 0.1, False)
+        _ = cache.set('key2', 'value2', 0.1, False)
+        _ = cache.set('key3', 'value3', 0.0, False)
+
+        self.assertTrue(cache.expire('key3', 0.1, None))
+        self.assertFalse(cache.expire('key4', 0.1, None))
+
+        # Nothing has expired yet ..
+        self.assertEqual(cache.delete_expired(), [])
+
+        sleep(0.2)
+
+        # .. but now it has.
+        with self.assertRaises(KeyExpiredError):
+            _ = cache.get('key1', cache.default_get, False)
+
+        self.assertEqual(sorted(cache.delete_expired()), ['key2', 'key3'])
+        self.assertEqual(len(cache), 0)
+
+# ################################################################################################################################
+
+    def test_pattern_operations(self):
+
+        cache = self._get_cache()
+
+        for idx in range(10):
+            _ = cache.set('abc.{}'.format(idx), idx, 0.0, False)
+            _ = cache.set('def.{}'.format(idx), idx, 0.0, False)
+
+        self.assertEqual(len(cache.get_by_prefix('abc.', False, 0)), 10)
+        self.assertEqual(cache.get_by_suffix('.3', False, 0), {'abc.3': 3, 'def.3': 3})
+        self.assertEqual(cache.get_by_regex(r'def\.[12]', False, 0), {'def.1': 1, 'def.2': 2})
+
+        meta_ref = {'_now': None, '_any_found': False}
+        out = cache.set_by_prefix('def.', 'new', 0.0, False, meta_ref, True, 0)
+
+        self.assertTrue(meta_ref['_any_found'])
+        self.assertEqual(out, {'def.{}'.format(idx): idx for idx in range(10)})
+        self.assertEqual(cache.get('def.5', cache.default_get, False), 'new')
+
+        out = cache.delete_contains('bc', True, 0)
+        self.assertEqual(len(out), 10)
+        self.assertEqual(len(cache), 10)
+
+# ################################################################################################################################
+
+    def test_cache_full(self):
+
+        cache = self._get_cache(max_size=10)
+
+        for idx in range(10):
+            _ = cache.set(idx, idx, 0.1, False)
+
+        with self.assertRaises(SharedMemoryCacheFull):
+            _ = cache.set('key', 'value', 0.0, False)
+
+        # Once entries have expired, there is room for new ones again
+        sleep(0.2)
+        _ = cache.set('key', 'value', 0.0, False)
+
+        self.assertEqual(cache.keys(), ['key'])
+
+# ################################################################################################################################
+
+    def test_shared_by_processes(self):
+
+        cache = self._get_cache()
+
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                child_cache = SharedMemoryCache(cache.name, cache.size, cache.max_size)
+                child_cache.open()
+                for idx in range(100):
+                    _ = child_cache.set('key.{}'.format(idx), idx, 0.0, False)
+                _ = child_cache.delete('key.0')
+            finally:
+                os._exit(0)
+
+        _ = os.waitpid(pid, 0)
+
+        self.assertEqual(len(cache), 99)
+        self.assertEqual(cache.get('key.99', cache.default_get, False), 99)
+        self.assertIsNone(cache.get('key.0', cache.default_get, False))
+
+# ################################################################################################################################
+
+    def test_cache_api(self):
+
+        cache_api1 = self._get_cache_api()
+        cache_api2 = self._get_cache_api()
+
+        cache1 = cache_api1.default
+        cache2 = cache_api2.default
+
+        self.to_close.append(cache1.impl)
+
+        # Both workers use the same entries so there is nothing to synchronize
+        self.assertTrue(cache1.is_shared)
+        self.assertFalse(cache1.needs_sync)
+
+        cache1.set('key1', 'value1')
+        self.assertEqual(cache2.get('key1'), 'value1')
+
+        cache2.delete('key1')
+        self.assertIsNone(cache1.get('key1'))
+
+        self.assertEqual(cache_api1._sync_queue, {})
+
+# ################################################################################################################################
+
+    def test_lock_held_by_another_process(self):
+
+        cache = self._get_cache()
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                child_cache = SharedMemoryCache(cache.name, cache.size, cache.max_size)
+                child_cache.open()
+                child_cache._lock_all(LOCK_EX)
+                _ = os.write(write_fd, b'1')
+                sleep(0.3)
+                child_cache._unlock_all()
+            finally:
+                os._exit(0)
+
+        # Wait until the child process holds all the bucket locks ..
+        _ = os.read(read_fd, 1)
+
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(1)
+                sleep(0.01)
+
+        # .. now, setting a key needs to wait for the child ..
+        ticker = spawn(tick)
+        setter = spawn(cache.set, 'key', 'value', 0.0, False)
+        _ = setter.get()
+        ticker.kill()
+
+        _ = os.waitpid(pid, 0)
+        os.close(read_fd)
+        os.close(write_fd)
+
+        # .. but other greenlets could run in the meantime.
+        self.assertGreater(len(ticks), 10)
+        self.assertEqual(cache.get('key', cache.default_get, False), 'value')
+
+# ################################################################################################################################
+
+    def test_cleanup_on_stop(self):
+
+        cache_api1 = self._get_cache_api()
+        cache1 = cache_api1.default
+
+        cache1.set('key1', 'value1')
+
+        # A worker stops but its segment is kept ..
+        cache_api1.cleanup_on_stop()
+        self.assertFalse(cache1.impl._mmap)
+
+        # .. so a worker started in its place sees the same entries ..
+        cache_api2 = self._get_cache_api()
+        cache2 = cache_api2.default
+
+        self.assertEqual(cache2.get('key1'), 'value1')
+        cache_api2.cleanup_on_stop()
+
+        # .. until the arbiter deletes the segments once the whole server stops.
+        server = _Server(self.deployment_key)
+
+        for cache_name in get_shmem_cache_names(server.fs_server_config):
+            unlink_shmem(get_shmem_name(self.deployment_key, cache_name))
+
+        with self.assertRaises(posix_ipc.ExistentialError):
+            _ = posix_ipc.SharedMemory(cache1.impl.name)
+
+        # Segments that do not exist are ignored
+        unlink_shmem(cache1.impl.name)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
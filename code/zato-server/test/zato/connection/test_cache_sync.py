@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Run gevent patches first
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+from base64 import b64decode
+from pickle import loads as pickle_loads
+from unittest import main, TestCase
+from unittest.mock import patch
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import joinall, spawn
+
+# Zato
+from zato.common.api import CACHE
+from zato.server.connection.cache import CacheAPI, ModuleCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from gevent import Greenlet
+    from zato.common.typing_ import any_, anydict, anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _BrokerClient:
+
+    def __init__(self) -> 'None':
+        self.messages = [] # type: anylist
+
+    def publish(self, msg:'anydict') -> 'None':
+        self.messages.append(msg)
+
+# ################################################################################################################################
+
+class _Server:
+
+    def __init__(self, worker_id:'int') -> 'None':
+        self.worker_id = worker_id
+        self.broker_client = _BrokerClient()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CacheSyncTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        # Caches run their callbacks in new greenlets, which is why the tests wait for all of them to complete ..
+        self.callbacks = []
+
+        def _spawn(*args:'any_', **kwargs:'any_') -> 'Greenlet':
+            greenlet = spawn(*args, **kwargs)
+            self.callbacks.append(greenlet)
+            return greenlet
+
+        # .. and they send batches whose window has closed themselves, instead of relying on how long they take to run.
+        patches = [
+            patch('zato.server.connection.cache.spawn', _spawn),
+            patch.object(ModuleCtx, 'Sync_Batch_Window', 3600),
+        ]
+
+        for item in patches:
+            _ = item.start()
+            self.addCleanup(item.stop)
+
+# ################################################################################################################################
+
+    def _get_cache_api(self, worker_id:'int') -> 'CacheAPI':
+
+        cache_api = CacheAPI(_Server(worker_id))
+        cache_api.create(Bunch({
+            'name': 'cache1',
+            'cache_type': CACHE.TYPE.BUILTIN,
+            'is_default': True,
+            'max_size': 100_000,
+            'max_item_size': 10_000,
+            'extend_expiry_on_get': True,
+            'extend_expiry_on_set': True,
+            'sync_method': CACHE.SYNC_METHOD.IN_BACKGROUND.id,
+        }))
+
+        # The greenlet that deletes expired keys runs for as long as the cache does, so it is not waited for
+        self.callbacks.clear()
+
+        return cache_api
+
+# ################################################################################################################################
+
+    def _get_contents(self, cache_api:'CacheAPI') -> 'anydict':
+        cache = cache_api.default
+        return {key: cache.get(key) for key in cache.impl.keys_by_position()}
+
+# ################################################################################################################################
+
+    def _sync(self, source:'CacheAPI', target:'CacheAPI') -> 'anylist':
+
+        # Wait until all the state changes are queued and send the ones that are still waiting for their window to close ..
+        _ = joinall(self.callbacks)
+        source.flush_sync_queue()
+
+        messages = source.server.broker_client.messages # type: ignore
+
+        # .. and apply them in the other process.
+        for msg in messages:
+            target.sync_batch(CACHE.TYPE.BUILTIN, Bunch(msg))
+
+        return messages
+
+# ################################################################################################################################
+
+    def test_state_changes_are_batched(self):
+
+        source = self._get_cache_api(1)
+        target = self._get_cache_api(2)
+
+        cache = source.default
+
+        num_keys = ModuleCtx.Sync_Batch_Max_Size * 3 + 1
+
+        for idx in range(num_keys):
+            _ = cache.set('key.{}'.format(idx), {'idx': idx})
+
+        # Full batches are sent right away ..
+        _ = joinall(self.callbacks)
+        self.assertEqual(len(source.server.broker_client.messages), 3) # type: ignore
+
+        # .. and the last one is sent once its window closes ..
+        messages = self._sync(source, target)
+
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(sum(len(pickle_loads(b64decode(msg['data']))) for msg in messages), num_keys)
+
+        # .. and the other process ends up with the same keys and values.
+        self.assertDictEqual(self._get_contents(target), self._get_contents(source))
+
+# ################################################################################################################################
+
+    def test_state_changes_are_coalesced(self):
+
+        source = self._get_cache_api(1)
+        target = self._get_cache_api(2)
+
+        cache = source.default
+
+        # Only the last one of these is sent ..
+        for idx in range(100):
+            _ = cache.set('key1', idx)
+
+        # .. here, only the delete is sent ..
+        for idx in range(100):
+            _ = cache.set('key2', idx)
+        _ = cache.delete('key2')
+
+        # .. a set with a different expiration time cannot be replaced by the next one ..
+        _ = cache.set('key3', 'value3', 3600)
+        _ = cache.set('key3', 'value3')
+
+        # .. and operations on multiple keys affect what happened to individual keys before them.
+        _ = cache.set('prefix.1', '1')
+        _ = cache.delete_by_prefix('prefix.', return_found=True)
+        _ = cache.set('prefix.1', '2')
+
+        messages = self._sync(source, target)
+        self.assertEqual(len(messages), 1)
+
+        queued = [(op, data['key']) for op, _, data in pickle_loads(b64decode(messages[0]['data']))]
+        self.assertListEqual(queued, [
+            (CACHE.STATE_CHANGED.SET, 'key1'),
+            (CACHE.STATE_CHANGED.DELETE, 'key2'),
+            (CACHE.STATE_CHANGED.SET, 'key3'),
+            (CACHE.STATE_CHANGED.SET, 'key3'),
+            (CACHE.STATE_CHANGED.SET, 'prefix.1'),
+            (CACHE.STATE_CHANGED.DELETE_BY_PREFIX, 'prefix.'),
+            (CACHE.STATE_CHANGED.SET, 'prefix.1'),
+        ])
+
+        self.assertDictEqual(self._get_contents(target), {'key1': 99, 'key3': 'value3', 'prefix.1': '2'})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import main, TestCase
+from unittest.mock import patch
+
+# Zato
+from zato.common.test import rand_string
+from zato.server.connection.kvdb.api import ObjectCtx, ListRepo
+from zato.server.connection.kvdb.core import ModuleCtx
+from zato.server.connection.kvdb.number import NumberRepo
+from zato.server.connection.kvdb.object_ import ObjectRepo
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class JournalTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.base_dir = mkdtemp(prefix='zato-test-kvdb-journal')
+
+    def tearDown(self) -> 'None':
+        rmtree(self.base_dir, ignore_errors=True)
+
+    def get_data_path(self) -> 'str':
+        return os.path.join(self.base_dir, rand_string())
+
+# ################################################################################################################################
+
+    def test_list_repo_replay(self):
+
+        data_path = self.get_data_path()
+        repo = ListRepo(rand_string(), data_path, use_journal=True)
+
+        for idx in range(3):
+            ctx = ObjectCtx()
+            ctx.id = 'id.{}'.format(idx)
+            ctx.data = {'idx': idx}
+            repo.append(ctx)
+
+        repo.delete('id.1')
+        repo.sync_state()
+
+        # Only the journal has been written to ..
+        self.assertFalse(os.path.exists(data_path))
+        self.assertTrue(os.path.getsize(repo.journal_path) > 0)
+
+        # .. and it is enough to restore the data ..
+        repo = ListRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertListEqual([item.id for item in repo.in_ram_store], ['id.0', 'id.2'])
+        self.assertDictEqual(repo.get('id.2').data, {'idx': 2})
+
+        # .. after which a new snapshot exists and the journal is empty.
+        self.assertTrue(os.path.exists(data_path))
+        self.assertEqual(os.path.getsize(repo.journal_path), 0)
+
+# ################################################################################################################################
+
+    def test_list_repo_replay_is_idempotent(self):
+
+        data_path = self.get_data_path()
+        repo = ListRepo(rand_string(), data_path, use_journal=True)
+
+        ctx = ObjectCtx()
+        ctx.id = rand_string()
+        repo.append(ctx)
+        repo.sync_state()
+
+        # Simulate stopping after a snapshot was written but before the journal was emptied
+        with open(repo.journal_path, 'rb') as f:
+            journal = f.read()
+
+        repo.save_data()
+
+        with open(repo.journal_path, 'wb') as f:
+            _ = f.write(journal)
+
+        repo = ListRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertEqual(repo.get_size(), 1)
+
+# ################################################################################################################################
+
+    def test_number_repo_replay(self):
+
+        data_path = self.get_data_path()
+        repo = NumberRepo(rand_string(), data_path, use_journal=True)
+
+        repo.incr('key1')
+        repo.incr('key1')
+        repo.incr('key2', 5)
+        repo.decr('key2')
+        repo.sync_state()
+
+        repo = NumberRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertEqual(repo.get('key1')['value'], 2)
+        self.assertEqual(repo.get('key2')['value'], 4)
+
+# ################################################################################################################################
+
+    def test_object_repo_replay(self):
+
+        data_path = self.get_data_path()
+        repo = ObjectRepo(rand_string(), data_path, use_journal=True)
+
+        repo.set('key1', {'a': 1})
+        repo.set('key2', {'b': 2})
+        repo.delete('key2')
+        repo.sync_state()
+
+        repo = ObjectRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertDictEqual(repo.in_ram_store, {'key1': {'a': 1}})
+
+# ################################################################################################################################
+
+    def test_records_written_without_sync(self):
+
+        data_path = self.get_data_path()
+        repo = NumberRepo(rand_string(), data_path, use_journal=True)
+
+        repo.incr('key1')
+        repo.incr('key1')
+
+        # The process stops before its state is synchronised, yet each change is already in the journal
+        repo = NumberRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertEqual(repo.get('key1')['value'], 2)
+
+        # New changes go to a new journal, after the snapshot that the previous one was replayed into
+        repo.incr('key1')
+
+        repo = NumberRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertEqual(repo.get('key1')['value'], 3)
+
+# ################################################################################################################################
+
+    def test_compaction(self):
+
+        data_path = self.get_data_path()
+        repo = ObjectRepo(rand_string(), data_path, use_journal=True)
+
+        repo.set('key1', {'a': 1})
+        repo.sync_state()
+
+        # The journal is still small, so synchronising the state does not write a snapshot ..
+        self.assertFalse(os.path.exists(data_path))
+
+        # .. but it does once the journal has grown too big ..
+        with patch.object(ModuleCtx, 'Journal_Compact_Min_Size', 0):
+            repo.sync_state()
+
+        self.assertTrue(os.path.exists(data_path))
+        self.assertEqual(os.path.getsize(repo.journal_path), 0)
+
+        # .. after which new records are appended to the emptied journal.
+        repo.set('key2', {'b': 2})
+        self.assertTrue(os.path.getsize(repo.journal_path) > 0)
+
+        repo = ObjectRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertDictEqual(repo.in_ram_store, {'key1': {'a': 1}, 'key2': {'b': 2}})
+
+# ################################################################################################################################
+
+    def test_partial_record_ignored(self):
+
+        data_path = self.get_data_path()
+        repo = ObjectRepo(rand_string(), data_path, use_journal=True)
+
+        repo.set('key1', {'a': 1})
+        repo.sync_state()
+
+        # The process stopped while writing the next record
+        with open(repo.journal_path, 'ab') as f:
+            _ = f.write(b'["set", ["key2"')
+
+        repo = ObjectRepo(rand_string(), data_path, use_journal=True)
+        repo.load_data()
+
+        self.assertDictEqual(repo.in_ram_store, {'key1': {'a': 1}})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
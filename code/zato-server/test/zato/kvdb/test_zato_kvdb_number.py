@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from datetime import datetime, timedelta
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import main, TestCase
+
+# gevent
+from gevent import spawn
+
+# Zato
+from zato.common.test import rand_string
+from zato.server.connection.kvdb.number import NumberRepo
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+num_stripes = 4
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class StripedNumberRepoTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.base_dir = mkdtemp(prefix='zato-test-kvdb-number')
+
+    def tearDown(self) -> 'None':
+        rmtree(self.base_dir, ignore_errors=True)
+
+    def get_repo(self, **kwargs) -> 'NumberRepo':
+        data_path = os.path.join(self.base_dir, rand_string())
+        return NumberRepo(rand_string(), data_path, num_stripes=num_stripes, **kwargs)
+
+# ################################################################################################################################
+
+    def test_incr_decr(self):
+
+        repo = self.get_repo()
+
+        # Changes are not aggregated when they are made so nothing is returned ..
+        self.assertIsNone(repo.incr('key1'))
+        self.assertIsNone(repo.incr('key1', 5))
+        self.assertIsNone(repo.decr('key1', 2))
+
+        # .. but only when a key is read.
+        self.assertEqual(repo.get('key1')['value'], 4)
+        self.assertIsNone(repo.get('key2'))
+
+# ################################################################################################################################
+
+    def test_aggregated_across_stripes(self):
+
+        repo = self.get_repo()
+
+        def incr() -> 'None':
+            for _x in range(10):
+                _ = repo.incr('key')
+
+        greenlets = [spawn(incr) for _x in range(num_stripes * 2)]
+        for greenlet in greenlets:
+            _ = greenlet.get()
+
+        self.assertEqual(repo.get('key')['value'], num_stripes * 2 * 10)
+
+# ################################################################################################################################
+
+    def test_timestamp_formatted_on_read(self):
+
+        repo = self.get_repo()
+        _ = repo.incr('key')
+
+        timestamp = repo.get('key')['last_timestamp']
+        timestamp = datetime.fromisoformat(timestamp)
+
+        self.assertLess(abs(datetime.utcnow() - timestamp), timedelta(seconds=5))
+
+# ################################################################################################################################
+
+    def test_incr_does_no_formatting(self):
+
+        repo = self.get_repo()
+        formatted = []
+
+        def _format_timestamp(monotonic_timestamp_ns:'int') -> 'str':
+            formatted.append(monotonic_timestamp_ns)
+            return ''
+
+        repo._format_timestamp = _format_timestamp
+
+        for _x in range(100):
+            _ = repo.incr('key')
+            _ = repo.decr('key')
+
+        # Nothing was formatted when values were changed ..
+        self.assertListEqual(formatted, [])
+
+        # .. only when one was read.
+        _ = repo.get('key')
+        self.assertEqual(len(formatted), 1)
+
+# ################################################################################################################################
+
+    def test_limits(self):
+
+        repo = self.get_repo(max_value=10, allow_negative=False)
+
+        _ = repo.incr('key1', 100)
+        _ = repo.decr('key2', 100)
+
+        self.assertEqual(repo.get('key1')['value'], 10)
+        self.assertEqual(repo.get('key2')['value'], 0)
+
+# ################################################################################################################################
+
+    def test_sync_state_merges_stripes(self):
+
+        repo = self.get_repo()
+
+        _ = repo.incr('key', 3)
+        repo.sync_state()
+
+        self.assertEqual(repo.current_value['key']['value'], 3)
+
+        # Changes after a merge are added to what has been already merged
+        _ = repo.incr('key', 2)
+        self.assertEqual(repo.get('key')['value'], 5)
+
+        # And what is saved can be loaded back
+        repo.save_data()
+
+        loaded = NumberRepo(rand_string(), repo.data_path, num_stripes=num_stripes)
+        loaded.load_data()
+
+        self.assertEqual(loaded.get('key')['value'], 5)
+
+# ################################################################################################################################
+
+    def test_remove_all(self):
+
+        repo = self.get_repo()
+
+        _ = repo.incr('key')
+        repo.remove_all()
+
+        self.assertIsNone(repo.get('key'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
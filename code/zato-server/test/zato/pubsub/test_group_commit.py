@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Run gevent patches first
+from gevent.monkey import patch_all
+patch_all()
+
+# stdlib
+from unittest import TestCase
+from unittest.mock import patch
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# SQLAlchemy
+from sqlalchemy.exc import IntegrityError
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.server.pubsub.core.group_commit import GDGroupCommitter, GroupCommitError
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Session:
+
+    def __init__(self, commits:'anylist') -> 'None':
+        self.commits = commits
+        self.rows = []
+
+    def commit(self) -> 'None':
+        self.commits.append(self)
+
+    def rollback(self) -> 'None':
+        self.rows[:] = []
+
+    def close(self) -> 'None':
+        pass
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class GDGroupCommitterTestCase(TestCase):
+
+    def _get_ctx(self, topic_id:'int', msg_id:'str', sub_keys:'anylist') -> 'any_':
+        ctx = Bunch()
+        ctx.cid = 'cid.' + msg_id
+        ctx.now = 1.0
+        ctx.topic = Bunch(id=topic_id, name='/topic.{}'.format(topic_id))
+        ctx.gd_msg_list = [{'pub_msg_id': msg_id}]
+        ctx.subscriptions_by_topic = [Bunch(sub_key=sub_key) for sub_key in sub_keys]
+        return ctx
+
+    def _get_committer(self, commits:'anylist', pub_counter:'anylist') -> 'GDGroupCommitter':
+        return GDGroupCommitter(
+            cluster_id = 1,
+            new_session_func = lambda: _Session(commits),
+            get_pub_counter_func = lambda: len(pub_counter),
+            incr_pub_counter_func = lambda: pub_counter.append(1),
+            batch_window = 0.05,
+            max_batch_size = 100,
+        )
+
+# ################################################################################################################################
+
+    def test_concurrent_publications_share_commit(self):
+
+        commits = []
+        pub_counter = []
+        inserted = []
+
+        def _sql_publish_with_retry(**kwargs:'any_') -> 'None':
+            inserted.append((kwargs['topic_id'], [msg['pub_msg_id'] for msg in kwargs['gd_msg_list']]))
+
+        committer = self._get_committer(commits, pub_counter)
+        runner = spawn(committer.run)
+
+        ctx1 = self._get_ctx(1, 'msg1', ['sk.1'])
+        ctx2 = self._get_ctx(1, 'msg2', ['sk.1'])
+        ctx3 = self._get_ctx(2, 'msg3', ['sk.2'])
+
+        with patch('zato.server.pubsub.core.group_commit.sql_publish_with_retry', _sql_publish_with_retry):
+            greenlets = [spawn(committer.publish, ctx) for ctx in (ctx1, ctx2, ctx3)]
+            _ = joinall(greenlets, raise_error=True)
+
+        committer.stop()
+        runner.join(1)
+
+        # All the publications went through a single commit ..
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(len(pub_counter), 3)
+
+        # .. with messages for the same topic and subscribers inserted together.
+        self.assertEqual(sorted(inserted), [(1, ['msg1', 'msg2']), (2, ['msg3'])])
+
+# ################################################################################################################################
+
+    def test_failed_group_commit_rejects_offending_publication_only(self):
+
+        commits = []
+        pub_counter = []
+
+        def _sql_publish_with_retry(**kwargs:'any_') -> 'None':
+            for msg in kwargs['gd_msg_list']:
+                if msg['pub_msg_id'] == 'msg.bad':
+                    raise ValueError('Duplicate message')
+
+        committer = self._get_committer(commits, pub_counter)
+        runner = spawn(committer.run)
+
+        ctx_ok = self._get_ctx(1, 'msg.ok', ['sk.1'])
+        ctx_bad = self._get_ctx(1, 'msg.bad', ['sk.1'])
+
+        with patch('zato.server.pubsub.core.group_commit.sql_publish_with_retry', _sql_publish_with_retry):
+            greenlet_ok = spawn(committer.publish, ctx_ok)
+            greenlet_bad = spawn(committer.publish, ctx_bad)
+            _ = joinall([greenlet_ok, greenlet_bad])
+
+        committer.stop()
+        runner.join(1)
+
+        self.assertTrue(greenlet_ok.successful())
+        self.assertIsInstance(greenlet_bad.exception, ValueError)
+
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(len(pub_counter), 1)
+
+# ################################################################################################################################
+
+    def test_retry_in_shared_transaction_commits_one_by_one(self):
+
+        commits = []
+        pub_counter = []
+        failed = []
+
+        def _sql_publish_with_retry(**kwargs:'any_') -> 'None':
+            session = kwargs['session']
+
+            while True:
+                kwargs['before_queue_insert_func'](None, [])
+
+                # The second group raises IntegrityError once ..
+                try:
+                    if kwargs['topic_id'] == 2 and not failed:
+                        failed.append(True)
+                        raise IntegrityError('insert', {}, Exception('Deadlock'))
+
+                # .. which, as in the SQL layer, means that the whole transaction was rolled back
+                # and that this group's rows need to be inserted again.
+                except IntegrityError:
+                    session.rollback()
+                    continue
+
+                break
+
+            session.rows.extend(msg['pub_msg_id'] for msg in kwargs['gd_msg_list'])
+
+        committer = self._get_committer(commits, pub_counter)
+        runner = spawn(committer.run)
+
+        ctx1 = self._get_ctx(1, 'msg1', ['sk.1'])
+        ctx2 = self._get_ctx(2, 'msg2', ['sk.2'])
+
+        with patch('zato.server.pubsub.core.group_commit.sql_publish_with_retry', _sql_publish_with_retry):
+            greenlets = [spawn(committer.publish, ctx) for ctx in (ctx1, ctx2)]
+            _ = joinall(greenlets, raise_error=True)
+
+        committer.stop()
+        runner.join(1)
+
+        # The shared transaction was given up on and each publication was committed in a session of its own ..
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(len(pub_counter), 2)
+
+        # .. which is why no rows were lost in the rollback.
+        self.assertListEqual(sorted(row for session in commits for row in session.rows), ['msg1', 'msg2'])
+
+# ################################################################################################################################
+
+    def test_stop_rejects_pending_publications(self):
+
+        commits = []
+        pub_counter = []
+
+        # The committing greenlet is not running so nothing will be taken off the queue
+        committer = self._get_committer(commits, pub_counter)
+
+        greenlet_pending = spawn(committer.publish, self._get_ctx(1, 'msg1', ['sk.1']))
+        sleep(0.01)
+
+        committer.stop()
+        _ = joinall([greenlet_pending], timeout=1)
+
+        self.assertIsInstance(greenlet_pending.exception, GroupCommitError)
+
+        # Publications made after the committer was stopped are rejected immediately
+        with self.assertRaises(GroupCommitError):
+            committer.publish(self._get_ctx(1, 'msg2', ['sk.1']))
+
+        self.assertListEqual(commits, [])
+
+# ################################################################################################################################
+
+    def test_publish_timeout(self):
+
+        committer = self._get_committer([], [])
+        committer.publish_timeout = 0.01
+
+        with self.assertRaises(GroupCommitError):
+            committer.publish(self._get_ctx(1, 'msg1', ['sk.1']))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    from unittest import main
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Run gevent patches first
+from gevent.monkey import patch_all
+patch_all()
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.server.pubsub.sync import InRAMSync
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import anydict
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InRAMSyncShardsTestCase(TestCase):
+
+    def _get_sync(self, shard_count:'int'=4) -> 'InRAMSync':
+        pubsub = Bunch()
+        pubsub.server = Bunch()
+        pubsub.server.name = 'server1'
+        pubsub.server.pid = 123
+
+        return InRAMSync(pubsub, shard_count) # type: ignore
+
+    def _get_msg(self, msg_id:'str', topic_id:'int') -> 'anydict':
+        return {
+            'pub_msg_id': msg_id,
+            'topic_id': topic_id,
+            'pub_time': '1.0',
+            'expiration_time': 123456789123456789,
+        }
+
+# ################################################################################################################################
+
+    def test_topics_in_different_shards(self):
+
+        sync = self._get_sync(shard_count=4)
+
+        topic_id1 = 1
+        topic_id2 = 2
+
+        shard1 = sync.get_shard_by_topic_id(topic_id1)
+        shard2 = sync.get_shard_by_topic_id(topic_id2)
+
+        self.assertIsNot(shard1, shard2)
+        self.assertIsNot(shard1.lock, shard2.lock)
+
+        sync.add_messages('cid1', topic_id1, '/topic1', 100, ['sk.1'], [self._get_msg('msg1', topic_id1)])
+        sync.add_messages('cid2', topic_id2, '/topic2', 100, ['sk.2'], [self._get_msg('msg2', topic_id2)])
+
+        self.assertIn('msg1', shard1.msg_id_to_msg)
+        self.assertNotIn('msg1', shard2.msg_id_to_msg)
+
+        self.assertIn('msg2', shard2.msg_id_to_msg)
+        self.assertNotIn('msg2', shard1.msg_id_to_msg)
+
+        self.assertTrue(sync.has_messages_by_sub_key('sk.1'))
+        self.assertTrue(sync.has_messages_by_sub_key('sk.2'))
+        self.assertFalse(sync.has_messages_by_sub_key('sk.3'))
+
+        self.assertEqual(sync.get_topic_depth(topic_id1), 1)
+        self.assertEqual(sync.get_topic_depth(topic_id2), 1)
+
+        self.assertEqual(sync.get_message_by_id('msg2')['topic_id'], topic_id2)
+
+# ################################################################################################################################
+
+    def test_retrieve_and_delete(self):
+
+        sync = self._get_sync()
+
+        topic_id = 1
+        messages = [self._get_msg('msg1', topic_id), self._get_msg('msg2', topic_id)]
+
+        sync.add_messages('cid1', topic_id, '/topic1', 100, ['sk.1'], messages)
+        sync.delete_msg_by_id('msg1')
+
+        self.assertEqual(sync.get_topic_depth(topic_id), 1)
+
+        out = sync.retrieve_messages_by_sub_keys(topic_id, ['sk.1'])
+
+        self.assertEqual(len(out), 1)
+        self.assertEqual(out[0]['pub_msg_id'], 'msg2')
+
+        self.assertEqual(sync.get_topic_depth(topic_id), 0)
+        self.assertFalse(sync.has_messages_by_sub_key('sk.1'))
+
+# ################################################################################################################################
+
+    def test_unsubscribe(self):
+
+        sync = self._get_sync()
+
+        topic_id = 1
+        sync.add_messages('cid1', topic_id, '/topic1', 100, ['sk.1', 'sk.2'], [self._get_msg('msg1', topic_id)])
+
+        sync.unsubscribe(topic_id, '/topic1', ['sk.1'])
+        self.assertEqual(sync.get_topic_depth(topic_id), 1)
+
+        sync.unsubscribe(topic_id, '/topic1', ['sk.2'])
+        self.assertEqual(sync.get_topic_depth(topic_id), 0)
+
+        with self.assertRaises(KeyError):
+            _ = sync.get_message_by_id('msg1')
+
+# ################################################################################################################################
+
+    def test_shard_indexes(self):
+
+        sync = self._get_sync()
+
+        topic_id1 = 1
+        topic_id2 = 2
+
+        shard1 = sync.get_shard_by_topic_id(topic_id1)
+        shard2 = sync.get_shard_by_topic_id(topic_id2)
+
+        sync.add_messages('cid1', topic_id1, '/topic1', 100, ['sk.1'], [self._get_msg('msg1', topic_id1)])
+        sync.add_messages('cid2', topic_id2, '/topic2', 100, ['sk.2', 'sk.3'],
+            [self._get_msg('msg2', topic_id2), self._get_msg('msg3', topic_id2)])
+
+        # Messages and sub_keys are found in their shards without looking at any other shard ..
+        self.assertDictEqual(sync.msg_id_to_shard, {'msg1': shard1, 'msg2': shard2, 'msg3': shard2})
+        self.assertDictEqual(sync.sub_key_to_shard, {'sk.1': shard1, 'sk.2': shard2, 'sk.3': shard2})
+
+        # .. and they are no longer found once they have been deleted, ..
+        sync.delete_msg_by_id('msg1')
+        self.assertNotIn('msg1', sync.msg_id_to_shard)
+
+        # .. retrieved, ..
+        _ = sync.get_delete_messages_by_sub_keys(topic_id2, ['sk.2'], delete_sub=True)
+        self.assertDictEqual(sync.msg_id_to_shard, {})
+        self.assertNotIn('sk.2', sync.sub_key_to_shard)
+
+        # .. or unsubscribed.
+        sync.unsubscribe(topic_id2, '/topic2', ['sk.3'])
+        self.assertDictEqual(sync.sub_key_to_shard, {'sk.1': shard1})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    from unittest import main
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -13,6 +13,9 @@ patch_all()
 # stdlib
 from unittest import TestCase
 
+# gevent
+from gevent import sleep, spawn
+
 # Zato
 from zato.common.api import PUBSUB
 from zato.common.test import TestServer
@@ -22,38 +25,36 @@ from zato.server.pubsub import PubSub
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import stranydict
+    from zato.common.typing_ import any_, intnone, stranydict
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 class TriggerNotifyPubSubTasksTestCase(TestCase):
 
-    def _run_sync(
+    sub_key = 'sk.123'
+    topic_id = 222
+    topic_name = '/my.topic'
+
+# ################################################################################################################################
+
+    def _get_pubsub(
         self,
-        needs_gd:'bool',
-        needs_non_gd:'bool',
-        gd_pub_time_max:'float',
-        non_gd_pub_time:'float',
-    ) -> 'stranydict':
+        server:'TestServer',
+        sync_max_iters:'intnone'=1,
+        needs_sub:'bool'=True,
+    ) -> 'PubSub':
 
-        cid = '987'
-        cluster_id = 123
-        server = TestServer()
         broker_client = None
 
-        sub_key = 'sk.123'
-        topic_id = 222
-        topic_name = '/my.topic'
+        sub_key = self.sub_key
+        topic_id = self.topic_id
+        topic_name = self.topic_name
         endpoint_id = 1
         ws_channel_id = 2
         cluster_id = 12345
         endpoint_type = PUBSUB.ENDPOINT_TYPE.WEB_SOCKETS.id
 
-        # This is used by the one-element non-GD messages
-        non_gd_pub_msg_id = 'aaa.bbb.111'
-        non_gd_expiration_time = 123456789123456789
-
         topic_config = {
             'id': topic_id,
             'name': topic_name,
@@ -101,9 +102,9 @@ class TriggerNotifyPubSubTasksTestCase(TestCase):
             'is_active': True,
             'is_internal': True,
             'security_id': None,
+            'service_id': None,
         }
 
-        sync_max_iters = 1
         spawn_trigger_notify = False
 
         ps = PubSub(
@@ -115,8 +116,44 @@ class TriggerNotifyPubSubTasksTestCase(TestCase):
 
         ps.create_topic_object(topic_config)
         ps.create_endpoint(endpoint_config)
-        ps.add_subscription(sub_config)
-        ps.set_sub_key_server(sk_server_config)
+
+        # Tests may subscribe to the topic only later on
+        self.sub_config = sub_config
+        self.sk_server_config = sk_server_config
+
+        if needs_sub:
+            self._subscribe(ps)
+
+        return ps
+
+# ################################################################################################################################
+
+    def _subscribe(self, ps:'PubSub') -> 'None':
+        ps.add_subscription(self.sub_config)
+        ps.set_sub_key_server(self.sk_server_config)
+
+# ################################################################################################################################
+
+    def _run_sync(
+        self,
+        needs_gd:'bool',
+        needs_non_gd:'bool',
+        gd_pub_time_max:'float',
+        non_gd_pub_time:'float',
+    ) -> 'stranydict':
+
+        cid = '987'
+        server = TestServer()
+
+        sub_key = self.sub_key
+        topic_id = self.topic_id
+        topic_name = self.topic_name
+
+        # This is used by the one-element non-GD messages
+        non_gd_pub_msg_id = 'aaa.bbb.111'
+        non_gd_expiration_time = 123456789123456789
+
+        ps = self._get_pubsub(server)
 
         # Optionally, set a flag to signal that a GD message is available
         if needs_gd:
@@ -138,8 +175,9 @@ class TriggerNotifyPubSubTasksTestCase(TestCase):
             }]
             ps.store_in_ram(cid, topic_id, topic_name, sub_keys, non_gd_msg_list)
 
-        # Trigger a sync call ..
-        ps.trigger_notify_pubsub_tasks()
+        # Trigger a sync call and let the service it invokes in background run ..
+        ps.notify_pub_sub_tasks_trigger.run()
+        sleep(0)
 
         # .. and return the dictionary with context data to our caller.
         return server.ctx
@@ -218,6 +256,119 @@ class TriggerNotifyPubSubTasksTestCase(TestCase):
         pub_time_max = ctx['request']['pub_time_max']
         self.assertEqual(pub_time_max, non_gd_pub_time)
 
+# ################################################################################################################################
+
+    def _publish(self, ps:'PubSub') -> 'None':
+        ps.set_sync_has_msg(
+            topic_id = self.topic_id,
+            is_gd = True,
+            value = True,
+            source = 'test_trigger',
+            gd_pub_time_max = 1.0
+        )
+
+# ################################################################################################################################
+
+    def test_trigger_wakes_up_on_publication(self):
+
+        server = TestServer()
+        ps = self._get_pubsub(server, sync_max_iters=None)
+        trigger = spawn(ps.notify_pub_sub_tasks_trigger.run)
+
+        # Nothing is published so the trigger does not notify anyone ..
+        sleep(0.05)
+        self.assertDictEqual(server.ctx, {})
+
+        # .. until a message is published ..
+        self._publish(ps)
+        sleep(0.05)
+
+        self.assertEqual(server.ctx['service'], 'zato.pubsub.after-publish')
+        self.assertEqual(server.ctx['request']['topic_name'], self.topic_name)
+
+        # .. and stopping pub/sub stops the trigger too.
+        ps.stop()
+        trigger.join(1)
+        self.assertTrue(trigger.dead)
+
+# ################################################################################################################################
+
+    def test_idle_topic_is_not_looked_at(self):
+
+        server = TestServer()
+        ps = self._get_pubsub(server, sync_max_iters=None)
+        trigger = spawn(ps.notify_pub_sub_tasks_trigger.run)
+
+        # Only topics marked as dirty by publishers are synced so setting the flag directly does not notify anyone
+        ps.topic_api.get_topic_by_id(self.topic_id).sync_has_gd_msg = True
+        sleep(0.05)
+
+        self.assertDictEqual(server.ctx, {})
+
+        ps.stop()
+        trigger.join(1)
+        self.assertTrue(trigger.dead)
+
+# ################################################################################################################################
+
+    def test_topic_without_subscribers_stays_dirty(self):
+
+        server = TestServer()
+        ps = self._get_pubsub(server, sync_max_iters=None, needs_sub=False)
+        trigger = spawn(ps.notify_pub_sub_tasks_trigger.run)
+
+        # There is no one to notify so the topic is kept for later ..
+        self._publish(ps)
+        sleep(0.05)
+
+        self.assertDictEqual(server.ctx, {})
+        self.assertSetEqual(ps.notify_pub_sub_tasks_trigger.dirty_topic_ids, {self.topic_id})
+
+        # .. and its subscribers are notified once there are any, without having to publish anything else.
+        self._subscribe(ps)
+        sleep(0.05)
+
+        self.assertEqual(server.ctx['request']['topic_name'], self.topic_name)
+        self.assertSetEqual(ps.notify_pub_sub_tasks_trigger.dirty_topic_ids, set())
+
+        ps.stop()
+        trigger.join(1)
+        self.assertTrue(trigger.dead)
+
+# ################################################################################################################################
+
+    def test_topic_is_retried_after_error(self):
+
+        server = TestServer()
+        ps = self._get_pubsub(server, sync_max_iters=None)
+
+        trigger = ps.notify_pub_sub_tasks_trigger
+        get_delete_messages = trigger.sync_backlog_get_delete_messages_by_sub_keys_func
+
+        calls = []
+
+        def get_delete_messages_by_sub_keys(*args:'any_') -> 'any_':
+            calls.append(args)
+            if len(calls) == 1:
+                raise Exception('Test exception')
+            return get_delete_messages(*args)
+
+        trigger.sync_backlog_get_delete_messages_by_sub_keys_func = get_delete_messages_by_sub_keys
+        greenlet = spawn(trigger.run)
+
+        # The first sync fails ..
+        self._publish(ps)
+        sleep(0.05)
+
+        # .. but the topic is not forgotten and its subscribers are notified in a later iteration.
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertEqual(server.ctx['request']['topic_name'], self.topic_name)
+        self.assertSetEqual(trigger.dirty_topic_ids, set())
+
+        ps.stop()
+        greenlet.join(1)
+        self.assertTrue(greenlet.dead)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import logging
+from datetime import datetime, timedelta
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep
+
+# pytz
+from pytz import timezone
+
+# Zato
+from zato.server.base.parallel.http import AccessLogWriter
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _ListHandler(logging.Handler):
+    def __init__(self) -> 'None':
+        super().__init__()
+        self.records = []
+
+    def emit(self, record:'logging.LogRecord') -> 'None':
+        self.records.append(record)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class AccessLogWriterTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.handler = _ListHandler()
+        self.access_logger = logging.getLogger('zato_access_log.test')
+        self.access_logger.propagate = False
+        self.access_logger.addHandler(self.handler)
+
+    def tearDown(self) -> 'None':
+        self.access_logger.removeHandler(self.handler)
+
+    def get_item(self, cid:'str', request_ts_utc:'datetime') -> 'tuple':
+        return (
+            '127.0.0.1',
+            cid,
+            timedelta(milliseconds=12),
+            'my.channel',
+            request_ts_utc,
+            'POST',
+            '/my/path',
+            'HTTP/1.1',
+            '200',
+            123,
+            'my-user-agent',
+        )
+
+# ################################################################################################################################
+
+    def test_entries_written_in_background(self):
+
+        writer = AccessLogWriter(self.access_logger, timezone('Europe/Prague'), interval=0.01)
+        request_ts_utc = datetime(2023, 1, 2, 3, 4, 5, 678)
+
+        for idx in range(3):
+            writer.enqueue(self.get_item('cid.{}'.format(idx), request_ts_utc))
+
+        # Nothing is written on the request path ..
+        self.assertListEqual(self.handler.records, [])
+
+        # .. only by the writer in background.
+        sleep(0.05)
+
+        records = self.handler.records
+        self.assertEqual(len(records), 3)
+
+        record = records[0]
+
+        self.assertEqual(record.cid_resp_time, 'cid.0/0.012')
+        self.assertEqual(record.req_timestamp_utc, '02/Jan/2023:03:04:05 ')
+        self.assertEqual(record.req_timestamp, '02/Jan/2023:04:04:05 +0100')
+        self.assertEqual(record.method, 'POST')
+        self.assertEqual(record.path, '/my/path')
+        self.assertEqual(record.status_code, '200')
+        self.assertEqual(record.response_size, 123)
+        self.assertEqual(record.user_agent, 'my-user-agent')
+
+# ################################################################################################################################
+
+    def test_timestamps_per_second(self):
+
+        writer = AccessLogWriter(self.access_logger, timezone('UTC'))
+        request_ts_utc = datetime(2023, 1, 2, 3, 4, 5, 678)
+
+        writer.pending.append(self.get_item('cid.1', request_ts_utc))
+        writer.pending.append(self.get_item('cid.2', request_ts_utc + timedelta(milliseconds=100)))
+        writer.pending.append(self.get_item('cid.3', request_ts_utc + timedelta(seconds=1)))
+        writer.flush()
+
+        timestamps = [record.req_timestamp for record in self.handler.records]
+
+        self.assertListEqual(timestamps, [
+            '02/Jan/2023:03:04:05 +0000',
+            '02/Jan/2023:03:04:05 +0000',
+            '02/Jan/2023:03:04:06 +0000',
+        ])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from hashlib import blake2b, sha256
+from unittest import main, skipIf, TestCase
+from unittest.mock import patch
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common.api import CACHE
+from zato.common.json_internal import dumps
+from zato.server.connection.http_soap import channel
+from zato.server.connection.http_soap.channel import RequestHandler
+from zato.server.service.internal.http_soap import _CreateEdit
+
+try:
+    from xxhash import xxh3_128_hexdigest
+except ImportError:
+    xxh3_128_hexdigest = None
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Server:
+
+    def __init__(self) -> 'None':
+        self.cache = {} # type: anydict
+
+    def get_from_cache(self, cache_type:'str', cache_name:'str', key:'str') -> 'any_':
+        return self.cache.get((cache_type, cache_name, key))
+
+    def set_in_cache(self, cache_type:'str', cache_name:'str', key:'str', value:'any_') -> 'None':
+        self.cache[(cache_type, cache_name, key)] = value
+
+# ################################################################################################################################
+
+class _Service:
+    get_request_hash = None
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ResponseCacheTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.server = _Server()
+        self.handler = RequestHandler(self.server) # type: ignore
+        self.wsgi_environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/my/api'}
+        self.channel_params = {'bbb': '222', 'aaa': '111'}
+
+# ################################################################################################################################
+
+    def get_channel_item(self, cache_key_type:'str'='') -> 'anydict':
+        return {
+            'id': 123,
+            'cache_type': CACHE.TYPE.BUILTIN,
+            'cache_name': 'my.cache',
+            'cache_key_type': cache_key_type,
+        }
+
+# ################################################################################################################################
+
+    def get_response(self, channel_item:'anydict', raw_request:'str'='{"customer_id":"123"}') -> 'any_':
+        return self.handler.get_response_from_cache(
+            _Service(), raw_request, channel_item, self.channel_params, self.wsgi_environ) # type: ignore
+
+# ################################################################################################################################
+
+    def test_round_trip(self):
+
+        channel_item = self.get_channel_item()
+        key, response = self.get_response(channel_item)
+
+        # There is nothing cached yet ..
+        self.assertIsNone(response)
+
+        headers = {'X-My-Header': 'my-value'}
+        self.handler.set_response_in_cache(channel_item, key, Bunch({
+            'payload': '{"name":"ąę"}',
+            'content_type': 'application/json',
+            'headers': headers,
+            'status_code': 200,
+        }))
+
+        # .. responses are stored ready to be sent ..
+        cached = self.server.cache[(CACHE.TYPE.BUILTIN, 'my.cache', key)]
+        self.assertEqual(cached, ('{"name":"ąę"}'.encode('utf8'), 'application/json', headers, 200))
+
+        # .. and they are returned as they were stored.
+        _, response = self.get_response(channel_item)
+
+        self.assertEqual(response.payload, '{"name":"ąę"}'.encode('utf8'))
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertDictEqual(response.headers, headers)
+        self.assertEqual(response.status_code, 200)
+
+# ################################################################################################################################
+
+    def test_legacy_json_entry(self):
+
+        channel_item = self.get_channel_item()
+        key, _ = self.get_response(channel_item)
+
+        # This is how responses were cached by previous versions
+        self.server.set_in_cache(CACHE.TYPE.BUILTIN, 'my.cache', key, dumps({
+            'payload': '{"name":"my.name"}',
+            'content_type': 'application/json',
+            'headers': {'X-My-Header': 'my-value'},
+            'status_code': 201,
+        }))
+
+        _, response = self.get_response(channel_item)
+
+        self.assertEqual(response.payload, '{"name":"my.name"}')
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertDictEqual(response.headers, {'X-My-Header': 'my-value'})
+        self.assertEqual(response.status_code, 201)
+
+# ################################################################################################################################
+
+    def test_key_types(self):
+
+        prefix = 'http-channel-123-'
+
+        def get_keys(cache_key_type:'str') -> 'tuple[str, str]':
+            channel_item = self.get_channel_item(cache_key_type)
+            key1, _ = self.get_response(channel_item, '{"customer_id":"123"}')
+            key2, _ = self.get_response(channel_item, '{"customer_id":"456"}')
+            return key1, key2
+
+        default1, default2 = get_keys('')
+        sha1, sha2 = get_keys(CACHE.HTTP_KEY_TYPE.SHA256)
+        fast1, fast2 = get_keys(CACHE.HTTP_KEY_TYPE.FAST_HASH)
+        no_payload1, no_payload2 = get_keys(CACHE.HTTP_KEY_TYPE.NO_PAYLOAD)
+
+        # The default type is sha256, which keeps the previous format of keys ..
+        self.assertEqual(default1, sha1)
+        self.assertTrue(sha1.startswith(prefix))
+
+        data = "POST/my/api[('aaa', '111'), ('bbb', '222')]{\"customer_id\":\"123\"}"
+        hash_value = sha256(data.encode('utf8')).hexdigest()
+
+        self.assertEqual(sha1, prefix + '-'.join(hash_value[idx:idx + 8] for idx in range(0, 64, 8)))
+
+        # .. a fast hash is 128-bit and it depends on the payload ..
+        self.assertTrue(fast1.startswith(prefix))
+        self.assertEqual(len(fast1), len(prefix) + 32)
+
+        # .. unlike a hash without the payload, which is still specific to the query string.
+        self.assertEqual(no_payload1, no_payload2)
+        self.assertEqual(len(no_payload1), len(prefix) + 32)
+
+        self.assertEqual(len({sha1, sha2, fast1, fast2, no_payload1}), 5)
+
+        self.channel_params = {'aaa': '111'}
+        no_payload3, _ = get_keys(CACHE.HTTP_KEY_TYPE.NO_PAYLOAD)
+
+        self.assertNotEqual(no_payload1, no_payload3)
+
+# ################################################################################################################################
+
+    def test_fast_hash_without_xxhash(self):
+
+        channel_item = self.get_channel_item(CACHE.HTTP_KEY_TYPE.FAST_HASH)
+        data = b"POST\x00/my/api\x00[('aaa', '111'), ('bbb', '222')]\x00" + b'{"customer_id":"123"}'
+
+        with patch.object(channel, 'xxh3_128_hexdigest', None):
+            key, _ = self.get_response(channel_item)
+
+        self.assertEqual(key, 'http-channel-123-' + blake2b(data, digest_size=16).hexdigest())
+
+# ################################################################################################################################
+
+    @skipIf(not xxh3_128_hexdigest, 'xxhash is not installed')
+    def test_fast_hash_with_xxhash(self):
+
+        channel_item = self.get_channel_item(CACHE.HTTP_KEY_TYPE.FAST_HASH)
+        data = b"POST\x00/my/api\x00[('aaa', '111'), ('bbb', '222')]\x00" + b'{"customer_id":"123"}'
+
+        with patch.object(channel, 'xxh3_128_hexdigest', xxh3_128_hexdigest):
+            key, _ = self.get_response(channel_item)
+
+        self.assertEqual(key, 'http-channel-123-' + xxh3_128_hexdigest(data)) # type: ignore
+
+# ################################################################################################################################
+
+    def test_key_type_is_validated(self):
+
+        for cache_key_type in ('',) + CACHE.HTTP_KEY_TYPE.ALL:
+            _CreateEdit._validate_cache_key_type(None, Bunch({'cache_key_type': cache_key_type})) # type: ignore
+
+        with self.assertRaises(Exception) as ctx:
+            _CreateEdit._validate_cache_key_type(None, Bunch({'cache_key_type': 'md5'})) # type: ignore
+
+        self.assertEqual(ctx.exception.args[0], 'Cache key type must be empty or one of `sha256`, `fast-hash`, `no-payload`')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Run gevent patches first
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+from time import time
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep
+
+# Zato
+from zato.common.typing_ import cast_
+from zato.server.connection.server.rpc.api import ConfigCtx, ServerRPC
+from zato.server.connection.server.rpc.invoker import ServerInvoker
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anylist, generator_
+    from zato.server.base.parallel import ParallelServer
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _ServerInvoker(ServerInvoker):
+
+    def __init__(self, server_name:'str', delay:'float'=0.0, exception:'Exception | None'=None) -> 'None':
+        super().__init__(cast_('ParallelServer', None), 'cluster1', server_name)
+        self.delay = delay
+        self.exception = exception
+
+    def invoke_all_pids(self, *args:'any_', **kwargs:'any_') -> 'anylist':
+
+        sleep(self.delay)
+
+        if self.exception:
+            raise self.exception
+
+        return [{'server_name': self.server_name}]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _ConfigCtx(ConfigCtx):
+
+    def __init__(self, invokers:'anylist') -> 'None':
+        self.invokers = invokers
+        self.populated = 0
+
+    def get_remote_server_invoker_list(self) -> 'generator_[ServerInvoker, None, None]':
+        self.populated += 1
+        for invoker in self.invokers:
+            yield invoker
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InvokeAllTestCase(TestCase):
+
+    def _get_server_rpc(self, invokers:'anylist') -> 'tuple[ServerRPC, _ConfigCtx]':
+
+        config_ctx = _ConfigCtx(invokers)
+        config_ctx.config_source = cast_('any_', type('ConfigSource', (), {'current_cluster_name': 'cluster1'}))
+
+        return ServerRPC(config_ctx), config_ctx
+
+# ################################################################################################################################
+
+    def test_invokers_are_cached_until_invalidated(self):
+
+        rpc, config_ctx = self._get_server_rpc([_ServerInvoker('server1'), _ServerInvoker('server2')])
+
+        for _ in range(3):
+            result = rpc.invoke_all('my.service')
+            self.assertTrue(result.is_ok)
+
+        self.assertEqual(config_ctx.populated, 1)
+
+        # A server was deleted ..
+        config_ctx.invokers.pop()
+        rpc.invalidate_invokers()
+
+        # .. so it is no longer invoked.
+        result = rpc.invoke_all('my.service')
+
+        self.assertEqual(config_ctx.populated, 2)
+        self.assertEqual(result.data, [{'server_name': 'server1'}])
+
+# ################################################################################################################################
+
+    def test_servers_are_invoked_concurrently(self):
+
+        rpc, _ = self._get_server_rpc([_ServerInvoker('server{}'.format(idx), delay=0.2) for idx in range(10)])
+
+        start = time()
+        result = rpc.invoke_all('my.service')
+
+        self.assertLess(time() - start, 1)
+        self.assertEqual(result.data, [{'server_name': 'server{}'.format(idx)} for idx in range(10)])
+
+# ################################################################################################################################
+
+    def test_failed_and_slow_servers(self):
+
+        rpc, config_ctx = self._get_server_rpc([
+            _ServerInvoker('server1'),
+            _ServerInvoker('server2', exception=ValueError('Server error')),
+            _ServerInvoker('server3', delay=5),
+        ])
+
+        start = time()
+        result = rpc.invoke_all('my.service', timeout=0.1)
+
+        # A slow server does not delay the others beyond the timeout ..
+        self.assertLess(time() - start, 4)
+
+        # .. responses from servers that replied are returned ..
+        self.assertFalse(result.is_ok)
+        self.assertEqual(result.data, [{'server_name': 'server1'}])
+
+        # .. along with details of what happened to the other ones ..
+        self.assertIn('Server error', result.errors['server2'])
+        self.assertIn('No response', result.errors['server3'])
+
+        # .. and the list of servers will be read again next time.
+        _ = rpc.get_invoker_list()
+        self.assertEqual(config_ctx.populated, 2)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
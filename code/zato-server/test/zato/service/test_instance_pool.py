@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2024, Zato Source s.r.o. https://zato.io
+
+Licensed under AGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+from unittest.mock import MagicMock
+
+# Zato
+from zato.server.service import Service
+from zato.server.service.store import ServiceStore
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PooledService(Service):
+    pool_instances = True
+
+    kvdb = MagicMock()
+    _worker_store = MagicMock()
+    _worker_config = MagicMock()
+    _out_ftp = MagicMock()
+    _out_plain_http = MagicMock()
+
+    component_enabled_sms = False
+    component_enabled_hl7 = False
+    component_enabled_ibm_mq = False
+    component_enabled_zeromq = False
+
+# ################################################################################################################################
+
+class NotPooledService(PooledService):
+    pool_instances = False
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InstancePoolTestCase(TestCase):
+
+    def _get_store(self, *service_classes:'type[Service]') -> 'ServiceStore':
+
+        store = ServiceStore(services={}, odb=None, server=MagicMock(), is_testing=False) # type: ignore
+
+        for service_class in service_classes:
+            service_class._Service__service_name = service_class.__name__      # type: ignore
+            service_class._Service__service_impl_name = service_class.__name__ # type: ignore
+
+            store.services[service_class.__name__] = {
+                'service_class': service_class,
+                'is_active': True,
+                'instance_pool': [],
+            }
+
+        return store
+
+# ################################################################################################################################
+
+    def test_facades_are_lazy(self):
+
+        store = self._get_store(PooledService)
+        service, _ = store.new_instance('PooledService')
+
+        self.assertNotIn('out', service.__dict__)
+        self.assertNotIn('rest', service.__dict__)
+        self.assertNotIn('security', service.__dict__)
+
+        service.cid = 'cid.1'
+
+        self.assertIs(service.out, service.outgoing)
+        self.assertEqual(service.rest.cid, 'cid.1')
+
+# ################################################################################################################################
+
+    def test_instance_is_reused_and_reset(self):
+
+        store = self._get_store(PooledService)
+
+        service1, _ = store.new_instance('PooledService')
+        service1.cid = 'cid.1'
+        service1.my_attr = 123 # type: ignore
+
+        out = service1.out
+        rest = service1.rest
+
+        store.release_instance(service1)
+        service2, _ = store.new_instance('PooledService')
+
+        # This is the same instance ..
+        self.assertIs(service1, service2)
+
+        # .. without any state from the previous invocation ..
+        self.assertEqual(service2.cid, '')
+        self.assertFalse(hasattr(service2, 'my_attr'))
+
+        # .. and its facades are either kept, if they do not depend on the invocation, or created anew.
+        self.assertIs(service2.out, out)
+        self.assertIsNot(service2.rest, rest)
+
+        # No idle instances are left now
+        service3, _ = store.new_instance('PooledService')
+        self.assertIsNot(service3, service2)
+
+# ################################################################################################################################
+
+    def test_instance_is_not_reused(self):
+
+        store = self._get_store(PooledService, NotPooledService)
+
+        # The class does not allow it ..
+        service, _ = store.new_instance('NotPooledService')
+        store.release_instance(service)
+        self.assertEqual(store.services['NotPooledService']['instance_pool'], [])
+
+        # .. the instance does not allow it ..
+        service, _ = store.new_instance('PooledService')
+        service.pool_instances = False
+        store.release_instance(service)
+        self.assertEqual(store.services['PooledService']['instance_pool'], [])
+
+        # .. or the service was redeployed in the meantime.
+        service, _ = store.new_instance('PooledService')
+        store.services['PooledService']['service_class'] = NotPooledService
+        store.release_instance(service)
+        self.assertEqual(store.services['PooledService']['instance_pool'], [])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
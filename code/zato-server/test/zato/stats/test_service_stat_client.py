@@ -35,6 +35,7 @@ class TestImplClass(EventsClient):
         self.port = port
 
         self.push_counter      = 0
+        self.push_many_batches = []
         self.is_run_called     = False
         self.is_connect_called = False
 
@@ -53,6 +54,11 @@ class TestImplClass(EventsClient):
     def push(self, *args, **kwargs):
         self.push_counter += 1
 
+# ################################################################################################################################
+
+    def push_many(self, ctx_list):
+        self.push_many_batches.append(ctx_list)
+
 # ################################################################################################################################
 
     def close(self):
@@ -305,6 +311,30 @@ class ServiceStatsClientTestCase(TestCase):
         self.assertEqual(len(stats_client.backlog), 0)
         self.assertEqual(stats_client.impl.push_counter, 2)
 
+# ################################################################################################################################
+
+    def test_push_buffered(self):
+
+        # In the buffered mode, events are pushed only when there are enough of them,
+        # and then they are all pushed in a single batch.
+
+        host = rand_string()
+        port = rand_int()
+
+        stats_client = ServiceStatsClient(impl_class=TestImplClass, is_buffered=True, push_batch_size=3)
+        stats_client.init(host, port)
+
+        for idx in range(4):
+            stats_client.push(rand_string(), rand_string(), rand_string(), False, idx)
+
+        self.assertEqual(stats_client.impl.push_counter, 0)
+        self.assertEqual(len(stats_client.impl.push_many_batches), 1)
+
+        batch = stats_client.impl.push_many_batches[0]
+
+        self.assertListEqual([ctx.total_time_ms for ctx in batch], [0, 1, 2])
+        self.assertEqual(len(stats_client.backlog), 1)
+
 # ################################################################################################################################
 
 if __name__ == '__main__':